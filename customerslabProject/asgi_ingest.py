@@ -0,0 +1,18 @@
+"""
+ASGI config of the ingest-only deployment profile.
+
+It exposes the ASGI callable as a module-level variable named ``application`` and warms up
+the ingest path, including the routing snapshot, before the first request arrives.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'customerslabProject.settings_ingest')
+
+application = get_asgi_application()
+
+from data_pusher_app.ingest import warm_up  # noqa: E402
+
+warm_up()
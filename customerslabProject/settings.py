@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import sys
+from datetime import timedelta
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -85,6 +87,25 @@ DATABASES = {
     }
 }
 
+# The test suite exercises cross-shard behavior on a second tenant shard. It is only used by the
+# test cases that list it in TENANT_SHARDS, which create its tables (see data_pusher_app/tests/shards.py).
+if sys.argv[1:2] == ['test']:
+    DATABASES['shard1'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'shard1.sqlite3',
+    }
+
+# Tenant shards: database aliases accounts are spread over by rendezvous hashing of account_id.
+# Each account's destinations, deliveries and statistics live on its shard, so writes of different
+# tenants go to different databases. Add the aliases to DATABASES, list them here, run
+# `manage.py migrate --database <alias>` for each, then `manage.py rebalance_shards` to move accounts
+# to their new shards. The shard directory (token -> shard) stays on 'default'; lookups are cached
+# per process for SHARD_DIRECTORY_CACHE_TTL seconds.
+TENANT_SHARDS = ['default']
+DATABASE_ROUTERS = ['data_pusher_app.sharding.TenantRouter']
+SHARD_DIRECTORY_CACHE_TTL = 60
+SHARD_DIRECTORY_CACHE_SIZE = 10000
+
 
 # REST_FRAMEWORK = {
 #     'DEFAULT_RENDERER_CLASSES': [
@@ -108,6 +129,188 @@ REST_FRAMEWORK = {
 
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Ingest rate limit counters. This local-memory cache is per process, so each worker enforces its own
+    # copy of the limits; point it at Redis or Memcached to share the counters between workers
+    'ratelimit': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ratelimit',
+    },
+}
+
+# Seconds a rendered account destination list stays cached (keyed by the destinations version)
+DESTINATIONS_CACHE_TIMEOUT = 300
+
+# Bulk destination endpoints: rows per write statement and maximum items per request
+BULK_BATCH_SIZE = 500
+BULK_MAX_ITEMS = 10000
+
+# Rows fetched per cursor round trip by the NDJSON export
+EXPORT_CHUNK_SIZE = 2000
+
+# Compiled per-account routing indexes kept in each process
+ROUTING_INDEX_CACHE_SIZE = 1024
+
+# Compiled destination payload transforms kept in each process
+TRANSFORM_CACHE_SIZE = 1024
+
+# Requests incoming_data serves concurrently per process and per account before answering 429. The time
+# spent serving requests is also counted per ADMISSION_LOAD_WINDOW seconds in the RATE_LIMIT_BACKEND store
+# below, where replays read how busy the ingest workers are; it is only shared if that store is.
+ADMISSION_MAX_IN_FLIGHT = 64
+ADMISSION_MAX_IN_FLIGHT_PER_ACCOUNT = 16
+ADMISSION_LOAD_WINDOW = 1
+
+# Per-account ingest rate limits, per RATE_LIMIT_WINDOW seconds, set with Account.ingest_rate_limit and
+# ingest_byte_rate_limit. The defaults apply to accounts without their own limits; None leaves them unlimited.
+# A token's limits are looked up, before its first request is counted, and kept in the counter store for
+# RATE_LIMIT_LIMITS_TTL seconds.
+RATE_LIMIT_BACKEND = {
+    'BACKEND': 'data_pusher_app.ratelimit.CacheBackend',
+    'OPTIONS': {'alias': 'ratelimit'},
+}
+RATE_LIMIT_WINDOW = 1
+RATE_LIMIT_DEFAULT_REQUESTS = None
+RATE_LIMIT_DEFAULT_BYTES = None
+RATE_LIMIT_LIMITS_TTL = 60
+
+# Memory-mapped routing snapshot built by `manage.py build_routing_snapshot`. When set, incoming_data
+# resolves tokens and destinations from the snapshot and only falls back to the database for tokens
+# missing from it. Workers check for a newer snapshot every ROUTING_SNAPSHOT_CHECK_INTERVAL seconds.
+ROUTING_SNAPSHOT_PATH = None
+ROUTING_SNAPSHOT_CHECK_INTERVAL = 5
+
+# Directory of the append-only event log that incoming events are stored in; None disables it.
+# Segments roll over at EVENT_LOG_SEGMENT_BYTES and appends are fsynced once EVENT_LOG_FSYNC_BYTES
+# or EVENT_LOG_FSYNC_INTERVAL seconds have accumulated, including when no further event arrives. Sealed segments are deleted by
+# `manage.py prune_event_log` once older than EVENT_LOG_RETENTION_SECONDS or beyond EVENT_LOG_RETENTION_BYTES.
+EVENT_LOG_DIR = None
+EVENT_LOG_SEGMENT_BYTES = 64 * 1024 * 1024
+EVENT_LOG_FSYNC_BYTES = 1024 * 1024
+EVENT_LOG_FSYNC_INTERVAL = 1.0
+EVENT_LOG_RETENTION_SECONDS = 7 * 24 * 60 * 60
+EVENT_LOG_RETENTION_BYTES = None
+
+# Directory of the time-partitioned delivery history, one SQLite file per DELIVERY_HISTORY_PARTITION
+# ('day' or 'week'); None disables it. Attempts are buffered and written every DELIVERY_HISTORY_FLUSH_INTERVAL
+# seconds or once DELIVERY_HISTORY_MAX_PENDING are buffered, and at exit; up to DELIVERY_HISTORY_MAX_PENDING
+# attempts that failed to be written are retried. DELIVERY_HISTORY_PARTITIONS_AHEAD partitions
+# are created ahead of time, and partitions that ended more than DELIVERY_HISTORY_RETENTION_SECONDS ago are
+# deleted as whole files (also by `manage.py maintain_delivery_history`).
+DELIVERY_HISTORY_DIR = None
+DELIVERY_HISTORY_PARTITION = 'day'
+DELIVERY_HISTORY_PARTITIONS_AHEAD = 2
+DELIVERY_HISTORY_RETENTION_SECONDS = 30 * 24 * 60 * 60
+DELIVERY_HISTORY_FLUSH_INTERVAL = 5
+DELIVERY_HISTORY_MAX_PENDING = 5000
+
+# Event replay from the event log: events per second sent to each destination, and the average number
+# of live ingest requests in flight across workers (see ADMISSION_LOAD_WINDOW) at which a replay pauses
+# so that backfills don't slow live traffic.
+REPLAY_DESTINATION_RATE = 10
+REPLAY_YIELD_IN_FLIGHT = 8
+
+# Ingest bodies larger than RELAY_THRESHOLD_BYTES are validated while being spooled to a temporary file
+# in RELAY_SPOOL_DIR (the system default if None) and streamed unchanged to destinations, instead of
+# being decoded in memory; None disables relaying. Only synchronous deliveries are relayed, and relayed
+# bodies are copied into the event log from the spool.
+RELAY_THRESHOLD_BYTES = 2621440
+RELAY_CHUNK_SIZE = 64 * 1024
+RELAY_SPOOL_DIR = None
+
+# Extra wire formats for ingest bodies, destination payloads and ingest responses, as dotted paths of
+# data_pusher_app.formats.Codec subclasses. JSON is built in; MessagePack and CBOR are available once the
+# msgpack and cbor2 packages are installed.
+CODECS = None
+
+# Send deliveries through pooled per-thread sessions that resolve hosts through an in-process DNS cache.
+# Answers are fresh for DNS_CACHE_TTL seconds and served stale for up to DNS_CACHE_STALE_TTL more while
+# they are refreshed; hosts with DNS_CACHE_HOT_HITS hits are refreshed DNS_CACHE_REFRESH_AHEAD seconds
+# before expiry. Failed lookups are cached for DNS_CACHE_NEGATIVE_TTL seconds.
+OUTBOUND_DNS_CACHE = False
+DNS_CACHE_TTL = 60
+DNS_CACHE_STALE_TTL = 300
+DNS_CACHE_NEGATIVE_TTL = 10
+DNS_CACHE_REFRESH_AHEAD = 10
+DNS_CACHE_HOT_HITS = 10
+DNS_CACHE_MAX_ENTRIES = 4096
+
+# Per-destination delivery statistics: latency histograms per DESTINATION_STATS_SLOT_SECONDS slot, a rolling
+# in-process window of DESTINATION_STATS_WINDOW_SLOTS slots, and a flush to the DestinationStats table every
+# DESTINATION_STATS_FLUSH_INTERVAL seconds. Flushed rows are kept for DESTINATION_STATS_RETENTION.
+DESTINATION_STATS_SLOT_SECONDS = 60
+DESTINATION_STATS_WINDOW_SLOTS = 5
+DESTINATION_STATS_FLUSH_INTERVAL = 10
+DESTINATION_STATS_RETENTION = timedelta(days=7)
+
+# Delivery rollups per account and destination: minute, hour and day counters with latency sums and
+# histograms, aggregated in memory and flushed in batches every ROLLUP_FLUSH_INTERVAL seconds, or once
+# ROLLUP_MAX_PENDING minute buckets are pending; up to ROLLUP_MAX_PENDING buckets that failed to be written
+# are retried. Rows of a granularity are kept for its ROLLUP_RETENTION
+# (None keeps them forever); range queries read the coarsest rows that fit and return at most
+# ROLLUP_MAX_POINTS points.
+ROLLUP_FLUSH_INTERVAL = 10
+ROLLUP_MAX_PENDING = 10000
+ROLLUP_MAX_POINTS = 10000
+ROLLUP_RETENTION = {
+    'minute': timedelta(days=2),
+    'hour': timedelta(days=90),
+    'day': None,
+}
+
+# 'sync' sends deliveries while incoming_data waits; 'durable' answers 202 and stores one Delivery row per
+# destination for `manage.py run_delivery_worker` processes on any node; 'async' answers 202 and queues one
+# delivery per destination in memory for DELIVERY_WORKERS threads, served fairly across accounts by deficit round-robin with
+# DELIVERY_QUANTUM deliveries per unit of Account.delivery_weight and round. Accounts with more than
+# DELIVERY_MAX_QUEUED_PER_ACCOUNT queued deliveries get 429.
+DELIVERY_MODE = 'sync'
+DELIVERY_WORKERS = 8
+DELIVERY_QUANTUM = 1
+DELIVERY_MAX_QUEUED_PER_ACCOUNT = 10000
+
+# Events of a destination with an ordering_key are hashed by key value into DELIVERY_ORDERING_PARTITIONS
+# partitions; each partition is delivered strictly in order while partitions run in parallel. Synchronous
+# deliveries serialize on one of DELIVERY_ORDERING_LOCKS locks per partition instead.
+DELIVERY_ORDERING_PARTITIONS = 1024
+DELIVERY_ORDERING_LOCKS = 256
+
+# Durable delivery workers claim up to DELIVERY_CLAIM_BATCH_SIZE deliveries under a lease of
+# DELIVERY_LEASE_SECONDS, extended while sending; deliveries of a worker that dies are reclaimed once
+# its lease expires. Failed deliveries are retried after DELIVERY_RETRY_BACKOFF seconds, doubling per
+# attempt, up to DELIVERY_MAX_ATTEMPTS attempts.
+DELIVERY_CLAIM_BATCH_SIZE = 100
+DELIVERY_LEASE_SECONDS = 60
+DELIVERY_MAX_ATTEMPTS = 5
+DELIVERY_RETRY_BACKOFF = 30
+
+# Events sent with a CL-X-DELIVER-AT or CL-X-DELAY header are stored as durable deliveries due at that
+# time, at most DELIVERY_SCHEDULE_MAX_DELAY seconds ahead. With DELIVERY_SCHEDULER on, each ingest process
+# keeps the deliveries due within DELIVERY_SCHEDULER_HORIZON seconds in a timing wheel advancing every
+# DELIVERY_SCHEDULER_TICK seconds, and sends them with DELIVERY_SCHEDULER_SENDERS threads; otherwise
+# run_delivery_worker sends them once due.
+DELIVERY_SCHEDULE_MAX_DELAY = 30 * 24 * 60 * 60
+DELIVERY_SCHEDULER = False
+DELIVERY_SCHEDULER_TICK = 1.0
+DELIVERY_SCHEDULER_HORIZON = 3600
+DELIVERY_SCHEDULER_SENDERS = 4
+
+# Every save and delete of an account or destination is recorded in a change feed, numbered without
+# gaps, served by /api/changes?since=<cursor> in pages of at most CHANGE_FEED_PAGE_SIZE changes. Long
+# polls wait at most CHANGE_FEED_MAX_TIMEOUT seconds and look for changes made by other processes every
+# CHANGE_FEED_POLL_INTERVAL seconds. `manage.py prune_change_feed` deletes changes older than
+# CHANGE_FEED_RETENTION_SECONDS (None keeps them forever); readers behind them get 410.
+CHANGE_FEED_PAGE_SIZE = 1000
+CHANGE_FEED_MAX_TIMEOUT = 30
+CHANGE_FEED_POLL_INTERVAL = 1.0
+CHANGE_FEED_RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -0,0 +1,25 @@
+"""
+Lean settings for ingest-only deployments of customerslabProject.
+
+Serves only the token-authenticated ingest endpoints: no admin, sessions, auth, messages,
+Django REST framework or django_extensions are loaded, and requests pass through no
+middleware. Run it with customerslabProject.wsgi_ingest or customerslabProject.asgi_ingest
+next to the regular deployment, which keeps serving the management APIs.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    'data_pusher_app',
+]
+
+# Token-authenticated JSON ingest needs neither sessions, CSRF, auth, messages nor clickjacking protection
+MIDDLEWARE = []
+
+ROOT_URLCONF = 'customerslabProject.urls_ingest'
+
+TEMPLATES = []
+
+WSGI_APPLICATION = 'customerslabProject.wsgi_ingest.application'
+
+AUTH_PASSWORD_VALIDATORS = []
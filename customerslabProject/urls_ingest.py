@@ -0,0 +1,12 @@
+"""
+URL configuration of the ingest-only deployment profile.
+
+Only imports the ingest views, keeping Django REST framework and the admin out of the process.
+"""
+from django.urls import path
+from data_pusher_app.ingest import incoming_data, metrics_view
+
+urlpatterns = [
+    path('api/server/incoming_data', incoming_data, name='incoming_data'),
+    path('api/server/metrics', metrics_view, name='metrics'),
+]
@@ -0,0 +1,179 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from .metrics import registry
+from .ratelimit import load_backend
+
+
+class OverloadedError(Exception):
+    """
+    Raised when a request is rejected because an in-flight budget is exhausted.
+
+    Attributes:
+        retry_after (int): Seconds the client should wait before retrying.
+        scope (str): Either 'process' or 'account'.
+    """
+
+    def __init__(self, scope, retry_after):
+        super().__init__(f"Too many requests in flight for this {scope}")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounds the number of requests in flight per process and per account.
+
+    Requests over a budget are rejected immediately instead of queueing inside the server. The
+    suggested Retry-After is derived from an exponentially weighted moving average of request
+    service time and the current occupancy of the exhausted budget.
+
+    The time spent serving requests is also added to a counter per load window in the rate
+    limiter's counter store, so that processes without live traffic of their own, such as
+    `manage.py replay_events`, can see how busy the ingest workers are.
+
+    Attributes:
+        max_in_flight (int): Budget for the whole process.
+        max_in_flight_per_account (int): Budget for a single account.
+        load_window (float): Seconds per busy-time counter.
+    """
+    ewma_weight = 0.2
+
+    def __init__(self, max_in_flight=None, max_in_flight_per_account=None, backend=None, load_window=None):
+        """
+        Initializes the AdmissionController.
+
+        Args:
+            max_in_flight (int): Budget for the process. Defaults to settings.ADMISSION_MAX_IN_FLIGHT.
+            max_in_flight_per_account (int): Budget per account. Defaults to settings.ADMISSION_MAX_IN_FLIGHT_PER_ACCOUNT.
+            backend: Counter store for the busy time. Defaults to the rate limiter's, settings.RATE_LIMIT_BACKEND.
+            load_window (float): Seconds per busy-time counter. Defaults to settings.ADMISSION_LOAD_WINDOW.
+        """
+        self.max_in_flight = max_in_flight or getattr(settings, 'ADMISSION_MAX_IN_FLIGHT', 64)
+        self.max_in_flight_per_account = (
+            max_in_flight_per_account or getattr(settings, 'ADMISSION_MAX_IN_FLIGHT_PER_ACCOUNT', 16)
+        )
+        self.backend = backend or load_backend()
+        self.load_window = load_window or getattr(settings, 'ADMISSION_LOAD_WINDOW', 1)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.in_flight_by_account = {}
+        self.admitted = 0
+        self.rejected = {'process': 0, 'account': 0}
+        self.service_time = 0.05
+
+    def retry_after(self, occupied, budget):
+        """
+        Estimates how long until a slot of a full budget frees up.
+
+        Args:
+            occupied (int): Slots currently in use.
+            budget (int): Size of the budget.
+
+        Returns:
+            int: Whole seconds, at least 1.
+        """
+        return max(1, math.ceil(self.service_time * occupied / budget))
+
+    @contextmanager
+    def admit(self, account_id=None):
+        """
+        Holds a slot of the process budget, or of the account's budget if an account is given.
+
+        Args:
+            account_id: The account the request belongs to, or None for the process budget.
+
+        Raises:
+            OverloadedError: If the budget is exhausted.
+        """
+        with self.lock:
+            if account_id is None:
+                if self.in_flight >= self.max_in_flight:
+                    self.rejected['process'] += 1
+                    raise OverloadedError('process', self.retry_after(self.in_flight, self.max_in_flight))
+                self.in_flight += 1
+                self.admitted += 1
+            else:
+                occupied = self.in_flight_by_account.get(account_id, 0)
+                if occupied >= self.max_in_flight_per_account:
+                    self.rejected['account'] += 1
+                    raise OverloadedError('account', self.retry_after(occupied, self.max_in_flight_per_account))
+                self.in_flight_by_account[account_id] = occupied + 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self.lock:
+                if account_id is None:
+                    self.in_flight -= 1
+                    self.service_time += self.ewma_weight * (elapsed - self.service_time)
+                else:
+                    remaining = self.in_flight_by_account[account_id] - 1
+                    if remaining:
+                        self.in_flight_by_account[account_id] = remaining
+                    else:
+                        del self.in_flight_by_account[account_id]
+            if account_id is None:
+                self.record_busy(elapsed)
+
+    def record_busy(self, elapsed, now=None):
+        """
+        Adds the time spent serving a request to the shared busy-time counter of the current window.
+
+        Args:
+            elapsed (float): Seconds the request was in flight.
+            now (float): The current time. Defaults to now.
+        """
+        now = time.time() if now is None else now
+        window_id = int(now // self.load_window)
+        self.backend.incr(f"adm:busy:{window_id}", max(1, round(elapsed * 1000)), self.load_window * 2)
+
+    def load(self, now=None):
+        """
+        Estimates the number of ingest requests in flight across all workers sharing the counter store.
+
+        The busy time of the last load window, over the window's length, is the average number
+        of requests that were in flight; as with the rate limiter's sliding window, the previous
+        window is weighted by how much of it still overlaps. Requests still in flight are only
+        counted once they complete, except for those of this process.
+
+        Args:
+            now (float): The current time. Defaults to now.
+
+        Returns:
+            float: The estimated number of requests in flight.
+        """
+        now = time.time() if now is None else now
+        window_id = int(now // self.load_window)
+        elapsed = (now % self.load_window) / self.load_window
+        current = self.backend.get(f"adm:busy:{window_id}")
+        previous = self.backend.get(f"adm:busy:{window_id - 1}")
+        busy = previous * (1 - elapsed) + current
+        return max(self.in_flight, busy / (self.load_window * 1000))
+
+    def collect(self):
+        """
+        Returns the admission metrics.
+
+        Returns:
+            list: Metric samples for the metrics registry.
+        """
+        with self.lock:
+            return [
+                ('ingest_in_flight', 'gauge', "Ingest requests currently in flight.", {}, self.in_flight),
+                ('ingest_in_flight_limit', 'gauge', "In-flight budget of the process.", {}, self.max_in_flight),
+                ('ingest_accounts_in_flight', 'gauge', "Accounts with requests in flight.", {}, len(self.in_flight_by_account)),
+                ('ingest_admitted_total', 'counter', "Ingest requests admitted.", {}, self.admitted),
+                ('ingest_rejected_total', 'counter', "Ingest requests rejected by admission control.",
+                 {'scope': 'process'}, self.rejected['process']),
+                ('ingest_rejected_total', 'counter', "Ingest requests rejected by admission control.",
+                 {'scope': 'account'}, self.rejected['account']),
+                ('ingest_service_seconds_avg', 'gauge', "Moving average of ingest service time.", {}, round(self.service_time, 6)),
+            ]
+
+
+admission_controller = AdmissionController()
+registry.register(admission_controller.collect)
@@ -0,0 +1,387 @@
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+from .models import Account, ChangeEvent, Destination, DestinationSequence
+from .sharding import get_shards, shard_map
+
+
+def atomic_on(aliases):
+    """
+    Opens one transaction on each of the given databases.
+
+    Args:
+        aliases (iterable): The database aliases.
+
+    Returns:
+        ExitStack: A context manager committing or rolling back all of them.
+    """
+    stack = ExitStack()
+    for alias in sorted(set(aliases)):
+        stack.enter_context(transaction.atomic(using=alias))
+    return stack
+
+
+class BulkDestinationProcessor:
+    """
+    Validates and writes batches of destinations without per-item queries.
+
+    Each item is validated in memory with the model's field and custom validations. The
+    referenced accounts of the whole batch are checked with a single query, and the writes
+    are issued with bulk_create/bulk_update/delete in chunks inside one transaction per
+    database. New destinations are written to the shard of their account, and existing ones
+    are found, updated and deleted on the shard holding them.
+
+    Attributes:
+        batch_size (int): Number of rows written per statement.
+        max_items (int): Maximum number of items accepted in one batch.
+    """
+    writable_fields = ('account', 'url', 'http_method', 'headers', 'routing_rules', 'transform', 'ordering_key',
+                       'outbound_encoding', 'max_body_bytes', 'split_array_path')
+
+    def __init__(self, batch_size=None, max_items=None):
+        """
+        Initializes the BulkDestinationProcessor.
+
+        Args:
+            batch_size (int): Number of rows written per statement. Defaults to settings.BULK_BATCH_SIZE.
+            max_items (int): Maximum number of items per batch. Defaults to settings.BULK_MAX_ITEMS.
+        """
+        self.batch_size = batch_size or getattr(settings, 'BULK_BATCH_SIZE', 500)
+        self.max_items = max_items or getattr(settings, 'BULK_MAX_ITEMS', 10000)
+
+    def check_items(self, items):
+        """
+        Checks that the payload is a list of objects within the batch size limit.
+
+        Args:
+            items (list): The decoded request payload.
+
+        Raises:
+            ValueError: If the payload is not a list of objects or exceeds the limit.
+        """
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ValueError("Expected a list of objects.")
+        if len(items) > self.max_items:
+            raise ValueError(f"A batch may contain at most {self.max_items} items.")
+
+    @staticmethod
+    def normalize_account_id(value):
+        """
+        Converts a raw account reference into the canonical UUID string.
+
+        Args:
+            value: The raw account ID from the payload.
+
+        Returns:
+            str: The canonical account ID, or None if the value is not a valid UUID.
+        """
+        try:
+            return str(Account._meta.pk.to_python(value))
+        except ValidationError:
+            return None
+
+    def existing_account_ids(self, items):
+        """
+        Resolves all account IDs referenced by the batch with a single query per shard.
+
+        Args:
+            items (list): The items of the batch.
+
+        Returns:
+            set: The canonical string form of the referenced account IDs that exist.
+        """
+        referenced = {self.normalize_account_id(item['account']) for item in items if item.get('account')}
+        referenced.discard(None)
+        existing = set()
+        for alias, account_ids in shard_map.group(referenced).items():
+            accounts = shard_map.manager(Account, alias).filter(pk__in=account_ids)
+            existing.update(str(pk) for pk in accounts.values_list('pk', flat=True))
+        return existing
+
+    def validate(self, destination, item, account_ids):
+        """
+        Validates a destination in memory, skipping the per-item foreign key query.
+
+        Args:
+            destination (Destination): The unsaved or modified destination.
+            item (dict): The raw item the destination was built from.
+            account_ids (set): Account IDs known to exist.
+
+        Returns:
+            dict: Field errors keyed by field name; empty if the destination is valid.
+        """
+        errors = {}
+        unknown = set(item) - set(self.writable_fields) - {'id'}
+        if unknown:
+            errors['non_field_errors'] = [f"Unknown fields: {', '.join(sorted(unknown))}."]
+        if str(destination.account_id) not in account_ids:
+            errors['account'] = ["Account not found."]
+        try:
+            destination.clean_fields(exclude=['account'])
+        except ValidationError as e:
+            for field, messages in e.message_dict.items():
+                errors.setdefault(field, []).extend(messages)
+            return errors
+        try:
+            destination.clean()
+        except ValidationError as e:
+            errors.setdefault('non_field_errors', []).extend(e.messages)
+        return errors
+
+    def build(self, destination, item):
+        """
+        Applies the writable fields of an item to a destination.
+
+        Args:
+            destination (Destination): The destination to update.
+            item (dict): The raw item.
+
+        Returns:
+            Destination: The updated destination.
+        """
+        for field in self.writable_fields:
+            if field not in item:
+                continue
+            if field == 'account':
+                destination.account_id = self.normalize_account_id(item['account']) or item['account']
+            else:
+                setattr(destination, field, item[field])
+        return destination
+
+    def create(self, items):
+        """
+        Creates a batch of destinations.
+
+        Args:
+            items (list): Destination objects with account, url, http_method and headers.
+
+        Returns:
+            dict: The IDs of the created destinations and the per-item errors.
+        """
+        self.check_items(items)
+        account_ids = self.existing_account_ids(items)
+        destinations, errors = [], []
+        for index, item in enumerate(items):
+            destination = self.build(Destination(), item)
+            item_errors = self.validate(destination, item, account_ids)
+            if item_errors:
+                errors.append({'index': index, 'errors': item_errors})
+            else:
+                destinations.append(destination)
+
+        groups = {}
+        for destination in destinations:
+            groups.setdefault(shard_map.shard_of(destination.account_id), []).append(destination)
+        with atomic_on([*groups, DEFAULT_DB_ALIAS]):
+            if destinations:
+                # IDs come from one sequence, so they are unique across shards
+                for destination, pk in zip(destinations, DestinationSequence.allocate(len(destinations))):
+                    destination.pk = pk
+            for alias, group in groups.items():
+                shard_map.manager(Destination, alias).bulk_create(group, batch_size=self.batch_size)
+                ChangeEvent.record(ChangeEvent.upserts(group), using=alias)
+            Account.bump_destinations_version(*{d.account_id for d in destinations})
+        return {'created': [d.pk for d in destinations], 'errors': errors}
+
+    def update(self, items):
+        """
+        Updates a batch of destinations identified by their IDs.
+
+        Args:
+            items (list): Destination objects containing an id and the fields to change.
+
+        Returns:
+            dict: The IDs of the updated destinations and the per-item errors.
+        """
+        self.check_items(items)
+        existing = shard_map.in_bulk(Destination, [item['id'] for item in items if isinstance(item.get('id'), int)])
+        account_ids = self.existing_account_ids(items) | {str(d.account_id) for d in existing.values()}
+        destinations, errors, touched_accounts, fields, moved = {}, [], set(), set(), {}
+        for index, item in enumerate(items):
+            destination = existing.get(item.get('id'))
+            if destination is None:
+                errors.append({'index': index, 'errors': {'id': ["Destination not found."]}})
+                continue
+            if destination.pk in destinations:
+                errors.append({'index': index, 'errors': {'id': ["Destination appears more than once."]}})
+                continue
+            previous_account_id = destination.account_id
+            self.build(destination, item)
+            item_errors = self.validate(destination, item, account_ids)
+            if item_errors:
+                errors.append({'index': index, 'errors': item_errors})
+                continue
+            destination.updated_at = timezone.now()  # bulk_update does not apply auto_now
+            destinations[destination.pk] = destination
+            touched_accounts.update({previous_account_id, destination.account_id})
+            if previous_account_id != destination.account_id:
+                moved[destination.pk] = previous_account_id
+            fields.update(field for field in self.writable_fields if field in item)
+
+        groups = {}
+        for destination in destinations.values():
+            groups.setdefault(destination._state.db, []).append(destination)
+        with atomic_on([*groups, DEFAULT_DB_ALIAS]):
+            for alias, group in groups.items():
+                if fields:
+                    shard_map.manager(Destination, alias).bulk_update(
+                        group, sorted(fields) + ['updated_at'], batch_size=self.batch_size
+                    )
+                tombstones = [(d.pk, moved[d.pk]) for d in group if d.pk in moved]
+                ChangeEvent.record(ChangeEvent.tombstones(Destination, tombstones) + ChangeEvent.upserts(group), using=alias)
+            Account.bump_destinations_version(*touched_accounts)
+        return {'updated': list(destinations), 'errors': errors}
+
+    def delete(self, ids):
+        """
+        Deletes a batch of destinations by ID.
+
+        Args:
+            ids (list): The IDs of the destinations to delete.
+
+        Returns:
+            dict: The IDs of the deleted destinations and the per-item errors.
+        """
+        if not isinstance(ids, list):
+            raise ValueError("Expected a list of destination IDs.")
+        if len(ids) > self.max_items:
+            raise ValueError(f"A batch may contain at most {self.max_items} items.")
+        requested = [i for i in ids if isinstance(i, int)]
+        groups, existing = {}, {}
+        for alias in get_shards():
+            rows = dict(shard_map.manager(Destination, alias).filter(pk__in=requested).values_list('pk', 'account_id'))
+            if rows:
+                groups[alias] = list(rows)
+                existing.update(rows)
+        errors = [
+            {'index': index, 'errors': {'id': ["Destination not found."]}}
+            for index, destination_id in enumerate(ids) if destination_id not in existing
+        ]
+        deleted = list(existing)
+        with atomic_on([*groups, DEFAULT_DB_ALIAS]):
+            for alias, group in groups.items():
+                for start in range(0, len(group), self.batch_size):
+                    shard_map.manager(Destination, alias).filter(pk__in=group[start:start + self.batch_size]).delete()
+                ChangeEvent.record(ChangeEvent.tombstones(Destination, [(pk, existing[pk]) for pk in group]), using=alias)
+            Account.bump_destinations_version(*existing.values())
+        return {'deleted': deleted, 'errors': errors}
+
+
+class BulkAccountProcessor:
+    """
+    Validates and creates batches of accounts with set-based uniqueness checks.
+
+    Instead of the per-row unique queries issued by Account.full_clean(), each batch checks
+    email IDs, account IDs and app secret tokens with one query per field and shard, and also
+    rejects duplicates within the batch itself. Accounts are written to their shard and
+    recorded in the shard directory.
+
+    Attributes:
+        batch_size (int): Number of rows written per statement.
+    """
+    writable_fields = (
+        'account_id', 'email_id', 'account_name', 'app_secret_token', 'website',
+        'ingest_rate_limit', 'ingest_byte_rate_limit', 'delivery_weight', 'delivery_priority',
+    )
+    unique_fields = ('account_id', 'email_id', 'app_secret_token')
+
+    def __init__(self, batch_size=None):
+        """
+        Initializes the BulkAccountProcessor.
+
+        Args:
+            batch_size (int): Number of rows written per statement. Defaults to settings.BULK_BATCH_SIZE.
+        """
+        self.batch_size = batch_size or getattr(settings, 'BULK_BATCH_SIZE', 500)
+
+    def build(self, item):
+        """
+        Builds an unsaved account from an item, converting its values to Python types.
+
+        Args:
+            item (dict): The raw item.
+
+        Returns:
+            tuple: The account and the field errors found while building it.
+        """
+        account = Account(**{field: item[field] for field in self.writable_fields if item.get(field) not in (None, '')})
+        errors = {}
+        unknown = set(item) - set(self.writable_fields)
+        if unknown:
+            errors['non_field_errors'] = [f"Unknown fields: {', '.join(sorted(unknown))}."]
+        try:
+            account.clean_fields()
+        except ValidationError as e:
+            errors.update(e.message_dict)
+            return account, errors
+        try:
+            account.clean()
+        except ValidationError as e:
+            errors.setdefault('non_field_errors', []).extend(e.messages)
+        return account, errors
+
+    def taken_values(self, accounts):
+        """
+        Looks up which unique values of a batch are already stored on any shard, with one query per
+        unique field and shard.
+
+        Args:
+            accounts (list): The candidate accounts.
+
+        Returns:
+            dict: The stored values keyed by unique field name.
+        """
+        taken = {}
+        for field in self.unique_fields:
+            values = {getattr(account, field) for account in accounts}
+            taken[field] = set()
+            for alias in get_shards():
+                stored = Account.objects.using(alias).filter(**{f'{field}__in': values})
+                taken[field].update(stored.values_list(field, flat=True))
+        return taken
+
+    def create(self, items):
+        """
+        Creates a batch of accounts.
+
+        Args:
+            items (list): Account objects with email_id, account_name and optional website,
+                account_id and app_secret_token.
+
+        Returns:
+            dict: The IDs of the created accounts and the per-item errors.
+        """
+        candidates, errors = [], []
+        for index, item in enumerate(items):
+            account, item_errors = self.build(item)
+            if item_errors:
+                errors.append({'index': index, 'errors': item_errors})
+            else:
+                candidates.append((index, account))
+
+        taken = self.taken_values([account for _, account in candidates])
+        accounts = []
+        for index, account in candidates:
+            conflicts = {
+                field: ["An account with this value already exists."]
+                for field in self.unique_fields if getattr(account, field) in taken[field]
+            }
+            if conflicts:
+                errors.append({'index': index, 'errors': conflicts})
+                continue
+            for field in self.unique_fields:
+                taken[field].add(getattr(account, field))
+            accounts.append(account)
+
+        groups = {}
+        for account in accounts:
+            groups.setdefault(shard_map.shard_of(account.pk), []).append(account)
+        with atomic_on([*groups, DEFAULT_DB_ALIAS]):
+            for alias, group in groups.items():
+                shard_map.manager(Account, alias).bulk_create(group, batch_size=self.batch_size)
+                shard_map.record_many(group, alias)
+                ChangeEvent.record(ChangeEvent.upserts(group), using=alias)
+        errors.sort(key=lambda error: error['index'])
+        return {'created': [str(account.pk) for account in accounts], 'errors': errors}
@@ -0,0 +1,183 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS
+from .sharding import get_shards
+
+
+class CursorExpired(Exception):
+    """
+    Raised when a change feed cursor points at changes that were pruned, or past the end of the feed.
+    """
+
+
+class ChangeFeed:
+    """
+    Reads the change feed of accounts and destinations and lets readers wait for new changes.
+
+    Changes are ChangeEvent rows numbered without gaps in the order they join the feed (see
+    ChangeEvent.record), so a reader holding the last sequence number it saw, its cursor, never
+    misses or repeats a change that joined the feed. Changes of the default database join it
+    when they commit; those of other tenant shards are published from the shard's outbox after
+    they commit, by their writer or, if it stopped before, by the next read. Long polls sleep on a condition that local writers notify on commit, and re-read
+    the table every CHANGE_FEED_POLL_INTERVAL seconds for changes made by other processes.
+
+    Attributes:
+        condition (threading.Condition): Notified when a change is committed by this process.
+        version (int): Number of notifications so far.
+    """
+
+    def __init__(self):
+        """
+        Initializes the ChangeFeed.
+        """
+        self.condition = threading.Condition()
+        self.version = 0
+
+    def notify(self):
+        """
+        Wakes up the readers waiting for changes.
+        """
+        with self.condition:
+            self.version += 1
+            self.condition.notify_all()
+
+    def latest(self):
+        """
+        Returns the sequence number of the last committed change, 0 if there is none.
+        """
+        from .models import ChangeSequence
+
+        return ChangeSequence.objects.filter(pk=1).values_list('value', flat=True).first() or 0
+
+    def read(self, since, limit=None, account_id=None):
+        """
+        Reads the changes after a cursor.
+
+        Args:
+            since (int): The cursor; only changes with a greater sequence number are returned.
+            limit (int): Maximum number of changes. Defaults to settings.CHANGE_FEED_PAGE_SIZE.
+            account_id (UUID): Restricts the changes to one account.
+
+        Returns:
+            tuple: The changes in order, and the cursor to continue from.
+
+        Raises:
+            CursorExpired: If changes after the cursor were pruned or the cursor is past the end.
+        """
+        from .models import ChangeEvent
+
+        limit = limit or getattr(settings, 'CHANGE_FEED_PAGE_SIZE', 1000)
+        for alias in get_shards():
+            if alias != DEFAULT_DB_ALIAS:
+                # Committed shard changes whose writer stopped before publishing them
+                ChangeEvent.publish(alias)
+        # Every change up to the committed sequence value is committed too
+        latest = self.latest()
+        if since > latest:
+            raise CursorExpired(f"Cursor {since} is past the end of the change feed ({latest}).")
+        if since < latest:
+            oldest = ChangeEvent.objects.filter(seq__gt=since).order_by('seq').values_list('seq', flat=True).first()
+            if oldest != since + 1:
+                raise CursorExpired(f"Changes after cursor {since} were pruned.")
+        changes = ChangeEvent.objects.filter(seq__gt=since, seq__lte=latest).order_by('seq')
+        if account_id is not None:
+            changes = changes.filter(account_id=account_id)
+        changes = list(changes[:limit])
+        return changes, changes[-1].seq if len(changes) == limit else latest
+
+    def poll(self, since, timeout=0, limit=None, account_id=None):
+        """
+        Reads the changes after a cursor, waiting up to timeout seconds for one if there is none yet.
+
+        Args:
+            since (int): The cursor.
+            timeout (float): Seconds to wait for a change.
+            limit (int): Maximum number of changes.
+            account_id (UUID): Restricts the changes to one account.
+
+        Returns:
+            tuple: The changes in order, possibly none, and the cursor to continue from.
+
+        Raises:
+            CursorExpired: If changes after the cursor were pruned or the cursor is past the end.
+        """
+        poll_interval = getattr(settings, 'CHANGE_FEED_POLL_INTERVAL', 1.0)
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.condition:
+                version = self.version
+            changes, since = self.read(since, limit=limit, account_id=account_id)
+            remaining = deadline - time.monotonic()
+            if changes or remaining <= 0:
+                return changes, since
+            with self.condition:
+                if self.version == version:
+                    self.condition.wait(min(remaining, poll_interval))
+
+    def prune(self, max_age=None):
+        """
+        Deletes changes older than the retention period. Readers behind them get CursorExpired.
+
+        Args:
+            max_age (float): Seconds to retain. Defaults to settings.CHANGE_FEED_RETENTION_SECONDS.
+
+        Returns:
+            int: The number of changes deleted.
+        """
+        from .models import ChangeEvent
+
+        max_age = max_age if max_age is not None else getattr(settings, 'CHANGE_FEED_RETENTION_SECONDS', None)
+        if max_age is None:
+            return 0
+        cutoff = datetime.now(dt_timezone.utc) - timedelta(seconds=max_age)
+        # Sequence numbers grow with time, so everything up to the newest expired change goes
+        last = ChangeEvent.objects.filter(created_at__lt=cutoff).order_by('-seq').values_list('seq', flat=True).first()
+        if last is None:
+            return 0
+        deleted, _ = ChangeEvent.objects.filter(seq__lte=last).delete()
+        return deleted
+
+
+def parse_change_options(params):
+    """
+    Parses the parameters of a change feed request.
+
+    Args:
+        params (QueryDict | dict): Mapping with optional 'since', 'timeout', 'limit' and 'account' values.
+
+    Returns:
+        dict: 'since' (int or None), 'timeout' (float, capped by CHANGE_FEED_MAX_TIMEOUT), 'limit' (int)
+            and 'account_id' (UUID or None).
+
+    Raises:
+        ValueError: If a parameter value is malformed.
+    """
+    from .models import Account
+
+    options = {'since': None, 'timeout': 0.0, 'account_id': None}
+    try:
+        if params.get('since'):
+            options['since'] = int(params['since'])
+        if params.get('timeout'):
+            options['timeout'] = float(params['timeout'])
+        limit = int(params.get('limit') or getattr(settings, 'CHANGE_FEED_PAGE_SIZE', 1000))
+    except ValueError:
+        raise ValueError("since and limit must be integers and timeout a number of seconds")
+    if options['since'] is not None and options['since'] < 0:
+        raise ValueError("since must not be negative")
+    if not 0 <= options['timeout'] < float('inf'):
+        raise ValueError("timeout must be a non-negative number of seconds")
+    options['timeout'] = min(options['timeout'], getattr(settings, 'CHANGE_FEED_MAX_TIMEOUT', 30))
+    options['limit'] = max(1, min(limit, getattr(settings, 'CHANGE_FEED_PAGE_SIZE', 1000)))
+    if params.get('account'):
+        try:
+            options['account_id'] = Account._meta.pk.to_python(params['account'])
+        except ValidationError:
+            raise ValueError("Invalid account ID")
+    return options
+
+
+change_feed = ChangeFeed()
@@ -0,0 +1,91 @@
+from .routing import _MISSING, resolve_path
+from .transforms import _set
+
+# Placeholder for the split array while its envelope is encoded; the bytes around it are reused by every chunk
+SPLICE_MARKER = '\x00data-pusher-array\x00'
+
+
+class ArrayChunker:
+    """
+    Splits a payload into bodies of bounded size by spreading one of its arrays over copies of it.
+
+    The rest of the payload, the envelope, is encoded once with a placeholder in place of the
+    array, and every item is encoded once on its own. Chunks are then assembled from those
+    bytes, filling each up to the size limit, so no chunk is encoded from scratch.
+
+    Attributes:
+        codec (Codec): The codec bodies are encoded with.
+        max_bytes (int): Maximum size of a body.
+        path (tuple): The path segments of the array.
+    """
+
+    def __init__(self, codec, max_bytes, path):
+        """
+        Initializes the ArrayChunker.
+
+        Args:
+            codec (Codec): The codec bodies are encoded with.
+            max_bytes (int): Maximum size of a body.
+            path (str): Dot-separated path of the array to split.
+        """
+        self.codec = codec
+        self.max_bytes = max_bytes
+        self.path = tuple(path.split('.'))
+
+    def splittable(self, payload):
+        """
+        Tells whether the payload has an array at the path.
+        """
+        return isinstance(resolve_path(payload, self.path), list)
+
+    def envelope(self, payload):
+        """
+        Encodes the payload around its array.
+
+        Returns:
+            tuple: The bytes before and after the array.
+
+        Raises:
+            ValueError: If the codec cannot assemble arrays from encoded items.
+        """
+        body = self.codec.encode(_set(payload, self.path, SPLICE_MARKER))
+        marker = self.codec.encode(SPLICE_MARKER)
+        if body.count(marker) != 1:
+            raise ValueError("The payload cannot be split: it contains the splice marker.")
+        prefix, suffix = body.split(marker)
+        return prefix, suffix
+
+    def chunks(self, payload):
+        """
+        Yields the bodies of the payload, each holding as many consecutive items of the array as fit.
+
+        Args:
+            payload (dict): The payload, with a list at the path.
+
+        Yields:
+            bytes: The encoded chunks, in array order. An empty array yields one body.
+
+        Raises:
+            ValueError: If a single item does not fit in a body or the codec cannot be chunked.
+        """
+        items = resolve_path(payload, self.path)
+        if items is _MISSING or not isinstance(items, list):
+            raise ValueError(f"No array at '{'.'.join(self.path)}' to split.")
+        try:
+            self.codec.array_overhead(0)
+        except NotImplementedError:
+            raise ValueError(f"Encoding '{self.codec.name}' does not support chunked delivery.") from None
+        prefix, suffix = self.envelope(payload)
+        fixed = len(prefix) + len(suffix)
+        current, size, sent = [], 0, False
+        for index, item in enumerate(items):
+            encoded = self.codec.encode(item)
+            if fixed + self.codec.array_overhead(1) + len(encoded) > self.max_bytes:
+                raise ValueError(f"Item {index} of '{'.'.join(self.path)}' alone exceeds {self.max_bytes} bytes.")
+            if current and fixed + self.codec.array_overhead(len(current) + 1) + size + len(encoded) > self.max_bytes:
+                yield prefix + self.codec.join_array(current) + suffix
+                current, size, sent = [], 0, True
+            current.append(encoded)
+            size += len(encoded)
+        if current or not sent:
+            yield prefix + self.codec.join_array(current) + suffix
@@ -0,0 +1,310 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import deque
+from contextlib import nullcontext
+from django.conf import settings
+from django.db import close_old_connections
+from .admission import OverloadedError
+from .metrics import registry
+from .routing import _MISSING, resolve_path
+
+logger = logging.getLogger(__name__)
+
+# Returned by FairScheduler.get() when the claim callback parked the delivery
+PARKED = object()
+
+
+def ordering_partition(destination, data, partitions=None):
+    """
+    Maps an event to the ordering partition of a destination.
+
+    Events whose ordering key has the same value always map to the same partition; deliveries
+    within a partition are sent one at a time, in order, while partitions proceed in parallel.
+
+    Args:
+        destination (Destination): The destination, whose `ordering_key` names the key field.
+        data: The decoded event.
+        partitions (int): Number of partitions per destination. Defaults to settings.DELIVERY_ORDERING_PARTITIONS.
+
+    Returns:
+        tuple: The destination ID and partition number, or None if the destination has no
+        ordering key or the event lacks the key field.
+    """
+    path = getattr(destination, 'ordering_key', None)
+    if not path:
+        return None
+    value = resolve_path(data, tuple(path.split('.')))
+    if value is _MISSING:
+        return None
+    partitions = partitions or getattr(settings, 'DELIVERY_ORDERING_PARTITIONS', 1024)
+    digest = hashlib.blake2b(json.dumps(value, sort_keys=True, default=str).encode('utf-8'), digest_size=8).digest()
+    return destination.pk, int.from_bytes(digest, 'little') % partitions
+
+
+class FairScheduler:
+    """
+    A queue of pending deliveries that is fair across accounts.
+
+    Each account has its own FIFO sub-queue. Accounts are grouped by priority tier, and tiers
+    are strictly ordered: deliveries of a lower tier are only handed out while every higher
+    tier is empty. Within a tier, accounts are served by deficit round-robin: when an account
+    reaches the front of the ring it is credited `quantum * weight` deliveries, and it is
+    served until the credit runs out or its queue empties. An account flooding the queue
+    therefore delays others by at most one round, however much it has queued.
+
+    Attributes:
+        quantum (int): Deliveries credited per unit of weight and round.
+        max_queued_per_account (int): Bound of an account's sub-queue.
+    """
+
+    def __init__(self, quantum=None, max_queued_per_account=None):
+        """
+        Initializes the FairScheduler.
+
+        Args:
+            quantum (int): Defaults to settings.DELIVERY_QUANTUM.
+            max_queued_per_account (int): Defaults to settings.DELIVERY_MAX_QUEUED_PER_ACCOUNT.
+        """
+        self.quantum = quantum or getattr(settings, 'DELIVERY_QUANTUM', 1)
+        self.max_queued_per_account = max_queued_per_account or \
+            getattr(settings, 'DELIVERY_MAX_QUEUED_PER_ACCOUNT', 10000)
+        self.condition = threading.Condition()
+        self.tiers = {}        # priority -> deque of account ids with queued deliveries
+        self.queues = {}       # account id -> deque of deliveries
+        self.accounts = {}     # account id -> [priority, weight, deficit]
+        self.size = 0
+
+    def put(self, account_id, item, weight=1, priority=0):
+        """
+        Queues a delivery of an account.
+
+        Args:
+            account_id: The account the delivery belongs to.
+            item: The delivery.
+            weight (int): The account's weight within its tier.
+            priority (int): The account's priority tier; higher tiers are served first.
+
+        Raises:
+            OverloadedError: If the account's sub-queue is full.
+        """
+        with self.condition:
+            queue = self.queues.get(account_id)
+            if queue is None:
+                queue = self.queues[account_id] = deque()
+                self.accounts[account_id] = [priority, max(1, weight), 0]
+                self.tiers.setdefault(priority, deque()).append(account_id)
+            elif len(queue) >= self.max_queued_per_account:
+                raise OverloadedError('account', 1)
+            else:
+                self.accounts[account_id][1] = max(1, weight)
+            queue.append(item)
+            self.size += 1
+            self.condition.notify()
+
+    def get(self, timeout=None, claim=None):
+        """
+        Takes the next delivery, waiting for one if the queue is empty.
+
+        Args:
+            timeout (float): Seconds to wait. None waits indefinitely.
+            claim (callable): Called with the delivery while the queue is still locked; returning
+                False means the callback kept the delivery for later.
+
+        Returns:
+            The delivery, None if the timeout expired, or PARKED if the claim callback kept it.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.size, timeout):
+                return None
+            priority = max(self.tiers)
+            ring = self.tiers[priority]
+            while True:
+                account_id = ring[0]
+                state = self.accounts[account_id]
+                if state[2] >= 1:
+                    break
+                ring.rotate(-1)
+                state = self.accounts[ring[0]]
+                state[2] += self.quantum * state[1]
+            state[2] -= 1
+            queue = self.queues[account_id]
+            item = queue.popleft()
+            self.size -= 1
+            if not queue:
+                # An idle account keeps no credit for later
+                ring.popleft()
+                del self.queues[account_id], self.accounts[account_id]
+                if not ring:
+                    del self.tiers[priority]
+            if claim is not None and not claim(item):
+                return PARKED
+            return item
+
+    def queued(self, account_id):
+        with self.condition:
+            return len(self.queues.get(account_id, ()))
+
+
+class DeliveryDispatcher:
+    """
+    Sends queued deliveries from a pool of worker threads, in the order of a FairScheduler.
+
+    Deliveries with an ordering partition are sent one at a time per partition: a worker taking
+    a delivery whose partition is busy parks it behind the partition's running delivery, and
+    the worker running that partition sends the parked deliveries next, in queue order. Since
+    the partition is claimed while the queue is locked, deliveries of a partition are sent in
+    exactly the order they were queued, and other partitions keep all workers busy.
+
+    Attributes:
+        scheduler (FairScheduler): The queue of pending deliveries.
+        workers (int): Number of worker threads, started on first use.
+    """
+
+    def __init__(self, scheduler=None, workers=None):
+        """
+        Initializes the DeliveryDispatcher.
+
+        Args:
+            scheduler (FairScheduler): Defaults to a new FairScheduler.
+            workers (int): Defaults to settings.DELIVERY_WORKERS.
+        """
+        self.scheduler = scheduler or FairScheduler()
+        self.workers = workers or getattr(settings, 'DELIVERY_WORKERS', 8)
+        self.threads = []
+        self.lock = threading.Lock()
+        self.busy = {}  # ordering partition -> deque of parked deliveries
+        self.partition_locks = [threading.Lock() for _ in range(getattr(settings, 'DELIVERY_ORDERING_LOCKS', 256))]
+        self.delivered = 0
+        self.failed = 0
+
+    def start(self):
+        """
+        Starts the worker threads if they are not running yet.
+        """
+        if self.threads:
+            return
+        with self.lock:
+            if self.threads:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self.work, name=f'delivery-{number}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, account, delivery, partition=None):
+        """
+        Queues a delivery for the worker threads.
+
+        Args:
+            account (Account): The account the delivery belongs to; its weight and priority tier apply.
+            delivery (callable): Sends the delivery when called.
+            partition (tuple): The ordering partition of the delivery, or None if unordered.
+
+        Raises:
+            OverloadedError: If the account has too many deliveries queued.
+        """
+        self.start()
+        self.scheduler.put(account.pk, (delivery, partition), account.delivery_weight, account.delivery_priority)
+
+    def claim(self, item):
+        """
+        Claims the partition of a delivery taken from the queue, or parks the delivery if it is busy.
+
+        Called with the scheduler locked.
+        """
+        partition = item[1]
+        if partition is None:
+            return True
+        parked = self.busy.get(partition)
+        if parked is not None:
+            parked.append(item[0])
+            return False
+        self.busy[partition] = deque()
+        return True
+
+    def next_in_partition(self, partition):
+        """
+        Returns the next parked delivery of a partition, releasing the partition if there is none.
+        """
+        if partition is None:
+            return None
+        with self.scheduler.condition:
+            parked = self.busy[partition]
+            if parked:
+                return parked.popleft()
+            del self.busy[partition]
+            return None
+
+    def ordering_lock(self, partition):
+        """
+        Returns a lock serializing synchronous deliveries of an ordering partition.
+
+        Args:
+            partition (tuple): The ordering partition, or None.
+
+        Returns:
+            A context manager.
+        """
+        if partition is None:
+            return nullcontext()
+        return self.partition_locks[hash(partition) % len(self.partition_locks)]
+
+    def run_one(self, timeout=None):
+        """
+        Sends the next queued delivery, followed by any deliveries parked behind it.
+
+        Args:
+            timeout (float): Seconds to wait for a delivery.
+
+        Returns:
+            bool: Whether a delivery was taken from the queue.
+        """
+        item = self.scheduler.get(timeout, self.claim)
+        if item is None:
+            return False
+        if item is PARKED:
+            return True
+        delivery, partition = item
+        while delivery is not None:
+            try:
+                delivery()
+                ok = True
+            except Exception:
+                ok = False
+                logger.exception("Queued delivery failed")
+            with self.lock:
+                if ok:
+                    self.delivered += 1
+                else:
+                    self.failed += 1
+            delivery = self.next_in_partition(partition)
+        return True
+
+    def work(self):
+        while True:
+            try:
+                self.run_one()
+            finally:
+                close_old_connections()
+
+    def collect(self):
+        """
+        Returns the delivery queue metrics.
+
+        Returns:
+            list: Metric samples for the metrics registry.
+        """
+        return [
+            ('delivery_queued', 'gauge', "Deliveries waiting in the queue.", {}, self.scheduler.size),
+            ('delivery_queued_accounts', 'gauge', "Accounts with queued deliveries.", {}, len(self.scheduler.queues)),
+            ('delivery_ordering_partitions_busy', 'gauge', "Ordering partitions with a delivery in progress.", {},
+             len(self.busy)),
+            ('delivery_dispatched_total', 'counter', "Queued deliveries sent.", {}, self.delivered),
+            ('delivery_dispatch_errors_total', 'counter', "Queued deliveries that raised.", {}, self.failed),
+        ]
+
+
+delivery_dispatcher = DeliveryDispatcher()
+registry.register(delivery_dispatcher.collect)
@@ -0,0 +1,525 @@
+import atexit
+import mmap
+import os
+import threading
+import time
+import uuid
+import zlib
+from collections import namedtuple
+from django.conf import settings
+from .metrics import registry
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# payload length, CRC32 of everything after this field, timestamp (ns), account id
+RECORD_HEADER_FORMAT = '<IIQ16s'
+RECORD_HEADER_SIZE = 4 + 4 + 8 + 16
+SEGMENT_SUFFIX = '.log'
+
+EventRecord = namedtuple('EventRecord', 'segment offset timestamp account_id payload')
+
+
+def segment_name(number):
+    return f"{number:012d}{SEGMENT_SUFFIX}"
+
+
+def pack_record(account_id, payload, timestamp):
+    """
+    Encode one event as a length-prefixed, checksummed record.
+
+    Args:
+        account_id (UUID): The account the event belongs to.
+        payload (bytes): The raw event body.
+        timestamp (int): Nanoseconds since the epoch.
+
+    Returns:
+        bytes: The encoded record.
+    """
+    body = timestamp.to_bytes(8, 'little') + account_id.bytes + payload
+    return len(payload).to_bytes(4, 'little') + zlib.crc32(body).to_bytes(4, 'little') + body
+
+
+def read_record(buffer, offset):
+    """
+    Decode the record at an offset of a segment.
+
+    Args:
+        buffer: The segment contents (bytes or mmap).
+        offset (int): Offset of the record.
+
+    Returns:
+        tuple: The timestamp, account ID, payload and offset of the next record, or None if
+        the record is incomplete or fails its checksum, which marks the end of valid data.
+    """
+    end = len(buffer)
+    if offset + RECORD_HEADER_SIZE > end:
+        return None
+    length = int.from_bytes(buffer[offset:offset + 4], 'little')
+    next_offset = offset + RECORD_HEADER_SIZE + length
+    if next_offset > end:
+        return None
+    body = buffer[offset + 8:next_offset]
+    if zlib.crc32(body) != int.from_bytes(buffer[offset + 4:offset + 8], 'little'):
+        return None
+    return int.from_bytes(body[:8], 'little'), uuid.UUID(bytes=bytes(body[8:24])), bytes(body[24:]), next_offset
+
+
+class SegmentIndex:
+    """
+    The valid length and per-account record offsets of a segment, built by scanning it once.
+
+    Sealed segments never change, so their index is complete after one scan; the active
+    segment is scanned incrementally from where the previous scan stopped.
+    """
+
+    def __init__(self):
+        self.scanned = 0
+        self.by_account = {}
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def extend(self, buffer):
+        """
+        Indexes the records appended since the last scan.
+
+        Args:
+            buffer: The segment contents.
+        """
+        offset = self.scanned
+        while True:
+            record = read_record(buffer, offset)
+            if record is None:
+                break
+            timestamp, account_id, _, next_offset = record
+            self.by_account.setdefault(account_id, []).append(offset)
+            if self.first_timestamp is None:
+                self.first_timestamp = timestamp
+            self.last_timestamp = timestamp
+            offset = next_offset
+        self.scanned = offset
+
+
+class EventLog:
+    """
+    An append-only event store made of numbered segment files.
+
+    Records are appended to the newest segment under an advisory file lock, so several worker
+    processes can share one directory; a new segment is started once the current one exceeds
+    the segment size. The lock file also holds the end of the last complete record, so a record
+    torn by a failed write or a crash is truncated before anything is appended after it. Writes
+    go to the operating system immediately and are fsynced in batches, once enough bytes have
+    accumulated or, through a timer, once the oldest unsynced write is fsync_interval old. Readers map segments with mmap and
+    consume them sequentially, or jump straight to an account's records through the
+    per-segment offset index. Old sealed segments are removed by the retention policy.
+
+    Attributes:
+        directory (str): Directory holding the segments.
+        segment_bytes (int): Size after which a new segment is started.
+        fsync_bytes (int): Unsynced bytes that trigger an fsync.
+        fsync_interval (float): Seconds after which unsynced data is fsynced.
+    """
+
+    def __init__(self, directory, segment_bytes=None, fsync_bytes=None, fsync_interval=None):
+        """
+        Opens or creates an event log.
+
+        Args:
+            directory (str): Directory holding the segments; created if missing.
+            segment_bytes (int): Defaults to settings.EVENT_LOG_SEGMENT_BYTES.
+            fsync_bytes (int): Defaults to settings.EVENT_LOG_FSYNC_BYTES.
+            fsync_interval (float): Defaults to settings.EVENT_LOG_FSYNC_INTERVAL.
+        """
+        self.directory = str(directory)
+        self.segment_bytes = segment_bytes or getattr(settings, 'EVENT_LOG_SEGMENT_BYTES', 64 * 1024 * 1024)
+        self.fsync_bytes = fsync_bytes or getattr(settings, 'EVENT_LOG_FSYNC_BYTES', 1024 * 1024)
+        self.fsync_interval = fsync_interval if fsync_interval is not None else \
+            getattr(settings, 'EVENT_LOG_FSYNC_INTERVAL', 1.0)
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock = threading.Lock()
+        # Not opened for appending, so the tail position can be rewritten in place
+        self.lock_file = os.fdopen(os.open(os.path.join(self.directory, '.lock'), os.O_RDWR | os.O_CREAT), 'r+b', 0)
+        self.active_number = None
+        self.active_file = None
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.sync_timer = None
+        self.indexes = {}
+        self.appended = 0
+        self.appended_bytes = 0
+
+    # Writing
+
+    def segment_numbers(self):
+        """
+        Lists the segment numbers present in the directory, oldest first.
+
+        Returns:
+            list: The segment numbers.
+        """
+        return sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+
+    def segment_path(self, number):
+        return os.path.join(self.directory, segment_name(number))
+
+    def repair(self, path, start=0):
+        """
+        Truncates a torn record left at the end of a segment by a crash or a failed write.
+
+        Args:
+            path (str): The segment path.
+            start (int): Offset of a record known to be complete; only what follows is checked.
+
+        Returns:
+            int: The length of the segment's valid data.
+        """
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read()
+        offset = 0
+        while (record := read_record(data, offset)) is not None:
+            offset = record[3]
+        if offset < len(data):
+            with open(path, 'r+b') as f:
+                f.truncate(start + offset)
+        return start + offset
+
+    def read_tail(self):
+        """
+        Returns the segment number and end offset of the last complete record, as written by
+        the last successful append of any process sharing the directory.
+
+        Returns:
+            tuple: The segment number and offset, or None if no append has recorded it yet.
+        """
+        self.lock_file.seek(0)
+        data = self.lock_file.read(16)
+        if len(data) < 16:
+            return None
+        return int.from_bytes(data[:8], 'little'), int.from_bytes(data[8:], 'little')
+
+    def write_tail(self, number, end):
+        self.lock_file.seek(0)
+        self.lock_file.write(number.to_bytes(8, 'little') + end.to_bytes(8, 'little'))
+
+    def check_tail(self, size):
+        """
+        Truncates whatever follows the last complete record of the active segment.
+
+        Only the bytes after the recorded tail are checked, so an append costs nothing extra
+        unless a writer failed or crashed mid-record, or the tail was lost with the lock file.
+
+        Args:
+            size (int): The current size of the active segment.
+
+        Returns:
+            int: The offset the next record goes to.
+        """
+        tail = self.read_tail()
+        if tail == (self.active_number, size):
+            return size
+        start = tail[1] if tail is not None and tail[0] == self.active_number and tail[1] <= size else 0
+        return self.repair(self.segment_path(self.active_number), start)
+
+    def open_active(self):
+        """
+        Opens the newest segment for appending, or a newer one that another process started.
+        """
+        numbers = self.segment_numbers()
+        number = numbers[-1] if numbers else 0
+        if number != self.active_number:
+            self.close_active()
+            path = self.segment_path(number)
+            if os.path.exists(path):
+                self.repair(path)
+            self.active_file = open(path, 'ab', buffering=0)
+            self.active_number = number
+
+    def close_active(self):
+        if self.active_file is not None:
+            os.fsync(self.active_file.fileno())
+            self.active_file.close()
+            self.active_file = None
+            self.unsynced = 0
+
+    def append(self, account_id, payload, timestamp=None):
+        """
+        Appends an event to the log.
+
+        Args:
+            account_id (UUID): The account the event belongs to.
+            payload (bytes): The raw event body.
+            timestamp (int): Nanoseconds since the epoch. Defaults to now.
+
+        Returns:
+            tuple: The segment number and offset of the record.
+        """
+        record = pack_record(account_id, payload, timestamp or time.time_ns())
+        return self.write_record(lambda f: f.write(record), len(record))
+
+    def append_file(self, account_id, source, timestamp=None, chunk_size=64 * 1024):
+        """
+        Appends an event read from a file, without holding its body in memory.
+
+        The file is read twice in chunks: once for the checksum, once to copy it into the segment.
+
+        Args:
+            account_id (UUID): The account the event belongs to.
+            source (file): The raw event body, positioned at its start; it is left at its end.
+            timestamp (int): Nanoseconds since the epoch. Defaults to now.
+            chunk_size (int): Bytes read at a time.
+
+        Returns:
+            tuple: The segment number and offset of the record.
+        """
+        start = source.tell()
+        prefix = (timestamp or time.time_ns()).to_bytes(8, 'little') + account_id.bytes
+        checksum, length = zlib.crc32(prefix), 0
+        while chunk := source.read(chunk_size):
+            checksum = zlib.crc32(chunk, checksum)
+            length += len(chunk)
+        header = length.to_bytes(4, 'little') + checksum.to_bytes(4, 'little') + prefix
+
+        def write(f):
+            f.write(header)
+            source.seek(start)
+            while chunk := source.read(chunk_size):
+                f.write(chunk)
+        return self.write_record(write, RECORD_HEADER_SIZE + length)
+
+    def write_record(self, write, size):
+        """
+        Writes one record at the end of the active segment under the append lock.
+
+        If the write fails or comes up short, the segment is truncated back to where the record
+        started before the error is raised, so the records appended after it stay readable.
+
+        Args:
+            write (callable): Writes the record to the file it is given.
+            size (int): The size of the record.
+
+        Returns:
+            tuple: The segment number and offset of the record.
+        """
+        with self.lock:
+            if fcntl is not None:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+            try:
+                if self.active_file is None or os.path.exists(self.segment_path(self.active_number + 1)):
+                    self.open_active()
+                # Other processes sharing the directory may have appended since our last write
+                self.active_file.seek(0, os.SEEK_END)
+                if self.active_file.tell() >= self.segment_bytes:
+                    self.close_active()
+                    self.active_file = open(self.segment_path(self.active_number + 1), 'ab', buffering=0)
+                    self.active_number += 1
+                offset = self.check_tail(self.active_file.tell())
+                try:
+                    write(self.active_file)
+                    if self.active_file.tell() != offset + size:
+                        raise OSError(f"Short write to event log segment {self.active_number}")
+                except BaseException:
+                    self.active_file.truncate(offset)
+                    raise
+                self.write_tail(self.active_number, offset + size)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.unsynced += size
+            self.appended += 1
+            self.appended_bytes += size
+            if self.unsynced >= self.fsync_bytes or time.monotonic() - self.last_sync >= self.fsync_interval:
+                self.sync()
+            elif self.sync_timer is None:
+                # Sync this write even if no other one follows it
+                self.sync_timer = threading.Timer(self.fsync_interval, self.sync_pending)
+                self.sync_timer.daemon = True
+                self.sync_timer.start()
+            return self.active_number, offset
+
+    def sync(self):
+        """
+        Forces appended records to stable storage.
+        """
+        if self.active_file is not None and self.unsynced:
+            os.fsync(self.active_file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def sync_pending(self):
+        """
+        Syncs writes that no later append synced, when the sync timer fires or at exit.
+        """
+        with self.lock:
+            self.sync_timer = None
+            self.sync()
+
+    def close(self):
+        """
+        Syncs and closes the log.
+        """
+        with self.lock:
+            if self.sync_timer is not None:
+                self.sync_timer.cancel()
+                self.sync_timer = None
+            self.close_active()
+            self.lock_file.close()
+
+    # Reading
+
+    def map_segment(self, number):
+        """
+        Maps a segment read-only.
+
+        Args:
+            number (int): The segment number.
+
+        Returns:
+            mmap: The mapped segment, or an empty bytes object for an empty segment.
+        """
+        with open(self.segment_path(number), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def index(self, number, buffer):
+        """
+        Returns the offset index of a segment, extending it with newly appended records.
+
+        Args:
+            number (int): The segment number.
+            buffer: The mapped segment.
+
+        Returns:
+            SegmentIndex: The index.
+        """
+        index = self.indexes.setdefault(number, SegmentIndex())
+        if index.scanned < len(buffer):
+            index.extend(buffer)
+        return index
+
+    def read(self, account_id=None, since=None, until=None, start=None):
+        """
+        Yields events in append order, without loading more than one segment mapping at a time.
+
+        Args:
+            account_id (UUID): Only yield this account's events, using the offset index.
+            since (int): Only yield events at or after this timestamp (ns).
+            until (int): Only yield events before this timestamp (ns).
+            start (tuple): Resume after this (segment, offset) position.
+
+        Yields:
+            EventRecord: The matching events.
+        """
+        for number in self.segment_numbers():
+            if start is not None and number < start[0]:
+                continue
+            try:
+                buffer = self.map_segment(number)
+            except FileNotFoundError:
+                continue  # removed by retention while reading
+            try:
+                index = self.index(number, buffer)
+                if index.first_timestamp is None:
+                    continue
+                if (since is not None and index.last_timestamp < since) or \
+                        (until is not None and index.first_timestamp >= until):
+                    continue
+                if account_id is not None:
+                    offsets = iter(index.by_account.get(account_id, ()))
+                else:
+                    offsets = self.sequential_offsets(buffer, index.scanned)
+                for offset in offsets:
+                    if start is not None and (number, offset) <= tuple(start):
+                        continue
+                    timestamp, record_account, payload, _ = read_record(buffer, offset)
+                    if since is not None and timestamp < since:
+                        continue
+                    if until is not None and timestamp >= until:
+                        continue
+                    yield EventRecord(number, offset, timestamp, record_account, payload)
+            finally:
+                if isinstance(buffer, mmap.mmap):
+                    try:
+                        buffer.close()
+                    except BufferError:
+                        pass  # a consumer still holds a view; the mapping is released with it
+
+    @staticmethod
+    def sequential_offsets(buffer, end):
+        offset = 0
+        while offset < end:
+            yield offset
+            offset = read_record(buffer, offset)[3]
+
+    # Retention
+
+    def apply_retention(self, max_age=None, max_bytes=None):
+        """
+        Deletes the oldest sealed segments that fall outside the retention policy.
+
+        Args:
+            max_age (float): Delete segments whose newest event is older than this many seconds.
+            max_bytes (int): Delete oldest segments while the log is larger than this.
+
+        Returns:
+            list: The deleted segment numbers.
+        """
+        numbers = self.segment_numbers()
+        sealed = numbers[:-1]  # never delete the segment being appended to
+        sizes = {number: os.path.getsize(self.segment_path(number)) for number in numbers}
+        total = sum(sizes.values())
+        cutoff = time.time() - max_age if max_age else None
+        deleted = []
+        for number in sealed:
+            expired = cutoff is not None and os.path.getmtime(self.segment_path(number)) < cutoff
+            oversized = max_bytes is not None and total > max_bytes
+            if not (expired or oversized):
+                break
+            os.remove(self.segment_path(number))
+            self.indexes.pop(number, None)
+            total -= sizes[number]
+            deleted.append(number)
+        return deleted
+
+    def collect(self):
+        """
+        Returns the event log metrics.
+
+        Returns:
+            list: Metric samples for the metrics registry.
+        """
+        return [
+            ('event_log_appended_total', 'counter', "Events appended to the event log.", {}, self.appended),
+            ('event_log_appended_bytes_total', 'counter', "Bytes appended to the event log.", {}, self.appended_bytes),
+            ('event_log_unsynced_bytes', 'gauge', "Appended bytes not yet fsynced.", {}, self.unsynced),
+        ]
+
+
+_event_log = None
+_event_log_lock = threading.Lock()
+
+
+def get_event_log():
+    """
+    Returns the process's event log, opening it on first use.
+
+    Returns:
+        EventLog: The event log in settings.EVENT_LOG_DIR, or None if the event store is disabled.
+    """
+    global _event_log
+    directory = getattr(settings, 'EVENT_LOG_DIR', None)
+    if not directory:
+        return None
+    if _event_log is None:
+        with _event_log_lock:
+            if _event_log is None:
+                _event_log = EventLog(directory)
+                registry.register(_event_log.collect)
+                atexit.register(_event_log.sync_pending)
+    return _event_log
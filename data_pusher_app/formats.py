@@ -0,0 +1,341 @@
+# Wire formats of ingested events, outbound deliveries and ingest responses. Imported by the
+# lean ingest path, so it must only depend on Django's core.
+import importlib
+import json
+import threading
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse, JsonResponse
+from django.utils.module_loading import import_string
+
+
+class Codec:
+    """
+    Encodes and decodes one wire format.
+
+    Subclasses set a short name, the Content-Type they produce and the media types they
+    accept, and implement loads() and dumps(). Codecs backed by an optional package name it in
+    `module`; they stay registered but unavailable while the package is not installed.
+
+    Attributes:
+        name (str): The name destinations select the codec by, e.g. 'json'.
+        content_type (str): The Content-Type of encoded bodies.
+        media_types (tuple): Media types, without parameters, decoded by the codec.
+        module (str): The optional package the codec needs, if any.
+    """
+    name = None
+    content_type = None
+    media_types = ()
+    module = None
+
+    def __init__(self):
+        self._lib = None if self.module else False
+
+    @property
+    def lib(self):
+        """
+        The codec's package, imported on first use.
+
+        Raises:
+            ImportError: If the package is not installed.
+        """
+        if self._lib is None:
+            try:
+                self._lib = importlib.import_module(self.module)
+            except ImportError:
+                # Remember the failure instead of retrying the import on every lookup
+                self._lib = False
+        if self._lib is False:
+            raise ImportError(f"Encoding '{self.name}' requires the '{self.module}' package.")
+        return self._lib
+
+    @property
+    def available(self):
+        if self.module is None:
+            return True
+        try:
+            self.lib
+            return True
+        except ImportError:
+            return False
+
+    def decode(self, body):
+        """
+        Decodes a request body.
+
+        Args:
+            body (bytes): The encoded document.
+
+        Returns:
+            The decoded data.
+
+        Raises:
+            ValueError: If the body is malformed.
+        """
+        try:
+            return self.loads(body)
+        except (ValueError, TypeError, KeyError) as e:
+            raise ValueError(f"Invalid {self.name} body: {e}") from e
+
+    def encode(self, data):
+        """
+        Encodes data.
+
+        Args:
+            data: JSON-compatible data.
+
+        Returns:
+            bytes: The encoded document.
+
+        Raises:
+            ValueError: If the data cannot be represented in the format.
+        """
+        try:
+            return self.dumps(data)
+        except (ValueError, TypeError, OverflowError) as e:
+            raise ValueError(f"Cannot encode as {self.name}: {e}") from e
+
+    def join_array(self, items):
+        """
+        Encodes an array from its already encoded items, so that chunks of a large array are
+        assembled without encoding the items again.
+
+        Args:
+            items (list): The encoded items.
+
+        Returns:
+            bytes: The encoded array.
+
+        Raises:
+            NotImplementedError: If the format cannot be assembled from encoded items.
+        """
+        raise NotImplementedError
+
+    def array_overhead(self, count):
+        """
+        Returns the bytes join_array() adds to `count` encoded items.
+        """
+        raise NotImplementedError
+
+    def loads(self, body):
+        raise NotImplementedError
+
+    def dumps(self, data):
+        raise NotImplementedError
+
+
+class JSONCodec(Codec):
+    name = 'json'
+    content_type = 'application/json'
+    media_types = ('application/json',)
+
+    def loads(self, body):
+        return json.loads(body.decode('utf-8'))
+
+    def dumps(self, data):
+        # The bytes requests produces for json=, so JSON deliveries look the same on the wire
+        return json.dumps(data, allow_nan=False).encode('utf-8')
+
+    def join_array(self, items):
+        return b'[' + b', '.join(items) + b']'
+
+    def array_overhead(self, count):
+        return 2 + 2 * max(count - 1, 0)
+
+
+class MessagePackCodec(Codec):
+    name = 'msgpack'
+    content_type = 'application/msgpack'
+    media_types = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+    module = 'msgpack'
+
+    def loads(self, body):
+        return self.lib.unpackb(body, raw=False)
+
+    def dumps(self, data):
+        return self.lib.packb(data, use_bin_type=True)
+
+    @staticmethod
+    def array_header(count):
+        if count < 16:
+            return bytes([0x90 | count])
+        if count < 1 << 16:
+            return b'\xdc' + count.to_bytes(2, 'big')
+        return b'\xdd' + count.to_bytes(4, 'big')
+
+    def join_array(self, items):
+        return self.array_header(len(items)) + b''.join(items)
+
+    def array_overhead(self, count):
+        return len(self.array_header(count))
+
+
+class CBORCodec(Codec):
+    name = 'cbor'
+    content_type = 'application/cbor'
+    media_types = ('application/cbor',)
+    module = 'cbor2'
+
+    def loads(self, body):
+        return self.lib.loads(body)
+
+    def dumps(self, data):
+        return self.lib.dumps(data)
+
+    @staticmethod
+    def array_header(count):
+        # Major type 4 with the length inline or in the following 1, 2, 4 or 8 bytes
+        if count < 24:
+            return bytes([0x80 | count])
+        for additional, size in ((24, 1), (25, 2), (26, 4), (27, 8)):
+            if count < 1 << (8 * size):
+                return bytes([0x80 | additional]) + count.to_bytes(size, 'big')
+
+    def join_array(self, items):
+        return self.array_header(len(items)) + b''.join(items)
+
+    def array_overhead(self, count):
+        return len(self.array_header(count))
+
+
+def media_type(header):
+    """
+    Returns the lowercased media type of a Content-Type or Accept entry, without parameters.
+    """
+    return (header or '').split(';', 1)[0].strip().lower()
+
+
+class CodecRegistry:
+    """
+    The codecs known to the process, by name and by media type.
+
+    JSON, MessagePack and CBOR are built in; codec classes listed by dotted path in the
+    CODECS setting are registered on first lookup, and register() adds codecs at runtime.
+    """
+
+    def __init__(self, codecs=()):
+        self.by_name = {}
+        self.by_media_type = {}
+        self.lock = threading.Lock()
+        self.configured = False
+        for codec in codecs:
+            self.register(codec)
+
+    def register(self, codec):
+        """
+        Registers a codec, replacing any codec with the same name or media types.
+
+        Args:
+            codec (Codec): The codec instance.
+
+        Returns:
+            Codec: The codec.
+        """
+        with self.lock:
+            self.by_name[codec.name] = codec
+            for media in codec.media_types:
+                self.by_media_type[media] = codec
+        return codec
+
+    def load_configured(self):
+        if self.configured:
+            return
+        self.configured = True
+        for path in getattr(settings, 'CODECS', None) or ():
+            self.register(import_string(path)())
+
+    def get(self, name):
+        """
+        Returns the codec registered under a name.
+
+        Raises:
+            LookupError: If no codec has that name.
+        """
+        self.load_configured()
+        try:
+            return self.by_name[name]
+        except KeyError:
+            raise LookupError(f"Unknown encoding: {name}") from None
+
+    def for_content_type(self, header):
+        """
+        Returns the codec decoding a Content-Type, or None if no codec accepts it.
+        """
+        self.load_configured()
+        return self.by_media_type.get(media_type(header))
+
+    def negotiate(self, accept):
+        """
+        Picks the response codec for an Accept header.
+
+        Media ranges are tried by decreasing quality; the first available codec wins and
+        JSON is used for wildcards, unknown types and a missing header.
+
+        Args:
+            accept (str): The Accept header.
+
+        Returns:
+            Codec: The codec to encode the response with.
+        """
+        self.load_configured()
+        default = self.by_name['json']
+        if not accept:
+            return default
+        ranges = []
+        for position, entry in enumerate(accept.split(',')):
+            quality = 1.0
+            for param in entry.split(';')[1:]:
+                key, _, value = param.partition('=')
+                if key.strip().lower() == 'q':
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            if quality > 0:
+                ranges.append((-quality, position, media_type(entry)))
+        for _, _, media in sorted(ranges):
+            if media in ('*/*', 'application/*'):
+                return default
+            codec = self.by_media_type.get(media)
+            if codec is not None and codec.available:
+                return codec
+        return default
+
+
+codecs = CodecRegistry([JSONCodec(), MessagePackCodec(), CBORCodec()])
+
+
+def validate_encoding(name):
+    """
+    Validate the outbound encoding of a destination.
+
+    Args:
+        name (str): A registered codec name.
+
+    Raises:
+        ValidationError: If the codec is unknown or its package is not installed.
+    """
+    try:
+        codec = codecs.get(name)
+    except LookupError as e:
+        raise ValidationError(str(e))
+    if not codec.available:
+        raise ValidationError(f"Encoding '{name}' requires the '{codec.module}' package.")
+
+
+def encoded_response(request, payload, status=200):
+    """
+    Returns a response encoded with the codec the request's Accept header asks for.
+
+    Args:
+        request (HttpRequest): The request being answered.
+        payload (dict): The response data.
+        status (int): The HTTP status.
+
+    Returns:
+        HttpResponse: A JsonResponse, or a response in the negotiated binary format.
+    """
+    codec = codecs.negotiate(request.headers.get('Accept'))
+    if codec.name == 'json':
+        return JsonResponse(payload, status=status)
+    return HttpResponse(codec.encode(payload), content_type=codec.content_type, status=status)
@@ -0,0 +1,433 @@
+import atexit
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import close_old_connections
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'day': 86400, 'week': 7 * 86400}
+PARTITION_NAME = re.compile(r'^deliveries-(day|week)-(\d{8})\.sqlite3$')
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS deliveries (
+        timestamp INTEGER NOT NULL,
+        account_id TEXT NOT NULL,
+        destination_id INTEGER NOT NULL,
+        url TEXT NOT NULL,
+        status_code INTEGER,
+        ok INTEGER NOT NULL,
+        latency_us INTEGER NOT NULL,
+        error TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS deliveries_account_time ON deliveries (account_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS deliveries_time ON deliveries (timestamp)",
+)
+COLUMNS = ('timestamp', 'account_id', 'destination_id', 'url', 'status_code', 'ok', 'latency_us', 'error')
+
+
+class PartitionManager:
+    """
+    Keeps delivery history in one SQLite file per day or week.
+
+    Partitions are named after their period and first day, so the partitions overlapping a
+    time range are found from the directory listing alone. Expiring history is a file unlink
+    per partition, however many rows it holds, instead of a DELETE that locks and bloats the
+    main database. Weekly partitions start on Mondays; all boundaries are in UTC.
+
+    Attributes:
+        directory (str): Where the partition files live.
+        period (str): 'day' or 'week', for new partitions.
+        retention (float): Seconds a partition is kept after it ends, or None to keep all.
+        ahead (int): Partitions created ahead of time, so writes never wait for a schema.
+    """
+
+    def __init__(self, directory, period=None, retention=None, ahead=None, clock=time.time):
+        """
+        Initializes the PartitionManager.
+
+        Args:
+            directory (str): Where the partition files live.
+            period (str): Defaults to settings.DELIVERY_HISTORY_PARTITION.
+            retention (float): Defaults to settings.DELIVERY_HISTORY_RETENTION_SECONDS.
+            ahead (int): Defaults to settings.DELIVERY_HISTORY_PARTITIONS_AHEAD.
+            clock (callable): Wall clock time source.
+
+        Raises:
+            ValueError: If the period is unknown.
+        """
+        self.directory = str(directory)
+        self.period = period or getattr(settings, 'DELIVERY_HISTORY_PARTITION', 'day')
+        if self.period not in PERIODS:
+            raise ValueError(f"Unknown partition period: {self.period}")
+        self.retention = retention if retention is not None else \
+            getattr(settings, 'DELIVERY_HISTORY_RETENTION_SECONDS', 30 * 86400)
+        self.ahead = ahead if ahead is not None else getattr(settings, 'DELIVERY_HISTORY_PARTITIONS_AHEAD', 2)
+        self.clock = clock
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def partition_start(self, seconds, period=None):
+        """
+        Returns the start of the partition holding a moment.
+
+        Args:
+            seconds (float): Epoch seconds.
+            period (str): Defaults to the manager's period.
+
+        Returns:
+            int: Epoch seconds of the partition start.
+        """
+        length = PERIODS[period or self.period]
+        # The epoch was a Thursday; shift so that weeks start on Mondays
+        offset = 3 * 86400 if length == PERIODS['week'] else 0
+        return int((seconds + offset) // length * length - offset)
+
+    def path(self, start, period=None):
+        day = datetime.fromtimestamp(start, dt_timezone.utc).strftime('%Y%m%d')
+        return os.path.join(self.directory, f'deliveries-{period or self.period}-{day}.sqlite3')
+
+    def partitions(self):
+        """
+        Lists the existing partitions in time order.
+
+        Returns:
+            list: (start, end, path) tuples in epoch seconds.
+        """
+        found = []
+        for name in os.listdir(self.directory):
+            match = PARTITION_NAME.match(name)
+            if match is None:
+                continue
+            period, day = match.groups()
+            start = int(datetime.strptime(day, '%Y%m%d').replace(tzinfo=dt_timezone.utc).timestamp())
+            found.append((start, start + PERIODS[period], os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def covering(self, since=None, until=None):
+        """
+        Returns the existing partitions overlapping a time range.
+
+        Args:
+            since (float): Start of the range in epoch seconds, or None for unbounded.
+            until (float): End of the range in epoch seconds, or None for unbounded.
+
+        Returns:
+            list: (start, end, path) tuples in time order.
+        """
+        return [
+            partition for partition in self.partitions()
+            if (since is None or partition[1] > since) and (until is None or partition[0] < until)
+        ]
+
+    def connect(self, path):
+        connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def create(self, start):
+        """
+        Creates the partition starting at `start` unless it exists.
+
+        Returns:
+            str: The partition path.
+        """
+        path = self.path(start)
+        if not os.path.exists(path):
+            with self.lock:
+                connection = self.connect(path)
+                try:
+                    for statement in SCHEMA:
+                        connection.execute(statement)
+                finally:
+                    connection.close()
+        return path
+
+    def create_ahead(self):
+        """
+        Creates the current partition and the next `ahead` ones.
+
+        Returns:
+            list: Paths of the partitions.
+        """
+        start = self.partition_start(self.clock())
+        length = PERIODS[self.period]
+        return [self.create(start + i * length) for i in range(self.ahead + 1)]
+
+    def drop_expired(self):
+        """
+        Deletes the partitions that ended more than `retention` seconds ago.
+
+        Returns:
+            list: Paths of the deleted partitions.
+        """
+        if self.retention is None:
+            return []
+        cutoff = self.clock() - self.retention
+        dropped = []
+        for start, end, path in self.partitions():
+            if end <= cutoff:
+                for suffix in ('', '-wal', '-shm'):
+                    try:
+                        os.unlink(path + suffix)
+                    except FileNotFoundError:
+                        pass
+                dropped.append(path)
+        return dropped
+
+    def maintain(self):
+        """
+        Creates upcoming partitions and drops expired ones.
+
+        Returns:
+            tuple: The paths created or kept ahead, and the paths dropped.
+        """
+        return self.create_ahead(), self.drop_expired()
+
+
+class DeliveryHistory:
+    """
+    Records every delivery attempt in the time partitions of a PartitionManager.
+
+    Attempts are buffered in memory and written by a background thread every `flush_interval`
+    seconds or once `max_pending` attempts are buffered, with one transaction per partition.
+    A timer flushes attempts that no later one comes to flush, and the process flushes at exit.
+    Attempts whose partition could not be written are put back to be retried by the next
+    flush, keeping at most `max_pending` of them. Queries only open the partitions overlapping
+    the requested range.
+    """
+
+    def __init__(self, partitions, flush_interval=None, max_pending=None, clock=time.time):
+        """
+        Initializes the DeliveryHistory.
+
+        Args:
+            partitions (PartitionManager): Where history is stored.
+            flush_interval (float): Defaults to settings.DELIVERY_HISTORY_FLUSH_INTERVAL.
+            max_pending (int): Defaults to settings.DELIVERY_HISTORY_MAX_PENDING.
+            clock (callable): Wall clock time source.
+        """
+        self.partitions = partitions
+        self.flush_interval = flush_interval or getattr(settings, 'DELIVERY_HISTORY_FLUSH_INTERVAL', 5)
+        self.max_pending = max_pending or getattr(settings, 'DELIVERY_HISTORY_MAX_PENDING', 5000)
+        self.clock = clock
+        self.pending = []
+        self.lock = threading.Lock()
+        self.flushing = False
+        self.flush_timer = None
+        self.next_flush = clock() + self.flush_interval
+        self.next_maintenance = 0
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self.discarded = 0
+
+    def record(self, account_id, destination_id, url, status_code, ok, latency, error=None, timestamp=None):
+        """
+        Buffers one delivery attempt.
+
+        Args:
+            account_id: The account's primary key.
+            destination_id (int): The destination's primary key.
+            url (str): The URL the attempt was sent to.
+            status_code (int): The response status, or None if the request failed.
+            ok (bool): Whether the destination accepted the delivery.
+            latency (float): Seconds the attempt took.
+            error (str): The error of a failed request.
+            timestamp (float): Epoch seconds of the attempt. Defaults to now.
+        """
+        now = self.clock()
+        row = (int((timestamp or now) * 1_000_000), str(account_id), destination_id, url, status_code, int(ok),
+               int(latency * 1_000_000), error)
+        with self.lock:
+            self.pending.append(row)
+            due = now >= self.next_flush or len(self.pending) >= self.max_pending
+            if not due:
+                self.schedule_flush(self.next_flush - now)
+        if due and not self.flushing:
+            self.flush_in_background()
+
+    def schedule_flush(self, delay):
+        """
+        Starts the flush timer, unless it is already running. Called with the lock held.
+
+        Args:
+            delay (float): Seconds until the flush.
+        """
+        if self.flush_timer is None:
+            self.flush_timer = threading.Timer(max(0, delay), self.flush_on_timer)
+            self.flush_timer.daemon = True
+            self.flush_timer.start()
+
+    def flush_on_timer(self):
+        with self.lock:
+            self.flush_timer = None
+        self.flush_in_background()
+
+    def flush_in_background(self):
+        with self.lock:
+            if self.flushing:
+                return
+            self.flushing = True
+
+        def target():
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+        threading.Thread(target=target, name='delivery-history-flush', daemon=True).start()
+
+    def flush(self):
+        """
+        Writes the buffered attempts to their partitions.
+
+        Errors are logged, and the attempts of the partitions that failed are put back.
+
+        Returns:
+            int: The number of attempts written.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, []
+            self.flushing = True
+        try:
+            now = self.clock()
+            if now >= self.next_maintenance:
+                try:
+                    self.partitions.maintain()
+                    self.next_maintenance = now + 3600
+                except Exception:
+                    logger.exception("Delivery history maintenance failed")
+            groups = {}
+            for row in pending:
+                groups.setdefault(self.partitions.partition_start(row[0] / 1_000_000), []).append(row)
+            written, failed = 0, []
+            cutoff = None if self.partitions.retention is None else now - self.partitions.retention
+            for start, rows in sorted(groups.items()):
+                if cutoff is not None and start + PERIODS[self.partitions.period] <= cutoff:
+                    self.dropped += len(rows)  # already expired
+                    continue
+                try:
+                    connection = self.partitions.connect(self.partitions.create(start))
+                    try:
+                        connection.execute('BEGIN')
+                        connection.executemany(
+                            f"INSERT INTO deliveries ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                            rows
+                        )
+                        connection.execute('COMMIT')
+                    finally:
+                        connection.close()
+                except Exception:
+                    logger.exception("Writing %d delivery attempts to the delivery history failed", len(rows))
+                    failed.extend(rows)
+                    continue
+                written += len(rows)
+            with self.lock:
+                self.written += written
+                if failed:
+                    self.write_errors += 1
+                    # Retried by the next flush, oldest first; beyond max_pending the oldest are given up
+                    retained = failed[-self.max_pending:] if len(failed) > self.max_pending else failed
+                    self.discarded += len(failed) - len(retained)
+                    self.pending[:0] = retained
+            return written
+        finally:
+            with self.lock:
+                self.flushing = False
+                self.next_flush = self.clock() + self.flush_interval
+                if self.pending:
+                    self.schedule_flush(self.flush_interval)
+
+    def query(self, account_id=None, destination_id=None, since=None, until=None, limit=None):
+        """
+        Yields recorded attempts in time order, reading only the partitions overlapping the range.
+
+        Args:
+            account_id: Only attempts of this account.
+            destination_id (int): Only attempts to this destination.
+            since (float): Only attempts at or after this time, in epoch seconds.
+            until (float): Only attempts before this time, in epoch seconds.
+            limit (int): Stop after this many attempts.
+
+        Yields:
+            dict: The attempt, with its timestamp as an aware datetime.
+        """
+        conditions, params = [], []
+        for column, operator, value in (
+            ('account_id', '=', None if account_id is None else str(account_id)),
+            ('destination_id', '=', destination_id),
+            ('timestamp', '>=', None if since is None else int(since * 1_000_000)),
+            ('timestamp', '<', None if until is None else int(until * 1_000_000)),
+        ):
+            if value is not None:
+                conditions.append(f'{column} {operator} ?')
+                params.append(value)
+        sql = f"SELECT {', '.join(COLUMNS)} FROM deliveries"
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY timestamp'
+        remaining = limit
+        for _, _, path in self.partitions.covering(since, until):
+            if remaining is not None and remaining <= 0:
+                return
+            connection = self.partitions.connect(path)
+            try:
+                rows = connection.execute(sql + ('' if remaining is None else f' LIMIT {int(remaining)}'), params)
+                for row in rows:
+                    item = dict(zip(COLUMNS, row))
+                    item['timestamp'] = datetime.fromtimestamp(item['timestamp'] / 1_000_000, dt_timezone.utc)
+                    item['ok'] = bool(item['ok'])
+                    item['latency_ms'] = item.pop('latency_us') / 1000
+                    if remaining is not None:
+                        remaining -= 1
+                    yield item
+            finally:
+                connection.close()
+
+    def collect(self):
+        """
+        Returns the delivery history metrics.
+
+        Returns:
+            list: Metric samples for the metrics registry.
+        """
+        return [
+            ('delivery_history_pending', 'gauge', "Delivery attempts waiting to be written.", {}, len(self.pending)),
+            ('delivery_history_written_total', 'counter', "Delivery attempts written.", {}, self.written),
+            ('delivery_history_expired_total', 'counter', "Delivery attempts discarded as already expired.", {},
+             self.dropped),
+            ('delivery_history_write_errors_total', 'counter', "Delivery history flushes that failed to write.", {},
+             self.write_errors),
+            ('delivery_history_discarded_total', 'counter', "Delivery attempts given up after failed writes.", {},
+             self.discarded),
+        ]
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_delivery_history():
+    """
+    Returns the process's delivery history, opening it on first use.
+
+    Returns:
+        DeliveryHistory: The history in settings.DELIVERY_HISTORY_DIR, or None if it is disabled.
+    """
+    global _history
+    directory = getattr(settings, 'DELIVERY_HISTORY_DIR', None)
+    if not directory:
+        return None
+    if _history is None:
+        with _history_lock:
+            if _history is None:
+                _history = DeliveryHistory(PartitionManager(directory))
+                registry.register(_history.collect)
+                atexit.register(_history.flush)
+    return _history
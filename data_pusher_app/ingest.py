@@ -0,0 +1,713 @@
+# The ingest path. This module must not import Django REST framework, the admin or anything
+# else the lean ingest profile (customerslabProject.settings_ingest) does not load. Optional
+# subsystems (chunking, the event log, delivery history, relaying, scheduling and routing
+# snapshots) are imported in the branches that use them, so disabled ones are never loaded.
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse, JsonResponse
+from django.urls import get_resolver
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST, require_http_methods
+from .admission import OverloadedError, admission_controller
+from .delivery import delivery_dispatcher, ordering_partition
+from .formats import codecs, encoded_response
+from .metrics import registry
+from .outbound import get_outbound_session
+from .models import Account, Delivery, Destination
+from .ratelimit import RateLimitExceeded, rate_limiter
+from .rollups import rollup_aggregator
+from .routing import routing_index_cache
+from .sharding import shard_map
+from .stats import destination_stats
+from .transforms import transform_cache
+import requests
+import json
+import time
+from functools import partial
+
+
+class AccountVerifier:
+    """
+    A class to verify account tokens.
+
+    Attributes:
+    ----------
+    token : str
+        The token to be verified.
+    """
+
+    def __init__(self, token):
+        """
+        Initializes the AccountVerifier with a token.
+
+        Parameters:
+        ----------
+        token : str
+            The token to be verified.
+        """
+        self.token = token
+
+    def verify_token(self):
+        """
+        Verifies the token and returns the associated account.
+
+        Returns:
+        -------
+        JsonResponse
+            A JSON response with an error message if unauthenticated or account not found.
+        Account
+            The account associated with the token if it exists.
+        """
+        if not self.token:
+            # Return an error response if the token is missing
+            return JsonResponse({'error': 'Unauthenticated'}, status=401)
+
+        try:
+            # Try to retrieve the account associated with the provided token from its shard
+            alias = shard_map.shard_of_token(self.token)
+            if alias is None:
+                raise Account.DoesNotExist
+            account = shard_map.manager(Account, alias).get(app_secret_token=self.token)
+            return account
+        except Account.DoesNotExist:
+            # Return an error response if the account does not exist
+            return JsonResponse({'error': 'Account not found'}, status=404)
+
+
+class JSONProcessor:
+    """
+    A class to process JSON data from a request body.
+
+    Attributes:
+    ----------
+    request_body : bytes
+        The request body containing JSON data.
+    """
+
+    def __init__(self, request_body):
+        """
+        Initializes the JSONProcessor with a request body.
+
+        Parameters:
+        ----------
+        request_body : bytes
+            The request body containing JSON data.
+        """
+        self.request_body = request_body
+
+    def parse_json(self):
+        """
+        Parses the JSON data from the request body.
+
+        Returns:
+        -------
+        dict
+            The parsed JSON data.
+        JsonResponse
+            A JSON response with an error message if the JSON format is invalid.
+        """
+        try:
+            # Attempt to decode and parse the JSON data from the request body
+            data = json.loads(self.request_body.decode('utf-8'))
+            return data
+        except json.JSONDecodeError:
+            # Return an error response if the JSON format is invalid
+            return JsonResponse({'error': 'Invalid JSON format'}, status=400)
+
+
+class DestinationHandler:
+    """
+    Handles processing and sending HTTP requests to multiple destinations associated with a given account.
+    
+    Attributes:
+        account (object): The account object used to filter destinations.
+        data (dict): The data to be sent in the HTTP requests.
+        destinations (list): The account's destinations if already known, e.g. from the routing snapshot.
+    """
+    def __init__(self, account, data, destinations=None):
+        """
+        Initializes the DestinationHandler with the given account and data.
+
+        Args:
+            account (object): The account object used to filter destinations.
+            data (dict): The data to be sent in the HTTP requests.
+            destinations (list): The account's destinations, to avoid loading them from the database.
+        """
+        self.account = account
+        self.data = data
+        self.destinations = destinations
+        # Transformed payloads of this event keyed by spec hash, shared by all its deliveries
+        self.payloads = {}
+        # Encoded bodies keyed by payload identity and codec name, so each encoding is produced once
+        self.bodies = {}
+
+    def load_destinations(self):
+        """
+        Retrieves all destinations associated with the account.
+
+        Returns:
+            QuerySet: The account's destinations.
+        """
+        if self.destinations is not None:
+            return self.destinations
+        return shard_map.manager(Destination, shard_map.shard_for(self.account)).filter(account=self.account)
+
+    def get_destinations(self):
+        """
+        Selects the destinations whose routing rules match the data.
+
+        The account's rules are compiled once per destinations version into a routing index,
+        so the destinations are only loaded from the database when they changed.
+
+        Returns:
+            list: The destinations the data must be sent to.
+        """
+        return routing_index_cache.get(self.account, self.load_destinations).match(self.data)
+
+    def process_destinations(self, destinations=None):
+        """
+        Processes the destinations of the account that match the data by sending HTTP requests
+        with the provided data and headers. 
+
+        Args:
+            destinations (list): The destinations to send to, if already selected. Defaults to the
+                destinations the data is routed to.
+
+        Returns:
+            list: A list of dictionaries containing the URL, response text, and status code for each destination.
+                  In case of an error, the dictionary will contain the URL and the error message.
+        """
+        # Retrieve the destinations associated with the account that the data is routed to
+        destinations = self.get_destinations() if destinations is None else destinations
+        responses = []
+        payloads = self.payloads
+
+        # Iterate through each destination and send an HTTP request
+        for destination in destinations:
+            started = time.perf_counter()
+            try:
+                # Load headers from JSON string if necessary; copy them since destinations are shared through the routing index
+                headers = json.loads(destination.headers) if isinstance(destination.headers, str) else dict(destination.headers)
+                # Encode the destination's payload once per outbound encoding and set its Content-Type
+                codec = codecs.get(getattr(destination, 'outbound_encoding', None) or 'json')
+                headers['Content-Type'] = codec.content_type
+                payload = self.get_payload(destination, payloads)
+                chunks = self.get_chunks(destination, payload, codec)
+                # Send the HTTP request with the destination's payload and store the response; events
+                # sharing an ordering key are sent one at a time
+                with delivery_dispatcher.ordering_lock(ordering_partition(destination, self.data)):
+                    if chunks is not None:
+                        outcome = self.send_chunks(destination, headers, payload, chunks)
+                    else:
+                        response = self.send_request(destination, headers, payload,
+                                                     self.get_body(destination, payload, codec))
+                if chunks is not None:
+                    ok = 'error' not in outcome and outcome['status_code'] < 400
+                    self._record_outcome(destination, started, ok, outcome.get('status_code'), outcome.get('error'))
+                    responses.append(outcome)
+                    continue
+                self._record_outcome(destination, started, response.status_code < 400, response.status_code)
+                responses.append({'url': destination.url, 'response': response.text, 'status_code': response.status_code})
+            except Exception as e:
+                # Handle any exceptions that occur during the request
+                self._record_outcome(destination, started, False, error=str(e))
+                responses.append({'url': destination.url, 'error': str(e)})
+        
+        return responses
+
+    def _record_outcome(self, destination, started, ok, status_code=None, error=None):
+        """
+        Records the latency and result of a delivery in the destination's rolling statistics and
+        rollups, and in the delivery history when it is enabled.
+
+        Args:
+            destination (object): The destination the request was sent to.
+            started (float): perf_counter() value taken before sending.
+            ok (bool): Whether the destination accepted the request.
+            status_code (int): The response status, if a response arrived.
+            error (str): The error of a failed request.
+        """
+        destination_id = getattr(destination, 'pk', None)
+        if destination_id is not None:
+            seconds = time.perf_counter() - started
+            account_id = getattr(destination, 'account_id', None)
+            destination_stats.record(destination_id, seconds, ok, account_id=account_id)
+            if account_id is not None:
+                rollup_aggregator.record(account_id, destination_id, seconds, ok)
+                if getattr(settings, 'DELIVERY_HISTORY_DIR', None):
+                    from .history import get_delivery_history
+
+                    get_delivery_history().record(account_id, destination_id, destination.url, status_code, ok, seconds,
+                                                  error)
+
+    def get_payload(self, destination, payloads):
+        """
+        Returns the payload for a destination, applying its transform if it has one.
+
+        Args:
+            destination (object): The destination the payload is sent to.
+            payloads (dict): Transformed payloads of the event keyed by spec hash, so that
+                destinations sharing a spec reuse the same output.
+
+        Returns:
+            The data to send.
+        """
+        key, transform = transform_cache.get(destination)
+        if key is None:
+            return self.data
+        if key not in payloads:
+            payloads[key] = transform(self.data)
+        return payloads[key]
+
+    def get_body(self, destination, payload, codec):
+        """
+        Returns the body sent to a destination.
+
+        Args:
+            destination (object): The destination the body is sent to.
+            payload: The destination's payload.
+            codec (Codec): The destination's outbound codec.
+
+        Returns:
+            bytes: The encoded payload, or None for GET destinations, which send query parameters.
+        """
+        if destination.http_method.lower() == 'get':
+            return None
+        return self.encode(payload, codec)
+
+    def encode(self, payload, codec):
+        """
+        Encodes a payload with a codec, only once per event.
+
+        Args:
+            payload: The data or one of its transformed payloads.
+            codec (Codec): The codec to encode with.
+
+        Returns:
+            bytes: The encoded payload.
+
+        Raises:
+            ValueError: If the payload cannot be represented in the codec's format.
+        """
+        # Payloads are held by the handler for its whole life, so their identity is a stable key
+        key = (id(payload), codec.name)
+        if key not in self.bodies:
+            self.bodies[key] = codec.encode(payload)
+        return self.bodies[key]
+
+    def get_chunks(self, destination, payload, codec):
+        """
+        Returns the bodies a payload larger than the destination's max_body_bytes is split into.
+
+        Payloads are split on the destination's split_array_path, each chunk carrying the rest
+        of the payload and as many consecutive items of the array as fit. Chunks are produced
+        once per event and shared by destinations with the same encoding, path and limit.
+
+        Args:
+            destination (object): The destination the payload is sent to.
+            payload: The destination's payload.
+            codec (Codec): The destination's outbound codec.
+
+        Returns:
+            list: The encoded chunks, or None if the payload is sent in one body.
+
+        Raises:
+            ValueError: If the payload is over the limit and cannot be split.
+        """
+        max_bytes = getattr(destination, 'max_body_bytes', None)
+        if not max_bytes or destination.http_method.lower() == 'get':
+            return None
+        # The whole body is encoded once per event either way, so payloads that fit are sent as is
+        body = self.encode(payload, codec)
+        if len(body) <= max_bytes:
+            return None
+        from .chunking import ArrayChunker
+
+        path = getattr(destination, 'split_array_path', None)
+        chunker = ArrayChunker(codec, max_bytes, path) if path else None
+        if chunker is None or not chunker.splittable(payload):
+            raise ValueError(f"Body of {len(body)} bytes exceeds max_body_bytes ({max_bytes}).")
+        key = (id(payload), codec.name, path, max_bytes)
+        if key not in self.bodies:
+            self.bodies[key] = list(chunker.chunks(payload))
+        return self.bodies[key]
+
+    def send_chunks(self, destination, headers, payload, chunks):
+        """
+        Sends every chunk of a payload and aggregates the results into one outcome.
+
+        A delivery fails as a whole when any chunk fails, and its retry sends every chunk again,
+        including those already accepted: receivers of chunked payloads get them at least once.
+
+        Args:
+            destination (object): The destination the chunks are sent to.
+            headers (dict): The headers to include in each request.
+            payload: The destination's payload.
+            chunks (list): The encoded chunks, sent in order.
+
+        Returns:
+            dict: The URL, the number of chunks and of failed chunks, and either the first
+            error raised or the response with the highest status code.
+        """
+        worst, error, failed = None, None, 0
+        for index, chunk in enumerate(chunks):
+            try:
+                response = self.send_request(destination, headers, payload, chunk)
+            except Exception as e:
+                failed += 1
+                error = error or f"Chunk {index + 1} of {len(chunks)}: {e}"
+                continue
+            failed += response.status_code >= 400
+            if worst is None or response.status_code > worst.status_code:
+                worst = response
+        outcome = {'url': destination.url, 'chunks': len(chunks), 'failed_chunks': failed}
+        if error is not None:
+            outcome['error'] = error
+        else:
+            outcome.update(response=worst.text, status_code=worst.status_code)
+        return outcome
+
+    def send_request(self, destination, headers, data=None, body=None):
+        """
+        Sends an HTTP request to the specified destination with the provided headers and data.
+
+        Args:
+            destination (object): The destination object containing the URL and HTTP method.
+            headers (dict): The headers to include in the HTTP request.
+            data: The payload to send. Defaults to the handler's data.
+            body (bytes): The payload already encoded, sent as is instead of encoding data as JSON.
+
+        Returns:
+            Response: The HTTP response object.
+        """
+        data = self.data if data is None else data
+        http = self.get_http_client()
+        # Check the HTTP method and send the request accordingly
+        if destination.http_method.lower() == 'get':
+            return http.get(destination.url, headers=headers, params=data)
+        elif body is not None:
+            return http.request(method=destination.http_method.lower(), url=destination.url, headers=headers, data=body)
+        else:
+            return http.request(method=destination.http_method.lower(), url=destination.url, headers=headers, json=data)
+
+    def get_http_client(self):
+        """
+        Returns the client deliveries are sent with.
+
+        Returns:
+            The thread's pooled session resolving hosts through the DNS cache if it is enabled,
+            otherwise the requests module.
+        """
+        session = get_outbound_session()
+        return session if session is not None else requests
+
+
+class RelayHandler(DestinationHandler):
+    """
+    Streams a spooled request body unchanged to the account's destinations.
+
+    Relayed bodies are never decoded, so only destinations that forward the raw event can
+    receive them: destinations with routing rules, a transform, a binary outbound encoding or a
+    body size limit, and GET destinations, which send the event as query parameters, are
+    reported as skipped.
+
+    Attributes:
+        spool (file): The validated request body.
+    """
+    def __init__(self, account, spool, destinations=None):
+        """
+        Initializes the RelayHandler.
+
+        Args:
+            account (object): The account object used to filter destinations.
+            spool (file): The validated request body.
+            destinations (list): The account's destinations, to avoid loading them from the database.
+        """
+        super().__init__(account, None, destinations)
+        self.spool = spool
+
+    @staticmethod
+    def relayable(destination):
+        return (destination.http_method.lower() != 'get' and not destination.routing_rules and not destination.transform
+                and (getattr(destination, 'outbound_encoding', None) or 'json') == 'json'
+                and not getattr(destination, 'max_body_bytes', None))
+
+    def get_destinations(self):
+        return [destination for destination in self.load_destinations() if self.relayable(destination)]
+
+    def process_destinations(self):
+        responses = super().process_destinations()
+        for destination in self.load_destinations():
+            if not self.relayable(destination):
+                responses.append({'url': destination.url, 'error': 'Skipped: large payloads are relayed unparsed'})
+        return responses
+
+    def get_payload(self, destination, payloads):
+        # Every destination reads the body from the start of the file
+        self.spool.seek(0)
+        return self.spool
+
+    def get_body(self, destination, payload, codec):
+        return None
+
+    def get_chunks(self, destination, payload, codec):
+        return None
+
+    def send_request(self, destination, headers, data=None, body=None):
+        return self.get_http_client().request(method=destination.http_method.lower(), url=destination.url,
+                                              headers=headers, data=data)
+
+
+def store_deliveries(account, destinations, data, available_at=None):
+    """
+    Stores one durable delivery of an event per destination on the account's shard.
+
+    Args:
+        account (Account): The account the event belongs to.
+        destinations (list): The destinations the event is routed to.
+        data: The decoded event.
+        available_at (datetime): When the deliveries are due. Defaults to now. Scheduled
+            deliveries are left out of ordering partitions: a pending one would block the
+            later events of its partition until it is due.
+
+    Returns:
+        tuple: The shard alias and the stored deliveries.
+    """
+    alias = shard_map.shard_for(account)
+    if available_at is None:
+        deliveries = [
+            Delivery(account=account, destination=destination, payload=data,
+                     ordering_partition=(ordering_partition(destination, data) or (None, None))[1])
+            for destination in destinations
+        ]
+    else:
+        deliveries = [
+            Delivery(account=account, destination=destination, payload=data, available_at=available_at)
+            for destination in destinations
+        ]
+    deliveries = shard_map.manager(Delivery, alias).bulk_create(deliveries)
+    return alias, deliveries
+
+
+def content_length(request):
+    """
+    Returns the declared size of the request body without reading it.
+
+    Args:
+        request (HttpRequest): The incoming HTTP request.
+
+    Returns:
+        int: The Content-Length header value, or 0 if absent or malformed.
+    """
+    try:
+        return max(0, int(request.headers.get('Content-Length') or 0))
+    except ValueError:
+        return 0
+
+
+def resolve_account(token):
+    """
+    Looks up the account of a token for the rate limiter, from the routing snapshot or the database.
+
+    Args:
+        token (str): The app secret token.
+
+    Returns:
+        Account: The account, or None if the token belongs to none.
+    """
+    if getattr(settings, 'ROUTING_SNAPSHOT_PATH', None):
+        from .snapshot import routing_snapshots
+
+        route = routing_snapshots.lookup(token)
+        if route is not None:
+            return route[0]
+    try:
+        account = AccountVerifier(token).verify_token()
+    except ValidationError:
+        return None
+    return None if isinstance(account, JsonResponse) else account
+
+
+@csrf_exempt
+@require_POST
+def incoming_data(request):
+    """
+    Handles incoming POST requests containing JSON data.
+
+    This function verifies the account token from request headers, processes the 
+    JSON data from the request body, and handles the data based on the verified account.
+    Requests beyond the process or per-account in-flight budget are rejected with 429
+    and a Retry-After header instead of queueing, as are requests over the account's rate limits.
+    Bodies whose Content-Type names a binary format such as MessagePack or CBOR are decoded
+    with its codec, and responses are encoded in the format the Accept header asks for.
+
+    Args:
+        request (HttpRequest): The incoming HTTP request.
+
+    Returns:
+        HttpResponse: A response containing the processed data or an error message.
+    """
+    token = request.headers.get('CL-X-TOKEN')
+    try:
+        # Enforce the account's request and byte rates; the database is only consulted when no
+        # worker has resolved the token's limits recently
+        if token:
+            rate_limiter.check(token, content_length(request), partial(resolve_account, token))
+
+        # Bodies without a registered Content-Type keep being read as JSON
+        codec = codecs.for_content_type(request.headers.get('Content-Type')) or codecs.get('json')
+        if not codec.available:
+            return encoded_response(request, {'error': f"Unsupported Content-Type: {codec.content_type}"}, status=415)
+        # When the event should be delivered, if it is held back
+        deliver_at = None
+        if 'CL-X-DELIVER-AT' in request.headers or 'CL-X-DELAY' in request.headers:
+            from .scheduling import parse_schedule
+
+            try:
+                deliver_at = parse_schedule(request.headers)
+            except ValueError as e:
+                return encoded_response(request, {'error': str(e)}, status=400)
+
+        with admission_controller.admit():
+            # Resolve the token from the routing snapshot, falling back to the database
+            route = None
+            if token and getattr(settings, 'ROUTING_SNAPSHOT_PATH', None):
+                from .snapshot import routing_snapshots
+
+                route = routing_snapshots.lookup(token)
+            if route is not None:
+                account, destinations = route
+            else:
+                # Verify the account token from request headers
+                verifier = AccountVerifier(token)
+                account = verifier.verify_token()
+                if isinstance(account, JsonResponse):
+                    return account
+                destinations = None
+            rate_limiter.remember(token, account)
+
+            with admission_controller.admit(account.pk):
+                # Relay large bodies from a temporary file instead of decoding them in memory; queued
+                # modes store or queue the decoded event so that it gets leases and retries
+                delivery_mode = getattr(settings, 'DELIVERY_MODE', 'sync')
+                relay_threshold = getattr(settings, 'RELAY_THRESHOLD_BYTES', None)
+                if (relay_threshold and codec.name == 'json' and deliver_at is None and delivery_mode == 'sync'
+                        and content_length(request) > relay_threshold):
+                    from .relay import spool_json
+
+                    try:
+                        spool = spool_json(request)
+                    except ValueError:
+                        return encoded_response(request, {'error': 'Invalid JSON format'}, status=400)
+                    with spool:
+                        # The spooled body is valid JSON, so it is logged as it is, like decoded JSON bodies
+                        if getattr(settings, 'EVENT_LOG_DIR', None):
+                            from .eventlog import get_event_log
+
+                            get_event_log().append_file(account.pk, spool)
+                            spool.seek(0)
+                        responses = RelayHandler(account, spool, destinations).process_destinations()
+                    return encoded_response(request, {'responses': responses})
+
+                if codec.name == 'json':
+                    # Parse JSON data from the request body
+                    processor = JSONProcessor(request.body)
+                    data = processor.parse_json()
+                    if isinstance(data, JsonResponse):
+                        return data
+                else:
+                    try:
+                        data = codec.decode(request.body)
+                    except ValueError:
+                        return encoded_response(request, {'error': f'Invalid {codec.name} format'}, status=400)
+
+                # Handle the data based on the verified account; destinations using the request's
+                # encoding without a transform are sent the received body unchanged
+                handler = DestinationHandler(account, data, destinations)
+                handler.bodies[(id(data), codec.name)] = request.body
+
+                # Keep the event in the event log, when enabled, for delivery workers and replay; the
+                # log holds JSON, so binary bodies are logged with the encoding JSON destinations reuse
+                if getattr(settings, 'EVENT_LOG_DIR', None):
+                    from .eventlog import get_event_log
+
+                    try:
+                        get_event_log().append(account.pk, handler.encode(data, codecs.get('json')))
+                    except ValueError as e:
+                        return encoded_response(request, {'error': str(e)}, status=400)
+                if deliver_at is not None:
+                    # Store the deliveries for later and hand them to this process's scheduler, if it runs
+                    from .scheduling import get_delivery_scheduler
+
+                    alias, deliveries = store_deliveries(account, handler.get_destinations(), data, deliver_at)
+                    scheduler = get_delivery_scheduler()
+                    if scheduler is not None:
+                        scheduler.schedule(alias, [delivery.pk for delivery in deliveries], deliver_at)
+                    return encoded_response(request, {'status': 'scheduled', 'deliveries': len(deliveries),
+                                                      'deliver_at': deliver_at.isoformat()}, status=202)
+                if delivery_mode == 'durable':
+                    # Store one delivery per destination for the delivery workers of all nodes
+                    _, deliveries = store_deliveries(account, handler.get_destinations(), data)
+                    return encoded_response(request, {'status': 'queued', 'deliveries': len(deliveries)}, status=202)
+                if delivery_mode == 'async':
+                    # Queue one delivery per destination; workers send them fairly across accounts
+                    routed = handler.get_destinations()
+                    for destination in routed:
+                        delivery_dispatcher.submit(account, partial(handler.process_destinations, [destination]),
+                                                   ordering_partition(destination, data))
+                    return encoded_response(request, {'status': 'queued', 'deliveries': len(routed)}, status=202)
+                responses = handler.process_destinations()
+
+                # Return a response containing the processed data
+                return encoded_response(request, {'responses': responses})
+
+    except (OverloadedError, RateLimitExceeded) as e:
+        # Shed load early and tell the client when to come back
+        response = encoded_response(request, {'error': str(e)}, status=429)
+        response['Retry-After'] = str(e.retry_after)
+        return response
+    
+    except ValueError as e:
+        # Return a response with a 401 status code for ValueError
+        return encoded_response(request, {'error': str(e)}, status=401)
+    
+    except LookupError as e:
+        # Return a response with a 404 status code for LookupError
+        return encoded_response(request, {'error': str(e)}, status=404)
+    
+    except Exception as e:
+        # Return a response with a 500 status code for any other exceptions
+        return encoded_response(request, {'error': str(e)}, status=500)
+
+
+@require_http_methods(["GET"])
+def metrics_view(request):
+    """
+    A view exposing the process's live metrics in the Prometheus text format.
+
+    Args:
+        request (HttpRequest): The request object.
+
+    Returns:
+        HttpResponse: The rendered metrics.
+    """
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4')
+
+
+def warm_up():
+    """
+    Prepares the ingest path before the first request.
+
+    Resolves the URLconf and maps the routing snapshot, so that a freshly started worker
+    serves its first request as fast as the following ones, and starts the delivery scheduler
+    when it is enabled, reloading the scheduled deliveries due soon.
+    """
+    get_resolver().url_patterns
+    if getattr(settings, 'ROUTING_SNAPSHOT_PATH', None):
+        from .snapshot import routing_snapshots
+
+        routing_snapshots.current()
+    if getattr(settings, 'DELIVERY_SCHEDULER', False):
+        from .scheduling import get_delivery_scheduler
+
+        get_delivery_scheduler()
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from data_pusher_app.snapshot import SnapshotWriter
+
+
+class Command(BaseCommand):
+    """
+    Compiles all accounts, tokens and destinations into the memory-mapped routing snapshot.
+    """
+    help = "Build the routing snapshot used by ingest workers to serve without database lookups."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="Snapshot path. Defaults to settings.ROUTING_SNAPSHOT_PATH.")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Rows fetched per cursor round trip.")
+
+    def handle(self, *args, **options):
+        path = options['output'] or getattr(settings, 'ROUTING_SNAPSHOT_PATH', None)
+        if not path:
+            raise CommandError("No output path given and settings.ROUTING_SNAPSHOT_PATH is not set.")
+        version, count = SnapshotWriter(path, chunk_size=options['chunk_size']).write()
+        self.stdout.write(self.style.SUCCESS(f"Wrote routing snapshot version {version} with {count} accounts to {path}."))
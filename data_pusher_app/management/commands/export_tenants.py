@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from data_pusher_app.export import TenantExporter, parse_export_filters
+
+
+class Command(BaseCommand):
+    """
+    Streams accounts and destinations as NDJSON to a file or standard output.
+    """
+    help = "Export accounts and destinations as NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', help="Only export this account ID and its destinations.")
+        parser.add_argument('--modified-since', help="Only export rows saved at or after this ISO 8601 datetime.")
+        parser.add_argument('--kinds', help="Comma-separated record kinds to export (accounts,destinations).")
+        parser.add_argument('--chunk-size', type=int, help="Rows fetched per cursor round trip.")
+        parser.add_argument('--output', help="Output file. Defaults to standard output.")
+
+    def handle(self, *args, **options):
+        try:
+            filters = parse_export_filters({
+                'account': options['account'],
+                'modified_since': options['modified_since'],
+                'kinds': options['kinds'],
+            })
+            exporter = TenantExporter(chunk_size=options['chunk_size'], **filters)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.writelines(exporter.iter_lines())
+        else:
+            for line in exporter.iter_lines():
+                self.stdout.write(line, ending='')
@@ -0,0 +1,136 @@
+import csv
+import json
+import os
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from data_pusher_app.bulk import BulkAccountProcessor, BulkDestinationProcessor
+
+
+class Command(BaseCommand):
+    """
+    Streams accounts or destinations from a CSV or NDJSON file into the database.
+
+    Records are read lazily and processed in fixed-size chunks, so memory stays constant
+    regardless of the file size. Each chunk is validated in memory, checked for uniqueness
+    with set-based queries and inserted with bulk_create. After every committed chunk the
+    number of consumed records is written to a checkpoint file, from which an interrupted
+    import resumes.
+    """
+    help = "Stream-import accounts or destinations from a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Path of the CSV or NDJSON file to import.")
+        parser.add_argument('--kind', choices=('accounts', 'destinations'), required=True,
+                            help="Type of the records in the file.")
+        parser.add_argument('--format', choices=('csv', 'ndjson'),
+                            help="Input format. Inferred from the file extension when omitted.")
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Number of records validated and inserted together.")
+        parser.add_argument('--checkpoint',
+                            help="Checkpoint file recording progress. Defaults to <path>.checkpoint.")
+        parser.add_argument('--restart', action='store_true',
+                            help="Ignore an existing checkpoint and import from the first record.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"File not found: {path}")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be positive.")
+        input_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        checkpoint_path = options['checkpoint'] or f"{path}.checkpoint"
+        start = 0 if options['restart'] else self.read_checkpoint(checkpoint_path, path)
+
+        if options['kind'] == 'accounts':
+            processor = BulkAccountProcessor()
+        else:
+            processor = BulkDestinationProcessor(max_items=options['chunk_size'])
+
+        with open(path, newline='', encoding='utf-8') as source:
+            records = self.read_records(source, input_format, options['kind'])
+            if start:
+                self.stdout.write(f"Resuming after record {start}.")
+                records = islice(records, start, None)
+
+            position, created, failed = start, 0, 0
+            while True:
+                chunk = list(islice(records, options['chunk_size']))
+                if not chunk:
+                    break
+                result = processor.create(chunk)
+                for error in result['errors']:
+                    self.stderr.write(f"Record {position + error['index'] + 1}: {json.dumps(error['errors'])}")
+                position += len(chunk)
+                created += len(result['created'])
+                failed += len(result['errors'])
+                self.write_checkpoint(checkpoint_path, path, position)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {created} {options['kind']} ({failed} rejected, {position} records read)."
+        ))
+
+    def read_records(self, source, input_format, kind):
+        """
+        Lazily yields the records of the file as dictionaries.
+
+        Args:
+            source (file): The open input file.
+            input_format (str): Either 'csv' or 'ndjson'.
+            kind (str): Either 'accounts' or 'destinations'.
+
+        Yields:
+            dict: One record per input row or line. Rows that cannot be decoded are yielded
+            as records with an unknown field so that they are reported by the processor.
+        """
+        if input_format == 'csv':
+            for row in csv.DictReader(source):
+                row = {key: value for key, value in row.items() if key is not None and value not in (None, '')}
+                if kind == 'destinations' and 'headers' in row:
+                    try:
+                        row['headers'] = json.loads(row['headers'])
+                    except json.JSONDecodeError:
+                        row['invalid_headers_json'] = row.pop('headers')
+                yield row
+            return
+
+        for line in source:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = {'invalid_json_line': line}
+            yield record if isinstance(record, dict) else {'invalid_json_line': line}
+
+    def read_checkpoint(self, checkpoint_path, path):
+        """
+        Reads the number of records already imported from the checkpoint file.
+
+        Args:
+            checkpoint_path (str): Path of the checkpoint file.
+            path (str): Path of the input file the checkpoint must belong to.
+
+        Returns:
+            int: The number of records to skip.
+        """
+        if not os.path.exists(checkpoint_path):
+            return 0
+        with open(checkpoint_path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('path') != os.path.abspath(path):
+            raise CommandError(f"Checkpoint {checkpoint_path} belongs to another file; use --restart.")
+        return checkpoint.get('records', 0)
+
+    def write_checkpoint(self, checkpoint_path, path, records):
+        """
+        Atomically records the number of consumed records.
+
+        Args:
+            checkpoint_path (str): Path of the checkpoint file.
+            path (str): Path of the input file.
+            records (int): Number of records processed so far.
+        """
+        temp_path = f"{checkpoint_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'path': os.path.abspath(path), 'records': records}, f)
+        os.replace(temp_path, checkpoint_path)
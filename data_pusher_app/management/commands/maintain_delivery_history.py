@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from data_pusher_app.history import PartitionManager
+
+
+class Command(BaseCommand):
+    """
+    Creates upcoming delivery history partitions and deletes expired ones.
+    """
+    help = "Create delivery history partitions ahead of time and drop partitions past their retention."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', help="History directory. Defaults to settings.DELIVERY_HISTORY_DIR.")
+        parser.add_argument('--ahead', type=int, help="Partitions to create ahead. Defaults to settings.DELIVERY_HISTORY_PARTITIONS_AHEAD.")
+        parser.add_argument('--retention', type=float, help="Seconds to keep. Defaults to settings.DELIVERY_HISTORY_RETENTION_SECONDS.")
+
+    def handle(self, *args, **options):
+        directory = options['directory'] or getattr(settings, 'DELIVERY_HISTORY_DIR', None)
+        if not directory:
+            raise CommandError("No directory given and settings.DELIVERY_HISTORY_DIR is not set.")
+        partitions = PartitionManager(directory, retention=options['retention'], ahead=options['ahead'])
+        created, dropped = partitions.maintain()
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(created)} partitions ready, {len(dropped)} expired partitions dropped in {directory}."
+        ))
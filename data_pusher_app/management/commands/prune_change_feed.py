@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from data_pusher_app.changes import change_feed
+
+
+class Command(BaseCommand):
+    """
+    Applies the change feed retention policy by deleting old changes.
+    """
+    help = "Delete change feed entries older than the retention period."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=float,
+                            help="Seconds to retain. Defaults to settings.CHANGE_FEED_RETENTION_SECONDS.")
+
+    def handle(self, *args, **options):
+        deleted = change_feed.prune(max_age=options['max_age'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} change feed entries."))
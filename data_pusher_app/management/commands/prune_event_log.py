@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from data_pusher_app.eventlog import EventLog
+
+
+class Command(BaseCommand):
+    """
+    Applies the event log retention policy by deleting old sealed segments.
+    """
+    help = "Delete event log segments older than the retention period or beyond the retained size."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', help="Event log directory. Defaults to settings.EVENT_LOG_DIR.")
+        parser.add_argument('--max-age', type=float, help="Seconds to retain. Defaults to settings.EVENT_LOG_RETENTION_SECONDS.")
+        parser.add_argument('--max-bytes', type=int, help="Bytes to retain. Defaults to settings.EVENT_LOG_RETENTION_BYTES.")
+
+    def handle(self, *args, **options):
+        directory = options['directory'] or getattr(settings, 'EVENT_LOG_DIR', None)
+        if not directory:
+            raise CommandError("No directory given and settings.EVENT_LOG_DIR is not set.")
+        max_age = options['max_age'] if options['max_age'] is not None else \
+            getattr(settings, 'EVENT_LOG_RETENTION_SECONDS', None)
+        max_bytes = options['max_bytes'] if options['max_bytes'] is not None else \
+            getattr(settings, 'EVENT_LOG_RETENTION_BYTES', None)
+        event_log = EventLog(directory)
+        try:
+            deleted = event_log.apply_retention(max_age=max_age, max_bytes=max_bytes)
+        finally:
+            event_log.close()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {len(deleted)} event log segments from {directory}."))
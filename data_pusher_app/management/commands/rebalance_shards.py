@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from data_pusher_app.sharding import ShardRebalancer, get_shards
+
+
+class Command(BaseCommand):
+    """
+    Moves accounts to the tenant shard their ID hashes to under settings.TENANT_SHARDS.
+    """
+    help = "Move accounts, with their destinations, deliveries and statistics, to their tenant shards."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drain', action='append', default=[],
+                            help="Database alias no longer in TENANT_SHARDS to move accounts off. Repeatable.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report how many accounts would move.")
+
+    def handle(self, *args, **options):
+        unknown = [alias for alias in get_shards() + options['drain'] if alias not in connections.settings]
+        if unknown:
+            raise CommandError(f"Unknown database aliases: {', '.join(unknown)}.")
+        counts = ShardRebalancer(drain=options['drain'], dry_run=options['dry_run']).run()
+        verb = "Would move" if options['dry_run'] else "Moved"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {counts['moved']} accounts; {counts['in_place']} already on their shard."
+        ))
@@ -0,0 +1,35 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from data_pusher_app.replay import EventReplay, get_replay_account, parse_replay_options
+
+
+class Command(BaseCommand):
+    """
+    Re-delivers an account's stored events from the event log, pausing while the ingest
+    workers are busy as reported through the rate limiter's counter store.
+    """
+    help = "Replay an account's stored events to all or selected destinations."
+
+    def add_arguments(self, parser):
+        parser.add_argument('account', help="The account ID.")
+        parser.add_argument('--since', help="Only replay events received at or after this ISO 8601 datetime.")
+        parser.add_argument('--until', help="Only replay events received before this ISO 8601 datetime.")
+        parser.add_argument('--destinations', help="Comma-separated destination IDs. Defaults to all.")
+        parser.add_argument('--rate', type=float, help="Events per second per destination.")
+        parser.add_argument('--nice', type=int, default=10, help="Scheduling niceness added to this process.")
+
+    def handle(self, *args, **options):
+        try:
+            account = get_replay_account(options['account'])
+            replay = EventReplay(account, **parse_replay_options(options))
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+        if options['nice'] and hasattr(os, 'nice'):
+            # Leave the CPU to the workers serving live traffic
+            os.nice(options['nice'])
+        replay.run()
+        if replay.status == 'failed':
+            raise CommandError(f"Replay failed after {replay.events} events: {replay.error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {replay.events} events: {replay.deliveries} delivered, {replay.failures} failed."
+        ))
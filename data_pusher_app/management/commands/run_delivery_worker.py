@@ -0,0 +1,35 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, close_old_connections
+from data_pusher_app.metrics import registry
+from data_pusher_app.workers import DeliveryWorker
+
+
+class Command(BaseCommand):
+    """
+    Runs a durable delivery worker; start one or more per node.
+    """
+    help = "Claim and send durable deliveries until interrupted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', help="Worker name used in lease tokens. Defaults to host and process ID.")
+        parser.add_argument('--batch-size', type=int, help="Deliveries claimed at a time.")
+        parser.add_argument('--lease-seconds', type=float, help="Lease duration, extended while sending.")
+        parser.add_argument('--idle-sleep', type=float, default=1.0, help="Seconds to wait when nothing is claimable.")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help="Tenant shard to send deliveries of.")
+        parser.add_argument('--once', action='store_true', help="Process a single batch and exit.")
+
+    def handle(self, *args, **options):
+        worker = DeliveryWorker(name=options['name'], batch_size=options['batch_size'],
+                                lease_seconds=options['lease_seconds'], database=options['database'])
+        registry.register(worker.collect)
+        while True:
+            try:
+                processed = worker.run_once()
+            finally:
+                close_old_connections()
+            if options['once']:
+                self.stdout.write(self.style.SUCCESS(f"Processed {processed} deliveries."))
+                return
+            if not processed:
+                time.sleep(options['idle_sleep'])
@@ -0,0 +1,62 @@
+import threading
+
+
+class MetricsRegistry:
+    """
+    A minimal registry of metric collectors rendered in the Prometheus text format.
+
+    Components register a collector, a callable returning samples, so values are read live
+    when the metrics endpoint is scraped instead of being pushed on every change.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty registry.
+        """
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def register(self, collector):
+        """
+        Registers a collector.
+
+        Args:
+            collector (callable): Returns an iterable of (name, type, help, labels, value) tuples.
+
+        Returns:
+            callable: The collector, so that the method can be used as a decorator.
+        """
+        with self.lock:
+            self.collectors.append(collector)
+        return collector
+
+    def collect(self):
+        """
+        Collects the current samples of all registered collectors.
+
+        Returns:
+            list: (name, type, help, labels, value) tuples.
+        """
+        with self.lock:
+            collectors = list(self.collectors)
+        return [sample for collector in collectors for sample in collector()]
+
+    def render(self):
+        """
+        Renders all samples in the Prometheus text exposition format.
+
+        Returns:
+            str: The rendered metrics.
+        """
+        lines, described = [], set()
+        for name, metric_type, help_text, labels, value in self.collect():
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+            label_text = ','.join(f'{key}="{value_}"' for key, value_ in sorted(labels.items()))
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-19 02:23
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_pusher_app', '0002_alter_account_app_secret_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='destinations_version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='destination',
+            name='http_method',
+            field=models.CharField(choices=[('GET', 'GET'), ('POST', 'POST'), ('PUT', 'PUT'), ('DELETE', 'DELETE')], max_length=10, validators=[django.core.validators.RegexValidator(message='Invalid HTTP method', regex='^(GET|POST|PUT|DELETE)$')]),
+        ),
+        migrations.AlterField(
+            model_name='destination',
+            name='url',
+            field=models.URLField(validators=[django.core.validators.URLValidator()]),
+        ),
+    ]
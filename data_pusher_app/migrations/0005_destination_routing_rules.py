@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-19 02:27
+
+import data_pusher_app.routing
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_pusher_app', '0004_account_updated_at_destination_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='destination',
+            name='routing_rules',
+            field=models.JSONField(blank=True, null=True, validators=[data_pusher_app.routing.validate_routing_rules]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-19 02:28
+
+import data_pusher_app.transforms
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_pusher_app', '0005_destination_routing_rules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='destination',
+            name='transform',
+            field=models.JSONField(blank=True, null=True, validators=[data_pusher_app.transforms.validate_transform_spec]),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-19 02:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_pusher_app', '0006_destination_transform'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='ingest_byte_rate_limit',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='ingest_rate_limit',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
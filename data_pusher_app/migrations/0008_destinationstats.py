@@ -0,0 +1,31 @@
+# Generated by Django 5.0.6 on 2026-10-19 02:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_pusher_app', '0007_account_ingest_rate_limits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DestinationStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window_start', models.DateTimeField(db_index=True)),
+                ('window_seconds', models.PositiveIntegerField()),
+                ('deliveries', models.PositiveBigIntegerField(default=0)),
+                ('errors', models.PositiveBigIntegerField(default=0)),
+                ('max_latency_us', models.PositiveBigIntegerField(default=0)),
+                ('buckets', models.JSONField(blank=True, default=dict)),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='data_pusher_app.destination')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='destinationstats',
+            constraint=models.UniqueConstraint(fields=('destination', 'window_start'), name='unique_destination_stats_window'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-19 02:42
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_pusher_app', '0008_destinationstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='delivery_priority',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='delivery_weight',
+            field=models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
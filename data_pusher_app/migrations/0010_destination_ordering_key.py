@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-19 02:43
+
+import data_pusher_app.routing
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_pusher_app', '0009_account_delivery_scheduling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='destination',
+            name='ordering_key',
+            field=models.CharField(blank=True, max_length=255, null=True, validators=[data_pusher_app.routing.validate_field_path]),
+        ),
+    ]
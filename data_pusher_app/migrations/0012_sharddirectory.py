@@ -0,0 +1,21 @@
+# Generated by Django 5.0.6 on 2026-10-19 02:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_pusher_app', '0011_delivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardDirectory',
+            fields=[
+                ('account_id', models.UUIDField(primary_key=True, serialize=False)),
+                ('app_secret_token', models.UUIDField(unique=True)),
+                ('shard', models.CharField(max_length=100)),
+            ],
+        ),
+    ]
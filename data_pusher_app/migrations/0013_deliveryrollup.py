@@ -0,0 +1,36 @@
+# Generated by Django 5.0.6 on 2026-10-19 02:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_pusher_app', '0012_sharddirectory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], max_length=6)),
+                ('bucket_start', models.DateTimeField()),
+                ('deliveries', models.PositiveBigIntegerField(default=0)),
+                ('errors', models.PositiveBigIntegerField(default=0)),
+                ('latency_sum_us', models.PositiveBigIntegerField(default=0)),
+                ('max_latency_us', models.PositiveBigIntegerField(default=0)),
+                ('buckets', models.JSONField(blank=True, default=dict)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='data_pusher_app.account')),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='data_pusher_app.destination')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['account', 'granularity', 'bucket_start'], name='rollup_account_idx'), models.Index(fields=['granularity', 'bucket_start'], name='rollup_retention_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='deliveryrollup',
+            constraint=models.UniqueConstraint(fields=('destination', 'granularity', 'bucket_start'), name='unique_delivery_rollup'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-19 02:57
+
+import data_pusher_app.formats
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_pusher_app', '0013_deliveryrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='destination',
+            name='outbound_encoding',
+            field=models.CharField(default='json', max_length=20, validators=[data_pusher_app.formats.validate_encoding]),
+        ),
+    ]
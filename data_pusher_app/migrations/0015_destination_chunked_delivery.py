@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-19 03:00
+
+import data_pusher_app.routing
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_pusher_app', '0014_destination_outbound_encoding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='destination',
+            name='max_body_bytes',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='destination',
+            name='split_array_path',
+            field=models.CharField(blank=True, max_length=255, null=True, validators=[data_pusher_app.routing.validate_field_path]),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.6 on 2026-10-19 03:14
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+def create_sequence(apps, schema_editor):
+    ChangeSequence = apps.get_model('data_pusher_app', 'ChangeSequence')
+    if schema_editor.connection.alias == 'default':
+        ChangeSequence.objects.using('default').get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_pusher_app', '0015_destination_chunked_delivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('seq', models.PositiveBigIntegerField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('account', 'Account'), ('destination', 'Destination')], max_length=20)),
+                ('object_id', models.CharField(max_length=64)),
+                ('account_id', models.UUIDField(db_index=True)),
+                ('operation', models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete')], max_length=10)),
+                ('data', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-19 03:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_sequence(apps, schema_editor):
+    # Start after the highest destination ID of any shard, whose own counters may overlap
+    if schema_editor.connection.alias != 'default':
+        return
+    Destination = apps.get_model('data_pusher_app', 'Destination')
+    DestinationSequence = apps.get_model('data_pusher_app', 'DestinationSequence')
+    highest = max(Destination.objects.using(alias).aggregate(highest=models.Max('pk'))['highest'] or 0
+                  for alias in getattr(settings, 'TENANT_SHARDS', None) or ['default'])
+    DestinationSequence.objects.using('default').get_or_create(pk=1, defaults={'value': highest})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_pusher_app', '0016_change_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DestinationSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:03
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_pusher_app', '0017_destinationsequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardChange',
+            fields=[
+                ('position', models.PositiveBigIntegerField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('account', 'Account'), ('destination', 'Destination')], max_length=20)),
+                ('object_id', models.CharField(max_length=64)),
+                ('account_id', models.UUIDField()),
+                ('operation', models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete')], max_length=10)),
+                ('data', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShardChangeCursor',
+            fields=[
+                ('shard', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('position', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShardChangeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -30,9 +30,17 @@
 
 
 
-from django.db import models
+from functools import partial
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, models, transaction
+from django.db.models import F, Max
+from django.utils import timezone
 from django.core.exceptions import ValidationError
-from django.core.validators import URLValidator, RegexValidator
+from django.core.validators import MinValueValidator, URLValidator, RegexValidator
+from .formats import validate_encoding
+from .routing import validate_field_path, validate_routing_rules
+from .sharding import get_shards, shard_map
+from .transforms import validate_transform_spec
 import uuid
 
 def generate_app_secret_token():
@@ -54,12 +62,24 @@ class Account(models.Model):
         account_name (CharField): The name of the account, limited to 100 characters.
         app_secret_token (UUIDField): The unique, secure secret token for the account.
         website (URLField): An optional URL field for the account's website.
+        destinations_version (PositiveBigIntegerField): Counter bumped on every change to the account's destinations.
+        updated_at (DateTimeField): When the account was last saved.
+        ingest_rate_limit (PositiveIntegerField): Optional ingest requests allowed per rate limit window.
+        ingest_byte_rate_limit (PositiveBigIntegerField): Optional ingest bytes allowed per rate limit window.
+        delivery_weight (PositiveIntegerField): Share of queued delivery capacity relative to other accounts.
+        delivery_priority (PositiveSmallIntegerField): Priority tier; queued deliveries of higher tiers are sent first.
     """
     email_id = models.EmailField(unique=True)
     account_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     account_name = models.CharField(max_length=100)
     app_secret_token = models.UUIDField(default=generate_app_secret_token, unique=True, editable=False)
     website = models.URLField(blank=True, null=True)
+    destinations_version = models.PositiveBigIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    ingest_rate_limit = models.PositiveIntegerField(blank=True, null=True)
+    ingest_byte_rate_limit = models.PositiveBigIntegerField(blank=True, null=True)
+    delivery_weight = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
+    delivery_priority = models.PositiveSmallIntegerField(default=0)
 
     def clean(self):
         """
@@ -79,8 +99,61 @@ class Account(models.Model):
             *args: Variable length argument list.
             **kwargs: Arbitrary keyword arguments.
         """
+        if kwargs.get('update_fields') is not None and not kwargs['update_fields']:
+            # Like Model.save(), an empty update_fields saves nothing, so there is no change to record
+            return
         self.full_clean()  # Call the full_clean method before saving to run all validations
-        super().save(*args, **kwargs)  # Call the real save method
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never write back a possibly stale destinations_version; it is only bumped atomically
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'destinations_version'
+            ]
+        adding = self._state.adding
+        if adding and len(get_shards()) > 1:
+            # Manager.create() passes the default database; new accounts belong on their shard
+            kwargs['using'] = shard_map.shard_of(self.pk)
+        alias = kwargs.get('using') or self._state.db or DEFAULT_DB_ALIAS
+        # The change is recorded in the transaction of the write, on the row's shard, so the feed
+        # follows commit order
+        with transaction.atomic(using=alias):
+            super().save(*args, **kwargs)  # Call the real save method
+            if adding and len(get_shards()) > 1:
+                shard_map.record(self)
+            ChangeEvent.record(ChangeEvent.upserts([self]), using=alias)
+
+    def delete(self, *args, **kwargs):
+        """
+        Override the delete method to drop the account from the shard directory and record
+        tombstones for it and its cascaded destinations.
+        """
+        account_id, token, alias = self.pk, self.app_secret_token, self._state.db
+        destination_ids = list(
+            Destination.objects.using(alias).filter(account_id=account_id).values_list('pk', flat=True)
+        )
+        with transaction.atomic(using=alias):
+            result = super().delete(*args, **kwargs)
+            ChangeEvent.record(
+                ChangeEvent.tombstones(Destination, [(pk, account_id) for pk in destination_ids])
+                + ChangeEvent.tombstones(Account, [(account_id, account_id)]),
+                using=alias,
+            )
+        if len(get_shards()) > 1:
+            ShardDirectory.objects.filter(account_id=account_id).delete()
+            shard_map.forget(account_id, token)
+        return result
+
+    @classmethod
+    def bump_destinations_version(cls, *account_ids):
+        """
+        Atomically increment the destinations version of the given accounts.
+
+        Args:
+            *account_ids: The primary keys of the accounts whose destinations changed.
+        """
+        account_ids = {account_id for account_id in account_ids if account_id is not None}
+        for alias, ids in shard_map.group(account_ids).items():
+            cls.objects.using(alias).filter(pk__in=ids).update(destinations_version=F('destinations_version') + 1)
 
     def __str__(self):
         """
@@ -102,6 +175,13 @@ class Destination(models.Model):
         url (URLField): The URL of the destination, validated to ensure it is properly formatted.
         http_method (CharField): The HTTP method to be used for this destination, validated to be one of GET, POST, PUT, or DELETE.
         headers (JSONField): Any additional headers to be used in requests to the destination.
+        routing_rules (JSONField): Optional rules an event must all match to be routed to the destination.
+        transform (JSONField): Optional declarative spec reshaping the payload sent to the destination.
+        ordering_key (CharField): Optional dot-separated path of an event field; events with equal values are delivered in order.
+        outbound_encoding (CharField): Name of the codec payloads are encoded with, e.g. 'json', 'msgpack' or 'cbor'.
+        max_body_bytes (PositiveIntegerField): Optional largest body the destination accepts.
+        split_array_path (CharField): Optional dot-separated path of an array larger payloads are split on into chunks.
+        updated_at (DateTimeField): When the destination was last saved.
     """
     account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='destinations')
     url = models.URLField(validators=[URLValidator()])  # Ensure the URL is valid
@@ -111,6 +191,22 @@ class Destination(models.Model):
         validators=[RegexValidator(regex='^(GET|POST|PUT|DELETE)$', message='Invalid HTTP method')]
     )
     headers = models.JSONField()
+    routing_rules = models.JSONField(blank=True, null=True, validators=[validate_routing_rules])
+    transform = models.JSONField(blank=True, null=True, validators=[validate_transform_spec])
+    ordering_key = models.CharField(max_length=255, blank=True, null=True, validators=[validate_field_path])
+    outbound_encoding = models.CharField(max_length=20, default='json', validators=[validate_encoding])
+    max_body_bytes = models.PositiveIntegerField(blank=True, null=True)
+    split_array_path = models.CharField(max_length=255, blank=True, null=True, validators=[validate_field_path])
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember the account the instance was loaded with so that moving it bumps both accounts' versions.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_account_id = instance.__dict__.get('account_id')
+        return instance
 
     def clean(self):
         """
@@ -121,6 +217,11 @@ class Destination(models.Model):
         """
         if 'localhost' in self.url:
             raise ValidationError("URL cannot contain 'localhost'.")
+        if self.split_array_path and not self.max_body_bytes:
+            raise ValidationError("split_array_path requires max_body_bytes.")
+        if not self._state.adding and len(get_shards()) > 1 and shard_map.shard_of(self.account_id) != self._state.db:
+            # The row stays on its shard when saved, where the new account does not exist
+            raise ValidationError("A destination cannot move to an account on another shard.")
 
     def save(self, *args, **kwargs):
         """
@@ -134,10 +235,46 @@ class Destination(models.Model):
             **kwargs: Arbitrary keyword arguments.
         """
         self.full_clean()  # Call the full_clean method before saving to run all validations
-        try:
-            super().save(*args, **kwargs)  # Call the real save method
-        except Exception as e:
-            raise ValidationError(f"Error saving Destination: {str(e)}")
+        if self._state.adding and len(get_shards()) > 1:
+            # Manager.create() passes the default database; new rows belong on the account's shard
+            kwargs['using'] = shard_map.shard_of(self.account_id)
+        previous_account_id = getattr(self, '_loaded_account_id', None)
+        alias = kwargs.get('using') or self._state.db or DEFAULT_DB_ALIAS
+        # As in Account.save, the change commits with the write
+        with transaction.atomic(using=alias):
+            if self._state.adding and self.pk is None:
+                # IDs come from one sequence, so they are unique across shards
+                self.pk = DestinationSequence.allocate(1)[0]
+                kwargs['force_insert'] = True
+            try:
+                super().save(*args, **kwargs)  # Call the real save method
+            except Exception as e:
+                raise ValidationError(f"Error saving Destination: {str(e)}")
+            Account.bump_destinations_version(self.account_id, previous_account_id)
+            changes = ChangeEvent.upserts([self])
+            if previous_account_id is not None and previous_account_id != self.account_id:
+                # Readers following only the previous account see the destination leave it
+                changes = ChangeEvent.tombstones(Destination, [(self.pk, previous_account_id)]) + changes
+            ChangeEvent.record(changes, using=alias)
+        self._loaded_account_id = self.account_id
+
+    def delete(self, *args, **kwargs):
+        """
+        Delete the model instance and bump the owning account's destinations version.
+
+        Args:
+            *args: Variable length argument list.
+            **kwargs: Arbitrary keyword arguments.
+
+        Returns:
+            tuple: The number of objects deleted and a dictionary with the number of deletions per object type.
+        """
+        account_id, pk, alias = self.account_id, self.pk, self._state.db
+        with transaction.atomic(using=alias):
+            result = super().delete(*args, **kwargs)
+            Account.bump_destinations_version(account_id)
+            ChangeEvent.record(ChangeEvent.tombstones(Destination, [(pk, account_id)]), using=alias)
+        return result
 
     def __str__(self):
         """
@@ -148,3 +285,431 @@ class Destination(models.Model):
         """
         return f"Destination for {self.account.account_name} ({self.url})"
 
+
+
+class DestinationStats(models.Model):
+    """
+    Delivery statistics of a destination over one time slot, merged from all worker processes.
+
+    Attributes:
+        destination (ForeignKey): The destination the statistics belong to.
+        window_start (DateTimeField): Start of the time slot.
+        window_seconds (PositiveIntegerField): Length of the time slot.
+        deliveries (PositiveBigIntegerField): Deliveries attempted in the slot.
+        errors (PositiveBigIntegerField): Deliveries that failed.
+        max_latency_us (PositiveBigIntegerField): Slowest delivery in microseconds.
+        buckets (JSONField): Sparse latency histogram mapping bucket index to count.
+    """
+    destination = models.ForeignKey(Destination, on_delete=models.CASCADE, related_name='stats')
+    window_start = models.DateTimeField(db_index=True)
+    window_seconds = models.PositiveIntegerField()
+    deliveries = models.PositiveBigIntegerField(default=0)
+    errors = models.PositiveBigIntegerField(default=0)
+    max_latency_us = models.PositiveBigIntegerField(default=0)
+    buckets = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['destination', 'window_start'], name='unique_destination_stats_window'),
+        ]
+
+    def __str__(self):
+        return f"Stats for destination {self.destination_id} at {self.window_start}"
+
+
+class DeliveryRollup(models.Model):
+    """
+    Delivery counters of a destination over one minute, hour or day, merged from all worker processes.
+
+    Attributes:
+        account (ForeignKey): The account the destination belongs to.
+        destination (ForeignKey): The destination.
+        granularity (CharField): 'minute', 'hour' or 'day'.
+        bucket_start (DateTimeField): Start of the bucket, in UTC.
+        deliveries (PositiveBigIntegerField): Deliveries attempted in the bucket.
+        errors (PositiveBigIntegerField): Deliveries that failed.
+        latency_sum_us (PositiveBigIntegerField): Sum of the delivery latencies in microseconds.
+        max_latency_us (PositiveBigIntegerField): Slowest delivery in microseconds.
+        buckets (JSONField): Sparse latency histogram mapping bucket index to count.
+    """
+    MINUTE = 'minute'
+    HOUR = 'hour'
+    DAY = 'day'
+
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='rollups')
+    destination = models.ForeignKey(Destination, on_delete=models.CASCADE, related_name='rollups')
+    granularity = models.CharField(max_length=6, choices=((MINUTE, 'Minute'), (HOUR, 'Hour'), (DAY, 'Day')))
+    bucket_start = models.DateTimeField()
+    deliveries = models.PositiveBigIntegerField(default=0)
+    errors = models.PositiveBigIntegerField(default=0)
+    latency_sum_us = models.PositiveBigIntegerField(default=0)
+    max_latency_us = models.PositiveBigIntegerField(default=0)
+    buckets = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['destination', 'granularity', 'bucket_start'], name='unique_delivery_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['account', 'granularity', 'bucket_start'], name='rollup_account_idx'),
+            models.Index(fields=['granularity', 'bucket_start'], name='rollup_retention_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} rollup for destination {self.destination_id} at {self.bucket_start}"
+
+
+class Delivery(models.Model):
+    """
+    A durable delivery of an event to a destination, claimed by delivery workers through leases.
+
+    Attributes:
+        account (ForeignKey): The account the event belongs to.
+        destination (ForeignKey): The destination to deliver to.
+        payload (JSONField): The event.
+        ordering_partition (IntegerField): The destination's ordering partition of the event, if it has an ordering key.
+        status (CharField): 'pending', 'delivered' or 'failed'.
+        attempts (PositiveIntegerField): Number of times the delivery was claimed.
+        available_at (DateTimeField): When the delivery may be claimed next.
+        lease_owner (CharField): Token of the worker batch holding the delivery.
+        lease_expires_at (DateTimeField): When the lease runs out and the delivery may be reclaimed.
+        last_status_code (PositiveIntegerField): Status code of the last attempt.
+        last_error (TextField): Error of the last failed attempt.
+        created_at (DateTimeField): When the delivery was queued.
+        completed_at (DateTimeField): When the delivery succeeded or finally failed.
+    """
+    PENDING = 'pending'
+    DELIVERED = 'delivered'
+    FAILED = 'failed'
+
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='deliveries')
+    destination = models.ForeignKey(Destination, on_delete=models.CASCADE, related_name='deliveries')
+    payload = models.JSONField()
+    ordering_partition = models.IntegerField(blank=True, null=True)
+    status = models.CharField(
+        max_length=10, default=PENDING,
+        choices=((PENDING, 'Pending'), (DELIVERED, 'Delivered'), (FAILED, 'Failed')),
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    lease_owner = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    lease_expires_at = models.DateTimeField(blank=True, null=True)
+    last_status_code = models.PositiveIntegerField(blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='delivery_claimable_idx'),
+            models.Index(fields=['destination', 'ordering_partition', 'status'], name='delivery_ordering_idx'),
+        ]
+
+    def __str__(self):
+        return f"Delivery {self.pk} to destination {self.destination_id} ({self.status})"
+
+
+class ShardDirectory(models.Model):
+    """
+    Records which tenant shard holds an account; kept on the default database.
+
+    Attributes:
+        account_id (UUIDField): The account ID.
+        app_secret_token (UUIDField): The account's app secret token, for ingest lookups.
+        shard (CharField): The database alias of the shard.
+    """
+    account_id = models.UUIDField(primary_key=True)
+    app_secret_token = models.UUIDField(unique=True)
+    shard = models.CharField(max_length=100)
+
+    def __str__(self):
+        return f"{self.account_id} on {self.shard}"
+
+
+class DestinationSequence(models.Model):
+    """
+    Holds the last destination ID handed out; kept on the default database.
+
+    Destinations of different accounts live on different tenant shards, whose own auto-increment
+    counters would hand out the same IDs. Destination IDs are taken from this single row instead,
+    so an ID names one destination across all shards and stays with it when its account moves.
+
+    Attributes:
+        value (PositiveBigIntegerField): The last destination ID used.
+    """
+    value = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def allocate(cls, count):
+        """
+        Reserves destination IDs.
+
+        The row is created by the migration, or on first use after the table was emptied, starting
+        after the highest ID found on any shard.
+
+        Args:
+            count (int): The number of IDs.
+
+        Returns:
+            range: The reserved IDs.
+        """
+        with transaction.atomic(using=DEFAULT_DB_ALIAS, savepoint=False):
+            sequence = cls.objects.using(DEFAULT_DB_ALIAS)
+            if not sequence.filter(pk=1).update(value=F('value') + count):
+                highest = max(Destination.objects.using(alias).aggregate(highest=Max('pk'))['highest'] or 0
+                              for alias in get_shards())
+                sequence.get_or_create(pk=1, defaults={'value': highest})
+                sequence.filter(pk=1).update(value=F('value') + count)
+            last = sequence.values_list('value', flat=True).get(pk=1)
+        return range(last - count + 1, last + 1)
+
+    def __str__(self):
+        return f"Destination sequence at {self.value}"
+
+
+class ChangeSequence(models.Model):
+    """
+    Holds the last sequence number handed out to the change feed; kept on the default database.
+
+    Writers increment the single row before inserting their changes, which locks it until their
+    transaction ends, so sequence numbers are contiguous and become visible in order.
+
+    Attributes:
+        value (PositiveBigIntegerField): The last sequence number used.
+    """
+    value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Change sequence at {self.value}"
+
+
+class ChangeEvent(models.Model):
+    """
+    An entry of the change feed of accounts and destinations; kept on the default database.
+
+    Changes are recorded in the transaction writing the row, so the feed follows commit order.
+    Rows on other tenant shards cannot share a transaction with the default database: their
+    changes are staged in the shard's ShardChange outbox by that transaction and published to
+    the feed after it commits, in the shard's commit order. Changes of one row therefore appear
+    in the order they were committed, and a change is never lost once its row is committed.
+    Changes of different shards are interleaved in the order they are published.
+
+    Attributes:
+        seq (PositiveBigIntegerField): The position in the feed, without gaps.
+        kind (CharField): 'account' or 'destination'.
+        object_id (CharField): The primary key of the changed row.
+        account_id (UUIDField): The account the row belongs to.
+        operation (CharField): 'upsert' or 'delete'.
+        data (JSONField): The row's field values after an upsert; null for deletes.
+        created_at (DateTimeField): When the change was recorded.
+    """
+    ACCOUNT = 'account'
+    DESTINATION = 'destination'
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    KIND_CHOICES = ((ACCOUNT, 'Account'), (DESTINATION, 'Destination'))
+    OPERATION_CHOICES = ((UPSERT, 'Upsert'), (DELETE, 'Delete'))
+
+    seq = models.PositiveBigIntegerField(primary_key=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.CharField(max_length=64)
+    account_id = models.UUIDField(db_index=True)
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    data = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    @staticmethod
+    def kind_of(model):
+        """
+        Returns the change kind of Account or Destination rows.
+        """
+        return ChangeEvent.ACCOUNT if issubclass(model, Account) else ChangeEvent.DESTINATION
+
+    @classmethod
+    def upserts(cls, instances):
+        """
+        Builds the changes recording the current state of saved accounts or destinations.
+
+        The destinations version is left out: it is only bumped in the database, so the
+        in-memory value may be stale.
+
+        Args:
+            instances (iterable): Saved Account or Destination instances.
+
+        Returns:
+            list: Unsaved ChangeEvent instances.
+        """
+        changes = []
+        for instance in instances:
+            account_id = instance.pk if isinstance(instance, Account) else instance.account_id
+            data = {
+                field.attname: field.value_from_object(instance) for field in instance._meta.concrete_fields
+                if field.name != 'destinations_version'
+            }
+            changes.append(cls(kind=cls.kind_of(type(instance)), object_id=str(instance.pk), account_id=account_id,
+                               operation=cls.UPSERT, data=data))
+        return changes
+
+    @classmethod
+    def tombstones(cls, model, rows):
+        """
+        Builds the changes recording deleted accounts or destinations.
+
+        Args:
+            model (type): Account or Destination.
+            rows (iterable): Pairs of primary key and account ID of the deleted rows.
+
+        Returns:
+            list: Unsaved ChangeEvent instances.
+        """
+        kind = cls.kind_of(model)
+        return [cls(kind=kind, object_id=str(pk), account_id=account_id, operation=cls.DELETE) for pk, account_id in rows]
+
+    @classmethod
+    def record(cls, changes, using=DEFAULT_DB_ALIAS):
+        """
+        Appends changes to the feed with the next sequence numbers and wakes up waiting readers once committed.
+
+        Args:
+            changes (list): Unsaved ChangeEvent instances, in the order they happened.
+            using (str): The database holding the changed rows. Changes of other databases than
+                the default one are staged in that database's outbox and published once committed.
+        """
+        from .changes import change_feed
+
+        if not changes:
+            return
+        if using != DEFAULT_DB_ALIAS:
+            with transaction.atomic(using=using, savepoint=False):
+                positions = ShardChangeSequence.allocate(len(changes), using)
+                ShardChange.objects.using(using).bulk_create([
+                    ShardChange(position=position, kind=change.kind, object_id=change.object_id,
+                                account_id=change.account_id, operation=change.operation, data=change.data)
+                    for position, change in zip(positions, changes)
+                ])
+                transaction.on_commit(partial(cls.publish, using), using=using)
+            return
+        with transaction.atomic(using=DEFAULT_DB_ALIAS, savepoint=False):
+            if not ChangeSequence.objects.filter(pk=1).update(value=F('value') + len(changes)):
+                ChangeSequence.objects.get_or_create(pk=1)
+                ChangeSequence.objects.filter(pk=1).update(value=F('value') + len(changes))
+            last = ChangeSequence.objects.values_list('value', flat=True).get(pk=1)
+            for seq, change in enumerate(changes, start=last - len(changes) + 1):
+                change.seq = seq
+            cls.objects.bulk_create(changes)
+        transaction.on_commit(change_feed.notify, using=DEFAULT_DB_ALIAS)
+
+    @classmethod
+    def publish(cls, alias):
+        """
+        Appends the committed changes staged in a shard's outbox to the feed, in the shard's commit order.
+
+        Writers publish after each commit; the change feed also publishes before reading, which
+        picks up changes whose writer stopped between its commit and publishing them.
+
+        Args:
+            alias (str): The shard's database alias.
+
+        Returns:
+            int: The number of changes published.
+        """
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            ShardChangeCursor.objects.get_or_create(shard=alias)
+            # Serializes publishers of the shard, so that no change is published twice
+            cursor = ShardChangeCursor.objects.select_for_update().get(shard=alias)
+            staged = list(ShardChange.objects.using(alias).filter(position__gt=cursor.position).order_by('position'))
+            if not staged:
+                return 0
+            cls.record([
+                cls(kind=change.kind, object_id=change.object_id, account_id=change.account_id,
+                    operation=change.operation, data=change.data)
+                for change in staged
+            ])
+            cursor.position = staged[-1].position
+            cursor.save(update_fields=['position'])
+        # Rows left behind by a crash here are skipped by the cursor and deleted by the next publish
+        ShardChange.objects.using(alias).filter(position__lte=cursor.position).delete()
+        return len(staged)
+
+    def as_dict(self):
+        """
+        Returns the change as it is served by the feed.
+        """
+        return {'seq': self.seq, 'type': self.kind, 'op': self.operation, 'id': self.object_id,
+                'account_id': str(self.account_id), 'data': self.data}
+
+    def __str__(self):
+        return f"Change {self.seq}: {self.operation} {self.kind} {self.object_id}"
+
+
+class ShardChangeSequence(models.Model):
+    """
+    Holds the last outbox position handed out on a tenant shard; kept on each shard.
+
+    Like ChangeSequence, the row stays locked until the writer's transaction ends, so positions
+    are contiguous and become visible in commit order.
+
+    Attributes:
+        value (PositiveBigIntegerField): The last position used.
+    """
+    value = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def allocate(cls, count, using):
+        """
+        Reserves outbox positions on a shard.
+
+        Args:
+            count (int): The number of positions.
+            using (str): The shard's database alias.
+
+        Returns:
+            range: The reserved positions.
+        """
+        with transaction.atomic(using=using, savepoint=False):
+            sequence = cls.objects.using(using)
+            if not sequence.filter(pk=1).update(value=F('value') + count):
+                sequence.get_or_create(pk=1)
+                sequence.filter(pk=1).update(value=F('value') + count)
+            last = sequence.values_list('value', flat=True).get(pk=1)
+        return range(last - count + 1, last + 1)
+
+    def __str__(self):
+        return f"Shard change sequence at {self.value}"
+
+
+class ShardChange(models.Model):
+    """
+    A change of an account or destination on a tenant shard other than the default database,
+    waiting in the shard's outbox to be published to the change feed (see ChangeEvent.record).
+
+    Attributes:
+        position (PositiveBigIntegerField): The position in the shard's outbox, without gaps.
+        kind, object_id, account_id, operation, data: As in ChangeEvent.
+        created_at (DateTimeField): When the change was staged.
+    """
+    position = models.PositiveBigIntegerField(primary_key=True)
+    kind = models.CharField(max_length=20, choices=ChangeEvent.KIND_CHOICES)
+    object_id = models.CharField(max_length=64)
+    account_id = models.UUIDField()
+    operation = models.CharField(max_length=10, choices=ChangeEvent.OPERATION_CHOICES)
+    data = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Staged change {self.position}: {self.operation} {self.kind} {self.object_id}"
+
+
+class ShardChangeCursor(models.Model):
+    """
+    The last outbox position of a tenant shard published to the change feed; kept on the default database.
+
+    Attributes:
+        shard (CharField): The shard's database alias.
+        position (PositiveBigIntegerField): The last published position.
+    """
+    shard = models.CharField(max_length=100, primary_key=True)
+    position = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.shard} published up to {self.position}"
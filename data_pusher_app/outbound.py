@@ -0,0 +1,271 @@
+import socket
+import threading
+import time
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
+from django.conf import settings
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NameResolutionError
+from .metrics import registry
+
+
+class DNSCache:
+    """
+    An in-process cache of resolved host addresses.
+
+    Answers are cached for `ttl` seconds. Past that, an answer is still served for up to
+    `stale_ttl` more seconds while a background refresh runs (stale-while-revalidate), so a
+    slow or failing resolver does not stall deliveries. Hosts hit at least `hot_hits` times
+    since their last resolution are refreshed in the background during the last
+    `refresh_ahead` seconds of their TTL, so busy hosts never expire at all. Failed lookups are
+    cached for `negative_ttl` seconds. The system resolver does not report record TTLs, so the
+    configured TTL applies to all hosts.
+    """
+
+    def __init__(self, ttl=None, stale_ttl=None, negative_ttl=None, refresh_ahead=None, hot_hits=None,
+                 max_entries=None, resolver=socket.getaddrinfo, clock=time.monotonic):
+        """
+        Initializes the DNSCache.
+
+        Args:
+            ttl (float): Seconds an answer is fresh. Defaults to settings.DNS_CACHE_TTL.
+            stale_ttl (float): Seconds an expired answer may still be served. Defaults to settings.DNS_CACHE_STALE_TTL.
+            negative_ttl (float): Seconds a failed lookup is cached. Defaults to settings.DNS_CACHE_NEGATIVE_TTL.
+            refresh_ahead (float): Seconds before expiry in which hot hosts are refreshed. Defaults to settings.DNS_CACHE_REFRESH_AHEAD.
+            hot_hits (int): Hits after which a host counts as hot. Defaults to settings.DNS_CACHE_HOT_HITS.
+            max_entries (int): Maximum number of cached hosts. Defaults to settings.DNS_CACHE_MAX_ENTRIES.
+            resolver (callable): A getaddrinfo-compatible resolver.
+            clock (callable): Monotonic time source.
+        """
+        self.ttl = ttl if ttl is not None else getattr(settings, 'DNS_CACHE_TTL', 60)
+        self.stale_ttl = stale_ttl if stale_ttl is not None else getattr(settings, 'DNS_CACHE_STALE_TTL', 300)
+        self.negative_ttl = negative_ttl if negative_ttl is not None else getattr(settings, 'DNS_CACHE_NEGATIVE_TTL', 10)
+        self.refresh_ahead = refresh_ahead if refresh_ahead is not None else \
+            getattr(settings, 'DNS_CACHE_REFRESH_AHEAD', 10)
+        self.hot_hits = hot_hits or getattr(settings, 'DNS_CACHE_HOT_HITS', 10)
+        self.max_entries = max_entries or getattr(settings, 'DNS_CACHE_MAX_ENTRIES', 4096)
+        self.resolver = resolver
+        self.clock = clock
+        self.entries = OrderedDict()  # (host, port) -> [addresses or error, expires, hits]
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        self.lookups = {'hit': 0, 'miss': 0, 'stale': 0, 'negative': 0}
+        self.refreshes = 0
+        self.failures = 0
+
+    def query(self, host, port):
+        """
+        Asks the resolver for the addresses of a host.
+
+        Returns:
+            list: The distinct addresses, in resolver order.
+        """
+        addresses = []
+        for _, _, _, _, sockaddr in self.resolver(host, port, 0, socket.SOCK_STREAM):
+            if sockaddr[0] not in addresses:
+                addresses.append(sockaddr[0])
+        return addresses
+
+    def store(self, key, answer):
+        ttl = self.negative_ttl if isinstance(answer, Exception) else self.ttl
+        with self.lock:
+            self.entries[key] = [answer, self.clock() + ttl, 0]
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def fetch(self, key):
+        """
+        Resolves a host and caches the answer, including a failure.
+
+        Returns:
+            The addresses or the resolver error.
+        """
+        try:
+            answer = self.query(*key)
+        except socket.gaierror as e:
+            with self.lock:
+                self.failures += 1
+            answer = e
+        self.store(key, answer)
+        return answer
+
+    def refresh(self, key):
+        """
+        Re-resolves a host on a background thread, at most once at a time per host.
+        """
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+            self.refreshes += 1
+
+        def target():
+            try:
+                answer = self.query(*key)
+            except socket.gaierror:
+                # Keep serving the previous answer until it runs out of stale time
+                with self.lock:
+                    self.failures += 1
+            else:
+                self.store(key, answer)
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+        threading.Thread(target=target, name=f'dns-refresh-{key[0]}', daemon=True).start()
+
+    def resolve(self, host, port=None):
+        """
+        Returns the addresses of a host, from the cache when possible.
+
+        Args:
+            host (str): The host name.
+            port (int): The port, passed to the resolver.
+
+        Returns:
+            list: The addresses.
+
+        Raises:
+            socket.gaierror: If the host does not resolve, possibly from the negative cache.
+        """
+        key = (host, port)
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                answer, expires, hits = entry
+                if isinstance(answer, Exception):
+                    if now < expires:
+                        self.lookups['negative'] += 1
+                        raise answer
+                elif now < expires:
+                    self.lookups['hit'] += 1
+                    entry[2] = hits + 1
+                    self.entries.move_to_end(key)
+                    refresh = hits + 1 >= self.hot_hits and expires - now <= self.refresh_ahead
+                    if not refresh:
+                        return answer
+                elif now < expires + self.stale_ttl:
+                    self.lookups['stale'] += 1
+                    refresh = True
+                else:
+                    answer = None
+            else:
+                answer = None
+            if answer is None or isinstance(answer, Exception):
+                self.lookups['miss'] += 1
+        if answer is None or isinstance(answer, Exception):
+            answer = self.fetch(key)
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+        self.refresh(key)
+        return answer
+
+    def collect(self):
+        """
+        Returns the DNS cache metrics.
+
+        Returns:
+            list: Metric samples for the metrics registry.
+        """
+        with self.lock:
+            samples = [
+                ('dns_cache_lookups_total', 'counter', "Outbound host lookups by cache result.", {'result': result}, count)
+                for result, count in self.lookups.items()
+            ]
+            samples += [
+                ('dns_cache_refreshes_total', 'counter', "Background refreshes of cached hosts.", {}, self.refreshes),
+                ('dns_cache_failures_total', 'counter', "Failed host resolutions.", {}, self.failures),
+                ('dns_cache_entries', 'gauge', "Hosts in the DNS cache.", {}, len(self.entries)),
+            ]
+        return samples
+
+
+dns_cache = DNSCache()
+registry.register(dns_cache.collect)
+
+
+class CachedDNSConnectionMixin:
+    """
+    Makes a urllib3 connection resolve its host through the DNS cache.
+
+    The connection still presents the original host name for TLS server name indication and
+    certificate verification; only the address it connects to comes from the cache. Addresses
+    are tried in order until one accepts the connection.
+    """
+
+    def _new_conn(self):
+        host = self._dns_host
+        try:
+            addresses = dns_cache.resolve(host, self.port)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        error = None
+        for address in addresses:
+            self._dns_host = address
+            try:
+                return super()._new_conn()
+            except OSError as e:
+                error = e
+            finally:
+                self._dns_host = host
+        raise error
+
+
+class CachedDNSHTTPConnection(CachedDNSConnectionMixin, HTTPConnection):
+    pass
+
+
+class CachedDNSHTTPSConnection(CachedDNSConnectionMixin, HTTPSConnection):
+    pass
+
+
+class CachedDNSHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = CachedDNSHTTPConnection
+
+
+class CachedDNSHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = CachedDNSHTTPSConnection
+
+
+class CachedDNSAdapter(HTTPAdapter):
+    """
+    A requests transport adapter whose connection pools resolve hosts through the DNS cache.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CachedDNSHTTPConnectionPool,
+            'https': CachedDNSHTTPSConnectionPool,
+        }
+
+
+_sessions = threading.local()
+
+
+def get_outbound_session():
+    """
+    Returns this thread's HTTP session for deliveries, if the DNS cache is enabled.
+
+    The session keeps connections alive between deliveries and never stores cookies, which
+    would otherwise leak between destinations.
+
+    Returns:
+        Session: The session, or None if settings.OUTBOUND_DNS_CACHE is off.
+    """
+    if not getattr(settings, 'OUTBOUND_DNS_CACHE', False):
+        return None
+    session = getattr(_sessions, 'session', None)
+    if session is None:
+        session = Session()
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = CachedDNSAdapter()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _sessions.session = session
+    return session
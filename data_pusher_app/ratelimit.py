@@ -0,0 +1,303 @@
+import hashlib
+import math
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from .metrics import registry
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when an account exceeds its ingest request or byte rate.
+
+    Attributes:
+        dimension (str): Either 'requests' or 'bytes'.
+        retry_after (int): Seconds the client should wait before retrying.
+    """
+
+    def __init__(self, dimension, retry_after):
+        super().__init__(f"Rate limit exceeded ({dimension})")
+        self.dimension = dimension
+        self.retry_after = retry_after
+
+
+class LocalMemoryBackend:
+    """
+    Counter store kept in process memory.
+
+    Suitable for tests and single-process deployments; counters are not shared between workers.
+    """
+
+    def __init__(self, **options):
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def incr(self, key, amount, ttl):
+        """
+        Adds to a counter, creating it with the given time to live if needed.
+
+        Args:
+            key (str): The counter key.
+            amount (int): The amount to add.
+            ttl (float): Seconds the counter lives after creation.
+
+        Returns:
+            int: The new value of the counter.
+        """
+        now = time.monotonic()
+        with self.lock:
+            value, expires = self.counters.get(key, (0, 0))
+            if expires <= now:
+                value, expires = 0, now + ttl
+            value += amount
+            self.counters[key] = (value, expires)
+            if len(self.counters) > 100000:
+                self.counters = {k: v for k, v in self.counters.items() if v[1] > now}
+            return value
+
+    def get(self, key, default=0):
+        """
+        Reads a counter or value.
+
+        Args:
+            key (str): The key.
+            default: Returned if the key is missing or expired.
+
+        Returns:
+            The stored value, or the default.
+        """
+        value, expires = self.counters.get(key, (default, 0))
+        return value if expires > time.monotonic() else default
+
+    def set(self, key, value, ttl):
+        """
+        Stores a value for the given time to live.
+
+        Args:
+            key (str): The key.
+            value: The value.
+            ttl (float): Seconds the value lives.
+        """
+        with self.lock:
+            self.counters[key] = (value, time.monotonic() + ttl)
+
+
+class CacheBackend:
+    """
+    Counter store backed by a Django cache.
+
+    Counters are only shared between workers when the cache is: a local-memory cache keeps
+    them per process. Point the configured cache alias at Redis or Memcached so that
+    increments are shared and atomic across processes and hosts.
+    """
+
+    def __init__(self, alias='default', **options):
+        self.cache = caches[alias]
+
+    def incr(self, key, amount, ttl):
+        """
+        Atomically adds to a counter, creating it with the given time to live if needed.
+        """
+        ttl = max(1, math.ceil(ttl))
+        self.cache.add(key, 0, ttl)
+        try:
+            return self.cache.incr(key, amount)
+        except ValueError:
+            # The counter expired between add() and incr()
+            self.cache.add(key, 0, ttl)
+            return self.cache.incr(key, amount)
+
+    def get(self, key, default=0):
+        """
+        Reads a counter or value, the default if missing or expired.
+        """
+        return self.cache.get(key, default)
+
+    def set(self, key, value, ttl):
+        """
+        Stores a value for the given time to live.
+        """
+        self.cache.set(key, value, max(1, math.ceil(ttl)))
+
+
+def load_backend():
+    """
+    Builds the counter store configured by settings.RATE_LIMIT_BACKEND.
+
+    Returns:
+        The counter store.
+    """
+    backend_settings = getattr(settings, 'RATE_LIMIT_BACKEND', {})
+    backend_class = import_string(backend_settings.get('BACKEND', 'data_pusher_app.ratelimit.LocalMemoryBackend'))
+    return backend_class(**backend_settings.get('OPTIONS', {}))
+
+
+class RateLimiter:
+    """
+    Per-account ingest rate limiter using sliding window counters.
+
+    Each account has a request and a byte counter per fixed window; the rate over the sliding
+    window is estimated from the current window's count plus the previous window's count
+    weighted by how much of it still overlaps. Requests are keyed by a digest of the app
+    secret token. A token's limits are kept in the counter store for a short time, so that
+    every worker sharing it applies them; when they are missing they are resolved, through the
+    routing snapshot or the database, before the request is counted. Tokens of no account get
+    the default limits. Only admitted requests are counted, so a client retrying too early is
+    not kept locked out by its own rejected requests.
+
+    Attributes:
+        backend: The counter store.
+        window (float): Window length in seconds; limits are per window.
+    """
+
+    def __init__(self, backend=None, window=None, default_requests=None, default_bytes=None, limits_ttl=None):
+        """
+        Initializes the RateLimiter.
+
+        Args:
+            backend: The counter store. Defaults to the class named by settings.RATE_LIMIT_BACKEND.
+            window (float): Window length in seconds. Defaults to settings.RATE_LIMIT_WINDOW.
+            default_requests (int): Requests per window for accounts without a limit.
+            default_bytes (int): Bytes per window for accounts without a limit.
+            limits_ttl (float): Seconds resolved account limits are trusted.
+        """
+        self.backend = backend or load_backend()
+        self.window = window or getattr(settings, 'RATE_LIMIT_WINDOW', 1)
+        self.default_requests = default_requests or getattr(settings, 'RATE_LIMIT_DEFAULT_REQUESTS', None)
+        self.default_bytes = default_bytes or getattr(settings, 'RATE_LIMIT_DEFAULT_BYTES', None)
+        self.limits_ttl = limits_ttl or getattr(settings, 'RATE_LIMIT_LIMITS_TTL', 60)
+        self.limits = {}
+        self.rejected = {'requests': 0, 'bytes': 0}
+
+    @staticmethod
+    def key_for(token):
+        """
+        Derives the counter key of a token without exposing the token to the counter store.
+
+        Args:
+            token (str): The app secret token.
+
+        Returns:
+            str: The key prefix.
+        """
+        return hashlib.blake2b(str(token).encode('utf-8'), digest_size=12).hexdigest()
+
+    def account_limits(self, account):
+        """
+        Returns the request and byte limits of an account, or the defaults if there is none.
+        """
+        if account is None:
+            return self.default_requests, self.default_bytes
+        return (account.ingest_rate_limit or self.default_requests,
+                account.ingest_byte_rate_limit or self.default_bytes)
+
+    def store_limits(self, key, limits):
+        self.backend.set(f"rl:{key}:limits", list(limits), self.limits_ttl)
+        if len(self.limits) > 100000:
+            now = time.monotonic()
+            self.limits = {k: v for k, v in self.limits.items() if v[2] > now}
+        self.limits[key] = (*limits, time.monotonic() + self.limits_ttl)
+
+    def remember(self, token, account):
+        """
+        Records the limits of a verified account for subsequent checks, in every worker.
+
+        Args:
+            token (str): The app secret token the account was verified with.
+            account (Account): The verified account.
+        """
+        key = self.key_for(token)
+        limits = self.account_limits(account)
+        entry = self.limits.get(key)
+        if entry is None or entry[2] <= time.monotonic() or tuple(entry[:2]) != limits:
+            self.store_limits(key, limits)
+
+    def limits_for(self, key, resolve=None):
+        """
+        Returns the limits of a token, from process memory, the counter store or the resolver.
+
+        Args:
+            key (str): The token's key.
+            resolve (callable): Returns the token's account, or None if there is none; called
+                when no worker has stored the limits within limits_ttl.
+
+        Returns:
+            tuple: The request and byte limits, None where unlimited.
+        """
+        entry = self.limits.get(key)
+        if entry is not None and entry[2] > time.monotonic():
+            return entry[0], entry[1]
+        limits = self.backend.get(f"rl:{key}:limits", None)
+        if limits is None:
+            limits = self.account_limits(resolve() if resolve is not None else None)
+            self.store_limits(key, limits)
+        else:
+            self.limits[key] = (*limits, time.monotonic() + self.limits_ttl)
+        return tuple(limits)
+
+    def consume(self, key, dimension, amount, limit, now):
+        """
+        Adds to the current window of a counter and checks the sliding window estimate.
+
+        Returns:
+            str: The counter added to.
+
+        Raises:
+            RateLimitExceeded: If the estimate exceeds the limit; the amount is taken back.
+        """
+        window_id = int(now // self.window)
+        elapsed = (now % self.window) / self.window
+        counter = f"rl:{key}:{dimension}:{window_id}"
+        current = self.backend.incr(counter, amount, self.window * 2)
+        previous = self.backend.get(f"rl:{key}:{dimension}:{window_id - 1}")
+        estimate = previous * (1 - elapsed) + current
+        if estimate > limit:
+            self.backend.incr(counter, -amount, self.window * 2)
+            self.rejected[dimension] += 1
+            raise RateLimitExceeded(dimension, max(1, math.ceil(self.window * (1 - elapsed))))
+        return counter
+
+    def check(self, token, nbytes=0, resolve=None):
+        """
+        Counts a request and its size against the limits of the token's account, if admitted.
+
+        Args:
+            token (str): The app secret token from the request.
+            nbytes (int): The declared size of the request body.
+            resolve (callable): Returns the token's account, or None; see limits_for().
+
+        Raises:
+            RateLimitExceeded: If the request or byte rate is exceeded. Nothing is counted.
+        """
+        key = self.key_for(token)
+        request_limit, byte_limit = self.limits_for(key, resolve)
+        now = time.time()
+        counted = None
+        if request_limit:
+            counted = self.consume(key, 'requests', 1, request_limit, now)
+        if byte_limit and nbytes:
+            try:
+                self.consume(key, 'bytes', nbytes, byte_limit, now)
+            except RateLimitExceeded:
+                if counted is not None:
+                    self.backend.incr(counted, -1, self.window * 2)
+                raise
+
+    def collect(self):
+        """
+        Returns the rate limiter metrics.
+
+        Returns:
+            list: Metric samples for the metrics registry.
+        """
+        return [
+            ('ingest_rate_limited_total', 'counter', "Ingest requests rejected by rate limiting.",
+             {'dimension': dimension}, count)
+            for dimension, count in self.rejected.items()
+        ]
+
+
+rate_limiter = RateLimiter()
+registry.register(rate_limiter.collect)
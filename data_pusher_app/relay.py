@@ -0,0 +1,162 @@
+import codecs
+import re
+import tempfile
+from django.conf import settings
+
+WHITESPACE = re.compile(rb'[ \t\n\r]*')
+# The body of a string up to its closing quote, an incomplete escape or an invalid character
+STRING_BODY = re.compile(rb'(?:[^"\\\x00-\x1f]+|\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4}))*')
+SCALAR = re.compile(rb'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?|true|false|null')
+# The run of bytes a number or literal extends over; it must match SCALAR exactly
+SCALAR_EXTENT = re.compile(rb'[-+.0-9a-zA-Z]*')
+# Longest incomplete scalar kept between chunks
+MAX_CARRY = 256
+
+VALUE, VALUE_OR_CLOSE, KEY, KEY_OR_CLOSE, COLON, COMMA_OR_CLOSE, DONE = range(7)
+
+
+class JSONScanner:
+    """
+    Validates a JSON document fed in chunks, without building any Python objects.
+
+    The scanner tracks only the nesting of containers and what may come next, so its memory
+    is proportional to the nesting depth. Strings are consumed with a regular expression and
+    may span any number of chunks; the encoding is checked with an incremental UTF-8 decoder.
+    """
+
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.stack = []
+        self.state = VALUE
+        self.in_string = False
+        self.string_is_key = False
+        self.carry = b''
+
+    def feed(self, chunk):
+        """
+        Scans the next chunk of the document.
+
+        Args:
+            chunk (bytes): The chunk.
+
+        Raises:
+            ValueError: If the document is invalid.
+        """
+        self.decoder.decode(chunk)
+        self.scan(self.carry + chunk if self.carry else chunk, final=False)
+
+    def close(self):
+        """
+        Checks that the document is complete.
+
+        Raises:
+            ValueError: If the document is invalid or incomplete.
+        """
+        self.decoder.decode(b'', final=True)
+        self.scan(self.carry, final=True)
+        if self.state != DONE or self.in_string:
+            raise ValueError("Unexpected end of JSON document")
+
+    def value_done(self):
+        self.state = COMMA_OR_CLOSE if self.stack else DONE
+
+    def start_value(self, position):
+        if self.state not in (VALUE, VALUE_OR_CLOSE):
+            raise ValueError(f"Unexpected value at byte {position}")
+
+    def scan(self, buffer, final):
+        position, end = 0, len(buffer)
+        while True:
+            if self.in_string:
+                position = STRING_BODY.match(buffer, position).end()
+                if position == end:
+                    break
+                if buffer[position] == 0x22:  # closing quote
+                    position += 1
+                    self.in_string = False
+                    if self.string_is_key:
+                        self.state = COLON
+                    else:
+                        self.value_done()
+                    continue
+                if buffer[position] == 0x5c and end - position < 6 and not final:
+                    break  # an escape split between chunks
+                raise ValueError("Invalid string in JSON document")
+
+            position = WHITESPACE.match(buffer, position).end()
+            if position == end:
+                break
+            byte = buffer[position]
+            if byte == 0x22:
+                if self.state in (KEY, KEY_OR_CLOSE):
+                    self.string_is_key = True
+                else:
+                    self.start_value(position)
+                    self.string_is_key = False
+                self.in_string = True
+                position += 1
+            elif byte in b'{[':
+                self.start_value(position)
+                self.stack.append(byte)
+                self.state = KEY_OR_CLOSE if byte == 0x7b else VALUE_OR_CLOSE
+                position += 1
+            elif byte in b'}]':
+                opening = 0x7b if byte == 0x7d else 0x5b
+                allowed = (KEY_OR_CLOSE, COMMA_OR_CLOSE) if byte == 0x7d else (VALUE_OR_CLOSE, COMMA_OR_CLOSE)
+                if not self.stack or self.stack[-1] != opening or self.state not in allowed:
+                    raise ValueError(f"Unexpected '{chr(byte)}' at byte {position}")
+                self.stack.pop()
+                self.value_done()
+                position += 1
+            elif byte == 0x2c:
+                if self.state != COMMA_OR_CLOSE:
+                    raise ValueError(f"Unexpected ',' at byte {position}")
+                self.state = KEY if self.stack[-1] == 0x7b else VALUE
+                position += 1
+            elif byte == 0x3a:
+                if self.state != COLON:
+                    raise ValueError(f"Unexpected ':' at byte {position}")
+                self.state = VALUE
+                position += 1
+            else:
+                self.start_value(position)
+                extent = SCALAR_EXTENT.match(buffer, position).end()
+                if extent == end and not final and end - position < MAX_CARRY:
+                    break  # possibly a scalar split between chunks
+                match = SCALAR.match(buffer, position)
+                if match is None or match.end() != extent:
+                    raise ValueError(f"Invalid JSON value at byte {position}")
+                position = extent
+                self.value_done()
+        self.carry = buffer[position:]
+
+
+def spool_json(request, chunk_size=None):
+    """
+    Copies a request body to a temporary file, validating it as JSON on the way.
+
+    The body is read from the request stream in chunks, so it is never held in memory as a whole.
+
+    Args:
+        request (HttpRequest): The request, whose body must not have been read yet.
+        chunk_size (int): Bytes read at a time. Defaults to settings.RELAY_CHUNK_SIZE.
+
+    Returns:
+        file: The spooled body, positioned at the start. The caller must close it.
+
+    Raises:
+        ValueError: If the body is not a valid JSON document.
+    """
+    chunk_size = chunk_size or getattr(settings, 'RELAY_CHUNK_SIZE', 64 * 1024)
+    spool = tempfile.TemporaryFile(dir=getattr(settings, 'RELAY_SPOOL_DIR', None))
+    try:
+        scanner = JSONScanner()
+        while chunk := request.read(chunk_size):
+            scanner.feed(chunk)
+            spool.write(chunk)
+        scanner.close()
+        spool.seek(0)
+        return spool
+    except BaseException:
+        spool.close()
+        raise
@@ -0,0 +1,295 @@
+import json
+import threading
+import time
+import uuid
+from datetime import timezone as dt_timezone
+from collections import OrderedDict
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .admission import admission_controller
+from .eventlog import get_event_log
+from .ingest import DestinationHandler
+from .metrics import registry
+from .models import Account, Destination
+from .routing import RoutingIndex
+from .sharding import shard_map
+
+
+class TokenBucket:
+    """
+    Caps the rate of an operation, allowing short bursts.
+
+    Attributes:
+        rate (float): Tokens added per second.
+        capacity (float): Maximum number of stored tokens.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+
+    def acquire(self):
+        """
+        Takes a token, sleeping until one is available.
+        """
+        while True:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            self.sleep((1 - self.tokens) / self.rate)
+
+
+class ReplayHandler(DestinationHandler):
+    """
+    Delivers a stored event to destinations the replay already selected with its own routing index.
+    """
+
+    def get_destinations(self):
+        return self.destinations
+
+
+def parse_replay_options(params):
+    """
+    Parses the options of a replay request.
+
+    Args:
+        params (dict): Mapping with optional 'since' and 'until' ISO 8601 datetimes, a
+            'destinations' list of destination IDs and a 'rate' in events per second.
+
+    Returns:
+        dict: Keyword arguments for EventReplay, without the account.
+
+    Raises:
+        ValueError: If an option is malformed.
+    """
+    options = {}
+    for name in ('since', 'until'):
+        if params.get(name):
+            value = parse_datetime(str(params[name]))
+            if value is None:
+                raise ValueError(f"{name} must be an ISO 8601 datetime")
+            if timezone.is_naive(value):
+                value = timezone.make_aware(value, dt_timezone.utc)
+            options[name] = value
+    if params.get('destinations') is not None:
+        destinations = params['destinations']
+        if isinstance(destinations, str):
+            destinations = [item for item in destinations.split(',') if item.strip()]
+        try:
+            options['destination_ids'] = [int(item) for item in destinations]
+        except (TypeError, ValueError):
+            raise ValueError("destinations must be a list of destination IDs")
+    if params.get('rate') is not None:
+        try:
+            options['rate'] = float(params['rate'])
+        except (TypeError, ValueError):
+            raise ValueError("rate must be a number")
+        if options['rate'] <= 0:
+            raise ValueError("rate must be positive")
+    return options
+
+
+class EventReplay:
+    """
+    Re-delivers an account's stored events from the event log.
+
+    History is streamed from the log through the account's offset index, one event at a time.
+    Each destination has its own token bucket, so a backfill never sends a destination more
+    than `rate` events per second. Replay yields to live traffic: while the ingest workers have
+    REPLAY_YIELD_IN_FLIGHT requests in flight on average, as published through the rate
+    limiter's counter store, it pauses before each delivery.
+
+    Attributes:
+        id (UUID): The replay ID.
+        status (str): 'pending', 'running', 'completed' or 'failed'.
+        events (int): Stored events read so far.
+        deliveries (int): Successful deliveries.
+        failures (int): Failed deliveries.
+    """
+
+    def __init__(self, account, since=None, until=None, destination_ids=None, rate=None, event_log=None):
+        """
+        Initializes the EventReplay.
+
+        Args:
+            account (Account): The account whose events are replayed.
+            since (datetime): Only replay events received at or after this time.
+            until (datetime): Only replay events received before this time.
+            destination_ids (list): Only deliver to these destinations. Defaults to all of the account's.
+            rate (float): Events per second per destination. Defaults to settings.REPLAY_DESTINATION_RATE.
+            event_log (EventLog): The log to read. Defaults to the configured event log.
+
+        Raises:
+            ValueError: If the event log is disabled or a destination is not the account's.
+        """
+        self.event_log = event_log or get_event_log()
+        if self.event_log is None:
+            raise ValueError("The event log is not enabled")
+        self.id = uuid.uuid4()
+        self.account = account
+        self.since = since
+        self.until = until
+        self.rate = rate or getattr(settings, 'REPLAY_DESTINATION_RATE', 10)
+        self.yield_in_flight = getattr(settings, 'REPLAY_YIELD_IN_FLIGHT', 8)
+        destinations = shard_map.manager(Destination, shard_map.shard_for(account)).filter(account=account).order_by('pk')
+        if destination_ids is not None:
+            destinations = destinations.filter(pk__in=destination_ids)
+            missing = set(destination_ids) - {destination.pk for destination in destinations}
+            if missing:
+                raise ValueError(f"Unknown destinations: {', '.join(str(pk) for pk in sorted(missing))}")
+        self.destinations = list(destinations)
+        self.routing_index = RoutingIndex(self.destinations)
+        self.buckets = {}
+        self.status = 'pending'
+        self.events = 0
+        self.deliveries = 0
+        self.failures = 0
+        self.error = None
+
+    @staticmethod
+    def to_timestamp(value):
+        return int(value.timestamp() * 1_000_000_000) if value is not None else None
+
+    def wait_for_capacity(self, destination):
+        """
+        Pauses while live traffic is busy, then takes a token of the destination's bucket.
+
+        Args:
+            destination (Destination): The destination about to receive an event.
+        """
+        while admission_controller.load() >= self.yield_in_flight:
+            time.sleep(0.05)
+        bucket = self.buckets.get(destination.pk)
+        if bucket is None:
+            bucket = self.buckets[destination.pk] = TokenBucket(self.rate)
+        bucket.acquire()
+
+    def run(self):
+        """
+        Replays the events, updating the counters as it goes.
+
+        Returns:
+            EventReplay: The replay, for chaining.
+        """
+        self.status = 'running'
+        try:
+            records = self.event_log.read(account_id=self.account.pk, since=self.to_timestamp(self.since),
+                                          until=self.to_timestamp(self.until))
+            for record in records:
+                self.events += 1
+                try:
+                    data = json.loads(record.payload)
+                except ValueError:
+                    continue
+                for destination in self.routing_index.match(data):
+                    self.wait_for_capacity(destination)
+                    for outcome in ReplayHandler(self.account, data, [destination]).process_destinations():
+                        if 'error' in outcome or outcome['status_code'] >= 400:
+                            self.failures += 1
+                        else:
+                            self.deliveries += 1
+            self.status = 'completed'
+        except Exception as e:
+            self.status = 'failed'
+            self.error = str(e)
+        return self
+
+    def as_dict(self):
+        return {
+            'replay_id': str(self.id),
+            'account': str(self.account.pk),
+            'status': self.status,
+            'events': self.events,
+            'deliveries': self.deliveries,
+            'failures': self.failures,
+            'error': self.error,
+        }
+
+
+class ReplayRegistry:
+    """
+    Tracks the replays started by this process and runs them on background threads.
+
+    Only the most recent replays are kept for status queries.
+    """
+
+    def __init__(self, max_size=100):
+        self.max_size = max_size
+        self.replays = OrderedDict()
+        self.lock = threading.Lock()
+
+    def start(self, replay):
+        """
+        Runs a replay on a daemon thread.
+
+        Args:
+            replay (EventReplay): The replay to run.
+
+        Returns:
+            EventReplay: The started replay.
+        """
+        with self.lock:
+            self.replays[replay.id] = replay
+            while len(self.replays) > self.max_size:
+                self.replays.popitem(last=False)
+
+        def target():
+            try:
+                replay.run()
+            finally:
+                close_old_connections()
+        threading.Thread(target=target, name=f'replay-{replay.id}', daemon=True).start()
+        return replay
+
+    def get(self, replay_id):
+        with self.lock:
+            return self.replays.get(replay_id)
+
+    def collect(self):
+        """
+        Returns the replay metrics.
+
+        Returns:
+            list: Metric samples for the metrics registry.
+        """
+        with self.lock:
+            replays = list(self.replays.values())
+        return [
+            ('replays_running', 'gauge', "Event replays currently running.", {},
+             sum(1 for replay in replays if replay.status == 'running')),
+            ('replay_deliveries_total', 'counter', "Events re-delivered by tracked replays.", {},
+             sum(replay.deliveries for replay in replays)),
+        ]
+
+
+def get_replay_account(account_id):
+    """
+    Looks up the account of a replay request.
+
+    Args:
+        account_id: The account ID.
+
+    Returns:
+        Account: The account.
+
+    Raises:
+        LookupError: If the account does not exist.
+    """
+    try:
+        return shard_map.manager(Account, shard_map.shard_of(account_id)).get(pk=account_id)
+    except (Account.DoesNotExist, ValidationError):
+        raise LookupError("Account not found")
+
+
+replays = ReplayRegistry()
+registry.register(replays.collect)
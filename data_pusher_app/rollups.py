@@ -0,0 +1,458 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .metrics import registry
+from .sharding import get_shards, shard_map
+from .stats import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# Rollup granularities and their lengths in seconds, coarsest first
+GRANULARITIES = (('day', 86400), ('hour', 3600), ('minute', 60))
+
+
+def to_datetime(seconds):
+    return datetime.fromtimestamp(seconds, dt_timezone.utc)
+
+
+def to_seconds(moment):
+    return int(moment.timestamp())
+
+
+class RollupAggregator:
+    """
+    Counts deliveries per account, destination and minute in memory and flushes them to rollups.
+
+    Recording is a dictionary lookup and a histogram increment. Every `flush_interval` seconds,
+    or as soon as `max_pending` minute buckets have piled up, a background thread merges the
+    pending minutes into the minute, hour and day DeliveryRollup rows of each destination in
+    one batch per shard: missing rows are inserted empty, the affected rows are locked and
+    read with one query, merged, and written back with one bulk update. Rows from all worker
+    processes therefore add up, and raw delivery records are never scanned. A timer flushes
+    buckets that no later delivery comes to flush. The buckets of a shard that could not be
+    written are put back to be retried by the next flush, keeping at most `max_pending` of them.
+    """
+
+    def __init__(self, flush_interval=None, max_pending=None, clock=time.time):
+        """
+        Initializes the RollupAggregator.
+
+        Args:
+            flush_interval (float): Seconds between flushes. Defaults to settings.ROLLUP_FLUSH_INTERVAL.
+            max_pending (int): Pending minute buckets that trigger an early flush. Defaults to settings.ROLLUP_MAX_PENDING.
+            clock (callable): Wall clock time source.
+        """
+        self.flush_interval = flush_interval or getattr(settings, 'ROLLUP_FLUSH_INTERVAL', 10)
+        self.max_pending = max_pending or getattr(settings, 'ROLLUP_MAX_PENDING', 10000)
+        self.clock = clock
+        self.pending = {}  # (account id, destination id, minute start) -> [histogram, latency sum]
+        self.lock = threading.Lock()
+        self.flushing = False
+        self.flush_timer = None
+        self.next_flush = clock() + self.flush_interval
+        self.flushes = 0
+        self.rows_written = 0
+        self.write_errors = 0
+        self.discarded = 0
+
+    def record(self, account_id, destination_id, seconds, ok):
+        """
+        Records the outcome of one delivery.
+
+        Args:
+            account_id: The account's primary key.
+            destination_id (int): The destination's primary key.
+            seconds (float): How long the delivery took.
+            ok (bool): Whether it succeeded.
+        """
+        now = self.clock()
+        key = (account_id, destination_id, int(now // 60) * 60)
+        micros = int(seconds * 1_000_000)
+        with self.lock:
+            entry = self.pending.get(key)
+            if entry is None:
+                entry = self.pending[key] = [LatencyHistogram(), 0]
+            entry[0].record(micros, ok)
+            entry[1] += micros
+            due = now >= self.next_flush or len(self.pending) >= self.max_pending
+            if not due:
+                self.schedule_flush(self.next_flush - now)
+        if due and not self.flushing:
+            self.flush_in_background()
+
+    def schedule_flush(self, delay):
+        """
+        Starts the flush timer, unless it is already running. Called with the lock held.
+
+        Args:
+            delay (float): Seconds until the flush.
+        """
+        if self.flush_timer is None:
+            self.flush_timer = threading.Timer(max(0, delay), self.flush_on_timer)
+            self.flush_timer.daemon = True
+            self.flush_timer.start()
+
+    def flush_on_timer(self):
+        with self.lock:
+            self.flush_timer = None
+        self.flush_in_background()
+
+    def flush_in_background(self):
+        with self.lock:
+            if self.flushing:
+                return
+            self.flushing = True
+
+        def target():
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+        threading.Thread(target=target, name='rollup-flush', daemon=True).start()
+
+    def rollup(self, pending):
+        """
+        Folds pending minute buckets into the buckets of every granularity.
+
+        Args:
+            pending (dict): (account id, destination id, minute start) -> [histogram, latency sum].
+
+        Returns:
+            dict: (account id, destination id, granularity, bucket start) -> [histogram, latency sum].
+        """
+        merged = {}
+        for (account_id, destination_id, minute), (histogram, latency_sum) in pending.items():
+            for granularity, seconds in GRANULARITIES:
+                key = (account_id, destination_id, granularity, minute - minute % seconds)
+                entry = merged.get(key)
+                if entry is None:
+                    entry = merged[key] = [LatencyHistogram(), 0]
+                entry[0].merge(histogram)
+                entry[1] += latency_sum
+        return merged
+
+    def flush(self):
+        """
+        Merges the recordings since the last flush into DeliveryRollup rows.
+
+        Errors are logged, and the buckets of the shards that failed are put back.
+
+        Returns:
+            int: The number of rows written.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushing = True
+        try:
+            by_account = {}
+            for key in pending:
+                by_account.setdefault(key[0], []).append(key)
+            written, failed = 0, {}
+            for alias, account_ids in shard_map.group(by_account).items():
+                shard_pending = {key: pending[key] for account_id in account_ids for key in by_account[account_id]}
+                try:
+                    written += self.write(alias, self.rollup(shard_pending))
+                except Exception:
+                    logger.exception("Writing delivery rollups to %s failed", alias)
+                    failed.update(shard_pending)
+            try:
+                self.prune()
+            except Exception:
+                logger.exception("Pruning delivery rollups failed")
+            with self.lock:
+                self.flushes += 1
+                self.rows_written += written
+                if failed:
+                    self.write_errors += 1
+                    self.requeue(failed)
+            return written
+        finally:
+            with self.lock:
+                self.flushing = False
+                self.next_flush = self.clock() + self.flush_interval
+                if self.pending:
+                    self.schedule_flush(self.flush_interval)
+
+    def requeue(self, failed):
+        """
+        Puts back minute buckets that failed to be written, merging them with newer recordings.
+        Beyond max_pending buckets the oldest minutes are given up. Called with the lock held.
+
+        Args:
+            failed (dict): (account id, destination id, minute start) -> [histogram, latency sum].
+        """
+        keys = sorted(failed, key=lambda key: key[2])
+        if len(keys) > self.max_pending:
+            self.discarded += len(keys) - self.max_pending
+            keys = keys[-self.max_pending:]
+        for key in keys:
+            histogram, latency_sum = failed[key]
+            entry = self.pending.get(key)
+            if entry is None:
+                self.pending[key] = [histogram, latency_sum]
+            else:
+                entry[0].merge(histogram)
+                entry[1] += latency_sum
+
+    def write(self, alias, merged):
+        """
+        Merges rolled-up buckets into the rows of one shard.
+
+        Args:
+            alias (str): The database alias of the shard.
+            merged (dict): Rolled-up buckets of accounts on the shard.
+
+        Returns:
+            int: The number of rows written.
+        """
+        from .models import DeliveryRollup, Destination
+
+        existing = set(Destination.objects.using(alias).filter(
+            pk__in={key[1] for key in merged}
+        ).values_list('pk', flat=True))
+        merged = {key: value for key, value in merged.items() if key[1] in existing}  # skip deleted destinations
+        if not merged:
+            return 0
+        rollups = DeliveryRollup.objects.using(alias)
+        with transaction.atomic(using=alias):
+            rollups.bulk_create([
+                DeliveryRollup(account_id=account_id, destination_id=destination_id, granularity=granularity,
+                               bucket_start=to_datetime(start))
+                for account_id, destination_id, granularity, start in merged
+            ], ignore_conflicts=True)
+            rows = rollups.select_for_update().filter(
+                destination_id__in={key[1] for key in merged},
+                bucket_start__in={to_datetime(key[3]) for key in merged},
+            )
+            updated = []
+            for row in rows:
+                entry = merged.get((row.account_id, row.destination_id, row.granularity, to_seconds(row.bucket_start)))
+                if entry is None:
+                    continue
+                histogram = LatencyHistogram.from_sparse(row.buckets, row.errors, row.max_latency_us)
+                histogram.merge(entry[0])
+                row.deliveries = histogram.count
+                row.errors = histogram.errors
+                row.max_latency_us = histogram.max_micros
+                row.latency_sum_us += entry[1]
+                row.buckets = histogram.to_sparse()
+                updated.append(row)
+            rollups.bulk_update(updated, ['deliveries', 'errors', 'latency_sum_us', 'max_latency_us', 'buckets'])
+        return len(updated)
+
+    def prune(self):
+        """
+        Deletes rollups older than the retention of their granularity.
+        """
+        from .models import DeliveryRollup
+
+        retention = getattr(settings, 'ROLLUP_RETENTION', {})
+        now = datetime.now(dt_timezone.utc)
+        for alias in get_shards():
+            for granularity, _ in GRANULARITIES:
+                if retention.get(granularity):
+                    DeliveryRollup.objects.using(alias).filter(
+                        granularity=granularity, bucket_start__lt=now - retention[granularity]
+                    ).delete()
+
+    def collect(self):
+        """
+        Returns the rollup aggregator metrics.
+
+        Returns:
+            list: Metric samples for the metrics registry.
+        """
+        return [
+            ('rollup_pending_buckets', 'gauge', "Minute buckets waiting to be flushed.", {}, len(self.pending)),
+            ('rollup_flushes_total', 'counter', "Rollup flushes.", {}, self.flushes),
+            ('rollup_rows_written_total', 'counter', "Rollup rows written.", {}, self.rows_written),
+            ('rollup_write_errors_total', 'counter', "Rollup flushes that failed to write a shard.", {},
+             self.write_errors),
+            ('rollup_discarded_buckets_total', 'counter', "Minute buckets given up after failed writes.", {},
+             self.discarded),
+        ]
+
+
+rollup_aggregator = RollupAggregator()
+registry.register(rollup_aggregator.collect)
+
+
+def decompose(since, until, max_seconds=None):
+    """
+    Covers a time range with the fewest rollup buckets.
+
+    Whole days in the middle of the range are read from day rows, the partial days at its
+    edges from hour rows, and the partial hours from minute rows.
+
+    Args:
+        since (int): Start of the range in epoch seconds, a multiple of 60.
+        until (int): End of the range in epoch seconds, a multiple of 60.
+        max_seconds (int): Coarsest bucket length allowed; buckets never straddle multiples of it.
+
+    Returns:
+        list: (granularity, start, end) pieces in epoch seconds, covering the range exactly.
+    """
+    allowed = [(name, seconds) for name, seconds in GRANULARITIES
+               if max_seconds is None or (seconds <= max_seconds and max_seconds % seconds == 0)]
+    pieces = []
+
+    def cover(start, end, level):
+        if start >= end:
+            return
+        name, seconds = allowed[level]
+        first = -(-start // seconds) * seconds
+        last = end // seconds * seconds
+        if level == len(allowed) - 1 or first >= last:
+            if level < len(allowed) - 1:
+                cover(start, end, level + 1)
+            else:
+                pieces.append((name, start, end))
+            return
+        cover(start, first, level + 1)
+        pieces.append((name, first, last))
+        cover(last, end, level + 1)
+
+    cover(since, until, 0)
+    return pieces
+
+
+class RollupQuery:
+    """
+    Answers delivery analytics from the rollup tables, never from raw rows.
+
+    Attributes:
+        account_id: The account queried.
+        since (int): Start of the range in epoch seconds, rounded down to the minute or step.
+        until (int): End of the range in epoch seconds, rounded up to the minute or step.
+        step (int): Seconds per series point, or None for one total over the range.
+        destination_ids (list): Destinations to include, or None for all of the account's.
+    """
+
+    def __init__(self, account_id, since, until, step=None, destination_ids=None):
+        """
+        Initializes the RollupQuery.
+
+        Args:
+            account_id: The account queried.
+            since (datetime): Start of the range.
+            until (datetime): End of the range.
+            step (int): Seconds per series point, or None for one total over the range.
+            destination_ids (list): Destinations to include. Defaults to all of the account's.
+
+        Raises:
+            ValueError: If the range is empty, the step is not a positive multiple of 60 seconds or
+                the series would have more than settings.ROLLUP_MAX_POINTS points.
+        """
+        if step is not None and (step <= 0 or step % 60):
+            raise ValueError("step must be a positive multiple of 60 seconds")
+        self.account_id = account_id
+        # Series points are aligned to multiples of the step, so they are made of whole buckets
+        align = step or 60
+        self.since = to_seconds(since) // align * align
+        self.until = -(-to_seconds(until) // align) * align
+        if self.until <= self.since:
+            raise ValueError("until must be after since")
+        max_points = getattr(settings, 'ROLLUP_MAX_POINTS', 10000)
+        if step is not None and (self.until - self.since) // step > max_points:
+            raise ValueError(f"The range holds more than {max_points} steps; use a larger step or a shorter range")
+        self.step = step
+        self.destination_ids = destination_ids
+
+    def pieces(self):
+        return decompose(self.since, self.until, self.step)
+
+    def rows(self):
+        """
+        Fetches the rollup rows covering the range.
+
+        Returns:
+            QuerySet: The DeliveryRollup rows.
+        """
+        from .models import DeliveryRollup
+
+        covered = Q()
+        for granularity, start, end in self.pieces():
+            covered |= Q(granularity=granularity, bucket_start__gte=to_datetime(start), bucket_start__lt=to_datetime(end))
+        rows = shard_map.manager(DeliveryRollup, shard_map.shard_of(self.account_id)).filter(
+            covered, account_id=self.account_id,
+        )
+        if self.destination_ids is not None:
+            rows = rows.filter(destination_id__in=self.destination_ids)
+        return rows
+
+    def run(self):
+        """
+        Merges the rows into series points.
+
+        Returns:
+            dict: The granularities read and one point per step with counts, error rate and latency.
+        """
+        points = {}
+        for row in self.rows().iterator():
+            start = to_seconds(row.bucket_start)
+            point_start = self.since if self.step is None else self.since + (start - self.since) // self.step * self.step
+            point = points.get(point_start)
+            if point is None:
+                point = points[point_start] = [LatencyHistogram(), 0]
+            point[0].merge(LatencyHistogram.from_sparse(row.buckets, row.errors, row.max_latency_us))
+            point[1] += row.latency_sum_us
+        starts = [self.since] if self.step is None else range(self.since, self.until, self.step)
+        series = []
+        for start in starts:
+            histogram, latency_sum = points.get(start) or (LatencyHistogram(), 0)
+            summary = histogram.summary()
+            summary['avg_ms'] = latency_sum / summary['deliveries'] / 1000 if summary['deliveries'] else None
+            series.append({'start': to_datetime(start), **summary})
+        return {
+            'since': to_datetime(self.since),
+            'until': to_datetime(self.until),
+            'step': self.step,
+            'granularities': sorted({piece[0] for piece in self.pieces()}),
+            'series': series,
+        }
+
+
+def parse_rollup_options(params, now=None, default_range=timedelta(days=1)):
+    """
+    Parses the options of a rollup query.
+
+    Args:
+        params (QueryDict | dict): Mapping with optional 'since' and 'until' ISO 8601 datetimes
+            (default: the last `default_range`), a 'step' in seconds and comma-separated 'destinations' IDs.
+        now (datetime): The current time.
+        default_range (timedelta): Length of the range when 'since' is missing.
+
+    Returns:
+        dict: Keyword arguments for RollupQuery, without the account.
+
+    Raises:
+        ValueError: If an option is malformed.
+    """
+    options = {}
+    for name in ('since', 'until'):
+        if params.get(name):
+            value = parse_datetime(str(params[name]))
+            if value is None:
+                raise ValueError(f"{name} must be an ISO 8601 datetime")
+            if timezone.is_naive(value):
+                value = timezone.make_aware(value, dt_timezone.utc)
+            options[name] = value
+    options.setdefault('until', now or timezone.now())
+    options.setdefault('since', options['until'] - default_range)
+    if params.get('step'):
+        try:
+            options['step'] = int(params['step'])
+        except (TypeError, ValueError):
+            raise ValueError("step must be a number of seconds")
+    if params.get('destinations'):
+        try:
+            options['destination_ids'] = [int(item) for item in str(params['destinations']).split(',') if item.strip()]
+        except ValueError:
+            raise ValueError("destinations must be a list of destination IDs")
+    return options
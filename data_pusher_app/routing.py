@@ -0,0 +1,286 @@
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+_MISSING = object()
+
+OPERATORS = ('eq', 'in', 'prefix', 'exists')
+
+
+def validate_routing_rules(rules):
+    """
+    Validate the routing rules of a destination.
+
+    Rules are a list of objects, all of which must match for an event to be routed to the
+    destination. Each rule names a dot-separated `field` path into the event and an `op`:
+    'eq' (equal to `value`), 'in' (equal to one of the `value` list), 'prefix' (a string
+    starting with `value`) or 'exists' (present, or absent when `value` is false).
+
+    Args:
+        rules (list): The rules to validate. None or an empty list routes every event.
+
+    Raises:
+        ValidationError: If the rules are malformed.
+    """
+    if rules is None:
+        return
+    if not isinstance(rules, list):
+        raise ValidationError("Routing rules must be a list.")
+    for position, rule in enumerate(rules):
+        if not isinstance(rule, dict) or not isinstance(rule.get('field'), str) or not rule['field']:
+            raise ValidationError(f"Routing rule {position} must be an object with a non-empty 'field'.")
+        op = rule.get('op', 'eq')
+        if op not in OPERATORS:
+            raise ValidationError(f"Routing rule {position} has an unknown op '{op}'.")
+        if op in ('eq', 'in', 'prefix') and 'value' not in rule:
+            raise ValidationError(f"Routing rule {position} requires a 'value'.")
+        if op == 'in' and not isinstance(rule['value'], list):
+            raise ValidationError(f"Routing rule {position} requires a list 'value' for 'in'.")
+        if op == 'prefix' and not isinstance(rule['value'], str):
+            raise ValidationError(f"Routing rule {position} requires a string 'value' for 'prefix'.")
+
+
+def validate_field_path(value):
+    """
+    Validate a dot-separated field path into events, such as a destination's ordering key.
+
+    Args:
+        value (str): The path. None or an empty string means no path.
+
+    Raises:
+        ValidationError: If the path has an empty segment.
+    """
+    if value and not all(value.split('.')):
+        raise ValidationError("Field paths must be dot-separated, non-empty field names.")
+
+
+def resolve_path(data, path):
+    """
+    Resolve a dot-separated path into nested dictionaries.
+
+    Args:
+        data: The decoded event.
+        path (tuple): The path segments.
+
+    Returns:
+        The value at the path, or a sentinel if any segment is missing.
+    """
+    for key in path:
+        if not isinstance(data, dict) or key not in data:
+            return _MISSING
+        data = data[key]
+    return data
+
+
+def hashable(value):
+    """
+    Return a hashable form of an event or rule value for index lookups.
+
+    Args:
+        value: A decoded JSON value.
+
+    Returns:
+        The value itself if hashable, otherwise its repr tagged with its type.
+    """
+    try:
+        hash(value)
+    except TypeError:
+        return (type(value).__name__, repr(value))
+    # Keep True and 1 apart, as JSON does
+    return (type(value) is bool, value)
+
+
+def compile_rule(rule):
+    """
+    Compile a single rule into a predicate over the event.
+
+    Args:
+        rule (dict): A validated routing rule.
+
+    Returns:
+        callable: A function taking the event and returning whether the rule matches.
+    """
+    path = tuple(rule['field'].split('.'))
+    op = rule.get('op', 'eq')
+    if op == 'eq':
+        expected = hashable(rule['value'])
+        return lambda data: (value := resolve_path(data, path)) is not _MISSING and hashable(value) == expected
+    if op == 'in':
+        expected = {hashable(item) for item in rule['value']}
+        return lambda data: (value := resolve_path(data, path)) is not _MISSING and hashable(value) in expected
+    if op == 'prefix':
+        prefix = rule['value']
+        return lambda data: isinstance(value := resolve_path(data, path), str) and value.startswith(prefix)
+    if rule.get('value', True):
+        return lambda data: resolve_path(data, path) is not _MISSING
+    return lambda data: resolve_path(data, path) is _MISSING
+
+
+class RoutingIndex:
+    """
+    Routing rules of an account compiled into an index keyed by discriminating fields.
+
+    Each destination is filed under the most selective of its rules: equality and membership
+    rules go into a hash map per field, prefix rules into a map per field keyed by prefix, and
+    existence rules into a list per field. Destinations without rules always match. Matching
+    an event looks up only the fields present in the index and evaluates the remaining rules
+    of the candidates found there.
+    """
+
+    def __init__(self, destinations):
+        """
+        Compiles the routing rules of the given destinations.
+
+        Args:
+            destinations (iterable): The destinations of one account, in delivery order.
+        """
+        self.catch_all = []
+        self.equality = {}   # path -> {value: [entry, ...]}
+        self.prefixes = {}   # path -> ({prefix: [entry, ...]}, sorted prefix lengths)
+        self.existence = {}  # path -> [entry, ...]
+        for order, destination in enumerate(destinations):
+            rules = destination.routing_rules or []
+            predicates = [compile_rule(rule) for rule in rules]
+            if not rules:
+                self.catch_all.append((order, destination, ()))
+                continue
+            key_position = self.discriminator(rules)
+            entry = (order, destination, tuple(p for i, p in enumerate(predicates) if i != key_position))
+            self.file(rules[key_position], entry)
+        for path, (by_prefix, _) in self.prefixes.items():
+            self.prefixes[path] = (by_prefix, sorted({len(prefix) for prefix in by_prefix}))
+
+    @staticmethod
+    def discriminator(rules):
+        """
+        Picks the rule used to index a destination, preferring the most selective operator.
+
+        Args:
+            rules (list): The destination's rules.
+
+        Returns:
+            int: The position of the chosen rule.
+        """
+        rank = {'eq': 0, 'in': 1, 'prefix': 2, 'exists': 3}
+        return min(range(len(rules)), key=lambda i: rank[rules[i].get('op', 'eq')])
+
+    def file(self, rule, entry):
+        """
+        Files a destination entry under its discriminating rule.
+
+        Args:
+            rule (dict): The discriminating rule.
+            entry (tuple): The order, destination and remaining predicates.
+        """
+        path = tuple(rule['field'].split('.'))
+        op = rule.get('op', 'eq')
+        if op in ('eq', 'in'):
+            values = [rule['value']] if op == 'eq' else rule['value']
+            by_value = self.equality.setdefault(path, {})
+            for value in {hashable(v) for v in values}:
+                by_value.setdefault(value, []).append(entry)
+        elif op == 'prefix':
+            by_prefix, _ = self.prefixes.setdefault(path, ({}, None))
+            by_prefix.setdefault(rule['value'], []).append(entry)
+        elif rule.get('value', True):
+            self.existence.setdefault(path, []).append(entry)
+        else:
+            # "Field must be absent" cannot be looked up, so it is checked on every event
+            self.catch_all.append((entry[0], entry[1], entry[2] + (compile_rule(rule),)))
+
+    def candidates(self, data):
+        """
+        Yields the entries whose discriminating rule matches the event.
+
+        Args:
+            data: The decoded event.
+
+        Yields:
+            tuple: Candidate entries.
+        """
+        yield from self.catch_all
+        for path, by_value in self.equality.items():
+            value = resolve_path(data, path)
+            if value is not _MISSING:
+                yield from by_value.get(hashable(value), ())
+        for path, (by_prefix, lengths) in self.prefixes.items():
+            value = resolve_path(data, path)
+            if isinstance(value, str):
+                for length in lengths:
+                    if length > len(value):
+                        break
+                    yield from by_prefix.get(value[:length], ())
+        for path, entries in self.existence.items():
+            if resolve_path(data, path) is not _MISSING:
+                yield from entries
+
+    def match(self, data):
+        """
+        Returns the destinations an event must be delivered to.
+
+        Args:
+            data: The decoded event.
+
+        Returns:
+            list: The matching destinations, in their original order.
+        """
+        matched = {}
+        for order, destination, predicates in self.candidates(data):
+            if order not in matched and all(predicate(data) for predicate in predicates):
+                matched[order] = destination
+        return [matched[order] for order in sorted(matched)]
+
+
+class RoutingIndexCache:
+    """
+    A bounded, thread-safe, process-local LRU cache of compiled routing indexes.
+
+    Indexes are keyed by account and destinations version, so any destination change makes
+    the next lookup compile a fresh index without explicit invalidation.
+    """
+
+    def __init__(self, max_size=None):
+        """
+        Initializes the cache.
+
+        Args:
+            max_size (int): Maximum number of cached indexes. Defaults to settings.ROUTING_INDEX_CACHE_SIZE.
+        """
+        self.max_size = max_size or getattr(settings, 'ROUTING_INDEX_CACHE_SIZE', 1024)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, account, load_destinations):
+        """
+        Returns the routing index of an account, compiling it on a miss.
+
+        Args:
+            account (Account): The account, whose pk and destinations_version form the key.
+            load_destinations (callable): Returns the account's destinations when compiling.
+
+        Returns:
+            RoutingIndex: The compiled index.
+        """
+        key = (account.pk, account.destinations_version)
+        with self.lock:
+            index = self.entries.get(key)
+            if index is not None:
+                self.entries.move_to_end(key)
+                return index
+        index = RoutingIndex(load_destinations())
+        with self.lock:
+            self.entries[key] = index
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return index
+
+    def clear(self):
+        """
+        Drops all cached indexes.
+        """
+        with self.lock:
+            self.entries.clear()
+
+
+routing_index_cache = RoutingIndexCache()
@@ -0,0 +1,397 @@
+import heapq
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.dateparse import parse_datetime
+from .metrics import registry
+from .sharding import get_shards
+
+logger = logging.getLogger(__name__)
+
+
+def parse_schedule(headers, now=None):
+    """
+    Reads when an event should be delivered from its request headers.
+
+    `CL-X-DELIVER-AT` is an ISO 8601 datetime with a UTC offset, e.g. 2024-05-01T09:00:00+02:00,
+    or a Unix timestamp; `CL-X-DELAY` is a number of seconds from now.
+
+    Args:
+        headers (Mapping): The request headers.
+        now (datetime): The current time. Defaults to now.
+
+    Returns:
+        datetime: When the event is due, or None to deliver it right away.
+
+    Raises:
+        ValueError: If a header is malformed, both are given, or the time is beyond
+            settings.DELIVERY_SCHEDULE_MAX_DELAY seconds from now.
+    """
+    deliver_at, delay = headers.get('CL-X-DELIVER-AT'), headers.get('CL-X-DELAY')
+    if deliver_at is None and delay is None:
+        return None
+    if deliver_at is not None and delay is not None:
+        raise ValueError("Send either CL-X-DELIVER-AT or CL-X-DELAY, not both")
+    now = now or datetime.now(dt_timezone.utc)
+    if delay is not None:
+        try:
+            seconds = float(delay)
+        except ValueError:
+            raise ValueError("CL-X-DELAY must be a number of seconds") from None
+        if not math.isfinite(seconds) or seconds < 0:
+            raise ValueError("CL-X-DELAY must be a number of seconds")
+        due = now + timedelta(seconds=seconds)
+    else:
+        try:
+            due = datetime.fromtimestamp(float(deliver_at), dt_timezone.utc)
+        except (ValueError, OverflowError, OSError):
+            due = parse_datetime(deliver_at.strip())
+            if due is None or due.tzinfo is None:
+                raise ValueError("CL-X-DELIVER-AT must be an ISO 8601 datetime with a UTC offset or a Unix timestamp")
+    max_delay = getattr(settings, 'DELIVERY_SCHEDULE_MAX_DELAY', 30 * 24 * 60 * 60)
+    if max_delay is not None and due - now > timedelta(seconds=max_delay):
+        raise ValueError(f"Deliveries can be scheduled at most {max_delay} seconds ahead")
+    return due if due > now else None
+
+
+class TimingWheel:
+    """
+    A hierarchical timing wheel holding keys until their due time.
+
+    Time advances in ticks. Level 0 has one slot per tick; every slot of level n spans as many
+    ticks as a whole turn of level n - 1. A key is placed in the lowest level whose turn
+    contains its due tick, and moved down a level whenever the wheel reaches its slot, so
+    adding a key costs O(1) and each key is moved at most once per level before it fires.
+    Keys due beyond the top level wait in a heap until the top level turns.
+
+    Attributes:
+        tick (float): Seconds per tick.
+        slots (int): Slots per level.
+        levels (int): Number of levels.
+        current (int): The last tick the wheel advanced to.
+    """
+
+    def __init__(self, tick=1.0, slots=64, levels=4, start=0.0):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.spans = [slots ** level for level in range(levels + 1)]
+        self.wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.overflow = []
+        self.ready = []
+        self.current = int(start // tick)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, key, due):
+        """
+        Adds a key.
+
+        Args:
+            key: Returned by advance() once due.
+            due (float): Timestamp the key is due at; keys already due fire on the next advance().
+        """
+        self.size += 1
+        self._place(math.ceil(due / self.tick), key)
+
+    def _place(self, due_tick, key):
+        if due_tick <= self.current:
+            self.ready.append(key)
+            return
+        for level in range(self.levels):
+            # The lowest level whose current turn contains the due tick
+            if due_tick // self.spans[level + 1] == self.current // self.spans[level + 1]:
+                self.wheels[level][(due_tick // self.spans[level]) % self.slots].append((due_tick, key))
+                return
+        heapq.heappush(self.overflow, (due_tick, id(key), key))
+
+    def advance(self, now):
+        """
+        Advances the wheel to a time.
+
+        Args:
+            now (float): The current timestamp.
+
+        Returns:
+            list: The keys that became due, in due order per tick.
+        """
+        target = int(now // self.tick)
+        due, self.ready = self.ready, []
+        while self.current < target:
+            # Jump over the ticks at which no slot fires or moves down
+            self.current = min(self._next_event(), target)
+            # Turn the higher levels whose slot boundary was reached, from the top down
+            for level in range(self.levels - 1, 0, -1):
+                if self.current % self.spans[level] == 0:
+                    self._cascade(level)
+            slot = self.wheels[0][self.current % self.slots]
+            if slot:
+                due.extend(key for _, key in slot)
+                slot.clear()
+            due.extend(self.ready)
+            self.ready = []
+        self.size -= len(due)
+        return due
+
+    def _next_event(self):
+        """
+        Returns the first tick after the current one at which a non-empty slot is reached.
+        """
+        top = self.spans[self.levels]
+        best = (self.overflow[0][0] // top) * top if self.overflow else math.inf
+        for level in range(self.levels):
+            span = self.spans[level]
+            position = self.current // span
+            # Entries of a level lie within the current turn of the level above
+            for index in range(position + 1, (position // self.slots + 1) * self.slots):
+                if self.wheels[level][index % self.slots]:
+                    best = min(best, index * span)
+                    break
+        return best
+
+    def _cascade(self, level):
+        if level == self.levels - 1 and self.current % self.spans[self.levels] == 0:
+            top = self.current // self.spans[self.levels]
+            while self.overflow and self.overflow[0][0] // self.spans[self.levels] <= top:
+                due_tick, _, key = heapq.heappop(self.overflow)
+                self._place(due_tick, key)
+        slot = self.wheels[level][(self.current // self.spans[level]) % self.slots]
+        entries, slot[:] = list(slot), []
+        for due_tick, key in entries:
+            self._place(due_tick, key)
+
+
+class DeliveryScheduler:
+    """
+    Sends scheduled durable deliveries when they are due.
+
+    Scheduled deliveries are stored as pending Delivery rows whose available_at is the due
+    time, so they survive restarts and any durable delivery worker would send them once due.
+    The scheduler keeps the IDs of the rows due within the next `horizon` seconds in a timing
+    wheel: the rows it stored itself, plus those loaded when it starts and, as time passes, the
+    next window of the (status, available_at) index. A ticker thread advances the wheel and
+    hands the due IDs to sender threads, which claim them through the workers' leases, so a
+    delivery held by several schedulers or workers is still sent once.
+
+    Attributes:
+        tick (float): Seconds per tick of the wheel.
+        horizon (float): Seconds ahead whose deliveries are kept in memory.
+        senders (int): Threads sending due deliveries.
+        name (str): Identifies the scheduler in lease tokens.
+    """
+
+    def __init__(self, tick=None, horizon=None, senders=None, name=None, clock=time.time):
+        """
+        Initializes the DeliveryScheduler.
+
+        Args:
+            tick (float): Defaults to settings.DELIVERY_SCHEDULER_TICK.
+            horizon (float): Defaults to settings.DELIVERY_SCHEDULER_HORIZON.
+            senders (int): Defaults to settings.DELIVERY_SCHEDULER_SENDERS.
+            name (str): Defaults to the host name and process ID.
+            clock (callable): Returns the current timestamp.
+        """
+        self.tick = tick or getattr(settings, 'DELIVERY_SCHEDULER_TICK', 1.0)
+        self.horizon = horizon or getattr(settings, 'DELIVERY_SCHEDULER_HORIZON', 3600)
+        self.senders = senders or getattr(settings, 'DELIVERY_SCHEDULER_SENDERS', 4)
+        self.name = name or f"scheduler-{socket.gethostname()}-{os.getpid()}"
+        self.clock = clock
+        self.wheel = TimingWheel(self.tick, start=clock())
+        self.lock = threading.Lock()
+        self.loaded_until = None
+        self.workers = {}
+        self.executor = None
+        self.thread = None
+        self.stopped = threading.Event()
+        self.fired = 0
+
+    def schedule(self, alias, ids, due):
+        """
+        Adds stored deliveries to the wheel.
+
+        Args:
+            alias (str): The tenant shard holding the deliveries.
+            ids (list): The delivery IDs.
+            due (datetime): When they are due.
+        """
+        timestamp = due.timestamp()
+        with self.lock:
+            # Rows beyond the loaded window are picked up with the next window instead
+            if self.loaded_until is None or timestamp > self.loaded_until:
+                return
+            for pk in ids:
+                self.wheel.add((alias, pk), timestamp)
+
+    def load(self, until):
+        """
+        Adds the pending deliveries due up to a time that are not loaded yet.
+
+        Args:
+            until (float): Timestamp the window ends at.
+
+        Returns:
+            int: The number of deliveries added.
+        """
+        from .models import Delivery
+        added = 0
+        with self.lock:
+            # Move the window first: a delivery stored meanwhile is then added by schedule(), at
+            # worst in addition to being loaded, and never missed
+            since, self.loaded_until = self.loaded_until, until
+        for alias in get_shards():
+            rows = Delivery.objects.using(alias).filter(
+                status=Delivery.PENDING, available_at__lte=datetime.fromtimestamp(until, dt_timezone.utc))
+            if since is not None:
+                rows = rows.filter(available_at__gt=datetime.fromtimestamp(since, dt_timezone.utc))
+            for pk, available_at in rows.values_list('pk', 'available_at').iterator(chunk_size=2000):
+                with self.lock:
+                    self.wheel.add((alias, pk), available_at.timestamp())
+                added += 1
+        return added
+
+    def start(self):
+        """
+        Loads the deliveries due within the horizon, overdue ones included, and starts ticking.
+        """
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run, name='delivery-scheduler', daemon=True)
+        self.executor = ThreadPoolExecutor(self.senders, thread_name_prefix='delivery-scheduler-send')
+        try:
+            self.load(self.clock() + self.horizon)
+        finally:
+            close_old_connections()
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+    def run(self):
+        while not self.stopped.wait(self.tick):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Delivery scheduler tick failed")
+            finally:
+                close_old_connections()
+
+    def run_once(self):
+        """
+        Advances the wheel, loads the next window when half of the current one has passed, and
+        submits the due deliveries to the sender threads.
+
+        Returns:
+            int: The number of deliveries that became due.
+        """
+        now = self.clock()
+        if self.loaded_until is not None and self.loaded_until - now < self.horizon / 2:
+            self.load(now + self.horizon)
+        with self.lock:
+            due = self.wheel.advance(now)
+        self.fired += len(due)
+        batches = defaultdict(list)
+        for alias, pk in due:
+            batches[alias].append(pk)
+        for alias, ids in batches.items():
+            batch_size = self.worker(alias).batch_size
+            for start in range(0, len(ids), batch_size):
+                self.submit(alias, ids[start:start + batch_size])
+        return len(due)
+
+    def submit(self, alias, ids):
+        if self.executor is None:
+            self.send(alias, ids)
+        else:
+            self.executor.submit(self.send, alias, ids)
+
+    def worker(self, alias):
+        from .workers import DeliveryWorker
+        if alias not in self.workers:
+            self.workers[alias] = DeliveryWorker(name=self.name, database=alias)
+        return self.workers[alias]
+
+    def send(self, alias, ids):
+        """
+        Claims and sends due deliveries, and puts back those still pending for later.
+
+        Retried deliveries return to the wheel at their backoff time. Deliveries that could not
+        be claimed, because another worker holds them or an earlier event of their ordering
+        partition is pending, are checked again after a lease period.
+
+        Args:
+            alias (str): The tenant shard.
+            ids (list): IDs of deliveries that became due.
+        """
+        from .models import Delivery
+        worker = self.worker(alias)
+        try:
+            token, deliveries = worker.claim(ids)
+            if deliveries:
+                worker.process(token, deliveries)
+            retry = [(delivery.pk, delivery.available_at.timestamp()) for delivery in deliveries
+                     if delivery.status == Delivery.PENDING]
+            claimed = {delivery.pk for delivery in deliveries}
+            unclaimed = [pk for pk in ids if pk not in claimed]
+            if unclaimed:
+                recheck = self.clock() + worker.lease_seconds
+                retry += [(pk, recheck) for pk in Delivery.objects.using(alias).filter(
+                    pk__in=unclaimed, status=Delivery.PENDING).values_list('pk', flat=True)]
+            with self.lock:
+                for pk, timestamp in retry:
+                    if self.loaded_until is not None and timestamp <= self.loaded_until:
+                        self.wheel.add((alias, pk), timestamp)
+        except Exception:
+            logger.exception("Sending scheduled deliveries failed")
+        finally:
+            close_old_connections()
+
+    def collect(self):
+        """
+        Returns the scheduler metrics.
+
+        Returns:
+            list: Metric samples for the metrics registry.
+        """
+        return [
+            ('delivery_scheduled_pending', 'gauge', "Scheduled deliveries held in the timing wheel.", {}, len(self.wheel)),
+            ('delivery_scheduled_fired_total', 'counter', "Scheduled deliveries that became due.", {}, self.fired),
+        ]
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_delivery_scheduler():
+    """
+    Returns the process's delivery scheduler, starting it on first use.
+
+    Returns:
+        DeliveryScheduler: The scheduler, or None if settings.DELIVERY_SCHEDULER is off.
+    """
+    global _scheduler
+    if not getattr(settings, 'DELIVERY_SCHEDULER', False):
+        return None
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                scheduler = DeliveryScheduler()
+                scheduler.start()
+                registry.register(scheduler.collect)
+                _scheduler = scheduler
+    return _scheduler
@@ -1,5 +1,7 @@
+from django.core.exceptions import ValidationError
 from rest_framework import serializers
 from .models import Account, Destination
+from .sharding import shard_map
 
 # class AccountSerializer(serializers.ModelSerializer):
 #     class Meta:
@@ -75,10 +77,34 @@ class AccountSerializer(BaseSerializer):
         # Specify the model for this serializer.
         model = Account
 
+class ShardedAccountField(serializers.PrimaryKeyRelatedField):
+    """
+    Account reference resolved on the shard holding the account.
+    """
+
+    def to_internal_value(self, data):
+        """
+        Looks up the referenced account on its shard.
+
+        Raises:
+            serializers.ValidationError: If the ID is malformed or no shard has the account.
+        """
+        try:
+            account_id = Account._meta.pk.to_python(data)
+        except ValidationError:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        account = shard_map.manager(Account, shard_map.shard_of(account_id)).filter(pk=account_id).first()
+        if account is None:
+            self.fail('does_not_exist', pk_value=data)
+        return account
+
+
 class DestinationSerializer(BaseSerializer):
     """
     Serializer for the Destination model, inheriting common behavior from BaseSerializer.
     """
+    account = ShardedAccountField(queryset=Account.objects.all())
+
     class Meta(BaseSerializer.Meta):
         # Specify the model for this serializer.
         model = Destination
@@ -0,0 +1,382 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+# Models whose rows live on the shard of the account they belong to, and the change outbox of each shard
+TENANT_MODELS = frozenset({
+    'account', 'destination', 'destinationstats', 'deliveryrollup', 'delivery', 'shardchange', 'shardchangesequence',
+})
+
+
+def get_shards():
+    """
+    Returns the database aliases tenants are spread over.
+
+    Returns:
+        list: settings.TENANT_SHARDS, defaulting to the default database only.
+    """
+    return list(getattr(settings, 'TENANT_SHARDS', None) or [DEFAULT_DB_ALIAS])
+
+
+def placement(account_id, shards=None):
+    """
+    Picks the shard of an account by rendezvous hashing of its ID.
+
+    Every shard gets a score from the hash of its alias and the account ID, and the highest
+    score wins. Adding a shard therefore only moves the accounts the new shard wins, about
+    1/N of them, and removing one only moves the accounts it held.
+
+    Args:
+        account_id: The account ID.
+        shards (list): The shard aliases. Defaults to get_shards().
+
+    Returns:
+        str: The database alias.
+    """
+    shards = shards or get_shards()
+    if len(shards) == 1:
+        return shards[0]
+    key = str(account_id).encode('utf-8')
+    return max(shards, key=lambda alias: hashlib.blake2b(key, key=alias.encode('utf-8')[:64], digest_size=8).digest())
+
+
+class ShardMap:
+    """
+    Locates the shard of accounts, by account ID or by app secret token.
+
+    The ShardDirectory table on the default database records where each account lives, so
+    accounts stay put when TENANT_SHARDS changes until `manage.py rebalance_shards` moves them.
+    Accounts without an entry are where placement() puts them. Lookups are cached for `ttl`
+    seconds per process. With a single shard, no lookups happen at all.
+    """
+
+    def __init__(self, ttl=None, max_entries=None, clock=time.monotonic):
+        """
+        Initializes the ShardMap.
+
+        Args:
+            ttl (float): Seconds a directory lookup is cached. Defaults to settings.SHARD_DIRECTORY_CACHE_TTL.
+            max_entries (int): Maximum number of cached lookups. Defaults to settings.SHARD_DIRECTORY_CACHE_SIZE.
+            clock (callable): Monotonic time source.
+        """
+        self.ttl = ttl if ttl is not None else getattr(settings, 'SHARD_DIRECTORY_CACHE_TTL', 60)
+        self.max_entries = max_entries or getattr(settings, 'SHARD_DIRECTORY_CACHE_SIZE', 10000)
+        self.clock = clock
+        self.entries = OrderedDict()  # account id or ('token', token) -> (alias, expires)
+        self.lock = threading.Lock()
+
+    def cached(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] <= self.clock():
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def remember(self, key, alias):
+        with self.lock:
+            self.entries[key] = (alias, self.clock() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def forget(self, account_id, token=None):
+        with self.lock:
+            self.entries.pop(str(account_id), None)
+            self.entries.pop(('token', str(token)), None)
+
+    def shard_of(self, account_id):
+        """
+        Returns the alias of the shard holding an account.
+
+        Args:
+            account_id: The account ID.
+
+        Returns:
+            str: The database alias.
+        """
+        shards = get_shards()
+        if len(shards) == 1 or account_id is None:
+            return shards[0]
+        key = str(account_id)
+        alias = self.cached(key)
+        if alias is None:
+            from .models import ShardDirectory
+
+            alias = (ShardDirectory.objects.using(DEFAULT_DB_ALIAS).filter(account_id=account_id)
+                     .values_list('shard', flat=True).first()) or placement(account_id, shards)
+            self.remember(key, alias)
+        return alias
+
+    def shard_for(self, account):
+        """
+        Returns the alias of the shard holding an account instance.
+
+        Args:
+            account (Account): The account; its own database wins if it was loaded from one.
+
+        Returns:
+            str: The database alias.
+        """
+        state = getattr(account, '_state', None)
+        if state is not None and state.db:
+            return state.db
+        return self.shard_of(getattr(account, 'pk', None))
+
+    def shard_of_token(self, token):
+        """
+        Returns the alias of the shard holding the account of an app secret token.
+
+        Tokens missing from the directory, e.g. of accounts created before sharding was enabled,
+        are searched on every shard and then recorded.
+
+        Args:
+            token (str): The app secret token.
+
+        Returns:
+            str: The database alias, or None if no shard has the token.
+        """
+        shards = get_shards()
+        if len(shards) == 1:
+            return shards[0]
+        from .models import Account, ShardDirectory
+
+        key = ('token', str(token))
+        alias = self.cached(key)
+        if alias is not None:
+            return alias
+        alias = (ShardDirectory.objects.using(DEFAULT_DB_ALIAS).filter(app_secret_token=token)
+                 .values_list('shard', flat=True).first())
+        if alias is None:
+            for shard in shards:
+                account = Account.objects.using(shard).filter(app_secret_token=token).first()
+                if account is not None:
+                    self.record(account, shard)
+                    alias = shard
+                    break
+            else:
+                return None
+        self.remember(key, alias)
+        return alias
+
+    def record(self, account, alias=None):
+        """
+        Records the shard of an account in the directory.
+
+        Args:
+            account (Account): The account.
+            alias (str): The database alias. Defaults to the account's database.
+        """
+        from .models import ShardDirectory
+
+        alias = alias or self.shard_for(account)
+        ShardDirectory.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+            account_id=account.pk, defaults={'app_secret_token': account.app_secret_token, 'shard': alias},
+        )
+        self.forget(account.pk, account.app_secret_token)
+
+    def record_many(self, accounts, alias):
+        """
+        Records the shard of new accounts in the directory with one insert per batch. With a
+        single shard, there is no directory to keep.
+
+        Args:
+            accounts (list): Accounts without a directory entry yet.
+            alias (str): The database alias holding them.
+        """
+        from .models import ShardDirectory
+
+        if len(get_shards()) == 1:
+            return
+
+        ShardDirectory.objects.using(DEFAULT_DB_ALIAS).bulk_create([
+            ShardDirectory(account_id=account.pk, app_secret_token=account.app_secret_token, shard=alias)
+            for account in accounts
+        ])
+        for account in accounts:
+            self.forget(account.pk, account.app_secret_token)
+
+    def manager(self, model, alias):
+        """
+        Returns the manager of a tenant model on a shard.
+
+        Args:
+            model: The tenant model class.
+            alias (str): The database alias.
+
+        Returns:
+            Manager: `model.objects` itself with a single shard, otherwise a copy bound to the shard.
+        """
+        if len(get_shards()) == 1:
+            return model.objects
+        return model.objects.db_manager(alias)
+
+    def in_bulk(self, model, ids):
+        """
+        Loads tenant rows by primary key from whichever shard holds them.
+
+        Only for models whose IDs are unique across shards, such as destinations, whose IDs come
+        from DestinationSequence.
+
+        Args:
+            model: The tenant model class.
+            ids (iterable): The primary keys.
+
+        Returns:
+            dict: Primary key -> instance, bound to the shard it was loaded from.
+        """
+        ids = list(ids)
+        found = {}
+        for alias in get_shards():
+            found.update(self.manager(model, alias).in_bulk(ids))
+        return found
+
+    def group(self, account_ids):
+        """
+        Groups account IDs by the shard holding them.
+
+        Returns:
+            dict: Database alias -> list of account IDs.
+        """
+        groups = {}
+        for account_id in account_ids:
+            groups.setdefault(self.shard_of(account_id), []).append(account_id)
+        return groups
+
+
+shard_map = ShardMap()
+
+
+class TenantRouter:
+    """
+    Routes tenant rows to the shard of their account.
+
+    Queries with an instance hint, such as saving a model or following a related manager, go
+    to the shard of the instance's account. Queries without one go to the default database;
+    tenant code that has no instance at hand selects the shard with `using()`. Tenant tables
+    are created on every shard, everything else only on the default database.
+    """
+
+    def account_id(self, instance):
+        if instance._meta.model_name == 'account':
+            return instance.pk
+        if instance._meta.model_name == 'destinationstats':
+            destination = instance._state.fields_cache.get('destination')
+            return destination.account_id if destination is not None else None
+        return getattr(instance, 'account_id', None)
+
+    def db_for_model(self, model, **hints):
+        if model._meta.app_label != 'data_pusher_app' or model._meta.model_name not in TENANT_MODELS:
+            return None
+        instance = hints.get('instance')
+        if instance is None or len(get_shards()) == 1:
+            return None
+        if instance._state.db:
+            return instance._state.db
+        account_id = self.account_id(instance)
+        return shard_map.shard_of(account_id) if account_id is not None else None
+
+    db_for_read = db_for_model
+    db_for_write = db_for_model
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if obj1._state.db and obj2._state.db and len(get_shards()) > 1:
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS:
+            return None
+        return app_label == 'data_pusher_app' and model_name in TENANT_MODELS and db in get_shards()
+
+
+class ShardRebalancer:
+    """
+    Moves accounts to the shard placement() assigns them under the current TENANT_SHARDS.
+
+    An account is moved with its destinations, deliveries, statistics and rollups in one transaction on
+    each side. Destinations keep their IDs, which are unique across shards. Every account visited
+    is recorded in the shard directory, so ingest finds it without searching the shards.
+
+    Attributes:
+        shards (list): The shards accounts are placed on.
+        sources (list): The shards scanned for accounts, including shards being drained.
+        dry_run (bool): Only report what would move.
+    """
+
+    def __init__(self, shards=None, drain=(), dry_run=False):
+        """
+        Initializes the ShardRebalancer.
+
+        Args:
+            shards (list): Defaults to get_shards().
+            drain (iterable): Aliases no longer in TENANT_SHARDS whose accounts must move off.
+            dry_run (bool): Only report what would move.
+        """
+        self.shards = list(shards or get_shards())
+        self.sources = self.shards + [alias for alias in drain if alias not in self.shards]
+        self.dry_run = dry_run
+
+    def plan(self):
+        """
+        Yields the accounts to move.
+
+        Yields:
+            tuple: The account, its current shard and its target shard.
+        """
+        from .models import Account
+
+        for source in self.sources:
+            for account in Account.objects.using(source).order_by('pk').iterator():
+                yield account, source, placement(account.pk, self.shards)
+
+    def move(self, account, source, target):
+        """
+        Copies an account and its rows to the target shard, then deletes them from the source.
+
+        Args:
+            account (Account): The account, loaded from the source.
+            source (str): The current shard.
+            target (str): The new shard.
+        """
+        from .models import Account, Delivery, DeliveryRollup, Destination, DestinationStats
+
+        with transaction.atomic(using=target), transaction.atomic(using=source):
+            destinations = list(Destination.objects.using(source).filter(account_id=account.pk).order_by('pk'))
+            deliveries = list(Delivery.objects.using(source).filter(account_id=account.pk).order_by('pk'))
+            stats = list(DestinationStats.objects.using(source).filter(destination__account_id=account.pk))
+            rollups = list(DeliveryRollup.objects.using(source).filter(account_id=account.pk))
+            Account.objects.using(target).bulk_create([account])
+            Destination.objects.using(target).bulk_create(destinations)
+            # Deliveries, statistics and rollups are numbered by each shard; they get new IDs
+            for row in deliveries + stats + rollups:
+                row.pk = None
+            Delivery.objects.using(target).bulk_create(deliveries)
+            DestinationStats.objects.using(target).bulk_create(stats)
+            DeliveryRollup.objects.using(target).bulk_create(rollups)
+            Account.objects.using(source).filter(pk=account.pk).delete()
+
+    def run(self):
+        """
+        Moves every misplaced account.
+
+        Returns:
+            dict: Numbers of accounts moved and already in place.
+        """
+        counts = {'moved': 0, 'in_place': 0}
+        # Plan before moving, so accounts moved to a later source are not visited twice
+        for account, source, target in list(self.plan()):
+            if source == target:
+                counts['in_place'] += 1
+            else:
+                counts['moved'] += 1
+            if self.dry_run:
+                continue
+            if source != target:
+                self.move(account, source, target)
+            if len(self.shards) > 1:
+                shard_map.record(account, target)
+        return counts
@@ -0,0 +1,348 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+from array import array
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from .metrics import registry
+from .models import Account, Destination
+from .sharding import get_shards
+
+MAGIC = b'DPRS'
+FORMAT_VERSION = 1
+
+# magic, format version, reserved, snapshot version, record count, slot count, index offset
+HEADER = struct.Struct('<4sHHQIIQ')
+# token hash, record offset
+SLOT = struct.Struct('<QQ')
+# token bytes, payload length
+RECORD = struct.Struct('<16sI')
+
+
+def token_bytes(token):
+    """
+    Convert an app secret token into its canonical 16 bytes.
+
+    Args:
+        token: The token as a UUID or any string form accepted by uuid.UUID.
+
+    Returns:
+        bytes: The token bytes, or None if the token is not a valid UUID.
+    """
+    if isinstance(token, uuid.UUID):
+        return token.bytes
+    try:
+        return uuid.UUID(str(token)).bytes
+    except ValueError:
+        return None
+
+
+def token_hash(raw):
+    """
+    Hash token bytes into a non-zero 64-bit slot key.
+
+    Args:
+        raw (bytes): The canonical token bytes.
+
+    Returns:
+        int: The hash; 0 is reserved for empty slots.
+    """
+    return int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), 'little') or 1
+
+
+def snapshot_fields(model):
+    """
+    Return the fields stored in the snapshot for a model.
+
+    Args:
+        model: Either Account or Destination.
+
+    Returns:
+        list: The concrete fields, without bookkeeping timestamps and the destination's account.
+    """
+    return [field for field in model._meta.concrete_fields if field.name not in ('updated_at', 'account')]
+
+
+class SnapshotWriter:
+    """
+    Compiles all accounts, their tokens and destinations into a routing snapshot file.
+
+    The file consists of a fixed header, one record per account, and an open-addressing hash
+    index from token hash to record offset. Each record holds the raw token, used to confirm
+    a lookup, followed by the account and its destinations as compact JSON. Accounts and
+    destinations are streamed from the database and merged in primary key order, so building
+    only keeps the index entries in memory. The file is written next to the target and renamed
+    into place, so readers never see a partial snapshot.
+    """
+
+    def __init__(self, path, chunk_size=2000):
+        """
+        Initializes the SnapshotWriter.
+
+        Args:
+            path (str): Path of the snapshot file.
+            chunk_size (int): Rows fetched per cursor round trip.
+        """
+        self.path = str(path)
+        self.chunk_size = chunk_size
+
+    def iter_routes(self):
+        """
+        Yields each account with its destinations by merging two ordered row streams per shard.
+
+        Yields:
+            tuple: The account values and a list of its destination values.
+        """
+        account_fields = [field.attname for field in snapshot_fields(Account)]
+        destination_fields = ['account_id'] + [field.attname for field in snapshot_fields(Destination)]
+        for alias in get_shards():
+            accounts = (Account.objects.using(alias).order_by('pk').values(*account_fields)
+                        .iterator(chunk_size=self.chunk_size))
+            destinations = (Destination.objects.using(alias).order_by('account_id', 'pk').values(*destination_fields)
+                            .iterator(chunk_size=self.chunk_size))
+            pending = next(destinations, None)
+            for account in accounts:
+                routes = []
+                while pending is not None and pending['account_id'] < account['account_id']:
+                    pending = next(destinations, None)
+                while pending is not None and pending['account_id'] == account['account_id']:
+                    del pending['account_id']
+                    routes.append(pending)
+                    pending = next(destinations, None)
+                yield account, routes
+
+    def write(self, version=None):
+        """
+        Builds the snapshot and atomically replaces the target file.
+
+        Args:
+            version (int): Snapshot version stored in the header. Defaults to the current time in nanoseconds.
+
+        Returns:
+            tuple: The snapshot version and the number of accounts written.
+        """
+        version = version or time.time_ns()
+        hashes, offsets = array('Q'), array('Q')
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(b'\0' * HEADER.size)
+            for account, destinations in self.iter_routes():
+                raw = token_bytes(account['app_secret_token'])
+                payload = json.dumps({'account': account, 'destinations': destinations},
+                                     cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8')
+                hashes.append(token_hash(raw))
+                offsets.append(f.tell())
+                f.write(RECORD.pack(raw, len(payload)))
+                f.write(payload)
+
+            # Keep the load factor at or below one half so probe sequences stay short
+            slot_count = max(8, 1 << (len(hashes) * 2 - 1).bit_length())
+            mask = slot_count - 1
+            index = bytearray(SLOT.size * slot_count)
+            for key, offset in zip(hashes, offsets):
+                slot = key & mask
+                while SLOT.unpack_from(index, slot * SLOT.size)[0]:
+                    slot = (slot + 1) & mask
+                SLOT.pack_into(index, slot * SLOT.size, key, offset)
+            index_offset = f.tell()
+            f.write(index)
+
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, version, len(hashes), slot_count, index_offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        return version, len(hashes)
+
+
+class RoutingSnapshot:
+    """
+    A read-only, memory-mapped routing snapshot.
+
+    Lookups hash the token, probe the index and decode a single record straight from the
+    mapped file, without touching the database. The operating system shares the mapped pages
+    between worker processes.
+
+    Attributes:
+        version (int): The snapshot version from the header.
+        record_count (int): Number of accounts in the snapshot.
+    """
+
+    def __init__(self, path):
+        """
+        Maps a snapshot file.
+
+        Args:
+            path (str): Path of the snapshot file.
+
+        Raises:
+            ValueError: If the file is not a valid snapshot.
+        """
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.buffer) < HEADER.size:
+            raise ValueError("Routing snapshot is truncated")
+        magic, format_version, _, self.version, self.record_count, self.slot_count, self.index_offset = \
+            HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError("Not a routing snapshot of a supported format")
+        if self.index_offset + self.slot_count * SLOT.size > len(self.buffer):
+            raise ValueError("Routing snapshot is truncated")
+        self.account_fields = {field.attname: field for field in snapshot_fields(Account)}
+        self.destination_fields = {field.attname: field for field in snapshot_fields(Destination)}
+
+    def find(self, token):
+        """
+        Locates the record of a token.
+
+        Args:
+            token: The app secret token.
+
+        Returns:
+            int: The record offset, or None if the token is not in the snapshot.
+        """
+        raw = token_bytes(token)
+        if raw is None:
+            return None
+        key = token_hash(raw)
+        mask = self.slot_count - 1
+        slot = key & mask
+        while True:
+            slot_key, offset = SLOT.unpack_from(self.buffer, self.index_offset + slot * SLOT.size)
+            if slot_key == 0:
+                return None
+            if slot_key == key and self.buffer[offset:offset + 16] == raw:
+                return offset
+            slot = (slot + 1) & mask
+
+    def lookup(self, token):
+        """
+        Returns the account and destinations of a token.
+
+        Args:
+            token: The app secret token.
+
+        Returns:
+            tuple: An unsaved Account and its list of unsaved Destination instances, or None
+            if the token is not in the snapshot.
+        """
+        offset = self.find(token)
+        if offset is None:
+            return None
+        _, length = RECORD.unpack_from(self.buffer, offset)
+        start = offset + RECORD.size
+        record = json.loads(self.buffer[start:start + length])
+        account = Account(**{
+            name: self.account_fields[name].to_python(value) for name, value in record['account'].items()
+        })
+        destinations = [
+            Destination(account=account, **{
+                name: self.destination_fields[name].to_python(value) for name, value in destination.items()
+            })
+            for destination in record['destinations']
+        ]
+        return account, destinations
+
+
+class SnapshotManager:
+    """
+    Keeps the current routing snapshot of the process and hot-swaps newer ones.
+
+    The file is mapped on first use and its identity is re-checked at most once per
+    interval; when it was replaced by a newer version, the new file is mapped and swapped in.
+    Readers holding the previous snapshot keep using it until they are done.
+    """
+
+    def __init__(self, path=None, check_interval=None):
+        """
+        Initializes the SnapshotManager.
+
+        Args:
+            path (str): Path of the snapshot. Defaults to settings.ROUTING_SNAPSHOT_PATH; None disables snapshots.
+            check_interval (float): Seconds between checks for a newer file. Defaults to settings.ROUTING_SNAPSHOT_CHECK_INTERVAL.
+        """
+        self.path = path if path is not None else getattr(settings, 'ROUTING_SNAPSHOT_PATH', None)
+        self.check_interval = check_interval if check_interval is not None else \
+            getattr(settings, 'ROUTING_SNAPSHOT_CHECK_INTERVAL', 5)
+        self.snapshot = None
+        self.identity = None
+        self.next_check = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def current(self):
+        """
+        Returns the current snapshot, mapping a newer file if one appeared.
+
+        Returns:
+            RoutingSnapshot: The snapshot, or None if snapshots are disabled or unavailable.
+        """
+        if not self.path:
+            return None
+        now = time.monotonic()
+        if now < self.next_check:
+            return self.snapshot
+        with self.lock:
+            if now < self.next_check:
+                return self.snapshot
+            self.next_check = now + self.check_interval
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return self.snapshot
+            identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if identity != self.identity:
+                try:
+                    snapshot = RoutingSnapshot(self.path)
+                except (OSError, ValueError):
+                    return self.snapshot
+                if self.snapshot is None or snapshot.version >= self.snapshot.version:
+                    self.snapshot = snapshot
+                self.identity = identity
+            return self.snapshot
+
+    def lookup(self, token):
+        """
+        Looks a token up in the current snapshot.
+
+        Args:
+            token: The app secret token.
+
+        Returns:
+            tuple: The account and its destinations, or None if there is no snapshot or the
+            token is not in it.
+        """
+        snapshot = self.current()
+        if snapshot is None:
+            return None
+        route = snapshot.lookup(token)
+        if route is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return route
+
+    def collect(self):
+        """
+        Returns the snapshot metrics.
+
+        Returns:
+            list: Metric samples for the metrics registry.
+        """
+        snapshot = self.snapshot
+        return [
+            ('routing_snapshot_version', 'gauge', "Version of the mapped routing snapshot.", {},
+             snapshot.version if snapshot else 0),
+            ('routing_snapshot_lookups_total', 'counter', "Routing snapshot lookups.", {'result': 'hit'}, self.hits),
+            ('routing_snapshot_lookups_total', 'counter', "Routing snapshot lookups.", {'result': 'miss'}, self.misses),
+        ]
+
+
+routing_snapshots = SnapshotManager()
+registry.register(routing_snapshots.collect)
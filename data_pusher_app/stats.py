@@ -0,0 +1,315 @@
+import threading
+import time
+from array import array
+from collections import deque
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from .sharding import get_shards, shard_map
+
+# Each power of two of microseconds is split into 2**SUB_BUCKET_BITS buckets, bounding the
+# relative error of a recorded latency to 1 / 2**SUB_BUCKET_BITS
+SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# Latencies are clamped to 2**36 microseconds (about 19 hours)
+MAX_EXPONENT = 36
+BUCKET_COUNT = (MAX_EXPONENT - SUB_BUCKET_BITS + 1) * SUB_BUCKETS
+
+
+def bucket_index(micros):
+    """
+    Maps a latency to its histogram bucket.
+
+    Args:
+        micros (int): The latency in microseconds.
+
+    Returns:
+        int: The bucket index.
+    """
+    micros = min(max(micros, 0), (1 << MAX_EXPONENT) - 1)
+    if micros < SUB_BUCKETS:
+        return micros
+    shift = micros.bit_length() - 1 - SUB_BUCKET_BITS
+    return shift * SUB_BUCKETS + (micros >> shift)
+
+
+def bucket_upper_bound(index):
+    """
+    Returns the largest latency in microseconds that falls into a bucket.
+    """
+    if index < SUB_BUCKETS:
+        return index
+    shift, mantissa = divmod(index, SUB_BUCKETS)
+    return ((mantissa + SUB_BUCKETS + 1) << (shift - 1)) - 1
+
+
+class LatencyHistogram:
+    """
+    A fixed-size, log-linear latency histogram with success and error counts.
+
+    Recording is a couple of array increments without locking; concurrent recordings may
+    very rarely lose an increment, which is acceptable for statistics.
+
+    Attributes:
+        counts (array): Recordings per bucket.
+        errors (int): Recordings of failed deliveries.
+        max_micros (int): Largest recorded latency.
+    """
+    __slots__ = ('counts', 'errors', 'max_micros')
+
+    def __init__(self):
+        self.counts = array('Q', bytes(8 * BUCKET_COUNT))
+        self.errors = 0
+        self.max_micros = 0
+
+    def record(self, micros, ok=True):
+        self.counts[bucket_index(micros)] += 1
+        if not ok:
+            self.errors += 1
+        if micros > self.max_micros:
+            self.max_micros = micros
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.errors += other.errors
+        self.max_micros = max(self.max_micros, other.max_micros)
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def percentile(self, fraction):
+        """
+        Returns the latency below which the given fraction of recordings fall.
+
+        Args:
+            fraction (float): Between 0 and 1.
+
+        Returns:
+            float: The latency in milliseconds, or None without recordings.
+        """
+        total = self.count
+        if not total:
+            return None
+        rank = max(1, round(fraction * total))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bucket_upper_bound(index), self.max_micros) / 1000
+        return self.max_micros / 1000
+
+    def summary(self):
+        """
+        Returns the counts and latency percentiles.
+
+        Returns:
+            dict: Delivery, success and error counts, and p50/p90/p99/max latency in milliseconds.
+        """
+        count = self.count
+        return {
+            'deliveries': count,
+            'successes': count - self.errors,
+            'errors': self.errors,
+            'error_rate': self.errors / count if count else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p90_ms': self.percentile(0.9),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': self.max_micros / 1000 if count else None,
+        }
+
+    def to_sparse(self):
+        return {str(index): count for index, count in enumerate(self.counts) if count}
+
+    @classmethod
+    def from_sparse(cls, buckets, errors=0, max_micros=0):
+        histogram = cls()
+        for index, count in buckets.items():
+            histogram.counts[int(index)] += count
+        histogram.errors = errors
+        histogram.max_micros = max_micros
+        return histogram
+
+
+class DestinationStatsRecorder:
+    """
+    Keeps rolling delivery statistics per destination and flushes them to DestinationStats.
+
+    Each destination has a ring of `window_slots` histograms, keyed by account and destination, of `slot_seconds` each for cheap
+    in-process queries, e.g. adaptive timeouts. Recordings since the last flush are also
+    collected per account, destination and time slot; flushing merges them into one
+    DestinationStats row per destination and slot on the account's shard, so rows from all
+    worker processes add up. Flushes happen on a background thread at most every
+    `flush_interval` seconds.
+    """
+
+    def __init__(self, slot_seconds=None, window_slots=None, flush_interval=None, clock=time.time):
+        """
+        Initializes the recorder.
+
+        Args:
+            slot_seconds (int): Length of a time slot. Defaults to settings.DESTINATION_STATS_SLOT_SECONDS.
+            window_slots (int): Slots in the rolling window. Defaults to settings.DESTINATION_STATS_WINDOW_SLOTS.
+            flush_interval (float): Seconds between flushes. Defaults to settings.DESTINATION_STATS_FLUSH_INTERVAL.
+            clock (callable): Wall clock time source.
+        """
+        self.slot_seconds = slot_seconds or getattr(settings, 'DESTINATION_STATS_SLOT_SECONDS', 60)
+        self.window_slots = window_slots or getattr(settings, 'DESTINATION_STATS_WINDOW_SLOTS', 5)
+        self.flush_interval = flush_interval or getattr(settings, 'DESTINATION_STATS_FLUSH_INTERVAL', 10)
+        self.clock = clock
+        self.windows = {}  # (account id, destination id) -> deque of (slot start, histogram)
+        self.pending = {}  # (account id, destination id, slot start) -> histogram
+        self.lock = threading.Lock()
+        self.flushing = False
+        self.next_flush = clock() + self.flush_interval
+
+    def slot_for(self, now):
+        return int(now // self.slot_seconds) * self.slot_seconds
+
+    def record(self, destination_id, seconds, ok, account_id=None):
+        """
+        Records the outcome of one delivery.
+
+        Args:
+            destination_id (int): The destination's primary key.
+            seconds (float): How long the delivery took.
+            ok (bool): Whether it succeeded.
+            account_id: The destination's account, locating its shard. Without it, the
+                statistics are flushed to the first shard.
+        """
+        now = self.clock()
+        slot = self.slot_for(now)
+        micros = int(seconds * 1_000_000)
+        window = self.windows.get((account_id, destination_id))
+        key = (account_id, destination_id, slot)
+        pending = self.pending.get(key)
+        if window is None or window[-1][0] != slot or pending is None:
+            with self.lock:
+                window = self.windows.setdefault((account_id, destination_id), deque(maxlen=self.window_slots))
+                if not window or window[-1][0] != slot:
+                    window.append((slot, LatencyHistogram()))
+                pending = self.pending.setdefault(key, LatencyHistogram())
+        window[-1][1].record(micros, ok)
+        pending.record(micros, ok)
+        if now >= self.next_flush and not self.flushing:
+            self.flush_in_background()
+
+    def snapshot(self, destination_id, account_id=None):
+        """
+        Returns this process's statistics of a destination over the rolling window.
+
+        Args:
+            destination_id (int): The destination's primary key.
+            account_id: The destination's account, as passed to record().
+
+        Returns:
+            dict: The summary of LatencyHistogram.
+        """
+        oldest = self.slot_for(self.clock()) - (self.window_slots - 1) * self.slot_seconds
+        merged = LatencyHistogram()
+        for slot, histogram in list(self.windows.get((account_id, destination_id), ())):
+            if slot >= oldest:
+                merged.merge(histogram)
+        return merged.summary()
+
+    def flush_in_background(self):
+        with self.lock:
+            if self.flushing:
+                return
+            self.flushing = True
+
+        def target():
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+        threading.Thread(target=target, name='destination-stats-flush', daemon=True).start()
+
+    def flush(self):
+        """
+        Merges the recordings since the last flush into DestinationStats rows.
+
+        Returns:
+            int: The number of rows written.
+        """
+        from .models import DestinationStats
+
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushing = True
+        try:
+            by_account = {}
+            for key in pending:
+                by_account.setdefault(key[0], []).append(key)
+            written = 0
+            for alias, account_ids in shard_map.group(by_account).items():
+                keys = [key for account_id in account_ids for key in by_account[account_id]]
+                written += self.write(alias, {key: pending[key] for key in keys})
+            retention = getattr(settings, 'DESTINATION_STATS_RETENTION', timedelta(days=7))
+            for alias in get_shards():
+                DestinationStats.objects.using(alias).filter(
+                    window_start__lt=datetime.now(dt_timezone.utc) - retention
+                ).delete()
+            return written
+        finally:
+            with self.lock:
+                self.flushing = False
+                self.next_flush = self.clock() + self.flush_interval
+
+    def write(self, alias, pending):
+        """
+        Merges pending histograms into the DestinationStats rows of one shard.
+
+        Args:
+            alias (str): The database alias of the shard.
+            pending (dict): (account id, destination id, slot start) -> histogram, of accounts on the shard.
+
+        Returns:
+            int: The number of rows written.
+        """
+        from .models import Destination, DestinationStats
+
+        # Skip rows whose destination was deleted, or moved to another account since it was recorded
+        owners = {pk: str(account_id) for pk, account_id in Destination.objects.using(alias).filter(
+            pk__in={destination_id for _, destination_id, _ in pending}
+        ).values_list('pk', 'account_id')}
+        written = 0
+        with transaction.atomic(using=alias):
+            for (account_id, destination_id, slot), histogram in sorted(pending.items(), key=lambda item: item[0][1:]):
+                if destination_id not in owners or account_id is not None and str(account_id) != owners[destination_id]:
+                    continue
+                window_start = datetime.fromtimestamp(slot, dt_timezone.utc)
+                row, _ = DestinationStats.objects.using(alias).select_for_update().get_or_create(
+                    destination_id=destination_id, window_start=window_start,
+                    defaults={'window_seconds': self.slot_seconds},
+                )
+                merged = LatencyHistogram.from_sparse(row.buckets, row.errors, row.max_latency_us)
+                merged.merge(histogram)
+                row.deliveries = merged.count
+                row.errors = merged.errors
+                row.max_latency_us = merged.max_micros
+                row.buckets = merged.to_sparse()
+                row.save(using=alias)
+                written += 1
+        return written
+
+
+def summarize_rows(rows):
+    """
+    Merges flushed DestinationStats rows into one summary.
+
+    Args:
+        rows (iterable): DestinationStats instances.
+
+    Returns:
+        dict: The summary of LatencyHistogram.
+    """
+    merged = LatencyHistogram()
+    for row in rows:
+        merged.merge(LatencyHistogram.from_sparse(row.buckets, row.errors, row.max_latency_us))
+    return merged.summary()
+
+
+destination_stats = DestinationStatsRecorder()
@@ -0,0 +1,39 @@
+import uuid
+from django.apps import apps
+from django.db import connections
+from django.test import override_settings
+from data_pusher_app.models import Account
+from data_pusher_app.sharding import TENANT_MODELS, placement
+
+SHARDS = ['default', 'shard1']
+
+
+class TwoShardsMixin:
+    """
+    Runs a test case with tenants spread over the default database and 'shard1', which settings
+    add to DATABASES for test runs. The tenant tables are created on shard1 on first use, as
+    `migrate --database shard1` does once shard1 is listed in TENANT_SHARDS.
+    """
+    databases = {'default', 'shard1'}
+
+    @classmethod
+    def setUpClass(cls):
+        connection = connections['shard1']
+        existing = set(connection.introspection.table_names())
+        with connection.schema_editor() as editor:
+            for model in apps.get_app_config('data_pusher_app').get_models():
+                if model._meta.model_name in TENANT_MODELS and model._meta.db_table not in existing:
+                    editor.create_model(model)
+        cls.enterClassContext(override_settings(TENANT_SHARDS=SHARDS))
+        super().setUpClass()
+
+    def account_on(self, alias, **fields):
+        """
+        Creates an account that placement() puts on the given shard.
+        """
+        account_id = uuid.uuid4()
+        while placement(account_id, SHARDS) != alias:
+            account_id = uuid.uuid4()
+        fields.setdefault('email_id', f'{account_id.hex[:12]}@test.com')
+        fields.setdefault('account_name', f'Tenant {account_id.hex[:6]}')
+        return Account.objects.create(account_id=account_id, **fields)
@@ -0,0 +1,71 @@
+import json
+import os
+import tempfile
+import uuid
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from data_pusher_app.models import Account, Destination
+
+
+class ImportTenantsCommandTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def run_command(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_tenants', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_accounts_csv(self):
+        token = uuid.uuid4()
+        path = self.write('accounts.csv', (
+            "email_id,account_name,app_secret_token,website\n"
+            f"one@test.com,One,{token},\n"
+            "two@test.com,Two,,http://two.com\n"
+            "one@test.com,Duplicate,,\n"
+            "bad-email,Bad,,\n"
+        ))
+        out, err = self.run_command(path, '--kind', 'accounts', '--chunk-size', '2')
+        self.assertIn("Imported 2 accounts (2 rejected, 4 records read)", out)
+        self.assertIn("Record 3:", err)
+        self.assertIn("Record 4:", err)
+        self.assertEqual(Account.objects.get(email_id='one@test.com').app_secret_token, token)
+        self.assertEqual(Account.objects.count(), 2)
+
+    def test_existing_accounts_rejected_with_set_based_check(self):
+        Account.objects.create(email_id='one@test.com', account_name='Existing')
+        path = self.write('accounts.ndjson', json.dumps({'email_id': 'one@test.com', 'account_name': 'New'}) + "\n")
+        out, err = self.run_command(path, '--kind', 'accounts')
+        self.assertIn("email_id", err)
+        self.assertEqual(Account.objects.get(email_id='one@test.com').account_name, 'Existing')
+
+    def test_import_destinations_ndjson(self):
+        account = Account.objects.create(email_id='one@test.com', account_name='One')
+        lines = [
+            {'account': str(account.pk), 'url': 'http://validurl.com', 'http_method': 'POST', 'headers': {'X-Key': '1'}},
+            {'account': str(uuid.uuid4()), 'url': 'http://validurl.com', 'http_method': 'POST', 'headers': {'X-Key': '1'}},
+        ]
+        path = self.write('destinations.ndjson', "\n".join(json.dumps(line) for line in lines) + "\nnot json\n")
+        out, err = self.run_command(path, '--kind', 'destinations')
+        self.assertIn("Imported 1 destinations (2 rejected, 3 records read)", out)
+        self.assertEqual(Destination.objects.get().headers, {'X-Key': '1'})
+
+    def test_resume_from_checkpoint(self):
+        lines = [json.dumps({'email_id': f'user{i}@test.com', 'account_name': f'User {i}'}) for i in range(5)]
+        path = self.write('accounts.ndjson', "\n".join(lines) + "\n")
+        with open(f"{path}.checkpoint", 'w', encoding='utf-8') as f:
+            json.dump({'path': os.path.abspath(path), 'records': 3}, f)
+
+        out, _ = self.run_command(path, '--kind', 'accounts')
+        self.assertIn("Resuming after record 3", out)
+        self.assertEqual(sorted(Account.objects.values_list('email_id', flat=True)), ['user3@test.com', 'user4@test.com'])
+        with open(f"{path}.checkpoint", encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['records'], 5)
@@ -2,6 +2,7 @@
 from django.test import TestCase
 from django.core.exceptions import ValidationError
 from uuid import UUID
+from data_pusher_app.changes import change_feed
 from data_pusher_app.models import Account
 
 def is_uuid(uuid_string):
@@ -53,3 +54,14 @@ class AccountModelTest(TestCase):
         account.account_name = 'invalid_example'
         with self.assertRaises(ValidationError):
             account.save()
+
+    def test_save_with_empty_update_fields(self):
+        """ Test that an empty update_fields saves nothing and records no change, like Model.save(). """
+        account = Account.objects.create(email_id='noop@example.com', account_name='Before')
+        start = change_feed.latest()
+        account.account_name = 'After'
+        account.save(update_fields=[])
+        self.assertEqual(Account.objects.get(pk=account.pk).account_name, 'Before')
+        self.assertEqual(change_feed.latest(), start)
+        account.save(update_fields=['account_name'])
+        self.assertEqual(Account.objects.get(pk=account.pk).account_name, 'After')
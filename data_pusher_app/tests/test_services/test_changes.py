@@ -0,0 +1,238 @@
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from unittest.mock import patch
+from data_pusher_app.bulk import BulkAccountProcessor, BulkDestinationProcessor
+from data_pusher_app.changes import ChangeFeed, CursorExpired, change_feed, parse_change_options
+from data_pusher_app.models import Account, ChangeEvent, Destination, ShardChange, ShardChangeSequence
+from data_pusher_app.tests.shards import TwoShardsMixin
+
+
+class ChangeRecordingTest(TestCase):
+    def setUp(self):
+        self.start = change_feed.latest()
+        self.account = Account.objects.create(email_id='feed@test.com', account_name='Feed')
+
+    def destination(self, account=None, url='http://feed.com'):
+        return Destination.objects.create(account=account or self.account, url=url, http_method='POST',
+                                          headers={'X-Key': 'k'})
+
+    def changes(self):
+        changes, _ = change_feed.read(self.start)
+        return [(change.kind, change.operation, change.object_id) for change in changes]
+
+    def test_saves_and_deletes(self):
+        destination = self.destination()
+        destination.url = 'http://moved.com'
+        destination.save()
+        destination_id = str(destination.pk)
+        destination.delete()
+        self.assertEqual(self.changes(), [
+            ('account', 'upsert', str(self.account.pk)),
+            ('destination', 'upsert', destination_id),
+            ('destination', 'upsert', destination_id),
+            ('destination', 'delete', destination_id),
+        ])
+        changes, cursor = change_feed.read(self.start)
+        self.assertEqual([change.seq for change in changes], list(range(self.start + 1, self.start + 5)))
+        self.assertEqual(cursor, self.start + 4)
+        self.assertEqual(changes[2].data['url'], 'http://moved.com')
+        self.assertEqual(changes[2].data['account_id'], str(self.account.pk))
+        self.assertIsNone(changes[3].data)
+
+    def test_account_delete_records_cascaded_destinations(self):
+        destinations = [self.destination(url=f'http://feed{i}.com') for i in range(2)]
+        self.start, account_id = change_feed.latest(), str(self.account.pk)
+        self.account.delete()
+        self.assertEqual(self.changes(), [('destination', 'delete', str(d.pk)) for d in destinations]
+                         + [('account', 'delete', account_id)])
+
+    def test_moving_a_destination_leaves_the_previous_account(self):
+        other = Account.objects.create(email_id='other@test.com', account_name='Other')
+        destination = self.destination()
+        self.start = change_feed.latest()
+        destination.account = other
+        destination.save()
+        changes, _ = change_feed.read(self.start, account_id=self.account.pk)
+        self.assertEqual([(change.operation, change.object_id) for change in changes], [('delete', str(destination.pk))])
+        changes, _ = change_feed.read(self.start, account_id=other.pk)
+        self.assertEqual([(change.operation, change.object_id) for change in changes], [('upsert', str(destination.pk))])
+
+    def test_bulk_operations(self):
+        processor = BulkDestinationProcessor()
+        items = [{'account': str(self.account.pk), 'url': f'http://bulk{i}.com', 'http_method': 'POST',
+                  'headers': {'X-Key': 'k'}} for i in range(3)]
+        created = processor.create(items)['created']
+        processor.update([{'id': created[0], 'url': 'http://renamed.com'}])
+        processor.delete(created[1:])
+        accounts = BulkAccountProcessor().create([{'email_id': 'bulk-feed@test.com', 'account_name': 'Bulk'}])['created']
+        self.assertEqual(self.changes()[1:], [('destination', 'upsert', str(pk)) for pk in created]
+                         + [('destination', 'upsert', str(created[0]))]
+                         + [('destination', 'delete', str(pk)) for pk in created[1:]]
+                         + [('account', 'upsert', accounts[0])])
+
+
+class ChangeFeedTest(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create(email_id='reader@test.com', account_name='Reader')
+        self.other = Account.objects.create(email_id='noise@test.com', account_name='Noise')
+        self.start = change_feed.latest()
+        for i in range(3):
+            Destination.objects.create(account=self.other, url=f'http://noise{i}.com', http_method='POST',
+                                       headers={'X-Key': 'k'})
+        self.destination = Destination.objects.create(account=self.account, url='http://reader.com', http_method='POST',
+                                                      headers={'X-Key': 'k'})
+
+    def get(self, **params):
+        return self.client.get(reverse('changes'), params)
+
+    def test_pages(self):
+        response = self.get(since=self.start, limit=3)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([change['seq'] for change in body['changes']], [self.start + 1, self.start + 2, self.start + 3])
+        self.assertEqual((body['cursor'], body['more']), (self.start + 3, True))
+        body = self.get(since=body['cursor'], limit=3).json()
+        self.assertEqual(body['changes'], [{
+            'seq': self.start + 4, 'type': 'destination', 'op': 'upsert', 'id': str(self.destination.pk),
+            'account_id': str(self.account.pk), 'data': body['changes'][0]['data'],
+        }])
+        self.assertEqual(body['changes'][0]['data']['url'], 'http://reader.com')
+        self.assertEqual((body['cursor'], body['more']), (self.start + 4, False))
+        self.assertEqual(self.get(since=body['cursor']).json(), {'changes': [], 'cursor': self.start + 4, 'more': False})
+
+    def test_current_cursor(self):
+        self.assertEqual(self.get().json(), {'changes': [], 'cursor': self.start + 4, 'more': False})
+
+    def test_account_filter_advances_cursor(self):
+        body = self.get(since=self.start, account=str(self.other.pk), limit=10).json()
+        self.assertEqual(len(body['changes']), 3)
+        self.assertEqual(body['cursor'], self.start + 4)
+        body = self.get(since=self.start + 4, account=str(self.account.pk)).json()
+        self.assertEqual((body['changes'], body['cursor']), ([], self.start + 4))
+
+    def test_expired_cursors(self):
+        self.assertEqual(self.get(since=self.start + 100).status_code, 410)
+        ChangeEvent.objects.filter(seq__lte=self.start + 2).update(created_at=timezone.now() - timedelta(days=30))
+        out = StringIO()
+        call_command('prune_change_feed', '--max-age', str(7 * 24 * 3600), stdout=out)
+        self.assertIn('Deleted', out.getvalue())
+        self.assertFalse(ChangeEvent.objects.filter(seq__lte=self.start + 2).exists())
+        self.assertEqual(self.get(since=self.start + 1).status_code, 410)
+        self.assertEqual(len(self.get(since=self.start + 2).json()['changes']), 2)
+
+    def test_invalid_parameters(self):
+        for params in ({'since': 'x'}, {'since': '-1'}, {'since': '0', 'timeout': 'nan'}, {'account': 'nope'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.get(**params).status_code, 400)
+
+
+class LongPollTest(SimpleTestCase):
+    @override_settings(CHANGE_FEED_MAX_TIMEOUT=5, CHANGE_FEED_PAGE_SIZE=100)
+    def test_options(self):
+        options = parse_change_options({'since': '7', 'timeout': '60', 'limit': '1000'})
+        self.assertEqual((options['since'], options['timeout'], options['limit']), (7, 5, 100))
+        self.assertIsNone(parse_change_options({})['since'])
+
+    @override_settings(CHANGE_FEED_POLL_INTERVAL=30)
+    def test_notify_wakes_up_readers(self):
+        feed = ChangeFeed()
+        change = ChangeEvent(seq=6)
+        with patch.object(feed, 'read', side_effect=[([], 5), ([change], 6)]) as read:
+            threading.Timer(0.05, feed.notify).start()
+            started = time.monotonic()
+            self.assertEqual(feed.poll(5, timeout=10), ([change], 6))
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(read.call_count, 2)
+
+    @override_settings(CHANGE_FEED_POLL_INTERVAL=0.01)
+    def test_timeout_without_changes(self):
+        feed = ChangeFeed()
+        with patch.object(feed, 'read', return_value=([], 5)) as read:
+            self.assertEqual(feed.poll(5, timeout=0.1), ([], 5))
+        self.assertGreater(read.call_count, 1)
+
+    def test_cursor_expired_is_raised(self):
+        feed = ChangeFeed()
+        with patch.object(feed, 'read', side_effect=CursorExpired('pruned')), self.assertRaises(CursorExpired):
+            feed.poll(1, timeout=1)
+
+
+class ChangeAtomicityTest(TestCase):
+    def test_failed_recording_rolls_back_the_write(self):
+        account = Account.objects.create(email_id='atomic@test.com', account_name='Atomic')
+        start = change_feed.latest()
+        account.account_name = 'Renamed'
+        with patch.object(ChangeEvent, 'record', side_effect=RuntimeError('down')), self.assertRaises(RuntimeError):
+            account.save()
+        self.assertEqual(Account.objects.get(pk=account.pk).account_name, 'Atomic')
+        destination = Destination(account=account, url='http://atomic.com', http_method='POST', headers={'X-Key': 'k'})
+        with patch.object(ChangeEvent, 'record', side_effect=RuntimeError('down')), self.assertRaises(RuntimeError):
+            destination.save()
+        self.assertFalse(Destination.objects.filter(account=account).exists())
+        self.assertEqual(change_feed.latest(), start)
+
+
+class ShardedChangesTest(TwoShardsMixin, TestCase):
+    def setUp(self):
+        self.start = change_feed.latest()
+
+    def test_shard_writes_are_staged_until_published(self):
+        account = self.account_on('shard1')
+        destination = Destination.objects.create(account=account, url='http://shard.com', http_method='POST',
+                                                 headers={'X-Key': 'k'})
+        destination.url = 'http://renamed.com'
+        destination.save()
+        destination_id = str(destination.pk)
+        destination.delete()
+        # Their transactions have not committed, so nothing was published yet
+        self.assertEqual(change_feed.latest(), self.start)
+        self.assertEqual(list(ShardChange.objects.using('shard1').values_list('position', flat=True)), [1, 2, 3, 4])
+
+        changes, cursor = change_feed.read(self.start)
+        self.assertEqual([(change.kind, change.operation, change.object_id) for change in changes], [
+            ('account', 'upsert', str(account.pk)),
+            ('destination', 'upsert', destination_id),
+            ('destination', 'upsert', destination_id),
+            ('destination', 'delete', destination_id),
+        ])
+        self.assertEqual(changes[2].data['url'], 'http://renamed.com')
+        self.assertEqual(cursor, self.start + 4)
+        self.assertFalse(ShardChange.objects.using('shard1').exists())
+        self.assertEqual(ChangeEvent.publish('shard1'), 0)
+
+    def test_changes_are_published_when_the_shard_commits(self):
+        with self.captureOnCommitCallbacks(using='shard1', execute=True):
+            account = self.account_on('shard1')
+        self.assertEqual(change_feed.latest(), self.start + 1)
+        self.assertEqual(ChangeEvent.objects.get(seq=self.start + 1).object_id, str(account.pk))
+        default_account = self.account_on('default')
+        self.assertEqual(ChangeEvent.objects.get(seq=self.start + 2).object_id, str(default_account.pk))
+        self.assertFalse(ShardChange.objects.using('shard1').exists())
+
+    def test_failed_staging_rolls_back_the_shard_write(self):
+        account = self.account_on('shard1')
+        account.account_name = 'Renamed'
+        with patch.object(ShardChangeSequence, 'allocate', side_effect=RuntimeError('down')), \
+                self.assertRaises(RuntimeError):
+            account.save()
+        self.assertNotEqual(Account.objects.using('shard1').get(pk=account.pk).account_name, 'Renamed')
+
+    def test_bulk_writes_are_staged_on_their_shard(self):
+        accounts = [self.account_on('default'), self.account_on('shard1')]
+        self.start = change_feed.latest()
+        items = [{'account': str(account.pk), 'url': 'http://bulk.com', 'http_method': 'POST',
+                  'headers': {'X-Key': 'k'}} for account in accounts]
+        created = BulkDestinationProcessor().create(items)['created']
+        staged = ShardChange.objects.using('shard1').filter(kind='destination')
+        self.assertEqual([change.object_id for change in staged], [str(created[1])])
+        changes, _ = change_feed.read(self.start)
+        # The staged account of shard1 is published with them
+        self.assertEqual(sorted(change.object_id for change in changes if change.kind == 'destination'),
+                         sorted(str(pk) for pk in created))
+
@@ -0,0 +1,115 @@
+import json
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from unittest.mock import patch, MagicMock
+from data_pusher_app.chunking import ArrayChunker
+from data_pusher_app.formats import CBORCodec, Codec, JSONCodec, MessagePackCodec
+from data_pusher_app.ingest import DestinationHandler
+from data_pusher_app.models import Account, Destination
+
+PAYLOAD = {'batch': 7, 'data': {'source': 'import', 'items': [{'id': i, 'name': f'item-{i}'} for i in range(100)]}}
+
+
+class ArrayChunkerTest(SimpleTestCase):
+    def test_chunks_are_bounded_and_keep_the_envelope(self):
+        chunks = list(ArrayChunker(JSONCodec(), 500, 'data.items').chunks(PAYLOAD))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) <= 500 for chunk in chunks))
+        decoded = [json.loads(chunk) for chunk in chunks]
+        self.assertTrue(all(part['batch'] == 7 and part['data']['source'] == 'import' for part in decoded))
+        self.assertEqual([item for part in decoded for item in part['data']['items']], PAYLOAD['data']['items'])
+        # Chunks are filled: the next item would not have fit
+        first = decoded[0]['data']['items']
+        self.assertGreater(len(json.dumps({**PAYLOAD, 'data': {**PAYLOAD['data'], 'items': first + first[:1]}})), 500)
+
+    def test_small_payload_is_one_chunk(self):
+        chunks = list(ArrayChunker(JSONCodec(), 10 ** 6, 'data.items').chunks(PAYLOAD))
+        self.assertEqual(chunks, [json.dumps(PAYLOAD).encode()])
+        self.assertEqual(list(ArrayChunker(JSONCodec(), 100, 'items').chunks({'items': []})), [b'{"items": []}'])
+
+    def test_oversized_item(self):
+        with self.assertRaisesMessage(ValueError, "Item 0 of 'items' alone exceeds 20 bytes."):
+            list(ArrayChunker(JSONCodec(), 20, 'items').chunks({'items': ['x' * 30]}))
+
+    def test_codec_without_array_support(self):
+        class PlainCodec(Codec):
+            name = 'plain'
+
+            def dumps(self, data):
+                return repr(data).encode()
+        with self.assertRaisesMessage(ValueError, "Encoding 'plain' does not support chunked delivery."):
+            list(ArrayChunker(PlainCodec(), 100, 'items').chunks({'items': [1]}))
+
+    def test_binary_array_headers(self):
+        self.assertEqual(MessagePackCodec.array_header(3), b'\x93')
+        self.assertEqual(MessagePackCodec.array_header(20), b'\xdc\x00\x14')
+        self.assertEqual(MessagePackCodec.array_header(70000), b'\xdd\x00\x01\x11\x70')
+        self.assertEqual(CBORCodec.array_header(23), b'\x97')
+        self.assertEqual(CBORCodec.array_header(24), b'\x98\x18')
+        self.assertEqual(CBORCodec.array_header(1000), b'\x99\x03\xe8')
+
+
+class ChunkedDeliveryTest(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create(email_id='chunks@test.com', account_name='Chunks')
+        self.split = [
+            Destination.objects.create(account=self.account, url=f'http://split{i}.com', http_method='POST',
+                                       headers={'X-Key': 'k'}, max_body_bytes=500, split_array_path='data.items')
+            for i in range(2)
+        ]
+        self.limited = Destination.objects.create(account=self.account, url='http://limited.com', http_method='POST',
+                                                  headers={'X-Key': 'k'}, max_body_bytes=500)
+        patcher = patch('data_pusher_app.ingest.requests.request')
+        self.request = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.request.return_value = MagicMock(status_code=200, text='ok')
+
+    def post(self, data):
+        response = self.client.post(reverse('incoming_data'), data=json.dumps(data), content_type='application/json',
+                                    headers={'CL-X-TOKEN': str(self.account.app_secret_token)})
+        self.assertEqual(response.status_code, 200)
+        return {outcome['url']: outcome for outcome in response.json()['responses']}
+
+    def bodies(self, url):
+        return [call.kwargs['data'] for call in self.request.call_args_list if call.kwargs['url'] == url]
+
+    def test_splits_oversized_payloads(self):
+        outcomes = self.post(PAYLOAD)
+        chunks = self.bodies('http://split0.com')
+        self.assertEqual(outcomes['http://split0.com'], {'url': 'http://split0.com', 'chunks': len(chunks),
+                                                         'failed_chunks': 0, 'response': 'ok', 'status_code': 200})
+        # Chunks are encoded once and shared by destinations with the same encoding, path and limit
+        self.assertEqual([id(chunk) for chunk in chunks], [id(chunk) for chunk in self.bodies('http://split1.com')])
+        # Without an array path, oversized payloads fail without being sent
+        self.assertIn('exceeds max_body_bytes (500)', outcomes['http://limited.com']['error'])
+        self.assertEqual(self.bodies('http://limited.com'), [])
+
+    def test_small_payloads_are_sent_whole(self):
+        outcomes = self.post({'data': {'items': [1, 2]}})
+        self.assertEqual(self.bodies('http://split0.com'), [b'{"data": {"items": [1, 2]}}'])
+        self.assertEqual(outcomes['http://split0.com']['status_code'], 200)
+        self.assertNotIn('chunks', outcomes['http://split0.com'])
+
+    def test_small_payloads_are_sent_whole_without_a_request_body(self):
+        # Durable workers, the dispatcher and replays build the handler from the decoded event
+        handler = DestinationHandler(self.account, {'data': {'items': [1, 2]}})
+        outcome = handler.process_destinations([self.split[0]])[0]
+        self.assertNotIn('chunks', outcome)
+        self.assertEqual(self.bodies('http://split0.com'), [b'{"data": {"items": [1, 2]}}'])
+
+    def test_aggregates_chunk_failures(self):
+        responses = iter([MagicMock(status_code=200, text='ok'), MagicMock(status_code=503, text='busy')])
+        self.request.side_effect = lambda **kwargs: next(responses, MagicMock(status_code=200, text='ok'))
+        outcome = self.post(PAYLOAD)['http://split0.com']
+        self.assertEqual((outcome['status_code'], outcome['response'], outcome['failed_chunks']), (503, 'busy', 1))
+
+        self.request.side_effect = ConnectionError('refused')
+        outcome = self.post(PAYLOAD)['http://split1.com']
+        self.assertEqual(outcome['failed_chunks'], outcome['chunks'])
+        self.assertEqual(outcome['error'], f"Chunk 1 of {outcome['chunks']}: refused")
+
+    def test_split_path_requires_limit(self):
+        with self.assertRaises(ValidationError):
+            Destination.objects.create(account=self.account, url='http://x.com', http_method='POST',
+                                       headers={'X-Key': 'k'}, split_array_path='items')
@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import Counter
+from functools import partial
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from unittest.mock import patch, MagicMock
+from data_pusher_app.admission import OverloadedError
+from data_pusher_app.delivery import PARKED, DeliveryDispatcher, FairScheduler, ordering_partition
+from data_pusher_app.models import Account, Destination
+
+
+class FairSchedulerTest(SimpleTestCase):
+    def drain(self, scheduler, count=None):
+        items = []
+        while count is None or len(items) < count:
+            item = scheduler.get(timeout=0)
+            if item is None:
+                break
+            items.append(item)
+        return items
+
+    def test_small_account_is_not_starved_by_a_flood(self):
+        scheduler = FairScheduler()
+        for i in range(1000):
+            scheduler.put('big', ('big', i))
+        for i in range(3):
+            scheduler.put('small', ('small', i))
+        first = self.drain(scheduler, 6)
+        self.assertEqual([item for item in first if item[0] == 'small'], [('small', 0), ('small', 1), ('small', 2)])
+        rest = self.drain(scheduler)
+        # Each account's deliveries keep their order
+        self.assertEqual([item[1] for item in first + rest if item[0] == 'big'], list(range(1000)))
+        self.assertEqual(scheduler.size, 0)
+
+    def test_weights_share_capacity(self):
+        scheduler = FairScheduler(quantum=2)
+        for i in range(300):
+            scheduler.put('heavy', 'heavy', weight=3)
+            scheduler.put('light', 'light', weight=1)
+        counts = Counter(self.drain(scheduler, 200))
+        self.assertEqual(counts['heavy'], 150)
+        self.assertEqual(counts['light'], 50)
+
+    def test_higher_priority_tiers_go_first(self):
+        scheduler = FairScheduler()
+        for i in range(5):
+            scheduler.put('bulk', 'bulk')
+        scheduler.put('vip', 'vip', priority=1)
+        self.assertEqual(self.drain(scheduler, 1), ['vip'])
+        scheduler.put('vip', 'vip', priority=1)
+        self.assertEqual(self.drain(scheduler), ['vip'] + ['bulk'] * 5)
+
+    def test_bounded_per_account(self):
+        scheduler = FairScheduler(max_queued_per_account=2)
+        scheduler.put('a', 1)
+        scheduler.put('a', 2)
+        with self.assertRaises(OverloadedError):
+            scheduler.put('a', 3)
+        scheduler.put('b', 1)
+        self.assertEqual(scheduler.queued('a'), 2)
+
+    def test_get_times_out(self):
+        self.assertIsNone(FairScheduler().get(timeout=0.01))
+
+    def test_dispatcher_runs_deliveries(self):
+        dispatcher = DeliveryDispatcher(workers=1)
+        account = MagicMock(pk='a', delivery_weight=1, delivery_priority=0)
+        delivery = MagicMock(side_effect=[None, Exception('boom')])
+        with patch.object(dispatcher, 'start'):
+            dispatcher.submit(account, delivery)
+            dispatcher.submit(account, delivery)
+        self.assertTrue(dispatcher.run_one(timeout=0))
+        self.assertTrue(dispatcher.run_one(timeout=0))
+        self.assertFalse(dispatcher.run_one(timeout=0))
+        self.assertEqual((dispatcher.delivered, dispatcher.failed), (1, 1))
+
+
+@override_settings(DELIVERY_MODE='async')
+class AsyncIncomingDataTest(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create(email_id='async@test.com', account_name='Async', delivery_weight=4)
+        for host in ('a', 'b'):
+            Destination.objects.create(account=self.account, url=f'http://{host}.com', http_method='POST',
+                                       headers={'Content-Type': 'application/json'})
+
+    @patch('data_pusher_app.ingest.requests.request')
+    def test_queues_one_delivery_per_destination(self, request):
+        request.return_value = MagicMock(status_code=200, text='ok')
+        dispatcher = DeliveryDispatcher(workers=1)
+        with patch('data_pusher_app.ingest.delivery_dispatcher', dispatcher), patch.object(dispatcher, 'start'):
+            response = self.client.post(reverse('incoming_data'), data={'event': 'x'}, content_type='application/json',
+                                        headers={'CL-X-TOKEN': str(self.account.app_secret_token)})
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.json(), {'status': 'queued', 'deliveries': 2})
+            request.assert_not_called()
+            self.assertEqual(dispatcher.scheduler.accounts[self.account.pk][1], 4)
+            while dispatcher.run_one(timeout=0):
+                pass
+        self.assertEqual(sorted(call.kwargs['url'] for call in request.call_args_list), ['http://a.com', 'http://b.com'])
+
+
+class OrderedDeliveryTest(SimpleTestCase):
+    def test_partition_of_key(self):
+        destination = MagicMock(pk=7, ordering_key='customer.id')
+        first = ordering_partition(destination, {'customer': {'id': 42}, 'n': 1})
+        self.assertEqual(first, ordering_partition(destination, {'customer': {'id': 42}, 'n': 2}))
+        self.assertEqual(first[0], 7)
+        self.assertIsNone(ordering_partition(destination, {'n': 1}))
+        self.assertIsNone(ordering_partition(MagicMock(ordering_key=None), {'customer': {'id': 42}}))
+        keys = {ordering_partition(destination, {'customer': {'id': i}}, partitions=64) for i in range(1000)}
+        self.assertEqual(len(keys), 64)
+
+    def test_same_partition_is_fifo_under_concurrency(self):
+        dispatcher = DeliveryDispatcher(workers=8)
+        sent = {key: [] for key in range(4)}
+        running = set()
+        overlaps = []
+        lock = threading.Lock()
+
+        def deliver(key, n):
+            with lock:
+                if key in running:
+                    overlaps.append(key)
+                running.add(key)
+            time.sleep(0.0005)
+            with lock:
+                running.discard(key)
+                sent[key].append(n)
+        account = MagicMock(pk='a', delivery_weight=1, delivery_priority=0)
+        for n in range(50):
+            for key in range(4):
+                dispatcher.submit(account, partial(deliver, key, n), ('d', key))
+        while dispatcher.scheduler.size or dispatcher.busy:
+            time.sleep(0.01)
+        self.assertEqual(overlaps, [])
+        self.assertEqual(sent, {key: list(range(50)) for key in range(4)})
+        self.assertEqual(dispatcher.delivered, 200)
+
+    def test_other_partitions_run_in_parallel(self):
+        dispatcher = DeliveryDispatcher(workers=2)
+        with patch.object(dispatcher, 'start'):
+            account = MagicMock(pk='a', delivery_weight=1, delivery_priority=0)
+            dispatcher.submit(account, MagicMock(), ('d', 1))
+            dispatcher.submit(account, MagicMock(), ('d', 1))
+            dispatcher.submit(account, MagicMock(), ('d', 2))
+        item = dispatcher.scheduler.get(0, dispatcher.claim)
+        # While ('d', 1) is held, its next delivery parks and ('d', 2) is handed out
+        self.assertIs(dispatcher.scheduler.get(0, dispatcher.claim), PARKED)
+        self.assertEqual(dispatcher.scheduler.get(0, dispatcher.claim)[1], ('d', 2))
+        self.assertEqual(len(dispatcher.busy[('d', 1)]), 1)
+        self.assertIsNotNone(dispatcher.next_in_partition(item[1]))
+        self.assertIsNone(dispatcher.next_in_partition(item[1]))
+        self.assertNotIn(('d', 1), dispatcher.busy)
@@ -0,0 +1,194 @@
+import os
+import tempfile
+import time
+import uuid
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from unittest.mock import patch
+from data_pusher_app import eventlog
+from data_pusher_app.eventlog import EventLog, pack_record
+from data_pusher_app.models import Account
+
+
+class EventLogTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.accounts = [uuid.uuid4() for _ in range(3)]
+
+    def open(self, **kwargs):
+        log = EventLog(self.directory, **kwargs)
+        self.addCleanup(log.close)
+        return log
+
+    def test_append_and_read_in_order_across_segments(self):
+        log = self.open(segment_bytes=200)
+        for i in range(30):
+            log.append(self.accounts[i % 3], f'{{"n": {i}}}'.encode(), timestamp=1000 + i)
+        self.assertGreater(len(log.segment_numbers()), 1)
+        records = list(log.read())
+        self.assertEqual([r.payload for r in records], [f'{{"n": {i}}}'.encode() for i in range(30)])
+        self.assertEqual([r.timestamp for r in records], list(range(1000, 1030)))
+
+    def test_read_by_account_and_time_range(self):
+        log = self.open(segment_bytes=200)
+        for i in range(30):
+            log.append(self.accounts[i % 3], str(i).encode(), timestamp=1000 + i)
+        records = list(log.read(account_id=self.accounts[1], since=1010, until=1020))
+        self.assertEqual([r.payload for r in records], [b'10', b'13', b'16', b'19'])
+        self.assertTrue(all(r.account_id == self.accounts[1] for r in records))
+
+    def test_resume_after_position(self):
+        log = self.open(segment_bytes=100)
+        for i in range(10):
+            log.append(self.accounts[0], str(i).encode())
+        records = list(log.read())
+        resumed = list(log.read(start=(records[4].segment, records[4].offset)))
+        self.assertEqual([r.payload for r in resumed], [str(i).encode() for i in range(5, 10)])
+
+    def test_reader_sees_appends_to_active_segment(self):
+        log = self.open()
+        log.append(self.accounts[0], b'1')
+        self.assertEqual(len(list(log.read(account_id=self.accounts[0]))), 1)
+        log.append(self.accounts[0], b'2')
+        self.assertEqual([r.payload for r in log.read(account_id=self.accounts[0])], [b'1', b'2'])
+
+    def test_offsets_of_logs_sharing_a_directory(self):
+        # Two processes appending to the same directory, each with its own handle on the active segment
+        first, second = self.open(), self.open()
+        positions = [log.append(self.accounts[0], str(i).encode()) for i, log in enumerate([first, second, first])]
+        records = list(first.read())
+        self.assertEqual([r.payload for r in records], [b'0', b'1', b'2'])
+        self.assertEqual(positions, [(r.segment, r.offset) for r in records])
+
+    def test_append_file_matches_append(self):
+        log = self.open()
+        body = b'{"items": [' + b'1, ' * 1000 + b'2]}'
+        with tempfile.TemporaryFile() as source:
+            source.write(body)
+            source.seek(0)
+            log.append_file(self.accounts[0], source, timestamp=1000, chunk_size=100)
+        log.append(self.accounts[0], body, timestamp=1000)
+        first, second = log.read()
+        self.assertEqual(first.payload, body)
+        self.assertEqual(second.offset - first.offset, len(pack_record(self.accounts[0], body, 1000)))
+
+    def test_torn_and_corrupt_records_end_the_segment(self):
+        log = self.open()
+        log.append(self.accounts[0], b'good')
+        log.close()
+        path = os.path.join(self.directory, eventlog.segment_name(0))
+        with open(path, 'ab') as f:
+            f.write(pack_record(self.accounts[0], b'torn', 1)[:-2])
+        reader = self.open()
+        self.assertEqual([r.payload for r in reader.read()], [b'good'])
+
+        # Reopening for writes truncates the torn tail before appending
+        reader.append(self.accounts[0], b'next')
+        self.assertEqual([r.payload for r in reader.read()], [b'good', b'next'])
+
+        with open(path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b'X')
+        self.assertEqual([r.payload for r in self.open().read()], [b'good'])
+
+    def test_failed_write_is_truncated(self):
+        log = self.open()
+        log.append(self.accounts[0], b'good')
+
+        def write(f):
+            f.write(pack_record(self.accounts[0], b'torn', 1)[:-2])
+            raise OSError("No space left on device")
+        with self.assertRaises(OSError):
+            log.write_record(write, len(pack_record(self.accounts[0], b'torn', 1)))
+        log.append(self.accounts[0], b'next')
+        self.assertEqual([r.payload for r in log.read()], [b'good', b'next'])
+
+    def test_short_write_is_truncated(self):
+        log = self.open()
+        record = pack_record(self.accounts[0], b'short', 1)
+        with self.assertRaises(OSError):
+            log.write_record(lambda f: f.write(record[:-1]), len(record))
+        log.append(self.accounts[0], b'next')
+        self.assertEqual([r.payload for r in log.read()], [b'next'])
+
+    def test_record_torn_by_another_writer_is_truncated(self):
+        log = self.open()
+        log.append(self.accounts[0], b'good')
+        # A process sharing the directory crashed mid-record; this log's segment is already open
+        with open(os.path.join(self.directory, eventlog.segment_name(0)), 'ab') as f:
+            f.write(pack_record(self.accounts[0], b'torn', 1)[:-2])
+        log.append(self.accounts[0], b'next')
+        self.assertEqual([r.payload for r in log.read()], [b'good', b'next'])
+
+    def test_fsync_is_batched(self):
+        log = self.open(fsync_bytes=1000, fsync_interval=3600)
+        with patch('data_pusher_app.eventlog.os.fsync') as fsync:
+            for _ in range(10):
+                log.append(self.accounts[0], b'x' * 10)
+            fsync.assert_not_called()
+            for _ in range(20):
+                log.append(self.accounts[0], b'x' * 10)
+            self.assertEqual(fsync.call_count, 1)
+        self.assertLess(log.unsynced, 1000)
+
+    def test_idle_log_is_synced_after_interval(self):
+        log = self.open(fsync_bytes=1000, fsync_interval=0.05)
+        with patch('data_pusher_app.eventlog.os.fsync') as fsync:
+            log.last_sync = time.monotonic()
+            log.append(self.accounts[0], b'x' * 10)
+            deadline = time.monotonic() + 5
+            while log.unsynced and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(fsync.call_count, 1)
+        self.assertEqual(log.unsynced, 0)
+        self.assertIsNone(log.sync_timer)
+
+    def test_retention_keeps_active_segment(self):
+        log = self.open(segment_bytes=100)
+        for i in range(20):
+            log.append(self.accounts[0], b'x' * 20)
+        numbers = log.segment_numbers()
+        old = time.time() - 3600
+        for number in numbers:
+            os.utime(log.segment_path(number), (old, old))
+        deleted = log.apply_retention(max_age=60)
+        self.assertEqual(deleted, numbers[:-1])
+        self.assertEqual(log.segment_numbers(), numbers[-1:])
+
+    def test_retention_by_size(self):
+        log = self.open(segment_bytes=100)
+        for i in range(20):
+            log.append(self.accounts[0], str(i).encode() * 10)
+        log.apply_retention(max_bytes=300)
+        self.assertLessEqual(sum(os.path.getsize(log.segment_path(n)) for n in log.segment_numbers()), 300)
+        payloads = [r.payload for r in log.read()]
+        self.assertEqual(payloads[-1], b'19' * 10)
+
+
+class IncomingDataEventLogTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.account = Account.objects.create(email_id='log@test.com', account_name='Log')
+        patcher = patch('data_pusher_app.eventlog._event_log', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_incoming_events_are_appended(self):
+        with override_settings(EVENT_LOG_DIR=self.directory):
+            response = self.client.post(reverse('incoming_data'), data=b'{"event": "signup"}',
+                                        content_type='application/json',
+                                        headers={'CL-X-TOKEN': str(self.account.app_secret_token)})
+            self.assertEqual(response.status_code, 200)
+            self.client.post(reverse('incoming_data'), data=b'not json', content_type='application/json',
+                             headers={'CL-X-TOKEN': str(self.account.app_secret_token)})
+            event_log = eventlog.get_event_log()
+            self.addCleanup(event_log.close)
+            records = list(event_log.read(account_id=self.account.pk))
+        self.assertEqual([r.payload for r in records], [b'{"event": "signup"}'])
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(eventlog.get_event_log())
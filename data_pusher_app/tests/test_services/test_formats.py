@@ -0,0 +1,171 @@
+import importlib.util
+import json
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from unittest import skipUnless
+from unittest.mock import patch, MagicMock
+from data_pusher_app.formats import CBORCodec, Codec, CodecRegistry, JSONCodec, MessagePackCodec, codecs, validate_encoding
+from data_pusher_app.models import Account, Destination
+
+
+def requires(module):
+    return skipUnless(importlib.util.find_spec(module), f"{module} is not installed")
+
+
+class ReversedJSONCodec(Codec):
+    """
+    A binary format for tests: JSON with its bytes reversed.
+    """
+    name = 'rjson'
+    content_type = 'application/x-rjson'
+    media_types = ('application/x-rjson',)
+    encoded = 0
+
+    def loads(self, body):
+        return json.loads(body[::-1])
+
+    def dumps(self, data):
+        ReversedJSONCodec.encoded += 1
+        return json.dumps(data).encode()[::-1]
+
+
+class MissingCodec(MessagePackCodec):
+    name = 'missing'
+    media_types = ('application/x-missing',)
+    module = 'data_pusher_app_missing_module'
+
+
+class CodecTest(SimpleTestCase):
+    def test_json_round_trip(self):
+        codec = JSONCodec()
+        self.assertEqual(codec.encode({'a': [1, 'é']}), json.dumps({'a': [1, 'é']}).encode())
+        self.assertEqual(codec.decode(b'{"a": 1}'), {'a': 1})
+        with self.assertRaises(ValueError):
+            codec.decode(b'{"a": ')
+        with self.assertRaises(ValueError):
+            codec.encode({'nan': float('nan')})
+
+    def test_missing_package(self):
+        codec = MissingCodec()
+        self.assertFalse(codec.available)
+        with self.assertRaisesMessage(ImportError, "requires the 'data_pusher_app_missing_module' package"):
+            codec.encode({})
+
+    @patch.dict(codecs.by_name, {'missing': MissingCodec()})
+    def test_validate_encoding(self):
+        validate_encoding('json')
+        with self.assertRaisesMessage(ValidationError, 'Unknown encoding: xml'):
+            validate_encoding('xml')
+        with self.assertRaises(ValidationError):
+            validate_encoding('missing')
+
+    @requires('msgpack')
+    def test_msgpack_round_trip(self):
+        codec = MessagePackCodec()
+        self.assertEqual(codec.decode(codec.encode({'a': [1, 'x', None]})), {'a': [1, 'x', None]})
+        with self.assertRaises(ValueError):
+            codec.decode(b'\xc1')
+
+    @requires('cbor2')
+    def test_cbor_round_trip(self):
+        codec = CBORCodec()
+        self.assertEqual(codec.decode(codec.encode({'a': [1, 'x', None]})), {'a': [1, 'x', None]})
+
+
+class CodecRegistryTest(SimpleTestCase):
+    def setUp(self):
+        self.registry = CodecRegistry([JSONCodec(), ReversedJSONCodec(), MissingCodec()])
+
+    def test_lookup_by_content_type(self):
+        self.assertEqual(self.registry.for_content_type('Application/X-RJSON; charset=binary').name, 'rjson')
+        self.assertIsNone(self.registry.for_content_type('text/plain'))
+        self.assertIsNone(self.registry.for_content_type(None))
+
+    def test_negotiate(self):
+        negotiate = self.registry.negotiate
+        self.assertEqual(negotiate(None).name, 'json')
+        self.assertEqual(negotiate('*/*').name, 'json')
+        self.assertEqual(negotiate('application/x-rjson').name, 'rjson')
+        self.assertEqual(negotiate('application/json;q=0.5, application/x-rjson').name, 'rjson')
+        self.assertEqual(negotiate('application/x-rjson;q=0.2, application/json').name, 'json')
+        self.assertEqual(negotiate('application/x-rjson;q=0, text/html').name, 'json')
+        # Unavailable codecs are skipped
+        self.assertEqual(negotiate('application/x-missing, application/x-rjson;q=0.1').name, 'rjson')
+
+    @override_settings(CODECS=['data_pusher_app.tests.test_services.test_formats.ReversedJSONCodec'])
+    def test_codecs_setting(self):
+        registry = CodecRegistry([JSONCodec()])
+        self.assertEqual(registry.get('rjson').content_type, 'application/x-rjson')
+        with self.assertRaises(LookupError):
+            registry.get('xml')
+
+
+class BinaryIngestTest(TestCase):
+    def setUp(self):
+        codec = ReversedJSONCodec()
+        for patcher in (patch.dict(codecs.by_name, {'rjson': codec}),
+                        patch.dict(codecs.by_media_type, {'application/x-rjson': codec}),
+                        patch.object(ReversedJSONCodec, 'encoded', 0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.codec = codec
+        self.account = Account.objects.create(email_id='binary@test.com', account_name='Binary')
+        for host, encoding, transform in (('json', 'json', None), ('r1', 'rjson', None), ('r2', 'rjson', None),
+                                          ('r3', 'rjson', {'select': ['id']}), ('r4', 'rjson', {'select': ['id']})):
+            Destination.objects.create(account=self.account, url=f'http://{host}.com', http_method='POST',
+                                       headers={'X-Key': 'k'}, outbound_encoding=encoding, transform=transform)
+        patcher = patch('data_pusher_app.ingest.requests.request')
+        self.request = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.request.return_value = MagicMock(status_code=200, text='ok')
+
+    def post(self, body, content_type, **headers):
+        return self.client.post(reverse('incoming_data'), data=body, content_type=content_type,
+                                headers={'CL-X-TOKEN': str(self.account.app_secret_token), **headers})
+
+    def sent(self):
+        return {call.kwargs['url']: (call.kwargs['headers']['Content-Type'], call.kwargs['data'])
+                for call in self.request.call_args_list}
+
+    def test_each_encoding_is_produced_once(self):
+        body = self.codec.encode({'id': 7, 'name': 'x'})
+        ReversedJSONCodec.encoded = 0
+        response = self.post(body, 'application/x-rjson')
+        self.assertEqual(response.status_code, 200)
+        sent = self.sent()
+        # The received body is reused and the transformed payload is encoded once for both destinations
+        self.assertEqual(ReversedJSONCodec.encoded, 1)
+        self.assertIs(sent['http://r1.com'][1], sent['http://r2.com'][1])
+        self.assertEqual(sent['http://r1.com'], ('application/x-rjson', body))
+        self.assertEqual(self.codec.decode(sent['http://r3.com'][1]), {'id': 7})
+        self.assertIs(sent['http://r3.com'][1], sent['http://r4.com'][1])
+        self.assertEqual(sent['http://json.com'][0], 'application/json')
+        self.assertEqual(json.loads(sent['http://json.com'][1]), {'id': 7, 'name': 'x'})
+
+    def test_json_body_to_binary_destinations(self):
+        response = self.post(json.dumps({'id': 1}), 'application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.codec.decode(self.sent()['http://r1.com'][1]), {'id': 1})
+        self.assertEqual(self.sent()['http://json.com'][1], b'{"id": 1}')
+
+    def test_invalid_body(self):
+        response = self.post(b'not reversed json', 'application/x-rjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid rjson format'})
+        self.request.assert_not_called()
+
+    def test_unavailable_codec(self):
+        with patch.dict(codecs.by_media_type, {'application/x-missing': MissingCodec()}):
+            response = self.post(b'\x80', 'application/x-missing')
+        self.assertEqual(response.status_code, 415)
+
+    def test_response_follows_accept(self):
+        response = self.post(json.dumps({'id': 1}), 'application/json', Accept='application/x-rjson')
+        self.assertEqual(response['Content-Type'], 'application/x-rjson')
+        self.assertEqual(len(self.codec.decode(response.content)['responses']), 5)
+
+    def test_unknown_encoding_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            Destination.objects.create(account=self.account, url='http://x.com', http_method='POST', headers={'X-Key': 'k'},
+                                       outbound_encoding='xml')
@@ -0,0 +1,146 @@
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from unittest.mock import patch
+from data_pusher_app.history import DeliveryHistory, PartitionManager
+
+DAY = 86400
+
+
+def at(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc).timestamp()
+
+
+class PartitionManagerTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.now = at(2024, 5, 10, 12)
+        self.partitions = PartitionManager(self.directory.name, period='day', retention=3 * DAY, ahead=2,
+                                           clock=lambda: self.now)
+
+    def names(self):
+        return sorted(name for name in os.listdir(self.directory.name) if name.endswith('.sqlite3'))
+
+    def test_creates_partitions_ahead(self):
+        self.partitions.create_ahead()
+        self.assertEqual(self.names(), ['deliveries-day-20240510.sqlite3', 'deliveries-day-20240511.sqlite3',
+                                        'deliveries-day-20240512.sqlite3'])
+
+    def test_drops_expired_partitions(self):
+        for day in range(1, 11):
+            self.partitions.create(self.partitions.partition_start(at(2024, 5, day)))
+        dropped = self.partitions.drop_expired()
+        # Partitions that ended before May 7th, 12:00 are gone
+        self.assertEqual(len(dropped), 6)
+        self.assertEqual(self.names()[0], 'deliveries-day-20240507.sqlite3')
+
+    def test_weeks_start_on_monday(self):
+        partitions = PartitionManager(self.directory.name, period='week', retention=None)
+        start = partitions.partition_start(at(2024, 5, 10, 12))
+        self.assertEqual(datetime.fromtimestamp(start, dt_timezone.utc), datetime(2024, 5, 6, tzinfo=dt_timezone.utc))
+        self.assertEqual(partitions.path(start)[-32:], 'deliveries-week-20240506.sqlite3')
+
+    def test_covering(self):
+        for day in (8, 9, 10):
+            self.partitions.create(self.partitions.partition_start(at(2024, 5, day)))
+        covering = self.partitions.covering(at(2024, 5, 9, 6), at(2024, 5, 9, 18))
+        self.assertEqual([os.path.basename(path) for _, _, path in covering], ['deliveries-day-20240509.sqlite3'])
+        self.assertEqual(len(self.partitions.covering()), 3)
+
+    def test_unknown_period(self):
+        with self.assertRaises(ValueError):
+            PartitionManager(self.directory.name, period='month')
+
+
+class DeliveryHistoryTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.now = at(2024, 5, 10, 12)
+        self.partitions = PartitionManager(self.directory.name, period='day', retention=3 * DAY, ahead=0,
+                                           clock=lambda: self.now)
+        self.history = DeliveryHistory(self.partitions, flush_interval=10 ** 9, clock=lambda: self.now)
+        self.account = uuid.uuid4()
+
+    def test_writes_to_partition_of_each_attempt(self):
+        self.history.record(self.account, 1, 'http://a.com', 200, True, 0.05, timestamp=at(2024, 5, 9, 23, 59))
+        self.history.record(self.account, 2, 'http://b.com', None, False, 0.5, 'timeout', timestamp=at(2024, 5, 10, 0, 1))
+        self.history.record(self.account, 1, 'http://a.com', 200, True, 0.05, timestamp=at(2024, 5, 1))
+        self.assertEqual(self.history.flush(), 2)
+        self.assertEqual(self.history.dropped, 1)  # already past retention
+        self.assertIn('deliveries-day-20240509.sqlite3', os.listdir(self.directory.name))
+
+        attempts = list(self.history.query(account_id=self.account))
+        self.assertEqual([attempt['destination_id'] for attempt in attempts], [1, 2])
+        self.assertEqual(attempts[1]['error'], 'timeout')
+        self.assertEqual(attempts[1]['latency_ms'], 500.0)
+        self.assertFalse(attempts[1]['ok'])
+
+    def test_query_reads_only_covering_partitions(self):
+        for hour in range(0, 48, 6):
+            self.history.record(self.account, 1, 'http://a.com', 200, True, 0.01, timestamp=at(2024, 5, 8) + hour * 3600)
+        self.history.flush()
+        opened = []
+        connect = self.partitions.connect
+        with patch.object(self.partitions, 'connect', side_effect=lambda path: opened.append(path) or connect(path)):
+            attempts = list(self.history.query(since=at(2024, 5, 9, 3), until=at(2024, 5, 9, 13)))
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual([os.path.basename(path) for path in opened], ['deliveries-day-20240509.sqlite3'])
+        self.assertEqual(len(list(self.history.query(limit=3))), 3)
+        self.assertEqual(list(self.history.query(account_id=uuid.uuid4())), [])
+
+
+    def test_failed_write_is_retried(self):
+        self.history.record(self.account, 1, 'http://a.com', 200, True, 0.05, timestamp=at(2024, 5, 9))
+        self.history.record(self.account, 1, 'http://a.com', 200, True, 0.05, timestamp=at(2024, 5, 10))
+        connect = self.partitions.connect
+        with patch.object(self.partitions, 'connect', side_effect=[OSError('disk full'), connect(
+                self.partitions.create(self.partitions.partition_start(at(2024, 5, 10))))]), \
+                self.assertLogs('data_pusher_app.history', 'ERROR'):
+            self.assertEqual(self.history.flush(), 1)
+        self.assertEqual((self.history.write_errors, len(self.history.pending)), (1, 1))
+        self.assertEqual(self.history.flush(), 1)
+        self.assertEqual(len(list(self.history.query(account_id=self.account))), 2)
+
+    def test_idle_history_is_flushed_by_timer(self):
+        history = DeliveryHistory(self.partitions, flush_interval=0.05, clock=lambda: self.now)
+        history.record(self.account, 1, 'http://a.com', 200, True, 0.05, timestamp=at(2024, 5, 10))
+        deadline = time.monotonic() + 5
+        while not history.written and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(history.written, 1)
+
+
+@override_settings(DELIVERY_HISTORY_RETENTION_SECONDS=3 * DAY)
+class MaintainCommandTest(SimpleTestCase):
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            out = StringIO()
+            call_command('maintain_delivery_history', directory=directory, ahead=1, stdout=out)
+            self.assertIn("2 partitions ready, 0 expired partitions dropped", out.getvalue())
+
+
+class DeliveryHistoryViewTest(TestCase):
+    def test_disabled(self):
+        response = self.client.get(reverse('delivery_history', args=[uuid.uuid4()]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_lists_attempts(self):
+        account = uuid.uuid4()
+        with tempfile.TemporaryDirectory() as directory:
+            history = DeliveryHistory(PartitionManager(directory, retention=None), flush_interval=10 ** 9)
+            history.record(account, 3, 'http://a.com', 201, True, 0.02)
+            history.flush()
+            with patch('data_pusher_app.views.get_delivery_history', return_value=history):
+                response = self.client.get(reverse('delivery_history', args=[account]))
+                self.assertEqual(self.client.get(reverse('delivery_history', args=[account]),
+                                                 {'limit': 'x'}).status_code, 400)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(d['destination_id'], d['status_code']) for d in response.json()['deliveries']], [(3, 201)])
@@ -0,0 +1,145 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from django.test import SimpleTestCase, override_settings
+from unittest.mock import patch, MagicMock
+from data_pusher_app import outbound
+from data_pusher_app.ingest import DestinationHandler
+from data_pusher_app.outbound import DNSCache
+
+
+class ImmediateThread:
+    """Runs background refreshes inline so tests are deterministic."""
+
+    def __init__(self, target, **kwargs):
+        self.target = target
+
+    def start(self):
+        self.target()
+
+
+class DNSCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.answers = {'hook.test': '10.0.0.1'}
+        self.queries = []
+        patcher = patch('data_pusher_app.outbound.threading.Thread', ImmediateThread)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def resolver(self, host, port, family, type):
+        self.queries.append(host)
+        if host not in self.answers:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return [(socket.AF_INET, type, 6, '', (self.answers[host], port))] * 2
+
+    def cache(self, **kwargs):
+        options = dict(ttl=60, stale_ttl=300, negative_ttl=10, refresh_ahead=5, hot_hits=3)
+        options.update(kwargs)
+        return DNSCache(resolver=self.resolver, clock=lambda: self.now, **options)
+
+    def test_caches_within_ttl(self):
+        cache = self.cache()
+        self.assertEqual(cache.resolve('hook.test', 443), ['10.0.0.1'])
+        self.now = 30
+        self.assertEqual(cache.resolve('hook.test', 443), ['10.0.0.1'])
+        self.assertEqual(self.queries, ['hook.test'])
+        self.assertEqual((cache.lookups['miss'], cache.lookups['hit']), (1, 1))
+
+    def test_serves_stale_while_refreshing(self):
+        cache = self.cache()
+        cache.resolve('hook.test', 443)
+        self.answers['hook.test'] = '10.0.0.2'
+        self.now = 100
+        # The stale answer is returned and the refresh stores the new one
+        self.assertEqual(cache.resolve('hook.test', 443), ['10.0.0.1'])
+        self.assertEqual(cache.resolve('hook.test', 443), ['10.0.0.2'])
+        self.assertEqual(cache.lookups['stale'], 1)
+
+    def test_stale_answer_survives_resolver_failure(self):
+        cache = self.cache()
+        cache.resolve('hook.test', 443)
+        del self.answers['hook.test']
+        self.now = 100
+        self.assertEqual(cache.resolve('hook.test', 443), ['10.0.0.1'])
+        self.assertEqual(cache.resolve('hook.test', 443), ['10.0.0.1'])
+        self.now = 1000
+        with self.assertRaises(socket.gaierror):
+            cache.resolve('hook.test', 443)
+
+    def test_negative_caching(self):
+        cache = self.cache()
+        for _ in range(3):
+            with self.assertRaises(socket.gaierror):
+                cache.resolve('missing.test', 443)
+        self.assertEqual(self.queries, ['missing.test'])
+        self.now = 11
+        with self.assertRaises(socket.gaierror):
+            cache.resolve('missing.test', 443)
+        self.assertEqual(len(self.queries), 2)
+        self.assertEqual(cache.lookups['negative'], 2)
+
+    def test_hot_hosts_refresh_ahead_of_expiry(self):
+        cache = self.cache()
+        cache.resolve('hook.test', 443)
+        self.now = 56
+        cache.resolve('hook.test', 443)
+        cache.resolve('hook.test', 443)
+        self.assertEqual(len(self.queries), 1)
+        cache.resolve('hook.test', 443)  # third hit inside the refresh window
+        self.assertEqual(len(self.queries), 2)
+        self.now = 100
+        self.assertEqual(cache.resolve('hook.test', 443), ['10.0.0.1'])
+        self.assertEqual(cache.lookups['stale'], 0)
+
+    def test_bounded(self):
+        cache = self.cache(max_entries=2)
+        self.answers.update({'a.test': '10.0.0.3', 'b.test': '10.0.0.4'})
+        for host in ('hook.test', 'a.test', 'b.test'):
+            cache.resolve(host, 443)
+        self.assertEqual(list(cache.entries), [('a.test', 443), ('b.test', 443)])
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(OUTBOUND_DNS_CACHE=True)
+class OutboundSessionTest(SimpleTestCase):
+    def setUp(self):
+        server = HTTPServer(('127.0.0.1', 0), WebhookHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.port = server.server_address[1]
+        cache = DNSCache(resolver=lambda host, port, family, type: [
+            (socket.AF_INET, type, 6, '', ('127.0.0.1', port))
+        ])
+        patcher = patch('data_pusher_app.outbound.dns_cache', cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = cache
+
+    def test_delivers_through_cached_resolution(self):
+        destination = MagicMock(url=f'http://webhook.invalid:{self.port}/hook', http_method='POST',
+                                headers={}, transform=None, outbound_encoding='json', max_body_bytes=None)
+        handler = DestinationHandler(MagicMock(), {'event': 'signup'}, [destination])
+        with patch.object(handler, 'get_destinations', return_value=[destination]):
+            responses = handler.process_destinations()
+            responses += handler.process_destinations()
+        self.assertEqual([r['status_code'] for r in responses], [200, 200])
+        self.assertEqual(responses[0]['response'], '{"event": "signup"}')
+        self.assertEqual(self.cache.lookups['miss'], 1)
+        self.assertIs(handler.get_http_client(), outbound.get_outbound_session())
+
+    @override_settings(OUTBOUND_DNS_CACHE=False)
+    def test_disabled(self):
+        self.assertIsNone(outbound.get_outbound_session())
@@ -0,0 +1,119 @@
+import json
+from django.test import TestCase
+from django.urls import reverse
+from unittest.mock import patch, MagicMock
+from data_pusher_app.models import Account
+from data_pusher_app.ratelimit import CacheBackend, LocalMemoryBackend, RateLimiter, RateLimitExceeded
+
+
+class RateLimiterTest(TestCase):
+    def limiter(self, **kwargs):
+        return RateLimiter(backend=LocalMemoryBackend(), window=10, **kwargs)
+
+    def test_request_limit(self):
+        limiter = self.limiter(default_requests=3)
+        for _ in range(3):
+            limiter.check('token')
+        with self.assertRaises(RateLimitExceeded) as context:
+            limiter.check('token')
+        self.assertEqual(context.exception.dimension, 'requests')
+        self.assertGreaterEqual(context.exception.retry_after, 1)
+        limiter.check('other-token')
+
+    def test_byte_limit(self):
+        limiter = self.limiter(default_requests=100, default_bytes=1000)
+        limiter.check('token', 600)
+        with self.assertRaises(RateLimitExceeded) as context:
+            limiter.check('token', 600)
+        self.assertEqual(context.exception.dimension, 'bytes')
+
+    def test_previous_window_is_weighted(self):
+        limiter = self.limiter(default_requests=10)
+        with patch('data_pusher_app.ratelimit.time.time', return_value=1005.0):
+            for _ in range(10):
+                limiter.check('token')
+        # Half of the previous window still overlaps, so only 5 more requests fit
+        with patch('data_pusher_app.ratelimit.time.time', return_value=1015.0):
+            for _ in range(5):
+                limiter.check('token')
+            with self.assertRaises(RateLimitExceeded):
+                limiter.check('token')
+
+    def test_account_limits_are_remembered(self):
+        limiter = self.limiter(default_requests=100)
+        limiter.remember('token', MagicMock(ingest_rate_limit=1, ingest_byte_rate_limit=None))
+        limiter.check('token')
+        with self.assertRaises(RateLimitExceeded):
+            limiter.check('token')
+
+    def test_accounts_without_limits_are_unlimited_by_default(self):
+        limiter = self.limiter()
+        self.assertEqual((limiter.default_requests, limiter.default_bytes), (None, None))
+        limiter.remember('token', MagicMock(ingest_rate_limit=None, ingest_byte_rate_limit=None))
+        for _ in range(1000):
+            limiter.check('token', 10 ** 9)
+
+    def test_limits_are_resolved_before_the_first_request_of_every_worker(self):
+        backend = LocalMemoryBackend()
+        account = MagicMock(ingest_rate_limit=1, ingest_byte_rate_limit=None)
+        resolve = MagicMock(return_value=account)
+        workers = [RateLimiter(backend=backend, window=10) for _ in range(2)]
+        workers[0].check('token', resolve=resolve)
+        with self.assertRaises(RateLimitExceeded):
+            workers[1].check('token', resolve=resolve)
+        # The second worker read the limits the first one stored
+        resolve.assert_called_once_with()
+
+    def test_rejected_requests_are_not_counted(self):
+        limiter = self.limiter(default_requests=10)
+        with patch('data_pusher_app.ratelimit.time.time', return_value=1005.0):
+            for _ in range(10):
+                limiter.check('token')
+            for _ in range(5):
+                with self.assertRaises(RateLimitExceeded):
+                    limiter.check('token')
+        with patch('data_pusher_app.ratelimit.time.time', return_value=1015.0):
+            for _ in range(5):
+                limiter.check('token')
+
+    def test_byte_rejection_takes_back_the_request(self):
+        limiter = self.limiter(default_requests=2, default_bytes=1000)
+        with patch('data_pusher_app.ratelimit.time.time', return_value=1000.0):
+            with self.assertRaises(RateLimitExceeded):
+                limiter.check('token', 2000)
+            limiter.check('token', 10)
+            limiter.check('token', 10)
+
+    def test_cache_backend(self):
+        backend = CacheBackend(alias='ratelimit')
+        self.assertEqual(backend.incr('rl:test-cache-backend', 2, 5), 2)
+        self.assertEqual(backend.incr('rl:test-cache-backend', 3, 5), 5)
+        self.assertEqual(backend.get('rl:test-cache-backend'), 5)
+
+
+class IncomingDataRateLimitTest(TestCase):
+    @patch('requests.request')
+    def test_account_limit_enforced_before_verification(self, mock_request):
+        mock_request.return_value = MagicMock(text='ok', status_code=200)
+        account = Account.objects.create(email_id='limited@test.com', account_name='Limited', ingest_rate_limit=1)
+        limiter = RateLimiter(backend=LocalMemoryBackend(), window=60, default_requests=100)
+        headers = {'content_type': 'application/json', 'HTTP_CL_X_TOKEN': str(account.app_secret_token)}
+
+        with patch('data_pusher_app.ingest.rate_limiter', limiter):
+            self.assertEqual(self.client.post(reverse('incoming_data'), json.dumps({}), **headers).status_code, 200)
+            with patch('data_pusher_app.ingest.AccountVerifier') as mock_verifier:
+                response = self.client.post(reverse('incoming_data'), json.dumps({}), **headers)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        mock_verifier.assert_not_called()
+
+    @patch('requests.request')
+    def test_first_request_is_counted_against_the_account_limit(self, mock_request):
+        mock_request.return_value = MagicMock(text='ok', status_code=200)
+        account = Account.objects.create(email_id='first@test.com', account_name='First', ingest_rate_limit=1)
+        limiter = RateLimiter(backend=LocalMemoryBackend(), window=60)
+        headers = {'content_type': 'application/json', 'HTTP_CL_X_TOKEN': str(account.app_secret_token)}
+
+        with patch('data_pusher_app.ingest.rate_limiter', limiter):
+            self.assertEqual(self.client.post(reverse('incoming_data'), json.dumps({}), **headers).status_code, 200)
+            self.assertEqual(self.client.post(reverse('incoming_data'), json.dumps({}), **headers).status_code, 429)
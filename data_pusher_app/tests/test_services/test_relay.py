@@ -0,0 +1,116 @@
+import json
+import tempfile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from unittest.mock import patch, MagicMock
+from data_pusher_app import eventlog
+from data_pusher_app.models import Account, Delivery, Destination
+from data_pusher_app.relay import JSONScanner
+
+VALID = [
+    b'{}', b'[]', b'0', b'-12.5e+3', b'"text"', b'true', b' null ',
+    b'{"a": [1, 2, {"b": null}], "c": "\\u00e9\\n\\"", "d": false}',
+    '{"name": "Zoë", "tags": ["x", "y"]}'.encode('utf-8'),
+    b'[[[[[]]]], {"": ""}]',
+]
+INVALID = [
+    b'', b'{', b'[1,]', b'{"a" 1}', b'{"a": 1,}', b'{1: 2}', b'[1 2]', b'"unterminated', b'"bad \\x escape"',
+    b'01', b'tru', b'nulls', b'{}}', b'[}', b'{"a": 1} x', b'"\x01"', b'"\xff"', b'{"a":}', b'.5', b'[-]',
+]
+
+
+def scan(document, chunk_size):
+    scanner = JSONScanner()
+    for start in range(0, len(document), chunk_size):
+        scanner.feed(document[start:start + chunk_size])
+    scanner.close()
+
+
+class JSONScannerTest(SimpleTestCase):
+    def test_agrees_with_json_module(self):
+        for document in VALID + INVALID:
+            try:
+                json.loads(document.decode('utf-8'))
+                expected = True
+            except ValueError:
+                expected = False
+            for chunk_size in (1, 2, 3, 7, 1024):
+                with self.subTest(document=document, chunk_size=chunk_size):
+                    if expected:
+                        scan(document, chunk_size)
+                    else:
+                        with self.assertRaises(ValueError):
+                            scan(document, chunk_size)
+
+    def test_long_strings_span_chunks(self):
+        document = json.dumps({'blob': 'x' * 100000, 'escaped': '\\' * 1000 + '"' * 1000}).encode()
+        scan(document, 4096)
+        scan(document, 5)
+
+
+@override_settings(RELAY_THRESHOLD_BYTES=100, RELAY_CHUNK_SIZE=16)
+class RelayTest(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create(email_id='relay@test.com', account_name='Relay')
+        for url, method, extra in (('http://raw.com', 'POST', {}), ('http://get.com', 'GET', {}),
+                                   ('http://routed.com', 'POST', {'routing_rules': [{'field': 'event', 'value': 'x'}]}),
+                                   ('http://put.com', 'PUT', {})):
+            Destination.objects.create(account=self.account, url=url, http_method=method,
+                                       headers={'Content-Type': 'application/json', 'X-Key': 'k'}, **extra)
+        patcher = patch('data_pusher_app.ingest.requests')
+        self.requests = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sent = []
+
+        def send(method, url, headers, data=None, json=None):
+            self.sent.append((method, url, headers['X-Key'], data.read() if hasattr(data, 'read') else data))
+            return MagicMock(status_code=200, text='ok')
+        self.requests.request.side_effect = send
+        self.requests.get.return_value = MagicMock(status_code=200, text='ok')
+
+    def post(self, body):
+        return self.client.post(reverse('incoming_data'), data=body, content_type='application/json',
+                                headers={'CL-X-TOKEN': str(self.account.app_secret_token)})
+
+    def test_streams_raw_body_to_destinations(self):
+        body = json.dumps({'event': 'x', 'items': list(range(100))}).encode()
+        with patch('data_pusher_app.ingest.JSONProcessor') as processor:
+            response = self.post(body)
+        processor.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.sent, [('post', 'http://raw.com', 'k', body), ('put', 'http://put.com', 'k', body)])
+        skipped = [item['url'] for item in response.json()['responses'] if 'error' in item]
+        self.assertEqual(skipped, ['http://get.com', 'http://routed.com'])
+
+    def test_relayed_bodies_are_logged(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        body = json.dumps({'event': 'x', 'items': list(range(100))}).encode()
+        with override_settings(EVENT_LOG_DIR=directory.name), patch('data_pusher_app.eventlog._event_log', None):
+            self.assertEqual(self.post(body).status_code, 200)
+            event_log = eventlog.get_event_log()
+            self.addCleanup(event_log.close)
+            self.assertEqual([record.payload for record in event_log.read(account_id=self.account.pk)], [body])
+        # The spool is rewound for the destinations after logging
+        self.assertEqual(self.sent[0][3], body)
+
+    @override_settings(DELIVERY_MODE='durable')
+    def test_queued_modes_do_not_relay(self):
+        body = {'event': 'x', 'items': list(range(100))}
+        response = self.post(json.dumps(body).encode())
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.sent, [])
+        self.assertEqual([delivery.payload for delivery in Delivery.objects.all()], [body] * 4)
+
+    def test_invalid_body(self):
+        response = self.post(b'{"items": [' + b'1, ' * 100 + b']}')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.sent, [])
+
+    def test_small_bodies_are_decoded(self):
+        response = self.post(b'{"event": "y"}')
+        self.assertEqual(response.status_code, 200)
+        # The received body is sent unchanged instead of being encoded again
+        self.assertEqual(self.sent, [('post', 'http://raw.com', 'k', b'{"event": "y"}'),
+                                     ('put', 'http://put.com', 'k', b'{"event": "y"}')])
+        self.requests.get.assert_called_once()
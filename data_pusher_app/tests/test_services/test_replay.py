@@ -0,0 +1,153 @@
+import json
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from io import StringIO
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from unittest.mock import patch, MagicMock
+from data_pusher_app.eventlog import EventLog
+from data_pusher_app.models import Account, Destination
+from data_pusher_app.replay import EventReplay, TokenBucket, parse_replay_options, replays
+
+HEADERS = {'Content-Type': 'application/json'}
+
+
+def ns(hour):
+    return int(datetime(2024, 1, 1, hour, tzinfo=timezone.utc).timestamp() * 1_000_000_000)
+
+
+class TokenBucketTest(SimpleTestCase):
+    def test_caps_rate_after_burst(self):
+        now = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+        bucket = TokenBucket(2, clock=lambda: now[0], sleep=sleep)
+        for _ in range(6):
+            bucket.acquire()
+        # Two tokens of burst, then one every half second
+        self.assertAlmostEqual(now[0], 2.0)
+        self.assertEqual(len(sleeps), 4)
+
+
+class ParseReplayOptionsTest(SimpleTestCase):
+    def test_parses_options(self):
+        options = parse_replay_options({'since': '2024-01-01T00:00:00', 'destinations': '1,2', 'rate': '5'})
+        self.assertEqual(options['since'], datetime(2024, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(options['destination_ids'], [1, 2])
+        self.assertEqual(options['rate'], 5.0)
+
+    def test_rejects_malformed_options(self):
+        for params in ({'until': 'yesterday'}, {'destinations': ['a']}, {'rate': 0}):
+            with self.assertRaises(ValueError):
+                parse_replay_options(params)
+
+
+class EventReplayTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.event_log = EventLog(directory.name)
+        self.addCleanup(self.event_log.close)
+        self.account = Account.objects.create(email_id='replay@test.com', account_name='Replay')
+        self.other = Account.objects.create(email_id='other@test.com', account_name='Other')
+        self.signups = Destination.objects.create(account=self.account, url='http://signups.com', http_method='POST',
+                                                  headers=HEADERS, routing_rules=[{'field': 'event', 'value': 'signup'}])
+        self.everything = Destination.objects.create(account=self.account, url='http://all.com', http_method='POST',
+                                                     headers=HEADERS)
+        for hour in range(6):
+            event = 'signup' if hour % 2 else 'login'
+            self.event_log.append(self.account.pk, json.dumps({'event': event, 'hour': hour}).encode(), ns(hour))
+            self.event_log.append(self.other.pk, b'{"event": "signup"}', ns(hour))
+        patcher = patch('data_pusher_app.ingest.requests.request')
+        self.request = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.request.return_value = MagicMock(status_code=200, text='ok')
+
+    def sent(self):
+        return [(call.kwargs['url'], json.loads(call.kwargs['data'])['hour']) for call in self.request.call_args_list]
+
+    def test_replays_time_range_through_routing_rules(self):
+        replay = EventReplay(self.account, since=datetime(2024, 1, 1, 1, tzinfo=timezone.utc),
+                             until=datetime(2024, 1, 1, 4, tzinfo=timezone.utc), rate=1000,
+                             event_log=self.event_log).run()
+        self.assertEqual(replay.status, 'completed')
+        self.assertEqual((replay.events, replay.deliveries, replay.failures), (3, 5, 0))
+        self.assertEqual(self.sent(), [('http://signups.com', 1), ('http://all.com', 1), ('http://all.com', 2),
+                                       ('http://signups.com', 3), ('http://all.com', 3)])
+
+    def test_selected_destinations(self):
+        replay = EventReplay(self.account, destination_ids=[self.signups.pk], rate=1000,
+                             event_log=self.event_log).run()
+        self.assertEqual(self.sent(), [('http://signups.com', 1), ('http://signups.com', 3), ('http://signups.com', 5)])
+        self.assertEqual(replay.deliveries, 3)
+
+    def test_rejects_other_accounts_destinations(self):
+        foreign = Destination.objects.create(account=self.other, url='http://other.com', http_method='POST', headers=HEADERS)
+        with self.assertRaises(ValueError):
+            EventReplay(self.account, destination_ids=[foreign.pk], event_log=self.event_log)
+
+    def test_destinations_are_read_from_the_account_shard(self):
+        with patch('data_pusher_app.replay.shard_map.shard_for', return_value='default') as shard_for, \
+                patch('data_pusher_app.replay.shard_map.manager', wraps=lambda model, alias: model.objects) as manager:
+            replay = EventReplay(self.account, event_log=self.event_log)
+        shard_for.assert_called_once_with(self.account)
+        manager.assert_called_once_with(Destination, 'default')
+        self.assertEqual(len(replay.destinations), Destination.objects.filter(account=self.account).count())
+
+    def test_counts_failures(self):
+        self.request.return_value = MagicMock(status_code=503, text='down')
+        replay = EventReplay(self.account, rate=1000, event_log=self.event_log).run()
+        self.assertEqual((replay.deliveries, replay.failures), (0, 9))
+
+    def test_yields_to_live_traffic(self):
+        with patch('data_pusher_app.replay.admission_controller') as controller, \
+                patch('data_pusher_app.replay.time.sleep') as sleep:
+            controller.load.return_value = 100
+
+            def drain(seconds):
+                controller.load.return_value = 0
+            sleep.side_effect = drain
+            EventReplay(self.account, rate=1000, event_log=self.event_log).run()
+        sleep.assert_called_once_with(0.05)
+
+    def test_command(self):
+        out = StringIO()
+        with patch('data_pusher_app.replay.get_event_log', return_value=self.event_log):
+            call_command('replay_events', str(self.account.pk), '--until', '2024-01-01T02:00:00',
+                         '--rate', '1000', '--nice', '0', stdout=out)
+        self.assertIn('Replayed 2 events: 3 delivered, 0 failed.', out.getvalue())
+
+
+class ReplayViewTest(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create(email_id='replay@test.com', account_name='Replay')
+
+    def test_starts_replay(self):
+        with patch('data_pusher_app.replay.get_event_log', return_value=MagicMock()), \
+                patch('data_pusher_app.views.replays.start') as start:
+            response = self.client.post(reverse('replay', args=[self.account.pk]),
+                                        data={'since': '2024-01-01T00:00:00Z', 'rate': 5}, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        replay = start.call_args.args[0]
+        self.assertEqual((replay.rate, replay.since.year), (5.0, 2024))
+        self.assertEqual(response.json()['replay_id'], str(replay.id))
+
+    def test_errors(self):
+        response = self.client.post(reverse('replay', args=[uuid.uuid4()]), data={}, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        # The event log is disabled in the test settings
+        response = self.client.post(reverse('replay', args=[self.account.pk]), data={}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_status(self):
+        replay = MagicMock(id=uuid.uuid4())
+        replay.as_dict.return_value = {'status': 'running'}
+        replays.replays[replay.id] = replay
+        self.addCleanup(replays.replays.pop, replay.id)
+        self.assertEqual(self.client.get(reverse('replay_status', args=[replay.id])).json(), {'status': 'running'})
+        self.assertEqual(self.client.get(reverse('replay_status', args=[uuid.uuid4()])).status_code, 404)
@@ -0,0 +1,166 @@
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from unittest.mock import patch
+from data_pusher_app.models import Account, DeliveryRollup, Destination
+from data_pusher_app.rollups import RollupAggregator, RollupQuery, decompose, parse_rollup_options, to_seconds
+
+DAY = 86400
+
+
+def at(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+class DecomposeTest(SimpleTestCase):
+    def test_uses_coarsest_buckets(self):
+        since, until = to_seconds(at(2024, 5, 1, 22, 30)), to_seconds(at(2024, 5, 4, 1, 15))
+        pieces = decompose(since, until)
+        self.assertEqual(pieces, [
+            ('minute', since, to_seconds(at(2024, 5, 1, 23))),
+            ('hour', to_seconds(at(2024, 5, 1, 23)), to_seconds(at(2024, 5, 2))),
+            ('day', to_seconds(at(2024, 5, 2)), to_seconds(at(2024, 5, 4))),
+            ('hour', to_seconds(at(2024, 5, 4)), to_seconds(at(2024, 5, 4, 1))),
+            ('minute', to_seconds(at(2024, 5, 4, 1)), until),
+        ])
+
+    def test_short_range_uses_minutes(self):
+        since = to_seconds(at(2024, 5, 1, 10, 5))
+        self.assertEqual(decompose(since, since + 600), [('minute', since, since + 600)])
+
+    def test_step_limits_granularity(self):
+        since = to_seconds(at(2024, 5, 1))
+        self.assertEqual({piece[0] for piece in decompose(since, since + 7 * DAY, 3600)}, {'hour'})
+        self.assertEqual({piece[0] for piece in decompose(since, since + DAY, 5400)}, {'minute'})
+
+
+@override_settings(ROLLUP_RETENTION={})
+class RollupAggregatorTest(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create(email_id='rollup@test.com', account_name='Rollup')
+        self.destinations = [
+            Destination.objects.create(account=self.account, url=f'http://{host}.com', http_method='POST',
+                                       headers={'Content-Type': 'application/json'})
+            for host in ('a', 'b')
+        ]
+        self.now = to_seconds(at(2024, 5, 1, 10, 30, 20))
+        self.aggregator = RollupAggregator(flush_interval=10 ** 9, clock=lambda: self.now)
+
+    def test_flush_writes_every_granularity(self):
+        a, b = self.destinations
+        self.aggregator.record(self.account.pk, a.pk, 0.010, True)
+        self.aggregator.record(self.account.pk, a.pk, 0.030, False)
+        self.aggregator.record(self.account.pk, b.pk, 0.020, True)
+        self.assertEqual(self.aggregator.flush(), 6)
+        row = DeliveryRollup.objects.get(destination=a, granularity='hour')
+        self.assertEqual(row.bucket_start, at(2024, 5, 1, 10))
+        self.assertEqual((row.deliveries, row.errors, row.latency_sum_us), (2, 1, 40000))
+        self.assertEqual(DeliveryRollup.objects.get(destination=a, granularity='minute').bucket_start,
+                         at(2024, 5, 1, 10, 30))
+        self.assertEqual(DeliveryRollup.objects.get(destination=a, granularity='day').bucket_start, at(2024, 5, 1))
+
+        # Later flushes, e.g. from other processes, add up
+        self.now += 3600
+        self.aggregator.record(self.account.pk, a.pk, 0.010, True)
+        self.aggregator.flush()
+        day = DeliveryRollup.objects.get(destination=a, granularity='day')
+        self.assertEqual((day.deliveries, day.latency_sum_us), (3, 50000))
+        self.assertEqual(DeliveryRollup.objects.filter(destination=a, granularity='hour').count(), 2)
+
+    @override_settings(ROLLUP_RETENTION={'minute': timedelta(days=2)})
+    def test_prunes_expired_rollups(self):
+        self.aggregator.record(self.account.pk, self.destinations[0].pk, 0.010, True)
+        self.aggregator.flush()
+        self.assertEqual(sorted(DeliveryRollup.objects.values_list('granularity', flat=True)), ['day', 'hour'])
+
+    def test_skips_deleted_destinations(self):
+        destination = self.destinations[0]
+        self.aggregator.record(self.account.pk, destination.pk, 0.010, True)
+        destination.delete()
+        self.assertEqual(self.aggregator.flush(), 0)
+
+    def test_early_flush_when_many_pending(self):
+        aggregator = RollupAggregator(flush_interval=10 ** 9, max_pending=2, clock=lambda: self.now)
+        flushed = []
+        aggregator.flush_in_background = lambda: flushed.append(True)
+        aggregator.record(self.account.pk, self.destinations[0].pk, 0.01, True)
+        self.assertEqual(flushed, [])
+        aggregator.record(self.account.pk, self.destinations[1].pk, 0.01, True)
+        self.assertEqual(flushed, [True])
+
+    def test_failed_write_is_retried(self):
+        self.aggregator.record(self.account.pk, self.destinations[0].pk, 0.010, True)
+        with patch.object(self.aggregator, 'write', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('data_pusher_app.rollups', 'ERROR'):
+            self.assertEqual(self.aggregator.flush(), 0)
+        self.assertEqual((self.aggregator.write_errors, len(self.aggregator.pending)), (1, 1))
+        self.aggregator.record(self.account.pk, self.destinations[0].pk, 0.030, True)
+        self.assertEqual(self.aggregator.flush(), 3)
+        row = DeliveryRollup.objects.get(destination=self.destinations[0], granularity='minute')
+        self.assertEqual((row.deliveries, row.latency_sum_us), (2, 40000))
+
+    def test_idle_buckets_are_flushed_by_timer(self):
+        aggregator = RollupAggregator(flush_interval=0.05, clock=lambda: self.now)
+        flushed = threading.Event()
+        aggregator.flush_in_background = flushed.set
+        aggregator.record(self.account.pk, self.destinations[0].pk, 0.01, True)
+        self.assertTrue(flushed.wait(5))
+
+
+@override_settings(ROLLUP_RETENTION={})
+class RollupQueryTest(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create(email_id='query@test.com', account_name='Query')
+        self.destination = Destination.objects.create(account=self.account, url='http://a.com', http_method='POST',
+                                                      headers={'Content-Type': 'application/json'})
+        self.now = to_seconds(at(2024, 5, 1, 0, 0))
+        aggregator = RollupAggregator(flush_interval=10 ** 9, clock=lambda: self.now)
+        # One delivery every 30 minutes over three days
+        for _ in range(3 * 48):
+            aggregator.record(self.account.pk, self.destination.pk, 0.050, True)
+            self.now += 1800
+        aggregator.flush()
+
+    def test_totals_read_coarse_rows(self):
+        query = RollupQuery(self.account.pk, at(2024, 5, 1, 12), at(2024, 5, 3, 12, 15))
+        result = query.run()
+        self.assertEqual(result['granularities'], ['day', 'hour', 'minute'])
+        self.assertEqual(result['series'][0]['deliveries'], 2 * 48 + 1)
+        self.assertEqual(result['series'][0]['avg_ms'], 50.0)
+        # 12 hour rows, 1 day row, 12 hour rows and one minute row at most
+        self.assertLessEqual(query.rows().count(), 26)
+
+    def test_series_by_step(self):
+        result = RollupQuery(self.account.pk, at(2024, 5, 1), at(2024, 5, 2), step=6 * 3600).run()
+        self.assertEqual(result['granularities'], ['hour'])
+        self.assertEqual([point['deliveries'] for point in result['series']], [12, 12, 12, 12])
+        self.assertEqual(result['series'][1]['start'], at(2024, 5, 1, 6))
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            RollupQuery(self.account.pk, at(2024, 5, 2), at(2024, 5, 1))
+        with self.assertRaises(ValueError):
+            RollupQuery(self.account.pk, at(2024, 5, 1), at(2024, 5, 2), step=90)
+        with override_settings(ROLLUP_MAX_POINTS=24), self.assertRaises(ValueError):
+            RollupQuery(self.account.pk, at(2024, 5, 1), at(2024, 5, 2), step=60)
+        with override_settings(ROLLUP_MAX_POINTS=24):
+            RollupQuery(self.account.pk, at(2024, 5, 1), at(2024, 5, 2), step=3600)
+        with self.assertRaises(ValueError):
+            parse_rollup_options({'since': 'yesterday'})
+        options = parse_rollup_options({'step': '3600', 'destinations': '1,2'}, now=at(2024, 5, 2))
+        self.assertEqual(options['since'], at(2024, 5, 1))
+        self.assertEqual((options['step'], options['destination_ids']), (3600, [1, 2]))
+
+    def test_view(self):
+        url = reverse('rollups', args=[self.account.pk])
+        response = self.client.get(url, {'since': '2024-05-01T00:00:00Z', 'until': '2024-05-02T00:00:00Z'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['series'][0]['deliveries'], 48)
+        self.assertEqual(self.client.get(url, {'step': 'x'}).status_code, 400)
+        response = self.client.get(url, {'since': '1970-01-01T00:00:00Z', 'step': '60'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('more than 10000 steps', response.json()['error'])
+        self.assertEqual(self.client.get(reverse('rollups', args=['5f0c6bb8-5a5b-4bd8-9d61-0c9e2b0f7a11'])).status_code,
+                         404)
@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from unittest.mock import MagicMock
+from data_pusher_app.models import Account, Destination
+from data_pusher_app.routing import RoutingIndex, RoutingIndexCache, validate_routing_rules
+from data_pusher_app.views import DestinationHandler
+
+
+def destination(name, rules=None):
+    return SimpleNamespace(name=name, routing_rules=rules)
+
+
+class RoutingRulesValidationTest(TestCase):
+    def test_valid_rules(self):
+        validate_routing_rules(None)
+        validate_routing_rules([
+            {'field': 'event', 'value': 'order.created'},
+            {'field': 'event', 'op': 'prefix', 'value': 'order.'},
+            {'field': 'user.id', 'op': 'exists'},
+            {'field': 'region', 'op': 'in', 'value': ['eu', 'us']},
+        ])
+
+    def test_invalid_rules(self):
+        for rules in ({'field': 'event'}, [{'op': 'eq', 'value': 1}], [{'field': 'a', 'op': 'regex', 'value': '.*'}],
+                      [{'field': 'a', 'op': 'prefix', 'value': 1}], [{'field': 'a', 'op': 'in', 'value': 'x'}],
+                      [{'field': 'a'}]):
+            with self.assertRaises(ValidationError):
+                validate_routing_rules(rules)
+
+    def test_destination_full_clean_validates_rules(self):
+        account = Account.objects.create(email_id='rules@test.com', account_name='Rules')
+        dest = Destination(account=account, url='http://validurl.com', http_method='POST',
+                           headers={'Content-Type': 'application/json'}, routing_rules=[{'field': ''}])
+        with self.assertRaises(ValidationError):
+            dest.full_clean()
+
+
+class RoutingIndexTest(TestCase):
+    def setUp(self):
+        self.all = destination('all')
+        self.orders = destination('orders', [{'field': 'event', 'op': 'prefix', 'value': 'order.'}])
+        self.created = destination('created', [{'field': 'event', 'value': 'order.created'},
+                                               {'field': 'amount', 'op': 'exists'}])
+        self.regions = destination('regions', [{'field': 'meta.region', 'op': 'in', 'value': ['eu', 'us']}])
+        self.anonymous = destination('anonymous', [{'field': 'user', 'op': 'exists', 'value': False}])
+        self.index = RoutingIndex([self.all, self.orders, self.created, self.regions, self.anonymous])
+
+    def names(self, data):
+        return [d.name for d in self.index.match(data)]
+
+    def test_match_keeps_destination_order(self):
+        event = {'event': 'order.created', 'amount': 5, 'meta': {'region': 'eu'}}
+        self.assertEqual(self.names(event), ['all', 'orders', 'created', 'regions', 'anonymous'])
+
+    def test_remaining_rules_are_checked(self):
+        self.assertEqual(self.names({'event': 'order.created', 'user': 'u1'}), ['all', 'orders'])
+
+    def test_non_matching_event(self):
+        self.assertEqual(self.names({'event': 'user.signup', 'user': 'u1', 'meta': {'region': 'apac'}}), ['all'])
+
+    def test_non_object_payload(self):
+        self.assertEqual(self.names([1, 2, 3]), ['all', 'anonymous'])
+
+    def test_equality_distinguishes_booleans(self):
+        index = RoutingIndex([destination('flag', [{'field': 'active', 'value': True}])])
+        self.assertEqual(len(index.match({'active': True})), 1)
+        self.assertEqual(index.match({'active': 1}), [])
+
+
+class RoutingIndexCacheTest(TestCase):
+    def test_index_compiled_once_per_version(self):
+        cache = RoutingIndexCache(max_size=2)
+        account = SimpleNamespace(pk='a', destinations_version=1)
+        load = MagicMock(return_value=[destination('all')])
+        cache.get(account, load)
+        cache.get(account, load)
+        self.assertEqual(load.call_count, 1)
+        account.destinations_version = 2
+        cache.get(account, load)
+        self.assertEqual(load.call_count, 2)
+
+    def test_cache_is_bounded(self):
+        cache = RoutingIndexCache(max_size=2)
+        for pk in 'abc':
+            cache.get(SimpleNamespace(pk=pk, destinations_version=0), list)
+        self.assertEqual(len(cache.entries), 2)
+
+
+class DestinationHandlerRoutingTest(TestCase):
+    def test_only_matching_destinations_are_processed(self):
+        account = Account.objects.create(email_id='rules@test.com', account_name='Rules')
+        headers = {'Content-Type': 'application/json'}
+        Destination.objects.create(account=account, url='http://orders.com', http_method='POST', headers=headers,
+                                   routing_rules=[{'field': 'event', 'value': 'order.created'}])
+        Destination.objects.create(account=account, url='http://users.com', http_method='POST', headers=headers,
+                                   routing_rules=[{'field': 'event', 'value': 'user.signup'}])
+        account.refresh_from_db()
+        handler = DestinationHandler(account, {'event': 'order.created'})
+        self.assertEqual([d.url for d in handler.get_destinations()], ['http://orders.com'])
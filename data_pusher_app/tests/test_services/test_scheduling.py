@@ -0,0 +1,179 @@
+import json
+import math
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from unittest.mock import patch, MagicMock
+from data_pusher_app.models import Account, Delivery, Destination
+from data_pusher_app.scheduling import DeliveryScheduler, TimingWheel, parse_schedule
+from data_pusher_app.workers import claimable_deliveries
+
+NOW = datetime(2024, 5, 1, 12, tzinfo=dt_timezone.utc)
+
+
+class ParseScheduleTest(SimpleTestCase):
+    def test_headers(self):
+        self.assertIsNone(parse_schedule({}, NOW))
+        self.assertEqual(parse_schedule({'CL-X-DELAY': '300'}, NOW), NOW + timedelta(minutes=5))
+        self.assertEqual(parse_schedule({'CL-X-DELIVER-AT': '2024-05-02T09:00:00+02:00'}, NOW),
+                         datetime(2024, 5, 2, 7, tzinfo=dt_timezone.utc))
+        self.assertEqual(parse_schedule({'CL-X-DELIVER-AT': str(NOW.timestamp() + 60)}, NOW), NOW + timedelta(minutes=1))
+        # Times already passed are delivered right away
+        self.assertIsNone(parse_schedule({'CL-X-DELAY': '0'}, NOW))
+        self.assertIsNone(parse_schedule({'CL-X-DELIVER-AT': '2024-05-01T11:00:00Z'}, NOW))
+
+    @override_settings(DELIVERY_SCHEDULE_MAX_DELAY=3600)
+    def test_invalid_headers(self):
+        for headers in ({'CL-X-DELAY': 'soon'}, {'CL-X-DELAY': '-5'}, {'CL-X-DELAY': 'nan'},
+                        {'CL-X-DELIVER-AT': '2024-05-02T09:00:00'}, {'CL-X-DELIVER-AT': 'tomorrow'},
+                        {'CL-X-DELAY': '5', 'CL-X-DELIVER-AT': '2024-05-02T09:00:00Z'}, {'CL-X-DELAY': '7200'}):
+            with self.subTest(headers=headers), self.assertRaises(ValueError):
+                parse_schedule(headers, NOW)
+
+
+class TimingWheelTest(SimpleTestCase):
+    def test_keys_fire_at_their_tick(self):
+        rng = random.Random(7)
+        # A small wheel, so that keys cascade through every level and the overflow heap
+        wheel = TimingWheel(tick=1.0, slots=4, levels=3, start=1000.0)
+        dues = {key: 1000 + rng.uniform(-5, 300) for key in range(2000)}
+        for key, due in dues.items():
+            wheel.add(key, due)
+        self.assertEqual(len(wheel), 2000)
+        fired = {}
+        for now in range(1000, 1302):
+            for key in wheel.advance(now):
+                fired[key] = now
+        self.assertEqual(len(wheel), 0)
+        self.assertEqual(fired, {key: max(1000, math.ceil(due)) for key, due in dues.items()})
+
+    def test_late_advance_fires_everything_due(self):
+        wheel = TimingWheel(tick=0.5, start=0)
+        for key, due in (('a', 1.2), ('b', 40.0), ('c', 5000.0), ('d', 10 ** 8)):
+            wheel.add(key, due)
+        self.assertEqual(wheel.advance(1.0), [])
+        self.assertEqual(wheel.advance(6000.0), ['a', 'b', 'c'])
+        self.assertEqual(len(wheel), 1)
+        # Adding to an empty wheel after a long pause
+        wheel.advance(10 ** 8)
+        wheel.add('e', 10 ** 8 + 2)
+        self.assertEqual(wheel.advance(10 ** 8 + 2), ['e'])
+
+
+class DeliverySchedulerTest(TestCase):
+    def setUp(self):
+        self.now = NOW.timestamp()
+        patcher = patch('data_pusher_app.workers.timezone.now',
+                        side_effect=lambda: datetime.fromtimestamp(self.now, dt_timezone.utc))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('data_pusher_app.ingest.requests.request')
+        self.request = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.request.return_value = MagicMock(status_code=200, text='ok')
+        self.account = Account.objects.create(email_id='later@test.com', account_name='Later')
+        self.destination = Destination.objects.create(account=self.account, url='http://later.com', http_method='POST',
+                                                      headers={'X-Key': 'k'})
+
+    def store(self, seconds, **payload):
+        return Delivery.objects.create(account=self.account, destination=self.destination, payload=payload,
+                                       available_at=NOW + timedelta(seconds=seconds))
+
+    def scheduler(self):
+        scheduler = DeliveryScheduler(tick=1, horizon=600, clock=lambda: self.now)
+        scheduler.load(self.now + scheduler.horizon)
+        return scheduler
+
+    def advance(self, scheduler, seconds):
+        sent = []
+        for _ in range(seconds):
+            self.now += 1
+            scheduler.run_once()
+            sent += [json.loads(call.kwargs['data'])['n'] for call in self.request.call_args_list]
+            self.request.reset_mock()
+        return sent
+
+    def test_sends_deliveries_when_due(self):
+        self.store(-30, n=0)
+        self.store(5, n=1)
+        self.store(900, n=2)
+        scheduler = self.scheduler()
+        self.assertEqual(len(scheduler.wheel), 2)
+        self.assertEqual(self.advance(scheduler, 1), [0])
+        self.assertEqual(self.advance(scheduler, 3), [])
+        self.assertEqual(self.advance(scheduler, 1), [1])
+        # The next window is loaded once half of the horizon has passed
+        self.assertEqual(self.advance(scheduler, 895), [2])
+        self.assertEqual(Delivery.objects.filter(status=Delivery.DELIVERED).count(), 3)
+        self.assertEqual(scheduler.fired, 3)
+
+    def test_restart_reloads_pending_deliveries(self):
+        delivery = self.store(60, n=1)
+        self.scheduler()
+        # The process dies before the delivery is due; a new one picks it up from the store
+        restarted = self.scheduler()
+        self.assertEqual(self.advance(restarted, 60), [1])
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, Delivery.DELIVERED)
+
+    def test_failures_return_to_the_wheel(self):
+        self.request.return_value = MagicMock(status_code=500, text='down')
+        self.store(1, n=1)
+        scheduler = self.scheduler()
+        self.advance(scheduler, 1)
+        self.assertEqual(len(scheduler.wheel), 1)
+        self.request.return_value = MagicMock(status_code=200, text='ok')
+        self.assertEqual(self.advance(scheduler, 30), [1])
+        self.assertEqual(Delivery.objects.get().attempts, 2)
+
+    def test_scheduled_ids_beyond_window_wait_for_it(self):
+        scheduler = self.scheduler()
+        first, second = self.store(10, n=1), self.store(700, n=2)
+        scheduler.schedule('default', [first.pk], first.available_at)
+        scheduler.schedule('default', [second.pk], second.available_at)
+        self.assertEqual(len(scheduler.wheel), 1)
+        self.assertEqual(self.advance(scheduler, 700), [1, 2])
+
+
+class ScheduledIngestTest(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create(email_id='ingest-later@test.com', account_name='Later')
+        Destination.objects.create(account=self.account, url='http://later.com', http_method='POST',
+                                   headers={'X-Key': 'k'})
+        patcher = patch('data_pusher_app.ingest.requests.request')
+        self.request = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, **headers):
+        return self.client.post(reverse('incoming_data'), data=json.dumps({'event': 'reminder'}),
+                                content_type='application/json',
+                                headers={'CL-X-TOKEN': str(self.account.app_secret_token), **headers})
+
+    def test_delay_stores_deliveries(self):
+        scheduler = MagicMock()
+        with patch('data_pusher_app.scheduling.get_delivery_scheduler', return_value=scheduler):
+            response = self.post(**{'CL-X-DELAY': '300'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'scheduled')
+        delivery = Delivery.objects.get()
+        self.assertEqual(delivery.payload, {'event': 'reminder'})
+        self.assertGreater(delivery.available_at, datetime.now(dt_timezone.utc) + timedelta(seconds=290))
+        scheduler.schedule.assert_called_once_with('default', [delivery.pk], delivery.available_at)
+        self.request.assert_not_called()
+
+    @override_settings(DELIVERY_MODE='durable')
+    def test_scheduled_events_do_not_block_ordered_ones(self):
+        Destination.objects.update(ordering_key='event')
+        with patch('data_pusher_app.scheduling.get_delivery_scheduler', return_value=None):
+            self.assertEqual(self.post(**{'CL-X-DELAY': '86400'}).status_code, 202)
+        self.assertEqual(self.post().status_code, 202)
+        scheduled, immediate = Delivery.objects.order_by('pk')
+        self.assertIsNone(scheduled.ordering_partition)
+        self.assertIsNotNone(immediate.ordering_partition)
+        self.assertEqual(list(claimable_deliveries(datetime.now(dt_timezone.utc), 'default')), [immediate])
+
+    def test_invalid_schedule(self):
+        response = self.post(**{'CL-X-DELIVER-AT': 'tomorrow'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Delivery.objects.exists())
@@ -0,0 +1,222 @@
+import uuid
+from collections import Counter
+from io import StringIO
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from unittest.mock import patch
+from rest_framework.test import APITestCase
+from data_pusher_app.bulk import BulkAccountProcessor, BulkDestinationProcessor
+from data_pusher_app.models import Account, Delivery, Destination, DestinationStats, ShardDirectory
+from data_pusher_app.sharding import ShardMap, ShardRebalancer, TenantRouter, placement, shard_map
+from data_pusher_app.tests.shards import TwoShardsMixin
+
+
+class PlacementTest(SimpleTestCase):
+    def test_spreads_accounts_evenly(self):
+        ids = [uuid.uuid4() for _ in range(4000)]
+        counts = Counter(placement(account_id, ['a', 'b', 'c', 'd']) for account_id in ids)
+        self.assertEqual(set(counts), {'a', 'b', 'c', 'd'})
+        self.assertTrue(all(800 < count < 1200 for count in counts.values()))
+
+    def test_adding_a_shard_only_moves_accounts_to_it(self):
+        ids = [uuid.uuid4() for _ in range(4000)]
+        before = {account_id: placement(account_id, ['a', 'b', 'c']) for account_id in ids}
+        after = {account_id: placement(account_id, ['a', 'b', 'c', 'd']) for account_id in ids}
+        moved = [account_id for account_id in ids if before[account_id] != after[account_id]]
+        self.assertTrue(all(after[account_id] == 'd' for account_id in moved))
+        self.assertTrue(800 < len(moved) < 1200)
+
+    def test_single_shard(self):
+        self.assertEqual(placement(uuid.uuid4(), ['default']), 'default')
+
+
+@override_settings(TENANT_SHARDS=['default', 'shard1'])
+class ShardMapTest(TestCase):
+    def setUp(self):
+        self.shard_map = ShardMap(ttl=60)
+
+    def test_directory_overrides_placement(self):
+        account_id = uuid.uuid4()
+        expected = placement(account_id)
+        self.assertEqual(self.shard_map.shard_of(account_id), expected)
+        other = 'shard1' if expected == 'default' else 'default'
+        ShardDirectory.objects.create(account_id=account_id, app_secret_token=uuid.uuid4(), shard=other)
+        # Cached until forgotten
+        self.assertEqual(self.shard_map.shard_of(account_id), expected)
+        self.shard_map.forget(account_id)
+        self.assertEqual(self.shard_map.shard_of(account_id), other)
+
+    def test_token_lookup_uses_directory(self):
+        token = uuid.uuid4()
+        ShardDirectory.objects.create(account_id=uuid.uuid4(), app_secret_token=token, shard='shard1')
+        self.assertEqual(self.shard_map.shard_of_token(str(token)), 'shard1')
+
+    def test_unknown_token_searches_shards(self):
+        with patch('data_pusher_app.models.Account.objects.using') as using:
+            using.return_value.filter.return_value.first.return_value = None
+            self.assertIsNone(self.shard_map.shard_of_token(str(uuid.uuid4())))
+        self.assertEqual([call.args[0] for call in using.call_args_list], ['default', 'shard1'])
+
+    def test_groups_account_ids_by_shard(self):
+        ids = [uuid.uuid4() for _ in range(20)]
+        groups = self.shard_map.group(ids)
+        self.assertEqual(sorted(sum(groups.values(), []), key=str), sorted(ids, key=str))
+        for alias, members in groups.items():
+            self.assertTrue(all(placement(account_id) == alias for account_id in members))
+
+
+class TenantRouterTest(SimpleTestCase):
+    router = TenantRouter()
+
+    def test_single_shard_routes_nothing(self):
+        account = Account(account_name='A', email_id='a@test.com')
+        self.assertIsNone(self.router.db_for_write(Account, instance=account))
+
+    @override_settings(TENANT_SHARDS=['default', 'shard1'])
+    def test_routes_by_account(self):
+        with patch('data_pusher_app.sharding.shard_map.shard_of', return_value='shard1') as shard_of:
+            account = Account(account_name='A', email_id='a@test.com')
+            destination = Destination(account=account, url='http://a.com', http_method='POST', headers={})
+            delivery = Delivery(account=account, destination=destination, payload={})
+            self.assertEqual(self.router.db_for_write(Account, instance=account), 'shard1')
+            self.assertEqual(self.router.db_for_write(Destination, instance=destination), 'shard1')
+            self.assertEqual(self.router.db_for_read(Delivery, instance=delivery), 'shard1')
+        shard_of.assert_called_with(account.pk)
+        # Loaded rows stay on their database, unhinted queries use the default
+        destination._state.db = 'default'
+        self.assertEqual(self.router.db_for_write(Destination, instance=destination), 'default')
+        self.assertIsNone(self.router.db_for_read(Destination))
+        self.assertIsNone(self.router.db_for_read(ShardDirectory, instance=ShardDirectory()))
+
+    @override_settings(TENANT_SHARDS=['default', 'shard1'])
+    def test_migrations(self):
+        self.assertIsNone(self.router.allow_migrate('default', 'auth', 'user'))
+        self.assertTrue(self.router.allow_migrate('shard1', 'data_pusher_app', 'destination'))
+        self.assertFalse(self.router.allow_migrate('shard1', 'data_pusher_app', 'sharddirectory'))
+        self.assertFalse(self.router.allow_migrate('shard1', 'auth', 'user'))
+        self.assertFalse(self.router.allow_migrate('other', 'data_pusher_app', 'destination'))
+
+
+class ShardRebalancerTest(TestCase):
+    def test_single_shard_moves_nothing(self):
+        Account.objects.create(email_id='stay@test.com', account_name='Stay')
+        self.assertEqual(ShardRebalancer().run(), {'moved': 0, 'in_place': 1})
+        self.assertFalse(ShardDirectory.objects.exists())
+
+    def test_plans_moves_to_new_shard(self):
+        accounts = [Account.objects.create(email_id=f'a{i}@test.com', account_name=f'A{i}') for i in range(40)]
+        rebalancer = ShardRebalancer(shards=['default', 'shard1'], dry_run=True)
+        # Only the default database exists here; shard1 would be empty before its first rebalance
+        rebalancer.sources = ['default']
+        plan = {account.pk: (source, target) for account, source, target in rebalancer.plan()}
+        self.assertEqual(set(plan), {account.pk for account in accounts})
+        self.assertTrue(all(source == 'default' for source, _ in plan.values()))
+        moving = sum(target == 'shard1' for _, target in plan.values())
+        self.assertEqual(rebalancer.run(), {'moved': moving, 'in_place': 40 - moving})
+        self.assertEqual(Account.objects.count(), 40)
+
+    def test_command_rejects_unknown_alias(self):
+        with self.assertRaisesMessage(Exception, "Unknown database aliases: nowhere."):
+            call_command('rebalance_shards', drain=['nowhere'], stdout=StringIO())
+
+    def test_command(self):
+        out = StringIO()
+        call_command('rebalance_shards', stdout=out)
+        self.assertIn("Moved 0 accounts", out.getvalue())
+
+
+class ShardedWritesTest(APITestCase):
+    """
+    Only the default database exists here, so a second shard is simulated: the shard map reports
+    two shards while every account is located on the default one.
+    """
+
+    def setUp(self):
+        for patcher in (patch('data_pusher_app.sharding.get_shards', return_value=['default', 'shard1']),
+                        patch.object(shard_map, 'shard_of', return_value='default')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_bulk_accounts_are_recorded_in_the_directory(self):
+        result = BulkAccountProcessor().create([{'email_id': f'bulk{i}@test.com', 'account_name': f'B{i}'}
+                                                for i in range(3)])
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(set(ShardDirectory.objects.values_list('shard', flat=True)), {'default'})
+        self.assertEqual({str(pk) for pk in ShardDirectory.objects.values_list('account_id', flat=True)},
+                         set(result['created']))
+
+    def test_bulk_destinations_go_to_the_account_shard(self):
+        account = Account.objects.create(email_id='owner@test.com', account_name='Owner')
+        shard_map.shard_of.reset_mock()
+        result = BulkDestinationProcessor().create([{'account': str(account.pk), 'url': 'http://sharded.com',
+                                                     'http_method': 'POST', 'headers': {'X-Key': 'k'}}])
+        self.assertEqual(len(result['created']), 1)
+        self.assertIn(str(account.pk), {str(call.args[0]) for call in shard_map.shard_of.call_args_list})
+
+    def test_account_endpoints_look_up_the_shard(self):
+        account = Account.objects.create(email_id='routed@test.com', account_name='Routed')
+        shard_map.shard_of.reset_mock()
+        response = self.client.get(reverse('account-detail', args=[account.pk]))
+        self.assertEqual(response.status_code, 200)
+        shard_map.shard_of.assert_called_with(account.pk)
+        response = self.client.post(reverse('destination-list'), {
+            'account': str(account.pk), 'url': 'http://routed.com', 'http_method': 'POST', 'headers': {'X-Key': 'k'},
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        # BaseViewSet answers every error, missing objects included, with 400
+        self.assertEqual(self.client.get(reverse('account-detail', args=[uuid.uuid4()])).status_code, 400)
+
+    def test_account_list_reads_every_shard(self):
+        Account.objects.create(email_id='listed@test.com', account_name='Listed')
+        with patch('data_pusher_app.views.get_shards', return_value=['default']) as get_shards:
+            response = self.client.get(reverse('account-list'))
+        get_shards.assert_called_once()
+        self.assertEqual([account['email_id'] for account in response.json()], ['listed@test.com'])
+
+
+class ShardedDestinationsTest(TwoShardsMixin, APITestCase):
+    def setUp(self):
+        self.accounts = {alias: self.account_on(alias) for alias in ('default', 'shard1')}
+
+    def create(self, alias, url):
+        response = self.client.post(reverse('destination-list'), {
+            'account': str(self.accounts[alias].pk), 'url': url, 'http_method': 'POST', 'headers': {'X-Key': 'k'},
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def test_ids_are_unique_across_shards(self):
+        first, second = self.create('default', 'http://first.com'), self.create('shard1', 'http://second.com')
+        third = BulkDestinationProcessor().create([{'account': str(self.accounts['shard1'].pk), 'url': 'http://third.com',
+                                                    'http_method': 'POST', 'headers': {'X-Key': 'k'}}])['created'][0]
+        self.assertEqual(len({first, second, third}), 3)
+        self.assertEqual(list(Destination.objects.using('shard1').order_by('pk').values_list('pk', flat=True)),
+                         [second, third])
+        self.assertFalse(Destination.objects.using('default').filter(pk__in=[second, third]).exists())
+
+    def test_endpoints_find_destinations_on_their_shard(self):
+        first, second = self.create('default', 'http://first.com'), self.create('shard1', 'http://second.com')
+        self.assertEqual(self.client.get(reverse('destination-detail', args=[second])).json()['url'], 'http://second.com')
+        self.assertEqual([d['id'] for d in self.client.get(reverse('destination-list')).json()], [first, second])
+        response = self.client.patch(reverse('destination-detail', args=[second]), {'url': 'http://moved.com'},
+                                     format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Destination.objects.using('shard1').get(pk=second).url, 'http://moved.com')
+        self.assertEqual(Destination.objects.using('default').get(pk=first).url, 'http://first.com')
+        # The row cannot follow an account to another shard
+        response = self.client.patch(reverse('destination-detail', args=[second]),
+                                     {'account': str(self.accounts['default'].pk)}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.delete(reverse('destination-detail', args=[second])).status_code, 204)
+        self.assertFalse(Destination.objects.using('shard1').exists())
+
+    def test_rebalancing_keeps_destination_ids(self):
+        destination_id = self.create('shard1', 'http://kept.com')
+        account = self.accounts['shard1']
+        DestinationStats.objects.using('shard1').create(destination_id=destination_id, window_start='2024-01-01T00:00Z',
+                                                        window_seconds=60, deliveries=3)
+        ShardRebalancer(shards=['default', 'shard1']).move(account, 'shard1', 'default')
+        self.assertEqual(Destination.objects.using('default').get(pk=destination_id).account_id, account.pk)
+        self.assertEqual(DestinationStats.objects.using('default').get().destination_id, destination_id)
+        self.assertFalse(Destination.objects.using('shard1').exists())
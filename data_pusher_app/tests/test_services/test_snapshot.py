@@ -0,0 +1,77 @@
+import json
+import os
+import tempfile
+import uuid
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from unittest.mock import patch, MagicMock
+from data_pusher_app.models import Account, Destination
+from data_pusher_app.snapshot import RoutingSnapshot, SnapshotManager, SnapshotWriter
+
+HEADERS = {'Content-Type': 'application/json'}
+
+
+class RoutingSnapshotTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'routing.snapshot')
+        self.accounts = [Account.objects.create(email_id=f'user{i}@test.com', account_name=f'User {i}') for i in range(20)]
+        for i, account in enumerate(self.accounts[:10]):
+            for j in range(i % 3):
+                Destination.objects.create(account=account, url=f'http://host{i}-{j}.com', http_method='POST',
+                                           headers=HEADERS, routing_rules=[{'field': 'event', 'value': j}])
+
+    def test_lookup_without_queries(self):
+        SnapshotWriter(self.path, chunk_size=3).write(version=7)
+        snapshot = RoutingSnapshot(self.path)
+        self.assertEqual((snapshot.version, snapshot.record_count), (7, 20))
+        with self.assertNumQueries(0):
+            for i, account in enumerate(self.accounts):
+                found, destinations = snapshot.lookup(str(account.app_secret_token))
+                self.assertEqual(found.pk, account.pk)
+                self.assertEqual(found.account_name, account.account_name)
+                self.assertEqual(len(destinations), i % 3 if i < 10 else 0)
+            found, destinations = snapshot.lookup(self.accounts[5].app_secret_token.hex)
+            self.assertEqual(destinations[1].url, 'http://host5-1.com')
+            self.assertEqual(destinations[1].routing_rules, [{'field': 'event', 'value': 1}])
+            self.assertIsNone(snapshot.lookup(str(uuid.uuid4())))
+            self.assertIsNone(snapshot.lookup('not-a-token'))
+
+    def test_manager_hot_swaps_newer_snapshot(self):
+        SnapshotWriter(self.path).write(version=1)
+        manager = SnapshotManager(self.path, check_interval=0)
+        self.assertEqual(manager.current().version, 1)
+        account = Account.objects.create(email_id='new@test.com', account_name='New')
+        self.assertIsNone(manager.lookup(account.app_secret_token))
+        SnapshotWriter(self.path).write(version=2)
+        self.assertEqual(manager.current().version, 2)
+        self.assertEqual(manager.lookup(account.app_secret_token)[0].pk, account.pk)
+
+    def test_rejects_invalid_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a snapshot' * 10)
+        with self.assertRaises(ValueError):
+            RoutingSnapshot(self.path)
+        self.assertIsNone(SnapshotManager(self.path, check_interval=0).current())
+
+    def test_build_command(self):
+        out = StringIO()
+        call_command('build_routing_snapshot', '--output', self.path, stdout=out)
+        self.assertIn("with 20 accounts", out.getvalue())
+
+    @patch('requests.request')
+    def test_incoming_data_served_from_snapshot(self, mock_request):
+        mock_request.return_value = MagicMock(text='ok', status_code=200)
+        SnapshotWriter(self.path).write()
+        account = self.accounts[2]
+        with override_settings(ROUTING_SNAPSHOT_PATH=self.path), \
+                patch('data_pusher_app.snapshot.routing_snapshots', SnapshotManager(self.path, check_interval=0)), \
+                patch('data_pusher_app.ingest.AccountVerifier') as mock_verifier:
+            response = self.client.post(reverse('incoming_data'), json.dumps({'event': 1}), content_type='application/json',
+                                        HTTP_CL_X_TOKEN=str(account.app_secret_token))
+        mock_verifier.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['url'] for r in response.json()['responses']], ['http://host2-1.com'])
@@ -0,0 +1,148 @@
+import random
+import time
+import uuid
+from django.test import SimpleTestCase, TestCase
+from unittest.mock import patch, MagicMock
+from data_pusher_app.ingest import DestinationHandler
+from data_pusher_app.models import Account, Destination, DestinationStats
+from data_pusher_app.sharding import shard_map
+from data_pusher_app.stats import (BUCKET_COUNT, DestinationStatsRecorder, LatencyHistogram, bucket_index,
+                                   bucket_upper_bound)
+from data_pusher_app.tests.shards import TwoShardsMixin
+
+HEADERS = {'Content-Type': 'application/json'}
+
+
+class LatencyHistogramTest(SimpleTestCase):
+    def test_buckets_bound_relative_error(self):
+        for micros in list(range(0, 5000)) + [10 ** 6, 123456789, 2 ** 36 - 1]:
+            index = bucket_index(micros)
+            self.assertLess(index, BUCKET_COUNT)
+            upper = bucket_upper_bound(index)
+            self.assertGreaterEqual(upper, micros)
+            self.assertLessEqual(upper - micros, micros / 8 + 1)
+        self.assertEqual(bucket_index(2 ** 40), bucket_index(2 ** 36 - 1))
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        samples = list(range(1000, 101000, 100))  # 1ms .. 101ms in microseconds
+        random.Random(1).shuffle(samples)
+        for i, micros in enumerate(samples):
+            histogram.record(micros, ok=i % 10 != 0)
+        summary = histogram.summary()
+        self.assertEqual((summary['deliveries'], summary['errors']), (1000, 100))
+        self.assertAlmostEqual(summary['p50_ms'], 51, delta=51 / 8)
+        self.assertAlmostEqual(summary['p99_ms'], 100, delta=100 / 8)
+        self.assertEqual(summary['max_ms'], 100.9)
+        self.assertEqual(LatencyHistogram().summary()['p50_ms'], None)
+
+    def test_sparse_round_trip(self):
+        histogram = LatencyHistogram()
+        for micros in (5, 500, 50000):
+            histogram.record(micros, ok=False)
+        copy = LatencyHistogram.from_sparse(histogram.to_sparse(), histogram.errors, histogram.max_micros)
+        self.assertEqual(copy.summary(), histogram.summary())
+
+
+class DestinationStatsRecorderTest(TestCase):
+    def setUp(self):
+        self.now = float(int(time.time()) // 60 * 60)
+        self.recorder = DestinationStatsRecorder(slot_seconds=60, window_slots=2, flush_interval=3600,
+                                                 clock=lambda: self.now)
+        account = Account.objects.create(email_id='stats@test.com', account_name='Stats')
+        self.destination = Destination.objects.create(account=account, url='http://stats.com', http_method='POST',
+                                                      headers=HEADERS)
+
+    def test_rolling_window(self):
+        self.recorder.record(self.destination.pk, 0.010, True)
+        self.now += 60
+        self.recorder.record(self.destination.pk, 0.020, False)
+        self.assertEqual(self.recorder.snapshot(self.destination.pk)['deliveries'], 2)
+        self.now += 60
+        live = self.recorder.snapshot(self.destination.pk)
+        self.assertEqual((live['deliveries'], live['errors']), (1, 1))
+
+    def test_windows_are_kept_per_account(self):
+        other = uuid.uuid4()
+        self.recorder.record(self.destination.pk, 0.010, True, account_id=self.destination.account_id)
+        self.recorder.record(self.destination.pk, 0.010, False, account_id=other)
+        live = self.recorder.snapshot(self.destination.pk, self.destination.account_id)
+        self.assertEqual((live['deliveries'], live['errors']), (1, 0))
+        self.assertEqual(self.recorder.snapshot(self.destination.pk, other)['errors'], 1)
+
+    def test_flush_merges_rows(self):
+        for _ in range(3):
+            self.recorder.record(self.destination.pk, 0.010, True)
+        self.recorder.record(12345, 0.010, True)  # unknown destination
+        self.assertEqual(self.recorder.flush(), 1)
+        # A second worker flushing the same slot adds to the row
+        other = DestinationStatsRecorder(slot_seconds=60, flush_interval=3600, clock=lambda: self.now)
+        other.record(self.destination.pk, 0.500, False)
+        other.flush()
+        row = DestinationStats.objects.get(destination=self.destination)
+        self.assertEqual((row.deliveries, row.errors, row.max_latency_us), (4, 1, 500000))
+        self.assertEqual(self.recorder.flush(), 0)
+
+    def test_flush_goes_to_the_account_shard(self):
+        account_id = self.destination.account_id
+        self.recorder.record(self.destination.pk, 0.010, True, account_id=account_id)
+        # Destination IDs are per shard: the same ID of another account's destination is not merged into this one
+        self.recorder.record(self.destination.pk, 0.010, True, account_id=uuid.uuid4())
+        with patch('data_pusher_app.stats.shard_map.group', wraps=shard_map.group) as group:
+            self.assertEqual(self.recorder.flush(), 1)
+        self.assertIn(account_id, group.call_args.args[0])
+        self.assertEqual(DestinationStats.objects.get(destination=self.destination).deliveries, 1)
+
+    def test_flushes_in_background_when_due(self):
+        recorder = DestinationStatsRecorder(flush_interval=1, clock=lambda: self.now)
+        self.now += 2
+        with patch.object(recorder, 'flush_in_background') as flush:
+            recorder.record(self.destination.pk, 0.01, True)
+        flush.assert_called_once()
+
+
+class DestinationStatsEndpointTest(TestCase):
+    def setUp(self):
+        account = Account.objects.create(email_id='stats@test.com', account_name='Stats')
+        self.destination = Destination.objects.create(account=account, url='http://stats.com', http_method='POST',
+                                                      headers=HEADERS)
+        self.recorder = DestinationStatsRecorder(flush_interval=3600)
+        patcher = patch('data_pusher_app.ingest.destination_stats', self.recorder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('data_pusher_app.views.destination_stats', self.recorder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('data_pusher_app.ingest.requests.request')
+    def test_deliveries_are_recorded_and_served(self, request):
+        request.side_effect = [MagicMock(status_code=200, text='ok'), MagicMock(status_code=500, text='no'),
+                               Exception('timeout')]
+        for _ in range(3):
+            DestinationHandler(self.destination.account, {'event': 'x'}).process_destinations()
+        live = self.client.get(f'/api/destinations/{self.destination.pk}/stats/').json()['live']
+        self.assertEqual((live['deliveries'], live['successes'], live['errors']), (3, 1, 2))
+
+        self.recorder.flush()
+        response = self.client.get(f'/api/destinations/{self.destination.pk}/stats/?minutes=5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['flushed']['deliveries'], 3)
+        self.assertIsNotNone(response.json()['flushed']['p90_ms'])
+
+
+class ShardedStatsEndpointTest(TwoShardsMixin, TestCase):
+    @patch('data_pusher_app.ingest.requests.request')
+    def test_statistics_are_read_from_the_destination_shard(self, request):
+        request.return_value = MagicMock(status_code=200, text='ok')
+        account = self.account_on('shard1')
+        destination = Destination.objects.create(account=account, url='http://stats.com', http_method='POST',
+                                                 headers=HEADERS)
+        recorder = DestinationStatsRecorder(flush_interval=3600)
+        with patch('data_pusher_app.ingest.destination_stats', recorder), \
+                patch('data_pusher_app.views.destination_stats', recorder):
+            DestinationHandler(account, {'event': 'x'}).process_destinations()
+            recorder.flush()
+            body = self.client.get(f'/api/destinations/{destination.pk}/stats/').json()
+        self.assertEqual(body['flushed']['deliveries'], 1)
+        self.assertEqual(body['live']['deliveries'], 1)
+        self.assertEqual(DestinationStats.objects.using('shard1').get().destination_id, destination.pk)
@@ -0,0 +1,68 @@
+import json
+from types import SimpleNamespace
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from unittest.mock import patch, MagicMock
+from data_pusher_app.models import Account
+from data_pusher_app.transforms import TransformCache, compile_transform, validate_transform_spec
+from data_pusher_app.views import DestinationHandler
+
+
+class TransformSpecTest(TestCase):
+    def test_validation(self):
+        validate_transform_spec(None)
+        validate_transform_spec({'select': ['a', 'b.c'], 'rename': {'a': 'x.y'}, 'drop': ['b'], 'set': {'v': 1}, 'wrap': 'data'})
+        for spec in ([], {'map': {}}, {'select': 'a'}, {'rename': {'a': 1}}, {'drop': ['a..b']}, {'wrap': ''}):
+            with self.assertRaises(ValidationError):
+                validate_transform_spec(spec)
+
+    def test_operations_in_order(self):
+        transform = compile_transform({
+            'select': ['user.id', 'user.name', 'event'],
+            'rename': {'user.id': 'customer_id', 'event': 'type'},
+            'drop': ['user.name'],
+            'set': {'source': 'data_pusher'},
+            'wrap': 'payload',
+        })
+        data = {'user': {'id': 7, 'name': 'Ann', 'email': 'a@b.c'}, 'event': 'signup', 'extra': True}
+        self.assertEqual(transform(data), {'payload': {'customer_id': 7, 'type': 'signup', 'user': {}, 'source': 'data_pusher'}})
+        self.assertEqual(data, {'user': {'id': 7, 'name': 'Ann', 'email': 'a@b.c'}, 'event': 'signup', 'extra': True})
+
+    def test_non_object_payload_is_only_wrapped(self):
+        transform = compile_transform({'select': ['a'], 'set': {'b': 1}, 'wrap': 'items'})
+        self.assertEqual(transform([1, 2]), {'items': [1, 2]})
+
+
+class TransformCacheTest(TestCase):
+    def test_destinations_sharing_a_spec_share_the_callable(self):
+        cache = TransformCache()
+        first = SimpleNamespace(transform={'wrap': 'data'})
+        second = SimpleNamespace(transform={'wrap': 'data'})
+        self.assertEqual(cache.get(first), cache.get(second))
+        self.assertEqual(len(cache.entries), 1)
+        self.assertEqual(cache.get(SimpleNamespace(transform=None)), (None, None))
+
+
+class DestinationHandlerTransformTest(TestCase):
+    @patch('data_pusher_app.ingest.transform_cache', TransformCache())
+    @patch('requests.request')
+    def test_shared_spec_is_applied_once_per_event(self, mock_request):
+        mock_request.return_value = MagicMock(text='ok', status_code=200)
+        account = Account(email_id='t@test.com', account_name='Transforms')
+        spec = {'select': ['id']}
+        destinations = [
+            SimpleNamespace(url=f'http://host{i}.com', http_method='POST', headers={}, transform=dict(spec), routing_rules=None)
+            for i in range(3)
+        ] + [SimpleNamespace(url='http://raw.com', http_method='POST', headers={}, transform=None, routing_rules=None)]
+        handler = DestinationHandler(account, {'id': 1, 'secret': 'x'})
+        handler.load_destinations = lambda: destinations
+
+        with patch('data_pusher_app.transforms.compile_transform', wraps=compile_transform) as mock_compile:
+            responses = handler.process_destinations()
+        self.assertEqual(mock_compile.call_count, 1)
+        self.assertEqual(len(responses), 4)
+        bodies = [call.kwargs['data'] for call in mock_request.call_args_list]
+        self.assertIs(bodies[0], bodies[1])
+        sent = [json.loads(body) for body in bodies]
+        self.assertEqual(sent[:3], [{'id': 1}] * 3)
+        self.assertEqual(sent[3], {'id': 1, 'secret': 'x'})
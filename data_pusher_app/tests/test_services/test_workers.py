@@ -0,0 +1,104 @@
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from unittest.mock import patch, MagicMock
+from data_pusher_app.models import Account, Delivery, Destination
+from data_pusher_app.workers import DeliveryWorker, claimable_deliveries
+
+
+class DeliveryWorkerTest(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create(email_id='durable@test.com', account_name='Durable')
+        self.destination = Destination.objects.create(account=self.account, url='http://a.com', http_method='POST',
+                                                      headers={'Content-Type': 'application/json'})
+
+    def queue(self, count, **fields):
+        return Delivery.objects.bulk_create([
+            Delivery(account=self.account, destination=self.destination, payload={'n': n}, **fields)
+            for n in range(count)
+        ])
+
+    def test_claims_are_exclusive(self):
+        self.queue(5)
+        first = DeliveryWorker(name='one', batch_size=3)
+        second = DeliveryWorker(name='two', batch_size=3)
+        token_one, claimed_one = first.claim()
+        token_two, claimed_two = second.claim()
+        self.assertEqual(len(claimed_one), 3)
+        self.assertEqual(len(claimed_two), 2)
+        self.assertFalse({d.pk for d in claimed_one} & {d.pk for d in claimed_two})
+        self.assertEqual(second.claim()[1], [])
+        self.assertTrue(all(d.lease_owner == token_one and d.attempts == 1 for d in claimed_one))
+
+    def test_expired_lease_is_reclaimed(self):
+        self.queue(1)
+        token, claimed = DeliveryWorker(name='dead').claim()
+        self.assertEqual(DeliveryWorker(name='live').claim()[1], [])
+        Delivery.objects.filter(pk=claimed[0].pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        _, reclaimed = DeliveryWorker(name='live').claim()
+        self.assertEqual([d.pk for d in reclaimed], [claimed[0].pk])
+        self.assertEqual(reclaimed[0].attempts, 2)
+        # The dead worker's late release does not overwrite the new owner's lease
+        DeliveryWorker(name='dead').release(token, [(claimed[0], {'status_code': 200})])
+        self.assertEqual(Delivery.objects.get(pk=claimed[0].pk).status, Delivery.PENDING)
+
+    def test_only_head_of_ordering_partition_is_claimable(self):
+        ordered = self.queue(3, ordering_partition=7)
+        self.queue(1, ordering_partition=8)
+        self.assertEqual(
+            sorted(claimable_deliveries(timezone.now()).values_list('pk', flat=True)),
+            sorted([ordered[0].pk, Delivery.objects.get(ordering_partition=8).pk]),
+        )
+        worker = DeliveryWorker(name='one')
+        token, claimed = worker.claim()
+        self.assertEqual(len(claimed), 2)
+        # The head is leased, so nothing else of its partition may be claimed
+        self.assertEqual(worker.claim()[1], [])
+        worker.release(token, [(delivery, {'status_code': 200}) for delivery in claimed])
+        _, claimed = worker.claim()
+        self.assertEqual([d.pk for d in claimed], [ordered[1].pk])
+
+    def test_failures_back_off_then_fail(self):
+        self.queue(1)
+        worker = DeliveryWorker(name='one', max_attempts=2, retry_backoff=30)
+        token, claimed = worker.claim()
+        worker.release(token, [(claimed[0], {'status_code': 503, 'response': 'down'})])
+        delivery = Delivery.objects.get(pk=claimed[0].pk)
+        self.assertEqual(delivery.status, Delivery.PENDING)
+        self.assertEqual(delivery.last_error, 'down')
+        self.assertIsNone(delivery.lease_owner)
+        self.assertGreater(delivery.available_at, timezone.now() + timedelta(seconds=25))
+        self.assertEqual(worker.claim()[1], [])
+
+        Delivery.objects.filter(pk=delivery.pk).update(available_at=timezone.now())
+        token, claimed = worker.claim()
+        worker.release(token, [(claimed[0], {'error': 'timeout'})])
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.attempts, delivery.last_error), (Delivery.FAILED, 2, 'timeout'))
+        self.assertEqual(worker.failed, 1)
+
+    @patch('data_pusher_app.ingest.requests.request')
+    def test_run_once_sends_and_marks_delivered(self, request):
+        request.return_value = MagicMock(status_code=200, text='ok')
+        self.queue(2)
+        worker = DeliveryWorker(name='one')
+        self.assertEqual(worker.run_once(), 2)
+        self.assertEqual(request.call_count, 2)
+        self.assertEqual(Delivery.objects.filter(status=Delivery.DELIVERED).count(), 2)
+        self.assertEqual(worker.run_once(), 0)
+
+    @override_settings(DELIVERY_MODE='durable')
+    @patch('data_pusher_app.ingest.requests.request')
+    def test_durable_ingest_stores_deliveries(self, request):
+        Destination.objects.create(account=self.account, url='http://b.com', http_method='POST',
+                                   headers={'Content-Type': 'application/json'}, ordering_key='user')
+        response = self.client.post(reverse('incoming_data'), data={'user': 'u1'}, content_type='application/json',
+                                    headers={'CL-X-TOKEN': str(self.account.app_secret_token)})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {'status': 'queued', 'deliveries': 2})
+        request.assert_not_called()
+        deliveries = Delivery.objects.order_by('destination__url')
+        self.assertEqual([d.payload for d in deliveries], [{'user': 'u1'}] * 2)
+        self.assertIsNone(deliveries[0].ordering_partition)
+        self.assertIsNotNone(deliveries[1].ordering_partition)
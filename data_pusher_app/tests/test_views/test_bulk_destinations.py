@@ -0,0 +1,118 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from data_pusher_app.models import Account, Destination
+from data_pusher_app.tests.shards import TwoShardsMixin
+
+HEADERS = {'Content-Type': 'application/json'}
+
+
+class BulkDestinationsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('destination-bulk')
+        self.account = Account.objects.create(email_id='bulk@test.com', account_name='Bulk Account')
+
+    def item(self, url='http://validurl.com', **overrides):
+        item = {'account': str(self.account.pk), 'url': url, 'http_method': 'POST', 'headers': HEADERS}
+        item.update(overrides)
+        return item
+
+    def test_bulk_create_uses_constant_queries(self):
+        items = [self.item(f'http://host{i}.com') for i in range(50)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 50)
+        self.assertEqual(Destination.objects.filter(account=self.account).count(), 50)
+        # Including the two reserving the batch's IDs from the destination sequence
+        self.assertLess(len(queries), 12)
+        self.assertEqual(Account.objects.get(pk=self.account.pk).destinations_version, 1)
+
+    def test_bulk_create_reports_item_errors(self):
+        items = [
+            self.item(),
+            self.item('http://localhost:8000'),
+            self.item(account='00000000-0000-0000-0000-000000000000'),
+            self.item(http_method='PATCH'),
+        ]
+        response = self.client.post(self.url, items, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(len(response.data['created']), 1)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2, 3])
+        self.assertIn('account', response.data['errors'][1]['errors'])
+        self.assertIn('http_method', response.data['errors'][2]['errors'])
+
+    def test_bulk_create_rejects_all_invalid(self):
+        response = self.client.post(self.url, [self.item('not_a_valid_url')], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Destination.objects.exists())
+
+    def test_bulk_update(self):
+        destinations = [
+            Destination.objects.create(account=self.account, url=f'http://host{i}.com', http_method='POST', headers=HEADERS)
+            for i in range(3)
+        ]
+        items = [{'id': d.pk, 'http_method': 'PUT'} for d in destinations] + [{'id': 999999, 'http_method': 'PUT'}]
+        response = self.client.put(self.url, items, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(sorted(response.data['updated']), sorted(d.pk for d in destinations))
+        self.assertEqual(set(Destination.objects.values_list('http_method', flat=True)), {'PUT'})
+
+    def test_bulk_delete(self):
+        destinations = [
+            Destination.objects.create(account=self.account, url=f'http://host{i}.com', http_method='POST', headers=HEADERS)
+            for i in range(3)
+        ]
+        version = Account.objects.get(pk=self.account.pk).destinations_version
+        response = self.client.delete(self.url, [d.pk for d in destinations[:2]], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(Destination.objects.values_list('pk', flat=True)), [destinations[2].pk])
+        self.assertEqual(Account.objects.get(pk=self.account.pk).destinations_version, version + 1)
+
+    def test_bulk_rejects_non_list_payload(self):
+        response = self.client.post(self.url, {'url': 'http://validurl.com'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ShardedBulkDestinationsTest(TwoShardsMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('destination-bulk')
+        self.accounts = {alias: self.account_on(alias) for alias in ('default', 'shard1')}
+        self.destinations = {
+            alias: [Destination.objects.create(account=account, url=f'http://{alias}{i}.com', http_method='POST',
+                                               headers=HEADERS) for i in range(2)]
+            for alias, account in self.accounts.items()
+        }
+
+    def urls(self, alias):
+        return list(Destination.objects.using(alias).order_by('pk').values_list('url', flat=True))
+
+    def test_bulk_update_writes_each_shard(self):
+        default, shard1 = self.destinations['default'][0], self.destinations['shard1'][0]
+        response = self.client.patch(self.url, [
+            {'id': default.pk, 'url': 'http://updated-default.com'},
+            {'id': shard1.pk, 'url': 'http://updated-shard1.com'},
+            {'id': shard1.pk + 1000, 'url': 'http://missing.com'},
+            # The row would stay on shard1, where the other account does not exist
+            {'id': self.destinations['shard1'][1].pk, 'account': str(self.accounts['default'].pk)},
+        ], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(sorted(response.data['updated']), sorted([default.pk, shard1.pk]))
+        self.assertEqual([error['index'] for error in response.data['errors']], [2, 3])
+        self.assertEqual(self.urls('default'), ['http://updated-default.com', 'http://default1.com'])
+        self.assertEqual(self.urls('shard1'), ['http://updated-shard1.com', 'http://shard11.com'])
+        versions = {alias: Account.objects.using(alias).get(pk=account.pk).destinations_version
+                    for alias, account in self.accounts.items()}
+        self.assertEqual(versions, {'default': 3, 'shard1': 3})
+
+    def test_bulk_delete_deletes_on_each_shard(self):
+        ids = [self.destinations['default'][1].pk, self.destinations['shard1'][0].pk]
+        response = self.client.delete(self.url, ids, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.data['deleted']), sorted(ids))
+        self.assertEqual(self.urls('default'), ['http://default0.com'])
+        self.assertEqual(self.urls('shard1'), ['http://shard11.com'])
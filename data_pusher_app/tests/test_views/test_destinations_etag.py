@@ -0,0 +1,80 @@
+from django.core.cache import cache
+from django.test import TestCase, RequestFactory
+from unittest.mock import patch
+from data_pusher_app.models import Account, Destination
+from data_pusher_app.views import get_destinations_view, etag_matches
+
+
+class DestinationsVersionTest(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create(email_id='etag@test.com', account_name='ETag Account')
+
+    def current_version(self):
+        return Account.objects.get(pk=self.account.pk).destinations_version
+
+    def test_version_bumped_on_save_and_delete(self):
+        """ Creating, updating and deleting a destination each bump the account's version. """
+        destination = Destination.objects.create(account=self.account, url='http://validurl.com', http_method='POST', headers={'Content-Type': 'application/json'})
+        self.assertEqual(self.current_version(), 1)
+        destination.url = 'http://otherurl.com'
+        destination.save()
+        self.assertEqual(self.current_version(), 2)
+        destination.delete()
+        self.assertEqual(self.current_version(), 3)
+
+    def test_stale_account_save_keeps_version(self):
+        """ Saving an account loaded before a destination change does not roll its version back. """
+        stale = Account.objects.get(pk=self.account.pk)
+        Destination.objects.create(account=self.account, url='http://validurl.com', http_method='POST', headers={'Content-Type': 'application/json'})
+        stale.account_name = 'Renamed'
+        stale.save()
+        self.assertEqual(self.current_version(), 1)
+
+    def test_moving_destination_bumps_both_accounts(self):
+        other = Account.objects.create(email_id='other@test.com', account_name='Other Account')
+        Destination.objects.create(account=self.account, url='http://validurl.com', http_method='POST', headers={'Content-Type': 'application/json'})
+        destination = Destination.objects.get(account=self.account)
+        destination.account = other
+        destination.save()
+        self.assertEqual(self.current_version(), 2)
+        self.assertEqual(Account.objects.get(pk=other.pk).destinations_version, 1)
+
+
+class ConditionalGetDestinationsViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.account = Account.objects.create(email_id='etag@test.com', account_name='ETag Account')
+        Destination.objects.create(account=self.account, url='http://validurl.com', http_method='POST', headers={'Content-Type': 'application/json'})
+
+    def test_not_modified_when_etag_matches(self):
+        response = get_destinations_view(self.factory.get('/'), account_id=self.account.pk)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with patch('data_pusher_app.views.DestinationRetriever.get_destinations') as mock_get_destinations:
+            response = get_destinations_view(self.factory.get('/', HTTP_IF_NONE_MATCH=etag), account_id=self.account.pk)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        mock_get_destinations.assert_not_called()
+
+    def test_rendered_list_served_from_cache(self):
+        first = get_destinations_view(self.factory.get('/'), account_id=self.account.pk)
+        with patch('data_pusher_app.views.DestinationRetriever.serialize_destinations') as mock_serialize:
+            second = get_destinations_view(self.factory.get('/'), account_id=self.account.pk)
+        mock_serialize.assert_not_called()
+        self.assertEqual(first.content, second.content)
+
+    def test_change_invalidates_etag(self):
+        etag = get_destinations_view(self.factory.get('/'), account_id=self.account.pk)['ETag']
+        Destination.objects.create(account=self.account, url='http://another.com', http_method='PUT', headers={'Content-Type': 'application/json'})
+        response = get_destinations_view(self.factory.get('/', HTTP_IF_NONE_MATCH=etag), account_id=self.account.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.content.decode().split('"url"')), 3)
+
+    def test_etag_matches_weak_and_wildcard(self):
+        self.assertTrue(etag_matches('"a-1"', 'W/"a-1", "b-2"'))
+        self.assertTrue(etag_matches('"a-1"', '*'))
+        self.assertFalse(etag_matches('"a-1"', '"a-2"'))
+        self.assertFalse(etag_matches('"a-1"', None))
@@ -0,0 +1,55 @@
+import json
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from data_pusher_app.models import Account, Destination
+
+HEADERS = {'Content-Type': 'application/json'}
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.first = Account.objects.create(email_id='first@test.com', account_name='First')
+        self.second = Account.objects.create(email_id='second@test.com', account_name='Second')
+        Destination.objects.create(account=self.first, url='http://first.com', http_method='POST', headers=HEADERS)
+        Destination.objects.create(account=self.second, url='http://second.com', http_method='GET', headers=HEADERS)
+
+    def read_stream(self, response):
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_export_streams_all_records(self):
+        response = self.client.get(reverse('export'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = self.read_stream(response)
+        self.assertEqual([record['type'] for record in records], ['account', 'account', 'destination', 'destination'])
+
+    def test_export_filtered_by_account(self):
+        response = self.client.get(reverse('export'), {'account': str(self.first.pk)})
+        records = self.read_stream(response)
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['data']['email_id'], 'first@test.com')
+        self.assertEqual(records[1]['data']['url'], 'http://first.com')
+
+    def test_export_filtered_by_modified_since(self):
+        Destination.objects.filter(account=self.first).update(updated_at=timezone.now() - timedelta(days=2))
+        Account.objects.filter(pk=self.first.pk).update(updated_at=timezone.now() - timedelta(days=2))
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        records = self.read_stream(self.client.get(reverse('export'), {'modified_since': since}))
+        self.assertEqual({record['data'].get('email_id') or record['data']['url'] for record in records},
+                         {'second@test.com', 'http://second.com'})
+
+    def test_export_rejects_invalid_filters(self):
+        self.assertEqual(self.client.get(reverse('export'), {'account': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export'), {'modified_since': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export'), {'kinds': 'events'}).status_code, 400)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('export_tenants', '--kinds', 'destinations', '--chunk-size', '1', stdout=out)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([record['data']['url'] for record in records], ['http://first.com', 'http://second.com'])
@@ -0,0 +1,80 @@
+import json
+from django.test import TestCase
+from django.urls import reverse
+from unittest.mock import patch, MagicMock
+from data_pusher_app.admission import AdmissionController, OverloadedError
+from data_pusher_app.models import Account, Destination
+from data_pusher_app.ratelimit import LocalMemoryBackend
+
+
+class AdmissionControllerTest(TestCase):
+    def test_process_budget(self):
+        controller = AdmissionController(max_in_flight=1, max_in_flight_per_account=1)
+        with controller.admit():
+            with self.assertRaises(OverloadedError) as context:
+                with controller.admit():
+                    pass
+        self.assertEqual(context.exception.scope, 'process')
+        self.assertGreaterEqual(context.exception.retry_after, 1)
+        with controller.admit():
+            self.assertEqual(controller.in_flight, 1)
+        self.assertEqual(controller.rejected['process'], 1)
+
+    def test_account_budget_is_per_account(self):
+        controller = AdmissionController(max_in_flight=10, max_in_flight_per_account=1)
+        with controller.admit('a'):
+            with controller.admit('b'):
+                with self.assertRaises(OverloadedError):
+                    with controller.admit('a'):
+                        pass
+        self.assertEqual(controller.in_flight_by_account, {})
+        self.assertEqual(controller.rejected['account'], 1)
+
+    def test_load_is_shared_through_the_counter_store(self):
+        backend = LocalMemoryBackend()
+        worker = AdmissionController(backend=backend, load_window=1)
+        replay_process = AdmissionController(backend=backend, load_window=1)
+        worker.record_busy(1.5, now=100.2)
+        worker.record_busy(1.5, now=100.9)
+        self.assertAlmostEqual(replay_process.load(now=100.95), 3.0)
+        # Half of the previous window still overlaps the sliding window
+        self.assertAlmostEqual(replay_process.load(now=101.5), 1.5)
+        with worker.admit():
+            pass
+        self.assertGreater(replay_process.load(), 0)
+
+
+class IncomingDataTest(TestCase):
+    def setUp(self):
+        self.url = reverse('incoming_data')
+        self.account = Account.objects.create(email_id='ingest@test.com', account_name='Ingest')
+        Destination.objects.create(account=self.account, url='http://validurl.com', http_method='POST',
+                                   headers={'Content-Type': 'application/json'})
+
+    def post(self, body, token=None):
+        token = str(self.account.app_secret_token) if token is None else token
+        return self.client.post(self.url, body, content_type='application/json', HTTP_CL_X_TOKEN=token)
+
+    @patch('requests.request')
+    def test_delivers_to_destinations(self, mock_request):
+        mock_request.return_value = MagicMock(text='ok', status_code=200)
+        response = self.post(json.dumps({'key': 'value'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['responses'][0]['status_code'], 200)
+
+    def test_missing_token_and_invalid_json(self):
+        self.assertEqual(self.post('{}', token='').status_code, 401)
+        self.assertEqual(self.post('{"key": ').status_code, 400)
+
+    def test_rejects_with_retry_after_when_overloaded(self):
+        controller = AdmissionController(max_in_flight=1, max_in_flight_per_account=1)
+        with patch('data_pusher_app.ingest.admission_controller', controller), controller.admit():
+            response = self.post('{}')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    def test_metrics_exports_admission_counters(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ingest_in_flight ', response.content.decode())
+        self.assertIn('ingest_rejected_total{scope="account"}', response.content.decode())
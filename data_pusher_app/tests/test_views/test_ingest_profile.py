@@ -0,0 +1,39 @@
+import json
+import os
+import subprocess
+import sys
+from django.conf import settings
+from django.test import SimpleTestCase
+
+PROBE = """
+import json, sys
+import django
+django.setup()
+from django.conf import settings
+from django.test import Client
+import customerslabProject.wsgi_ingest
+response = Client().post('/api/server/incoming_data', '{}', content_type='application/json')
+print(json.dumps({
+    'status': response.status_code,
+    'middleware': settings.MIDDLEWARE,
+    'modules': sorted(m for m in ('rest_framework', 'django.contrib.admin', 'django.contrib.sessions', 'django_extensions')
+                      if m in sys.modules),
+    'subsystems': sorted(m for m in ('chunking', 'eventlog', 'history', 'relay', 'scheduling', 'snapshot')
+                         if 'data_pusher_app.' + m in sys.modules),
+}))
+"""
+
+
+class IngestProfileTest(SimpleTestCase):
+    def test_ingest_profile_loads_only_the_ingest_path(self):
+        """ The lean profile serves incoming_data without loading DRF, the admin, any middleware or disabled subsystems. """
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='customerslabProject.settings_ingest')
+        result = subprocess.run([sys.executable, '-c', PROBE], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        self.assertEqual(probe['status'], 401)
+        self.assertEqual(probe['middleware'], [])
+        self.assertEqual(probe['modules'], [])
+        # Disabled optional subsystems are not even imported
+        self.assertEqual(probe['subsystems'], [])
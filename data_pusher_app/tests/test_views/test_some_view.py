@@ -251,10 +251,13 @@ class GetDestinationsViewTest(TestCase):
         mock_instance.get_account.return_value = MagicMock()
         mock_instance.get_destinations.return_value = MagicMock()
         mock_instance.serialize_destinations.return_value = [{'id': 1, 'url': 'http://example.com'}]
+        mock_instance.get_etag.return_value = '"1-0"'
+        mock_instance.get_cache_key.return_value = 'destinations:test-view-success:0'
 
         response = get_destinations_view(request, account_id=1)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.content, b'[{"id": 1, "url": "http://example.com"}]')
+        self.assertEqual(response['ETag'], '"1-0"')
 
     @patch('data_pusher_app.views.DestinationRetriever')
     def test_get_destinations_view_account_not_found(self, mock_retriever):
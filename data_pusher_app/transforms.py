@@ -0,0 +1,209 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from .routing import _MISSING, resolve_path
+
+OPERATIONS = ('select', 'rename', 'drop', 'set', 'wrap')
+
+
+def validate_transform_spec(spec):
+    """
+    Validate the payload transformation spec of a destination.
+
+    A spec is an object whose operations are applied in this order:
+    'select' (list of dot-separated paths to keep), 'rename' (object mapping source paths to
+    target paths), 'drop' (list of paths to remove), 'set' (object mapping paths to constant
+    values) and 'wrap' (key of an envelope object the result is placed under).
+
+    Args:
+        spec (dict): The spec to validate. None forwards the payload unchanged.
+
+    Raises:
+        ValidationError: If the spec is malformed.
+    """
+    if spec is None:
+        return
+    if not isinstance(spec, dict):
+        raise ValidationError("Transform must be an object.")
+    unknown = set(spec) - set(OPERATIONS)
+    if unknown:
+        raise ValidationError(f"Unknown transform operations: {', '.join(sorted(unknown))}.")
+    for operation in ('select', 'drop'):
+        if operation in spec and not (isinstance(spec[operation], list) and all(_is_path(p) for p in spec[operation])):
+            raise ValidationError(f"Transform '{operation}' must be a list of field paths.")
+    if 'rename' in spec and not (isinstance(spec['rename'], dict)
+                                 and all(_is_path(k) and _is_path(v) for k, v in spec['rename'].items())):
+        raise ValidationError("Transform 'rename' must map field paths to field paths.")
+    if 'set' in spec and not (isinstance(spec['set'], dict) and all(_is_path(k) for k in spec['set'])):
+        raise ValidationError("Transform 'set' must map field paths to values.")
+    if 'wrap' in spec and not _is_path(spec['wrap']):
+        raise ValidationError("Transform 'wrap' must be a field name.")
+
+
+def _is_path(value):
+    return isinstance(value, str) and bool(value) and all(value.split('.'))
+
+
+def spec_hash(spec):
+    """
+    Compute a stable hash of a transform spec.
+
+    Args:
+        spec (dict): The transform spec.
+
+    Returns:
+        str: The hex digest of the canonical JSON form of the spec.
+    """
+    return hashlib.sha1(json.dumps(spec, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def _set(data, path, value):
+    """
+    Return a copy of `data` with `value` stored at `path`, copying only the dicts along the path.
+    """
+    head, rest = path[0], path[1:]
+    result = dict(data) if isinstance(data, dict) else {}
+    result[head] = _set(result.get(head), rest, value) if rest else value
+    return result
+
+
+def _delete(data, path):
+    """
+    Return a copy of `data` without `path`, copying only the dicts along the path.
+    """
+    head, rest = path[0], path[1:]
+    if not isinstance(data, dict) or head not in data:
+        return data
+    result = dict(data)
+    if rest:
+        result[head] = _delete(result[head], rest)
+    else:
+        del result[head]
+    return result
+
+
+def compile_transform(spec):
+    """
+    Compile a transform spec into a callable.
+
+    The paths of the spec are split once and every operation becomes a closure, so applying
+    the transform does no parsing. The input payload is never mutated.
+
+    Args:
+        spec (dict): A validated transform spec.
+
+    Returns:
+        callable: A function taking the payload and returning the transformed payload.
+    """
+    steps = []
+    if 'select' in spec:
+        selected = [tuple(p.split('.')) for p in spec['select']]
+
+        def select(data):
+            if not isinstance(data, dict):
+                return data
+            result = {}
+            for path in selected:
+                value = resolve_path(data, path)
+                if value is not _MISSING:
+                    result = _set(result, path, value)
+            return result
+        steps.append(select)
+    if 'rename' in spec:
+        pairs = [(tuple(s.split('.')), tuple(t.split('.'))) for s, t in spec['rename'].items()]
+
+        def rename(data):
+            if not isinstance(data, dict):
+                return data
+            moved = [(target, resolve_path(data, source)) for source, target in pairs]
+            for source, _ in pairs:
+                data = _delete(data, source)
+            for target, value in moved:
+                if value is not _MISSING:
+                    data = _set(data, target, value)
+            return data
+        steps.append(rename)
+    if 'drop' in spec:
+        dropped = [tuple(p.split('.')) for p in spec['drop']]
+
+        def drop(data):
+            for path in dropped:
+                data = _delete(data, path)
+            return data
+        steps.append(drop)
+    if 'set' in spec:
+        constants = [(tuple(p.split('.')), value) for p, value in spec['set'].items()]
+
+        def set_constants(data):
+            if not isinstance(data, dict):
+                return data
+            for path, value in constants:
+                data = _set(data, path, value)
+            return data
+        steps.append(set_constants)
+    if 'wrap' in spec:
+        envelope = tuple(spec['wrap'].split('.'))
+        steps.append(lambda data: _set({}, envelope, data))
+
+    def transform(data):
+        for step in steps:
+            data = step(data)
+        return data
+    return transform
+
+
+class TransformCache:
+    """
+    A bounded, thread-safe LRU cache of compiled transforms keyed by spec hash.
+
+    Destinations sharing a spec share one compiled callable. The hash of a destination's spec
+    is memoized on the destination instance, which lives as long as its routing index.
+    """
+
+    def __init__(self, max_size=None):
+        """
+        Initializes the cache.
+
+        Args:
+            max_size (int): Maximum number of compiled transforms. Defaults to settings.TRANSFORM_CACHE_SIZE.
+        """
+        self.max_size = max_size or getattr(settings, 'TRANSFORM_CACHE_SIZE', 1024)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, destination):
+        """
+        Returns the compiled transform of a destination.
+
+        Args:
+            destination (Destination): The destination whose `transform` spec is compiled.
+
+        Returns:
+            tuple: The spec hash and compiled callable, or (None, None) if the destination has no spec.
+        """
+        spec = getattr(destination, 'transform', None)
+        if not spec:
+            return None, None
+        memo = getattr(destination, '_transform_memo', None)
+        if memo is not None and memo[0] is spec:
+            key = memo[1]
+        else:
+            key = spec_hash(spec)
+            destination._transform_memo = (spec, key)
+        with self.lock:
+            function = self.entries.get(key)
+            if function is not None:
+                self.entries.move_to_end(key)
+                return key, function
+        function = compile_transform(spec)
+        with self.lock:
+            self.entries[key] = function
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return key, function
+
+
+transform_cache = TransformCache()
@@ -1,6 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import AccountViewSet, DestinationViewSet, incoming_data, get_destinations_view
+from .ingest import metrics_view
+from .views import AccountViewSet, DestinationViewSet, incoming_data, get_destinations_view, export_view, \
+    replay_view, replay_status_view, rollups_view, delivery_history_view, changes_view
 from django.views.generic.base import RedirectView
 
 # router = DefaultRouter()
@@ -109,7 +111,14 @@ class URLPatterns:
             return [
                 path('', include(self.router_urls)),
                 path('server/incoming_data', incoming_data, name='incoming_data'),
+                path('server/metrics', metrics_view, name='metrics'),
                 path('accounts/<uuid:account_id>/destinations', get_destinations_view, name='get_destinations_view'),
+                path('export', export_view, name='export'),
+                path('changes', changes_view, name='changes'),
+                path('accounts/<uuid:account_id>/replay', replay_view, name='replay'),
+                path('replays/<uuid:replay_id>', replay_status_view, name='replay_status'),
+                path('accounts/<uuid:account_id>/rollups', rollups_view, name='rollups'),
+                path('accounts/<uuid:account_id>/deliveries', delivery_history_view, name='delivery_history'),
             ]
         except Exception as e:
             print(f"Error creating URL patterns: {e}")
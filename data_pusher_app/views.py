@@ -1,11 +1,30 @@
-from rest_framework import viewsets
-from .models import Account, Destination
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from .bulk import BulkDestinationProcessor
+from .changes import CursorExpired, change_feed, parse_change_options
+from .export import TenantExporter, parse_export_filters
+from .history import get_delivery_history
+# The ingest path lives in .ingest so that it can be served without DRF; the names this module
+# used to define are re-exported here
+from .ingest import AccountVerifier, JSONProcessor, DestinationHandler, incoming_data
+from .models import Account, Destination, DestinationStats
+from .replay import EventReplay, get_replay_account, parse_replay_options, replays
+from .rollups import RollupQuery, parse_rollup_options
 from .serializers import AccountSerializer, DestinationSerializer
-from django.http import JsonResponse
+from .sharding import get_shards, shard_map
+from .stats import destination_stats, summarize_rows
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import parse_etags
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST, require_http_methods
-import requests
+from django.views.decorators.http import require_http_methods
 import json
+from datetime import timedelta
 import logging
 
 
@@ -104,219 +123,135 @@ class AccountViewSet(BaseViewSet):
     """
     View set for handling Account objects.
     
-    Inherits from BaseViewSet to include custom error handling.
+    Inherits from BaseViewSet to include custom error handling. Accounts are read from their
+    tenant shard, and listed from all of them.
     """
     queryset = Account.objects.all()
     serializer_class = AccountSerializer
 
-class DestinationViewSet(BaseViewSet):
-    """
-    View set for handling Destination objects.
-    
-    Inherits from BaseViewSet to include custom error handling.
-    """
-    queryset = Destination.objects.all()
-    serializer_class = DestinationSerializer
-
-
-
-
-
-class AccountVerifier:
-    """
-    A class to verify account tokens.
-
-    Attributes:
-    ----------
-    token : str
-        The token to be verified.
-    """
-
-    def __init__(self, token):
+    def get_object(self):
         """
-        Initializes the AccountVerifier with a token.
+        Looks up the account of the URL on its shard.
 
-        Parameters:
-        ----------
-        token : str
-            The token to be verified.
+        Raises:
+            Http404: If the ID is malformed or no shard has the account.
         """
-        self.token = token
+        try:
+            account_id = Account._meta.pk.to_python(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValidationError:
+            raise Http404("Account not found")
+        queryset = shard_map.manager(Account, shard_map.shard_of(account_id)).filter(pk=account_id)
+        account = queryset.first()
+        if account is None:
+            raise Http404("Account not found")
+        self.check_object_permissions(self.request, account)
+        return account
 
-    def verify_token(self):
+    def list(self, request, *args, **kwargs):
         """
-        Verifies the token and returns the associated account.
-
-        Returns:
-        -------
-        JsonResponse
-            A JSON response with an error message if unauthenticated or account not found.
-        Account
-            The account associated with the token if it exists.
+        Lists the accounts of every shard.
         """
-        if not self.token:
-            # Return an error response if the token is missing
-            return JsonResponse({'error': 'Unauthenticated'}, status=401)
+        accounts = [account for alias in get_shards() for account in Account.objects.using(alias).order_by('pk')]
+        page = self.paginate_queryset(accounts)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(accounts, many=True).data)
 
-        try:
-            # Try to retrieve the account associated with the provided token
-            account = Account.objects.get(app_secret_token=self.token)
-            return account
-        except Account.DoesNotExist:
-            # Return an error response if the account does not exist
-            return JsonResponse({'error': 'Account not found'}, status=404)
-
-
-class JSONProcessor:
+class DestinationViewSet(BaseViewSet):
     """
-    A class to process JSON data from a request body.
-
-    Attributes:
-    ----------
-    request_body : bytes
-        The request body containing JSON data.
+    View set for handling Destination objects.
+    
+    Inherits from BaseViewSet to include custom error handling. Destination IDs are unique
+    across tenant shards, so destinations are looked up on every shard, and listed from all of them.
     """
+    queryset = Destination.objects.all()
+    serializer_class = DestinationSerializer
 
-    def __init__(self, request_body):
-        """
-        Initializes the JSONProcessor with a request body.
-
-        Parameters:
-        ----------
-        request_body : bytes
-            The request body containing JSON data.
-        """
-        self.request_body = request_body
-
-    def parse_json(self):
+    def get_object(self):
         """
-        Parses the JSON data from the request body.
+        Looks up the destination of the URL on the shard holding it.
 
-        Returns:
-        -------
-        dict
-            The parsed JSON data.
-        JsonResponse
-            A JSON response with an error message if the JSON format is invalid.
+        Raises:
+            Http404: If the ID is malformed or no shard has the destination.
         """
         try:
-            # Attempt to decode and parse the JSON data from the request body
-            data = json.loads(self.request_body.decode('utf-8'))
-            return data
-        except json.JSONDecodeError:
-            # Return an error response if the JSON format is invalid
-            return JsonResponse({'error': 'Invalid JSON format'}, status=400)
-
-
-class DestinationHandler:
-    """
-    Handles processing and sending HTTP requests to multiple destinations associated with a given account.
-    
-    Attributes:
-        account (object): The account object used to filter destinations.
-        data (dict): The data to be sent in the HTTP requests.
-    """
-    def __init__(self, account, data):
+            destination_id = Destination._meta.pk.to_python(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValidationError:
+            raise Http404("Destination not found")
+        destination = shard_map.in_bulk(Destination, [destination_id]).get(destination_id)
+        if destination is None:
+            raise Http404("Destination not found")
+        self.check_object_permissions(self.request, destination)
+        return destination
+
+    def list(self, request, *args, **kwargs):
         """
-        Initializes the DestinationHandler with the given account and data.
-
-        Args:
-            account (object): The account object used to filter destinations.
-            data (dict): The data to be sent in the HTTP requests.
+        Lists the destinations of every shard in ID order.
         """
-        self.account = account
-        self.data = data
-
-    def process_destinations(self):
+        destinations = sorted((destination for alias in get_shards() for destination in Destination.objects.using(alias)),
+                              key=lambda destination: destination.pk)
+        page = self.paginate_queryset(destinations)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(destinations, many=True).data)
+
+    @action(detail=False, methods=['post', 'put', 'patch', 'delete'], url_path='bulk')
+    def bulk(self, request):
         """
-        Processes all destinations associated with the account by sending HTTP requests
-        with the provided data and headers. 
+        Create (POST), update (PUT/PATCH) or delete (DELETE) a batch of destinations in one request.
 
-        Returns:
-            list: A list of dictionaries containing the URL, response text, and status code for each destination.
-                  In case of an error, the dictionary will contain the URL and the error message.
-        """
-        # Retrieve all destinations associated with the account
-        destinations = Destination.objects.filter(account=self.account)
-        responses = []
-
-        # Iterate through each destination and send an HTTP request
-        for destination in destinations:
-            try:
-                # Load headers from JSON string if necessary
-                headers = json.loads(destination.headers) if isinstance(destination.headers, str) else destination.headers
-                # Ensure the Content-Type is set to application/json
-                headers['Content-Type'] = 'application/json'
-                # Send the HTTP request and store the response
-                response = self.send_request(destination, headers)
-                responses.append({'url': destination.url, 'response': response.text, 'status_code': response.status_code})
-            except Exception as e:
-                # Handle any exceptions that occur during the request
-                responses.append({'url': destination.url, 'error': str(e)})
-        
-        return responses
-
-    def send_request(self, destination, headers):
-        """
-        Sends an HTTP request to the specified destination with the provided headers and data.
+        Creation and update take a list of destination objects (updates identify them by `id`),
+        deletion takes a list of destination IDs. Valid items are written in one transaction and
+        invalid ones are reported by their index in the batch.
 
         Args:
-            destination (object): The destination object containing the URL and HTTP method.
-            headers (dict): The headers to include in the HTTP request.
+            request (Request): The request carrying the batch as its JSON body.
 
         Returns:
-            Response: The HTTP response object.
+            Response: The affected destination IDs and the per-item errors.
         """
-        # Check the HTTP method and send the request accordingly
-        if destination.http_method.lower() == 'get':
-            return requests.get(destination.url, headers=headers, params=self.data)
+        processor = BulkDestinationProcessor()
+        if request.method == 'POST':
+            result, key, success_status = processor.create(request.data), 'created', status.HTTP_201_CREATED
+        elif request.method == 'DELETE':
+            result, key, success_status = processor.delete(request.data), 'deleted', status.HTTP_200_OK
         else:
-            return requests.request(method=destination.http_method.lower(), url=destination.url, headers=headers, json=self.data)
+            result, key, success_status = processor.update(request.data), 'updated', status.HTTP_200_OK
 
+        if not result['errors']:
+            return Response(result, status=success_status)
+        if result[key]:
+            return Response(result, status=status.HTTP_207_MULTI_STATUS)
+        return Response(result, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=['get'], url_path='stats')
+    def stats(self, request, pk=None):
+        """
+        Report the delivery latency percentiles and success/error counts of a destination.
 
-@csrf_exempt
-@require_POST
-def incoming_data(request):
-    """
-    Handles incoming POST requests containing JSON data.
+        The 'minutes' query parameter (default 60) selects how far back the statistics flushed
+        by all workers to the destination's shard are merged; 'live' holds this process's
+        rolling window, including deliveries not flushed yet.
 
-    This function verifies the account token from request headers, processes the 
-    JSON data from the request body, and handles the data based on the verified account.
+        Args:
+            request (Request): The request.
+            pk (str): The destination ID.
 
-    Args:
-        request (HttpRequest): The incoming HTTP request.
+        Returns:
+            Response: The merged and the live statistics.
+        """
+        destination = self.get_object()
+        minutes = int(request.query_params.get('minutes', 60))
+        since = timezone.now() - timedelta(minutes=minutes)
+        rows = shard_map.manager(DestinationStats, destination._state.db).filter(destination=destination,
+                                                                                 window_start__gte=since)
+        return Response({
+            'destination': destination.pk,
+            'minutes': minutes,
+            'flushed': summarize_rows(rows),
+            'live': destination_stats.snapshot(destination.pk, destination.account_id),
+        })
 
-    Returns:
-        JsonResponse: A JSON response containing the processed data or an error message.
-    """
-    try:
-        # Verify the account token from request headers
-        verifier = AccountVerifier(request.headers.get('CL-X-TOKEN'))
-        account = verifier.verify_token()
-        
-        # Parse JSON data from the request body
-        processor = JSONProcessor(request.body)
-        data = processor.parse_json()
-        
-        # Handle the data based on the verified account
-        handler = DestinationHandler(account, data)
-        responses = handler.process_destinations()
-
-        # Return a JSON response containing the processed data
-        return JsonResponse({'responses': responses})
-    
-    except ValueError as e:
-        # Return a JSON response with a 401 status code for ValueError
-        return JsonResponse({'error': str(e)}, status=401)
-    
-    except LookupError as e:
-        # Return a JSON response with a 404 status code for LookupError
-        return JsonResponse({'error': str(e)}, status=404)
-    
-    except Exception as e:
-        # Return a JSON response with a 500 status code for any other exceptions
-        return JsonResponse({'error': str(e)}, status=500)
 
 
 
@@ -348,7 +283,7 @@ class DestinationRetriever:
             ValueError: If the account does not exist.
         """
         try:
-            account = Account.objects.get(pk=self.account_id)
+            account = shard_map.manager(Account, shard_map.shard_of(self.account_id)).get(pk=self.account_id)
         except Account.DoesNotExist:
             raise ValueError("Account not found")
         return account
@@ -365,7 +300,7 @@ class DestinationRetriever:
             Returns an empty list if no destinations are found.
         """
         try:
-            destinations = Destination.objects.filter(account=account)
+            destinations = shard_map.manager(Destination, shard_map.shard_for(account)).filter(account=account)
         except Destination.DoesNotExist:
             # Handle the case where no destinations are found
             return []
@@ -384,30 +319,244 @@ class DestinationRetriever:
         serializer = DestinationSerializer(destinations, many=True)
         return serializer.data
 
+    def get_etag(self, account):
+        """
+        Builds the ETag of the account's destination list from its destinations version.
+
+        Args:
+            account (Account): The account whose destinations are being retrieved.
+
+        Returns:
+            str: A quoted strong ETag.
+        """
+        return f'"{account.pk}-{account.destinations_version}"'
+
+    def get_cache_key(self, account):
+        """
+        Builds the cache key of the rendered destination list for the account's current version.
+
+        Args:
+            account (Account): The account whose destinations are being retrieved.
+
+        Returns:
+            str: The cache key.
+        """
+        return f"destinations:{account.pk}:{account.destinations_version}"
+
+
+def etag_matches(etag, if_none_match):
+    """
+    Checks whether an ETag matches the value of an If-None-Match header using weak comparison.
+
+    Args:
+        etag (str): The current quoted ETag.
+        if_none_match (str): The raw If-None-Match header, or None.
+
+    Returns:
+        bool: True if the client already holds the current representation.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    strip_weak = lambda tag: tag[2:] if tag.startswith('W/') else tag
+    return strip_weak(etag) in {strip_weak(tag) for tag in parse_etags(if_none_match)}
+
 
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_destinations_view(request, account_id):
     """
     A view to handle GET requests for retrieving destinations of an account.
+
+    The response carries an ETag derived from the account's destinations version. A matching
+    If-None-Match header is answered with 304 without touching the destinations, and the rendered
+    list is cached per version so unchanged lists are never serialized twice.
     
     Args:
         request (HttpRequest): The request object.
         account_id (int): The ID of the account for which destinations are to be retrieved.
     
     Returns:
-        JsonResponse: A JSON response containing serialized destination data or an error message.
+        HttpResponse: A JSON response containing serialized destination data, a 304 response, or an error message.
     """
     handler = DestinationRetriever(account_id)
     try:
         account = handler.get_account()
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=404)
+
+    etag = handler.get_etag(account)
+    if etag_matches(etag, request.headers.get('If-None-Match')):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    cache_key = handler.get_cache_key(account)
+    content = cache.get(cache_key)
+    if content is None:
         destinations = handler.get_destinations(account)
         serialized_data = handler.serialize_destinations(destinations)
-        return JsonResponse(serialized_data, safe=False)
+        content = JsonResponse(serialized_data, safe=False).content
+        cache.set(cache_key, content, getattr(settings, 'DESTINATIONS_CACHE_TIMEOUT', 300))
+
+    response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def export_view(request):
+    """
+    A view streaming accounts and destinations as NDJSON.
+
+    Supports the query parameters 'account' (account ID), 'modified_since' (ISO 8601 datetime)
+    and 'kinds' (comma-separated subset of 'accounts,destinations').
+
+    Args:
+        request (HttpRequest): The request object.
+
+    Returns:
+        StreamingHttpResponse: The NDJSON export, or a JSON error response for invalid filters.
+    """
+    try:
+        exporter = TenantExporter(**parse_export_filters(request.GET))
     except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return StreamingHttpResponse(exporter.iter_lines(), content_type='application/x-ndjson')
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def replay_view(request, account_id):
+    """
+    A view starting a background replay of an account's stored events.
+
+    The JSON body may contain 'since' and 'until' (ISO 8601 datetimes), 'destinations' (list of
+    destination IDs, defaulting to all of the account's) and 'rate' (events per second per destination).
+
+    Args:
+        request (HttpRequest): The request object.
+        account_id (UUID): The account whose events are replayed.
+
+    Returns:
+        JsonResponse: The accepted replay with status 202, or an error message.
+    """
+    try:
+        account = get_replay_account(account_id)
+    except LookupError as e:
         return JsonResponse({'error': str(e)}, status=404)
+    try:
+        params = json.loads(request.body or b'{}')
+        if not isinstance(params, dict):
+            raise ValueError("Expected a JSON object")
+        replay = EventReplay(account, **parse_replay_options(params))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    replays.start(replay)
+    return JsonResponse(replay.as_dict(), status=202)
 
 
+@require_http_methods(["GET"])
+def rollups_view(request, account_id):
+    """
+    A view reporting an account's delivery counts and latencies over a time range from the rollups.
 
+    Query parameters: 'since' and 'until' (ISO 8601, default the last 24 hours), 'step' (seconds per
+    series point, a multiple of 60; default one total) and 'destinations' (comma-separated IDs).
+    Each point is read from the coarsest rollups that fit it exactly.
 
+    Args:
+        request (HttpRequest): The request object.
+        account_id (UUID): The account queried.
+
+    Returns:
+        JsonResponse: The series, or an error message.
+    """
+    if not shard_map.manager(Account, shard_map.shard_of(account_id)).filter(pk=account_id).exists():
+        return JsonResponse({'error': "Account not found"}, status=404)
+    try:
+        query = RollupQuery(account_id, **parse_rollup_options(request.GET))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(query.run())
+
+
+@require_http_methods(["GET"])
+def delivery_history_view(request, account_id):
+    """
+    A view listing an account's recorded delivery attempts from the time-partitioned history.
 
+    Query parameters: 'since' and 'until' (ISO 8601, default the last hour), 'destination' (ID)
+    and 'limit' (default 1000). Only the partitions overlapping the range are read.
+
+    Args:
+        request (HttpRequest): The request object.
+        account_id (UUID): The account queried.
+
+    Returns:
+        JsonResponse: The attempts in time order, or an error message.
+    """
+    history = get_delivery_history()
+    if history is None:
+        return JsonResponse({'error': 'Delivery history is not enabled'}, status=404)
+    try:
+        options = parse_rollup_options(request.GET, default_range=timedelta(hours=1))
+        limit = int(request.GET.get('limit', 1000))
+        destination_id = int(request.GET['destination']) if request.GET.get('destination') else None
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    attempts = list(history.query(account_id=account_id, destination_id=destination_id,
+                                  since=options['since'].timestamp(), until=options['until'].timestamp(),
+                                  limit=max(1, min(limit, 10000))))
+    return JsonResponse({'since': options['since'], 'until': options['until'], 'deliveries': attempts})
+
+
+@require_http_methods(["GET"])
+def changes_view(request):
+    """
+    A view serving the incremental change feed of accounts and destinations.
+
+    Query parameters: 'since' (the cursor of the last response), 'timeout' (seconds to wait for a
+    change, capped by CHANGE_FEED_MAX_TIMEOUT), 'limit' and 'account' (ID). Without 'since', no
+    changes are returned, only the current cursor.
+
+    Args:
+        request (HttpRequest): The request object.
+
+    Returns:
+        JsonResponse: The changes in order with the cursor to continue from, or an error message;
+            410 if the cursor expired and the reader has to start over from an export.
+    """
+    try:
+        options = parse_change_options(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if options['since'] is None:
+        return JsonResponse({'changes': [], 'cursor': change_feed.latest(), 'more': False})
+    try:
+        changes, cursor = change_feed.poll(options['since'], timeout=options['timeout'], limit=options['limit'],
+                                           account_id=options['account_id'])
+    except CursorExpired as e:
+        return JsonResponse({'error': str(e)}, status=410)
+    return JsonResponse({'changes': [change.as_dict() for change in changes], 'cursor': cursor,
+                         'more': len(changes) == options['limit']})
+
+
+@require_http_methods(["GET"])
+def replay_status_view(request, replay_id):
+    """
+    A view reporting the progress of a replay started by this process.
+
+    Args:
+        request (HttpRequest): The request object.
+        replay_id (UUID): The replay ID.
+
+    Returns:
+        JsonResponse: The replay status, or a 404 error message.
+    """
+    replay = replays.get(replay_id)
+    if replay is None:
+        return JsonResponse({'error': 'Replay not found'}, status=404)
+    return JsonResponse(replay.as_dict())
@@ -0,0 +1,233 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+from .ingest import DestinationHandler
+from .models import Delivery
+
+logger = logging.getLogger(__name__)
+
+
+def claimable_deliveries(now, using=DEFAULT_DB_ALIAS):
+    """
+    Returns the deliveries a worker may claim.
+
+    A delivery is claimable when it is pending, due, and not leased or its lease has expired.
+    Of the deliveries sharing a destination's ordering partition, only the oldest pending one
+    is claimable, so ordered deliveries are never in flight twice, even across nodes.
+
+    Args:
+        now (datetime): The current time.
+        using (str): The database alias of the tenant shard.
+
+    Returns:
+        QuerySet: The claimable deliveries.
+    """
+    earlier = Delivery.objects.using(using).filter(
+        destination=OuterRef('destination'), ordering_partition=OuterRef('ordering_partition'),
+        status=Delivery.PENDING, pk__lt=OuterRef('pk'),
+    )
+    return (Delivery.objects.using(using)
+            .filter(status=Delivery.PENDING, available_at__lte=now)
+            .filter(Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=now))
+            .filter(Q(ordering_partition__isnull=True) | ~Exists(earlier)))
+
+
+class DeliveryWorker:
+    """
+    Sends durable deliveries, sharing the work with other nodes through leases.
+
+    A batch is claimed with a single UPDATE that stamps the claimable rows with a fresh lease
+    token and expiry; since the UPDATE re-applies the claimable conditions, two workers can
+    never claim the same row. While the batch is being sent, a heartbeat extends the lease. When
+    a worker dies, its lease runs out and the deliveries become claimable again (visibility
+    timeout). Finished deliveries are released in bulk: successes are marked delivered, failures
+    are retried with exponential backoff until they run out of attempts.
+
+    Attributes:
+        name (str): Identifies the worker in lease tokens.
+        batch_size (int): Deliveries claimed at a time.
+        lease_seconds (float): Lease duration, extended while sending.
+        max_attempts (int): Attempts before a delivery is marked failed.
+        retry_backoff (float): Delay before the first retry, doubled for each further attempt.
+        database (str): The tenant shard whose deliveries the worker sends.
+    """
+
+    def __init__(self, name=None, batch_size=None, lease_seconds=None, max_attempts=None, retry_backoff=None,
+                 database=DEFAULT_DB_ALIAS):
+        """
+        Initializes the DeliveryWorker.
+
+        Args:
+            name (str): Defaults to the host name and process ID.
+            batch_size (int): Defaults to settings.DELIVERY_CLAIM_BATCH_SIZE.
+            lease_seconds (float): Defaults to settings.DELIVERY_LEASE_SECONDS.
+            max_attempts (int): Defaults to settings.DELIVERY_MAX_ATTEMPTS.
+            retry_backoff (float): Defaults to settings.DELIVERY_RETRY_BACKOFF.
+            database (str): Defaults to the default database.
+        """
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size or getattr(settings, 'DELIVERY_CLAIM_BATCH_SIZE', 100)
+        self.lease_seconds = lease_seconds or getattr(settings, 'DELIVERY_LEASE_SECONDS', 60)
+        self.max_attempts = max_attempts or getattr(settings, 'DELIVERY_MAX_ATTEMPTS', 5)
+        self.retry_backoff = retry_backoff or getattr(settings, 'DELIVERY_RETRY_BACKOFF', 30)
+        self.database = database
+        self.claimed = 0
+        self.delivered = 0
+        self.failed = 0
+
+    def claim(self, ids=None):
+        """
+        Claims a batch of deliveries in one statement.
+
+        Args:
+            ids (list): Claim only these deliveries, e.g. those a scheduler found due. Defaults
+                to the deliveries due the longest.
+
+        Returns:
+            tuple: The lease token and the claimed deliveries with their destinations and accounts.
+        """
+        now = timezone.now()
+        token = f"{self.name[:31]}:{uuid.uuid4().hex}"
+        batch = claimable_deliveries(now, self.database)
+        if ids is not None:
+            batch = batch.filter(pk__in=ids)
+        batch = batch.order_by('available_at', 'pk').values('pk')[:self.batch_size]
+        count = claimable_deliveries(now, self.database).filter(pk__in=batch).update(
+            lease_owner=token,
+            lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+            attempts=F('attempts') + 1,
+        )
+        if not count:
+            return token, []
+        self.claimed += count
+        deliveries = list(Delivery.objects.using(self.database).filter(lease_owner=token).select_related('destination__account')
+                          .order_by('pk'))
+        return token, deliveries
+
+    def extend(self, token):
+        """
+        Extends the lease of a batch that is still being sent.
+
+        Args:
+            token (str): The lease token.
+
+        Returns:
+            int: The number of deliveries still leased.
+        """
+        return Delivery.objects.using(self.database).filter(lease_owner=token, status=Delivery.PENDING).update(
+            lease_expires_at=timezone.now() + timedelta(seconds=self.lease_seconds)
+        )
+
+    def heartbeat(self, token, stop):
+        while not stop.wait(self.lease_seconds / 3):
+            try:
+                self.extend(token)
+            except Exception:
+                logger.exception("Extending delivery lease failed")
+            finally:
+                close_old_connections()
+
+    def send(self, delivery):
+        """
+        Sends one delivery.
+
+        Args:
+            delivery (Delivery): The claimed delivery.
+
+        Returns:
+            dict: The outcome reported by DestinationHandler.
+        """
+        destination = delivery.destination
+        handler = DestinationHandler(destination.account, delivery.payload)
+        return handler.process_destinations([destination])[0]
+
+    def release(self, token, outcomes):
+        """
+        Records the outcomes of a batch and releases its lease.
+
+        Args:
+            token (str): The lease token.
+            outcomes (list): Pairs of delivery and outcome.
+        """
+        now = timezone.now()
+        finished = []
+        for delivery, outcome in outcomes:
+            delivery.lease_owner = None
+            delivery.lease_expires_at = None
+            delivery.last_status_code = outcome.get('status_code')
+            ok = 'error' not in outcome and outcome['status_code'] < 400
+            delivery.last_error = None if ok else outcome.get('error') or outcome.get('response', '')[:1000]
+            if ok:
+                delivery.status = Delivery.DELIVERED
+                delivery.completed_at = now
+                self.delivered += 1
+            elif delivery.attempts >= self.max_attempts:
+                delivery.status = Delivery.FAILED
+                delivery.completed_at = now
+                self.failed += 1
+            else:
+                delivery.available_at = now + timedelta(seconds=self.retry_backoff * 2 ** (delivery.attempts - 1))
+            finished.append(delivery)
+        # Only rows still holding our lease are written; a reclaimed row belongs to another worker now
+        owned = set(Delivery.objects.using(self.database).filter(lease_owner=token).values_list('pk', flat=True))
+        Delivery.objects.using(self.database).bulk_update(
+            [delivery for delivery in finished if delivery.pk in owned],
+            ['status', 'lease_owner', 'lease_expires_at', 'last_status_code', 'last_error', 'available_at',
+             'completed_at'],
+        )
+
+    def run_once(self):
+        """
+        Claims, sends and releases one batch.
+
+        Returns:
+            int: The number of deliveries processed.
+        """
+        token, deliveries = self.claim()
+        if not deliveries:
+            return 0
+        return self.process(token, deliveries)
+
+    def process(self, token, deliveries):
+        """
+        Sends a claimed batch while extending its lease, then releases it.
+
+        Args:
+            token (str): The lease token.
+            deliveries (list): The claimed deliveries.
+
+        Returns:
+            int: The number of deliveries processed.
+        """
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self.heartbeat, args=(token, stop), daemon=True)
+        heartbeat.start()
+        try:
+            outcomes = [(delivery, self.send(delivery)) for delivery in deliveries]
+        finally:
+            stop.set()
+            heartbeat.join()
+        self.release(token, outcomes)
+        return len(outcomes)
+
+    def collect(self):
+        """
+        Returns the worker metrics.
+
+        Returns:
+            list: Metric samples for the metrics registry.
+        """
+        return [
+            ('delivery_claimed_total', 'counter', "Durable deliveries claimed by this worker.", {}, self.claimed),
+            ('delivery_completed_total', 'counter', "Durable deliveries completed by this worker.",
+             {'status': Delivery.DELIVERED}, self.delivered),
+            ('delivery_completed_total', 'counter', "Durable deliveries completed by this worker.",
+             {'status': Delivery.FAILED}, self.failed),
+        ]